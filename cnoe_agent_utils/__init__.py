@@ -1,5 +1,8 @@
 from .llm_factory import LLMFactory
 
+# Tokenizer warmup, called explicitly before worker processes fork (LLM_TOKENIZER_PRELOAD)
+from .token_counting import preload_tokenizers_from_env
+
 # Import tracing utilities (always available since langfuse is now a standard dependency)
 from .tracing import TracingManager, trace_agent_stream, disable_a2a_tracing, is_a2a_disabled
 
@@ -11,8 +14,11 @@ try:
     from .agents import (
         # Context configuration (always available)
         get_context_limit_for_provider, # noqa: F401
+        get_calibrated_context_limit, # noqa: F401
         get_min_messages_to_keep, # noqa: F401
+        get_trim_watermarks, # noqa: F401
         is_auto_compression_enabled, # noqa: F401
+        is_background_compaction_enabled, # noqa: F401
         get_context_config, # noqa: F401
         log_context_config, # noqa: F401
     )
@@ -44,15 +50,19 @@ __all__ = [
     'Spinner',
     'stream_with_spinner',
     'invoke_with_spinner',
-    'time_llm_operation'
+    'time_llm_operation',
+    'preload_tokenizers_from_env',
 ]
 
 # Add agent context configuration if available
 if _AGENTS_BASE_AVAILABLE:
     __all__.extend([
         'get_context_limit_for_provider',
+        'get_calibrated_context_limit',
         'get_min_messages_to_keep',
+        'get_trim_watermarks',
         'is_auto_compression_enabled',
+        'is_background_compaction_enabled',
         'get_context_config',
         'log_context_config',
     ])
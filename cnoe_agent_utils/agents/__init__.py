@@ -6,8 +6,11 @@
 # Context configuration utilities
 from .context_config import (
     get_context_limit_for_provider,
+    get_calibrated_context_limit,
     get_min_messages_to_keep,
+    get_trim_watermarks,
     is_auto_compression_enabled,
+    is_background_compaction_enabled,
     get_context_config,
     log_context_config,
 )
@@ -31,8 +34,11 @@ except ImportError:
 __all__ = [
     # Context config (always available)
     "get_context_limit_for_provider",
+    "get_calibrated_context_limit",
     "get_min_messages_to_keep",
+    "get_trim_watermarks",
     "is_auto_compression_enabled",
+    "is_background_compaction_enabled",
     "get_context_config",
     "log_context_config",
 ]
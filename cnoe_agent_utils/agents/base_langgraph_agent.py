@@ -3,10 +3,12 @@
 
 """Base agent class providing common A2A functionality with streaming support."""
 
+import asyncio
 import json
 import logging
 import os
 import tempfile
+import weakref
 from abc import ABC, abstractmethod
 from collections.abc import AsyncIterable
 from typing import Any, Dict
@@ -26,12 +28,19 @@ from cnoe_agent_utils.tracing import TracingManager, trace_agent_stream
 from pydantic import BaseModel
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import tiktoken
 
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 
-from .context_config import get_context_limit_for_provider, get_min_messages_to_keep, is_auto_compression_enabled
+from .context_config import (
+    get_calibrated_context_limit,
+    get_context_limit_for_provider,
+    get_min_messages_to_keep,
+    get_trim_watermarks,
+    is_auto_compression_enabled,
+    is_background_compaction_enabled,
+)
+from .context_trimming import select_trim_cut, trim_cut_points
 
 
 logger = logging.getLogger(__name__)
@@ -43,6 +52,9 @@ if not MCP_AVAILABLE:
 CHUNK_SIZE_THRESHOLD = int(os.getenv("TOOL_OUTPUT_CHUNK_THRESHOLD", "50000"))  # 50KB default
 CHUNK_SIZE = int(os.getenv("TOOL_OUTPUT_CHUNK_SIZE", "10000"))  # 10KB chunks
 
+# Threads whose background compaction is remembered before finished ones are dropped
+MAX_TRACKED_COMPACTIONS = 10_000
+
 # Reduce verbosity of third-party libraries
 # Set this early before any imports use these loggers
 for log_name in ["httpx", "mcp.server.streamable_http", "mcp.server.streamable_http_manager",
@@ -90,30 +102,40 @@ class BaseLangGraphAgent(ABC):
 
     def __init__(self):
         """Initialize the agent with LLM, tracing, and graph setup."""
-        self.model = LLMFactory().get_llm()
+        llm_factory = LLMFactory()
+        self.model = llm_factory.get_llm(thinking_policy=self.get_thinking_policy())
         self.tracing = TracingManager()
         self.graph = None
+        # System prompt the graph was built with (counted toward the context)
+        self.system_prompt = None
         # Store tool metadata for debugging and reference
         self.tools_info = {}
 
-        # Initialize tokenizer for context management
-        try:
-            self.tokenizer = tiktoken.encoding_for_model("gpt-4")
-        except Exception:
-            # Fallback to cl100k_base (used by GPT-4/3.5)
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # Provider-aware token counter for context management
+        self.token_counter = llm_factory.get_token_counter(llm=self.model)
 
         # Get context management configuration from global config
         llm_provider = os.getenv("LLM_PROVIDER", "azure-openai").lower()
         self.max_context_tokens = get_context_limit_for_provider(llm_provider)
+        # Limit used once token estimates are calibrated against provider usage
+        self.calibrated_context_tokens = get_calibrated_context_limit(llm_provider, self.token_counter.model_name)
         self.min_messages_to_keep = get_min_messages_to_keep()
         self.enable_auto_compression = is_auto_compression_enabled()
+        self.enable_background_compaction = is_background_compaction_enabled()
+        # Trim above the high watermark, down to the low one (fractions of the limit)
+        self.trim_high_watermark, self.trim_low_watermark = get_trim_watermarks()
+        # Latest background compaction per thread_id, and a lock per thread_id
+        # so compaction never runs twice at once on the same history
+        self._compaction_tasks: dict[str, asyncio.Task] = {}
+        self._compaction_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
 
         logger.info(
             f"Context management initialized for provider={llm_provider}: "
             f"max_tokens={self.max_context_tokens:,}, "
             f"min_messages={self.min_messages_to_keep}, "
-            f"auto_compression={self.enable_auto_compression}"
+            f"auto_compression={self.enable_auto_compression}, "
+            f"background_compaction={self.enable_background_compaction}, "
+            f"trim_watermarks={self.trim_high_watermark:g}/{self.trim_low_watermark:g}"
         )
 
     @abstractmethod
@@ -160,6 +182,16 @@ Use this as the reference point for all date calculations. When users say "today
         """Return the Pydantic model class for structured responses."""
         pass
 
+    def get_thinking_policy(self) -> Any:
+        """
+        Return a ``ThinkingPolicy`` that sizes the extended-thinking budget per
+        model call, or None to use LLM_THINKING_POLICY / the *_THINKING_* settings.
+
+        A ``latency_slo`` (seconds) in the run metadata tightens the budget
+        for that request.
+        """
+        return None
+
     def get_mcp_config(self, server_path: str) -> Dict[str, Any]:
         """
         Return the MCP server configuration for stdio mode.
@@ -445,11 +477,12 @@ Use this as the reference point for all date calculations. When users say "today
         # Create the react agent graph
         logger.info(f"🔧 Creating {agent_name} agent graph with {len(tools)} tools...")
 
+        self.system_prompt = self._get_system_instruction_with_date()
         self.graph = create_react_agent(
             self.model,
             tools,
             checkpointer=memory,
-            prompt=self._get_system_instruction_with_date(),
+            prompt=self.system_prompt,
             response_format=(
                 self.get_response_format_instruction(),
                 self.get_response_format_class()
@@ -497,21 +530,10 @@ Use this as the reference point for all date calculations. When users say "today
             message: A LangChain message object
 
         Returns:
-            Approximate token count
+            Token count from the provider's tokenizer (or its approximation)
         """
         try:
-            content = ""
-            if hasattr(message, "content"):
-                content = str(message.content)
-            elif isinstance(message, dict) and "content" in message:
-                content = str(message["content"])
-
-            # Add tokens for tool calls if present
-            if hasattr(message, "tool_calls") and message.tool_calls:
-                for tool_call in message.tool_calls:
-                    content += str(tool_call)
-
-            return len(self.tokenizer.encode(content))
+            return self.token_counter.count_message(message)
         except Exception as e:
             logger.warning(f"Error counting tokens: {e}, returning estimate")
             # Rough estimate: 1 token ≈ 4 characters
@@ -522,22 +544,98 @@ Use this as the reference point for all date calculations. When users say "today
         """
         Count total tokens across all messages.
 
+        Counts are memoized per message ID and content, so each turn only
+        tokenizes the messages added since the last count.
+
         Args:
             messages: List of messages
 
         Returns:
             Total token count
         """
-        return sum(self._count_message_tokens(msg) for msg in messages)
+        return sum(self._count_message_list(messages))
+
+    def _count_message_list(self, messages: list, limit: int | None = None, fixed_tokens: int = 0) -> list:
+        """
+        Count tokens per message.
+
+        With a *limit*, the counter's tokenizer mode decides whether messages
+        are tokenized or estimated (hybrid: estimated unless near the limit).
+
+        Args:
+            messages: List of messages
+            limit: Context limit the counts are checked against
+            fixed_tokens: Tokens sent alongside the messages (system prompt)
+
+        Returns:
+            Token count of each message, in order
+        """
+        try:
+            if limit is not None:
+                return self.token_counter.count_for_limit(
+                    messages, limit, fixed_tokens, to_provider_tokens=self._calibrated_tokens
+                )
+            return self.token_counter.count_messages(messages)
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"Error counting tokens: {e}, counting per message")
+            return [self._count_message_tokens(msg) for msg in messages]
+
+    async def _acount_message_list(self, messages: list, limit: int | None = None, fixed_tokens: int = 0) -> list:
+        """
+        Count tokens per message without blocking the event loop.
+
+        Large uncached content is tokenized on the counter's thread pool
+        instead of inline, so other sessions keep streaming meanwhile.
+        See ``_count_message_list`` for the arguments.
+        """
+        try:
+            if limit is not None:
+                return await self.token_counter.acount_for_limit(
+                    messages, limit, fixed_tokens, to_provider_tokens=self._calibrated_tokens
+                )
+            return await self.token_counter.acount_messages(messages)
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"Error counting tokens: {e}, counting per message")
+            return [self._count_message_tokens(msg) for msg in messages]
+
+    def _context_limit(self) -> int:
+        """
+        Return the token limit for context trimming.
+
+        Once local estimates are calibrated against provider-reported usage,
+        this is the model's context window minus the output reserve instead
+        of the conservative provider default.
+        """
+        if self.token_counter.calibration.ready:
+            return self.calibrated_context_tokens
+        return self.max_context_tokens
+
+    def _calibrated_tokens(self, tokens: int) -> int:
+        """
+        Convert a local token count into the expected provider count.
+
+        Args:
+            tokens: Local token count
+
+        Returns:
+            Calibrated count plus a margin for its recent error
+        """
+        return self.token_counter.calibration.upper_bound(tokens)
 
     async def _trim_messages_if_needed(self, config: RunnableConfig) -> None:
         """
         Trim old messages from the checkpointer if context is too large.
 
+        Trims only when the context crosses the high watermark, then cuts
+        down to the low watermark in one step, at the start of a user turn
+        when possible. The turns in between keep the same prompt prefix, so
+        provider prompt caches stay warm.
+
         Keeps:
         - System messages (always)
         - Recent N messages (configurable via MIN_MESSAGES_TO_KEEP)
-        - Removes oldest messages in between
+        - Removes oldest messages in between, never separating a tool call
+          from its results
 
         Args:
             config: Runnable configuration with thread_id
@@ -567,49 +665,65 @@ Use this as the reference point for all date calculations. When users say "today
 
             # Count current tokens
             logger.info(f"{agent_name}: Found {len(messages)} messages in state, counting tokens...")
-            total_tokens = self._count_total_tokens(messages)
-            logger.info(f"{agent_name}: Total tokens: {total_tokens:,} (limit: {self.max_context_tokens:,})")
+            # The graph sends the system prompt ahead of the state messages
+            # (a fixed ID lets the counter reuse its count without rereading it)
+            prompt_tokens = (
+                sum(await self._acount_message_list([SystemMessage(content=self.system_prompt, id="system_prompt")]))
+                if self.system_prompt else 0
+            )
+            max_context_tokens = self._context_limit()
+            high_watermark = int(max_context_tokens * self.trim_high_watermark)
+            low_watermark = int(max_context_tokens * self.trim_low_watermark)
+            counts = await self._acount_message_list(messages, limit=high_watermark, fixed_tokens=prompt_tokens)
+            total_tokens = self._calibrated_tokens(prompt_tokens + sum(counts))
+            logger.info(
+                f"{agent_name}: Total tokens: {total_tokens:,} "
+                f"(limit: {max_context_tokens:,}, trim above {high_watermark:,} down to {low_watermark:,})"
+            )
 
-            if total_tokens <= self.max_context_tokens:
+            if total_tokens <= high_watermark:
                 logger.info(f"{agent_name}: ✅ Context size OK ({total_tokens:,} tokens)")
                 return
 
             logger.warning(
-                f"{agent_name}: Context too large ({total_tokens} tokens > {self.max_context_tokens}). "
-                f"Trimming old messages..."
+                f"{agent_name}: Context too large ({total_tokens} tokens > {high_watermark}). "
+                f"Trimming old messages down to {low_watermark} tokens..."
             )
 
             # Separate system messages from conversation messages
-            system_messages = []
+            system_tokens = 0
             conversation_messages = []
+            conversation_counts = []
 
-            for msg in messages:
+            for msg, count in zip(messages, counts):
                 if isinstance(msg, SystemMessage) or (
                     isinstance(msg, dict) and msg.get("type") == "system"
                 ):
-                    system_messages.append(msg)
+                    system_tokens += count
                 else:
                     conversation_messages.append(msg)
-
-            # Keep recent N messages
-            messages_to_keep = conversation_messages[-self.min_messages_to_keep:]
-            messages_to_remove = conversation_messages[:-self.min_messages_to_keep]
-
-            # Calculate tokens after trimming
-            kept_tokens = (
-                self._count_total_tokens(system_messages) +
-                self._count_total_tokens(messages_to_keep)
-            )
-
-            # If still too large, trim more aggressively
-            while kept_tokens > self.max_context_tokens and len(messages_to_keep) > 2:
-                # Remove the oldest message from kept messages
-                removed = messages_to_keep.pop(0)
-                messages_to_remove.append(removed)
-                kept_tokens = (
-                    self._count_total_tokens(system_messages) +
-                    self._count_total_tokens(messages_to_keep)
+                    conversation_counts.append(count)
+
+            # Keep recent N messages, then cut further (never between a tool call and its result)
+            # at the oldest point under the low watermark, found by binary search over prefix sums.
+            # Cuts at the start of a user turn are preferred; any safe cut is used only when no
+            # user turn boundary gets the context under the high watermark (e.g. one long tool loop).
+            fixed_tokens = prompt_tokens + system_tokens
+            for user_turns in (True, False):
+                cut = select_trim_cut(
+                    conversation_counts,
+                    fixed_tokens,
+                    low_watermark,
+                    self.min_messages_to_keep,
+                    safe_cuts=trim_cut_points(conversation_messages, self.min_messages_to_keep, user_turns),
+                    to_provider_tokens=self._calibrated_tokens,
                 )
+                kept_tokens = self._calibrated_tokens(fixed_tokens + sum(conversation_counts[cut:]))
+                if kept_tokens <= high_watermark:
+                    break
+            messages_to_keep = conversation_messages[cut:]
+            messages_to_remove = conversation_messages[:cut]
+            removed_tokens = sum(conversation_counts[:cut])
 
             if not messages_to_remove:
                 logger.warning(f"{agent_name}: Cannot trim further without breaking conversation")
@@ -629,7 +743,6 @@ Use this as the reference point for all date calculations. When users say "today
                     {"messages": remove_commands}
                 )
 
-                removed_tokens = self._count_total_tokens(messages_to_remove)
                 logger.info(
                     f"{agent_name}: ✂️ Trimmed {len(messages_to_remove)} messages "
                     f"({removed_tokens} tokens). Kept {len(messages_to_keep)} messages "
@@ -645,6 +758,78 @@ Use this as the reference point for all date calculations. When users say "today
             # Don't fail the request if trimming fails - just log and continue
             logger.warning(f"{agent_name}: Continuing without message trimming due to error")
 
+    def _compaction_lock(self, thread_id: str) -> asyncio.Lock:
+        lock = self._compaction_locks.get(thread_id)
+        if lock is None:
+            lock = self._compaction_locks[thread_id] = asyncio.Lock()
+        return lock
+
+    async def _compact_history(self, config: RunnableConfig, scheduled: bool = False) -> None:
+        """
+        Trim the thread's history, serialized per thread_id.
+
+        Args:
+            config: Runnable configuration with thread_id
+            scheduled: Run as the background compaction of a turn; skipped if
+                the next turn has already started and trims inline instead
+        """
+        thread_id = str((config.get("configurable") or {}).get("thread_id"))
+        async with self._compaction_lock(thread_id):
+            if scheduled and self._compaction_tasks.get(thread_id) is not asyncio.current_task():
+                return
+            await self._trim_messages_if_needed(config)
+
+    async def _prepare_context(self, config: RunnableConfig) -> None:
+        """
+        Make sure the thread's history fits before a turn starts.
+
+        With background compaction, a compaction that finished after the
+        thread's previous turn already covers the history, and the turn
+        starts without waiting. Each compaction covers only the turn that
+        scheduled it: the next turn consumes it. The history is trimmed
+        inline (serialized with any compaction still running) when:
+
+        - the previous turn was aborted, cancelled or failed, so it scheduled
+          no compaction and the last one is older than that turn
+        - the compaction is still running or did not complete; one that has
+          not started yet is skipped, one already trimming finishes first
+        - it is the thread's first turn in this process, or background
+          compaction is disabled
+
+        Args:
+            config: Runnable configuration with thread_id
+        """
+        if not self.enable_auto_compression:
+            return
+        thread_id = str((config.get("configurable") or {}).get("thread_id"))
+        task = self._compaction_tasks.pop(thread_id, None)
+        if (
+            self.enable_background_compaction and task is not None and task.done()
+            and not task.cancelled() and task.exception() is None
+        ):
+            return
+        await self._compact_history(config)
+
+    def _schedule_compaction(self, config: RunnableConfig) -> None:
+        """
+        Compact the thread's history in a background task after a turn.
+
+        The next turn then starts from an already-compacted state instead of
+        waiting for state fetch, token counting and the state update. Only
+        turns that complete schedule one; see ``_prepare_context``.
+
+        Args:
+            config: Runnable configuration with thread_id
+        """
+        if not (self.enable_auto_compression and self.enable_background_compaction):
+            return
+        thread_id = str((config.get("configurable") or {}).get("thread_id"))
+        if len(self._compaction_tasks) >= MAX_TRACKED_COMPACTIONS:
+            # Forgotten threads are trimmed inline on their next turn
+            for done_id in [tid for tid, task in self._compaction_tasks.items() if task.done()]:
+                del self._compaction_tasks[done_id]
+        self._compaction_tasks[thread_id] = asyncio.create_task(self._compact_history(config, scheduled=True))
+
     async def _ensure_graph_initialized(self, config: RunnableConfig) -> None:
         """Ensure the graph is initialized before use."""
         if self.graph is None:
@@ -678,18 +863,23 @@ Use this as the reference point for all date calculations. When users say "today
         if sessionId and "thread_id" not in configurable:
             configurable["thread_id"] = sessionId
 
+        # agent_name and thread_id attribute LLM usage in the usage ledger;
+        # user-facing streams take the interactive lane of a shared LLM quota
+        metadata = {"priority": "interactive", **(config.get("metadata") or {}), "agent_name": agent_name}
+
         config = RunnableConfig(
             callbacks=config.get("callbacks"),
             tags=config.get("tags"),
-            metadata=config.get("metadata"),
+            metadata=metadata,
             configurable=configurable,
         )
 
         # Ensure graph is initialized
         await self._ensure_graph_initialized(config)
 
-        # Auto-trim old messages to prevent context overflow
-        await self._trim_messages_if_needed(config)
+        # Auto-trim old messages to prevent context overflow (normally already
+        # done in the background after the previous turn)
+        await self._prepare_context(config)
 
         # Track which messages we've already processed to avoid duplicates
         seen_tool_calls = set()
@@ -976,6 +1166,9 @@ Use this as the reference point for all date calculations. When users say "today
                                 'content': str(content_text),
                             }
 
+        # Compact this turn's history before the next turn needs it
+        self._schedule_compaction(config)
+
         # Yield task completion marker
         yield {
             'is_task_complete': True,
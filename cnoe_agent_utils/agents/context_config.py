@@ -7,6 +7,8 @@ import logging
 import os
 from typing import Dict
 
+from ..utils import env_int
+
 logger = logging.getLogger(__name__)
 
 # Default context limits per provider (conservative with 20-30% safety margin)
@@ -18,6 +20,7 @@ DEFAULT_PROVIDER_CONTEXT_LIMITS: Dict[str, int] = {
     "anthropic-claude": 150000, # Claude 3/4: 200K tokens, use 150K (25% margin)
     "google-gemini": 800000,    # Gemini 2.0: 1M-2M tokens, use 800K (20% margin)
     "gcp-vertexai": 150000,     # Varies by model, conservative default
+    "openai-compatible": 32000, # Self-hosted servers are often launched with a 32K max-model-len
 }
 
 # Environment variable mappings for provider-specific overrides
@@ -28,6 +31,7 @@ PROVIDER_ENV_VARS: Dict[str, str] = {
     "anthropic-claude": "ANTHROPIC_MAX_CONTEXT_TOKENS",
     "google-gemini": "GOOGLE_GEMINI_MAX_CONTEXT_TOKENS",
     "gcp-vertexai": "GCP_VERTEXAI_MAX_CONTEXT_TOKENS",
+    "openai-compatible": "OPENAI_COMPATIBLE_MAX_CONTEXT_TOKENS",
 }
 
 
@@ -111,6 +115,47 @@ def get_context_limit_for_provider(provider: str = None) -> int:
     return default_limit
 
 
+def has_context_limit_override(provider: str | None = None) -> bool:
+    """
+    Check whether the context limit for a provider is set explicitly.
+
+    Args:
+        provider: LLM provider name; if None, uses LLM_PROVIDER
+
+    Returns:
+        True if the provider-specific variable or MAX_CONTEXT_TOKENS is set
+    """
+    provider = (provider or os.getenv("LLM_PROVIDER", "azure-openai")).lower()
+    provider_env_var = PROVIDER_ENV_VARS.get(provider)
+    return bool((provider_env_var and os.getenv(provider_env_var)) or os.getenv("MAX_CONTEXT_TOKENS"))
+
+
+def get_calibrated_context_limit(provider: str | None = None, model_name: str | None = None) -> int:
+    """
+    Get the context token limit to use once token estimates are calibrated.
+
+    Calibrated estimates track what the provider counts, so the limit is the
+    model's context window minus the output reserve (LLM_OUTPUT_RESERVE_TOKENS)
+    instead of the conservative provider default. An explicit limit
+    (see get_context_limit_for_provider) always wins.
+
+    Args:
+        provider: LLM provider name; if None, uses LLM_PROVIDER
+        model_name: Model name used to look up the context window
+
+    Returns:
+        Context token limit as integer
+    """
+    provider = (provider or os.getenv("LLM_PROVIDER", "azure-openai")).lower()
+    configured = get_context_limit_for_provider(provider)
+    if has_context_limit_override(provider):
+        return configured
+
+    from ..token_budget import DEFAULT_OUTPUT_RESERVE_TOKENS, get_model_limits
+    context_window, _ = get_model_limits(model_name, provider)
+    return max(configured, context_window - env_int("LLM_OUTPUT_RESERVE_TOKENS", DEFAULT_OUTPUT_RESERVE_TOKENS))
+
+
 def get_min_messages_to_keep() -> int:
     """
     Get the minimum number of recent messages to always keep.
@@ -128,6 +173,34 @@ def get_min_messages_to_keep() -> int:
         return 10
 
 
+def get_trim_watermarks() -> tuple[float, float]:
+    """
+    Get the high and low trimming watermarks as fractions of the context limit.
+
+    Trimming starts only when the context crosses the high watermark and
+    then cuts down to the low watermark in one step, so the prompt prefix
+    (and the provider's prompt cache) stays unchanged for the turns in
+    between.
+
+    Returns:
+        (high, low) from CONTEXT_TRIM_HIGH_WATERMARK and
+        CONTEXT_TRIM_LOW_WATERMARK (defaults: 1.0 and 0.7)
+    """
+    try:
+        high = float(os.getenv("CONTEXT_TRIM_HIGH_WATERMARK", "1.0"))
+        low = float(os.getenv("CONTEXT_TRIM_LOW_WATERMARK", "0.7"))
+    except ValueError:
+        logger.warning("Invalid CONTEXT_TRIM_*_WATERMARK value, using defaults: 1.0 and 0.7")
+        return 1.0, 0.7
+    if not 0 < low <= high <= 1:
+        logger.warning(
+            f"Trim watermarks must satisfy 0 < low <= high <= 1 (got high={high}, low={low}), "
+            "using defaults: 1.0 and 0.7"
+        )
+        return 1.0, 0.7
+    return high, low
+
+
 def is_auto_compression_enabled() -> bool:
     """
     Check if auto-compression is enabled.
@@ -138,6 +211,18 @@ def is_auto_compression_enabled() -> bool:
     return os.getenv("ENABLE_AUTO_COMPRESSION", "true").lower() == "true"
 
 
+def is_background_compaction_enabled() -> bool:
+    """
+    Check if history compaction runs in the background after each turn.
+
+    When disabled, messages are trimmed inline before each turn instead.
+
+    Returns:
+        True if enabled (default), False otherwise
+    """
+    return os.getenv("ENABLE_BACKGROUND_COMPACTION", "true").lower() == "true"
+
+
 def get_context_config() -> Dict[str, any]:
     """
     Get complete context management configuration.
@@ -148,6 +233,8 @@ def get_context_config() -> Dict[str, any]:
         - max_context_tokens: Token limit for the provider
         - min_messages_to_keep: Minimum messages to preserve
         - auto_compression_enabled: Whether auto-compression is enabled
+        - background_compaction_enabled: Whether compaction runs after each turn
+        - trim_watermarks: (high, low) fractions of the limit for trimming
     """
     provider = os.getenv("LLM_PROVIDER", "azure-openai").lower()
     return {
@@ -155,6 +242,8 @@ def get_context_config() -> Dict[str, any]:
         "max_context_tokens": get_context_limit_for_provider(provider),
         "min_messages_to_keep": get_min_messages_to_keep(),
         "auto_compression_enabled": is_auto_compression_enabled(),
+        "background_compaction_enabled": is_background_compaction_enabled(),
+        "trim_watermarks": get_trim_watermarks(),
     }
 
 
@@ -165,5 +254,7 @@ def log_context_config():
         f"Context management config: provider={config['provider']}, "
         f"max_tokens={config['max_context_tokens']:,}, "
         f"min_messages={config['min_messages_to_keep']}, "
-        f"auto_compression={config['auto_compression_enabled']}"
+        f"auto_compression={config['auto_compression_enabled']}, "
+        f"background_compaction={config['background_compaction_enabled']}, "
+        f"trim_watermarks={config['trim_watermarks']}"
     )
@@ -0,0 +1,198 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Cut-point selection for context trimming.
+
+Agents trim a conversation by removing its oldest messages. Everything
+older than the newest ``min_keep`` messages is removed, and the cut point
+among those is chosen from their token counts: one prefix sum over them,
+then a binary search for the oldest cut that fits the limit. Re-counting
+the kept messages after every single removal is not needed, and only the
+newest ``min_keep`` messages are scanned for cut points.
+
+A cut never splits a tool call from its results: every ``ToolMessage``
+kept must also have the AI message that requested it kept, otherwise the
+provider rejects the history. Agents prefer cuts where a user turn starts
+(``stable_cut_points``) and trim with hysteresis: only above a high
+watermark, then down to a low one, so the prompt prefix, and the provider's
+prompt cache, survives the turns in between.
+
+Usage:
+    counts = token_counter.count_messages(conversation)
+    cut = select_trim_cut(counts, fixed_tokens, limit, min_keep=10,
+                          safe_cuts=trim_cut_points(conversation, min_keep=10))
+    removed, kept = conversation[:cut], conversation[cut:]
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Sequence
+from itertools import accumulate
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Trimming never goes below this many conversation messages
+MIN_TRIMMED_MESSAGES = 2
+
+
+def _field(message: Any, name: str) -> Any:
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def _tool_call_ids(message: Any) -> list[str]:
+    ids = []
+    for call in _field(message, "tool_calls") or []:
+        call_id = call.get("id") if isinstance(call, dict) else getattr(call, "id", None)
+        if call_id:
+            ids.append(call_id)
+    return ids
+
+
+def safe_cut_points(messages: Sequence[Any], start: int = 0) -> list[int]:
+    """
+    Return the indexes where *messages* can be cut without orphaning a tool result.
+
+    A cut at ``i`` keeps ``messages[i:]``; it is safe when no tool result at
+    or after ``i`` answers a tool call made before ``i``. A result whose call
+    is not in *messages* at all does not block any cut. Index 0 and
+    ``len(messages)`` are always safe.
+
+    With *start*, only the cuts at or after it are returned. Only
+    ``messages[start:]`` is scanned, plus older messages while a result in
+    it still has its tool call unaccounted for.
+    """
+    n = len(messages)
+    start = min(max(start, 0), n)
+    requested_at = {}
+    # Oldest message each position depends on (its own index when it depends on none)
+    depends_on = []
+    # Results whose tool call, if any, comes before start
+    unresolved: dict[str, list[int]] = {}
+    for index in range(start, n):
+        message = messages[index]
+        for call_id in _tool_call_ids(message):
+            requested_at[call_id] = index
+        tool_call_id = _field(message, "tool_call_id") if _field(message, "type") == "tool" else None
+        if tool_call_id is not None and tool_call_id not in requested_at and start:
+            unresolved.setdefault(tool_call_id, []).append(index)
+        depends_on.append(min(index, requested_at.get(tool_call_id, index)))
+
+    for index in range(start - 1, -1, -1):
+        if not unresolved:
+            break
+        for call_id in _tool_call_ids(messages[index]):
+            for result in unresolved.pop(call_id, ()):
+                depends_on[result - start] = index
+
+    safe = [n]
+    oldest = n
+    for index in range(n - 1, start - 1, -1):
+        oldest = min(oldest, depends_on[index - start])
+        if oldest >= index:
+            safe.append(index)
+    safe.reverse()
+    return safe
+
+
+def stable_cut_points(messages: Sequence[Any], safe_cuts: Sequence[int] | None = None) -> list[int]:
+    """
+    Return the safe cut points where a user turn starts.
+
+    The history kept after such a cut always opens with a user message, and
+    the same cut stays valid however the rest of the turn unfolds.
+
+    Args:
+        messages: Conversation messages, oldest first
+        safe_cuts: Result of ``safe_cut_points(messages)``, if already computed
+    """
+    safe_cuts = safe_cut_points(messages) if safe_cuts is None else safe_cuts
+    return [i for i in safe_cuts if i < len(messages) and _field(messages[i], "type") == "human"]
+
+
+def trim_cut_points(messages: Sequence[Any], min_keep: int, user_turns: bool = False) -> list[int]:
+    """
+    Return the cut points ``select_trim_cut`` can choose from with *min_keep*.
+
+    Only the newest messages are scanned: the newest *min_keep*, and twice
+    as many each time the scanned ones hold no usable cut, so the latest cut
+    before them is still found. The result selects the same cut as the cut
+    points of the whole history.
+
+    Args:
+        messages: Conversation messages, oldest first
+        min_keep: Number of recent messages kept before trimming further
+        user_turns: Only return cuts where a user turn starts (see ``stable_cut_points``)
+    """
+    n = len(messages)
+    window = max(min_keep, 1)
+    start = max(0, n - min_keep)
+    stop = max(start, n - MIN_TRIMMED_MESSAGES)
+    while True:
+        cuts = safe_cut_points(messages, start)
+        if user_turns:
+            cuts = stable_cut_points(messages, cuts)
+        if (cuts and cuts[0] <= stop) or start == 0:
+            return cuts
+        window *= 2
+        start = max(0, n - window)
+
+
+def select_trim_cut(
+    counts: Sequence[int],
+    fixed_tokens: int,
+    limit: int,
+    min_keep: int,
+    safe_cuts: Sequence[int] | None = None,
+    to_provider_tokens: Callable[[int], int] | None = None,
+) -> int:
+    """
+    Choose how many of the oldest messages to remove.
+
+    Messages older than the newest *min_keep* are always removed. If the
+    rest still exceeds *limit*, the oldest cut that fits is chosen, keeping
+    at least two messages.
+
+    Args:
+        counts: Token count of each conversation message, oldest first
+        fixed_tokens: Tokens that are always sent (system prompt and messages)
+        limit: Token limit for the whole request
+        min_keep: Number of recent messages kept before trimming further
+        safe_cuts: Sorted cut indexes allowed (see ``safe_cut_points``); all when None
+        to_provider_tokens: Maps a local count to the expected provider count,
+            e.g. ``TokenCalibration.upper_bound``; must be non-decreasing
+
+    Returns:
+        Cut index: ``counts[:cut]`` is removed, ``counts[cut:]`` is kept
+    """
+    n = len(counts)
+    convert = to_provider_tokens or (lambda tokens: tokens)
+    start = max(0, n - min_keep)
+    # prefix[i] is the token count of the i oldest messages from start on
+    prefix = [0, *accumulate(counts[start:])]
+    stop = max(start, n - MIN_TRIMMED_MESSAGES)
+    if safe_cuts is None:
+        safe_cuts = range(n + 1)
+
+    candidates = safe_cuts[bisect_left(safe_cuts, start):bisect_right(safe_cuts, stop)]
+    if not candidates:
+        # Keep more than asked rather than split a tool call from its result
+        earlier = safe_cuts[:bisect_left(safe_cuts, start)]
+        return earlier[-1] if earlier else 0
+
+    def fits(cut: int) -> bool:
+        return convert(fixed_tokens + prefix[-1] - prefix[cut - start]) <= limit
+
+    # Kept tokens only shrink as the cut moves forward: find the first cut that fits
+    low, high = 0, len(candidates) - 1
+    if not fits(candidates[high]):
+        return candidates[high]
+    while low < high:
+        middle = (low + high) // 2
+        if fits(candidates[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return candidates[low]
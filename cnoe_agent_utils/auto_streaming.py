@@ -0,0 +1,163 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Per-call choice between streaming and non-streaming requests.
+
+``LLM_STREAMING=true`` (or ``OPENAI_STREAMING``, ``AWS_BEDROCK_STREAMING``,
+...) makes every call a streaming request, including short structured-output
+and classification calls where nobody reads the tokens as they arrive. For
+those, per-chunk parsing, callbacks and chunk merging cost more than they
+save (see ``examples/streaming_benchmark.py``).
+
+With the streaming setting ``auto``, models from ``LLMFactory.get_llm()``
+are wrapped in ``AutoStreamingLLM``, which streams a call only when:
+
+- the caller consumes tokens live: ``stream()``/``astream()``, or a
+  streaming callback such as LangGraph ``stream_mode="messages"`` or
+  ``astream_events`` is attached to the run, and
+- the expected output is at least ``LLM_STREAMING_MIN_OUTPUT_TOKENS``
+  (default 256) tokens. The expectation comes from an
+  ``expected_output_tokens`` keyword or run metadata, else the call's
+  ``max_tokens``, else the model's; structured-output models without
+  either count as short.
+
+Every other call is a single non-streaming request; ``stream()`` then yields
+the whole message as one chunk.
+
+Usage:
+    export LLM_STREAMING=auto
+    llm = LLMFactory("openai").get_llm()
+    llm.invoke(prompt)                              # non-streaming
+    llm.stream(prompt)                              # streaming
+    llm.invoke(prompt, expected_output_tokens=20)   # non-streaming even under a live consumer
+"""
+
+import logging
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import ensure_config
+from pydantic import PrivateAttr
+
+from .chat_wrapper import ChatModelWrapper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAMING_MIN_OUTPUT_TOKENS = 256
+# Keyword arguments that carry the output cap, by provider family
+_MAX_TOKENS_KEYS = ("max_tokens", "max_output_tokens", "max_completion_tokens")
+
+
+def _streaming_handler_types() -> tuple[type, ...]:
+    try:
+        from langchain_core.tracers._streaming import _StreamingCallbackHandler, _V2StreamingCallbackHandler
+        return (_StreamingCallbackHandler, _V2StreamingCallbackHandler)
+    except ImportError:  # older langchain-core
+        from langchain_core.tracers._streaming import _StreamingCallbackHandler
+        return (_StreamingCallbackHandler,)
+
+
+def has_live_consumer(config: RunnableConfig | None) -> bool:
+    """True when a streaming callback (LangGraph messages mode, ``astream_events``) is attached to the run."""
+    callbacks = ensure_config(config).get("callbacks")
+    if callbacks is None:
+        return False
+    handlers: list[Any] = callbacks if isinstance(callbacks, list) else getattr(callbacks, "handlers", [])
+    return any(isinstance(handler, _streaming_handler_types()) for handler in handlers)
+
+
+def expected_output_tokens(model: Any, config: RunnableConfig | None, kwargs: dict[str, Any], structured: bool) -> int | None:
+    """
+    Return the expected output size of a call, or None when unknown.
+
+    Pops the ``expected_output_tokens`` keyword from *kwargs*.
+    """
+    expected = kwargs.pop("expected_output_tokens", None)
+    if expected is None:
+        expected = ((config or {}).get("metadata") or {}).get("expected_output_tokens")
+    if expected is not None:
+        return int(expected)
+    for key in _MAX_TOKENS_KEYS:
+        if kwargs.get(key):
+            return int(kwargs[key])
+    if structured:
+        return 0
+    for key in _MAX_TOKENS_KEYS:
+        value = getattr(model, key, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+class AutoStreamingLLM(ChatModelWrapper):
+    """
+    Chat model that streams a call only when it is consumed live and its output is long.
+
+    Args:
+        model: Underlying chat model, built without a fixed ``streaming`` setting
+        min_output_tokens: Smallest expected output worth streaming
+        structured: Whether the model returns structured output (short unless a size is given)
+        bound: Runnable to call when streaming; defaults to *model* (a tool-bound model when tools are bound)
+        tools: Tools and ``bind_tools`` kwargs, rebound on the non-streaming copy
+    """
+
+    min_output_tokens: int = DEFAULT_STREAMING_MIN_OUTPUT_TOKENS
+    structured: bool = False
+    tools: tuple[Any, dict[str, Any]] | None = None
+    _non_streaming: Any = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        model: Any,
+        min_output_tokens: int = DEFAULT_STREAMING_MIN_OUTPUT_TOKENS,
+        structured: bool = False,
+        bound: Any = None,
+        tools: tuple[Any, dict[str, Any]] | None = None,
+    ):
+        super().__init__(model, bound, min_output_tokens=min_output_tokens, structured=structured, tools=tools)
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "AutoStreamingLLM":
+        tools = list(tools)
+        return AutoStreamingLLM(
+            self.model, self.min_output_tokens, self.structured,
+            bound=self.model.bind_tools(tools, **kwargs), tools=(tools, kwargs),
+        )
+
+    def model_copy(self, *, update: dict[str, Any] | None = None, deep: bool = False) -> "AutoStreamingLLM":
+        """Copy the underlying model (e.g. for a per-call variant) and keep the streaming choice."""
+        return AutoStreamingLLM(self.model.model_copy(update=update, deep=deep), self.min_output_tokens, self.structured)
+
+    def _non_streaming_runnable(self) -> Any:
+        if self._non_streaming is None:
+            model = self.model.model_copy(update={"disable_streaming": True})
+            self._non_streaming = model.bind_tools(self.tools[0], **self.tools[1]) if self.tools is not None else model
+        return self._non_streaming
+
+    def should_stream(self, live: bool, config: RunnableConfig | None, kwargs: dict[str, Any]) -> bool:
+        """Decide one call; pops ``expected_output_tokens`` from *kwargs*."""
+        # with_structured_output calls carry their schema as ls_structured_output_format
+        structured = self.structured or "ls_structured_output_format" in kwargs
+        expected = expected_output_tokens(self.model, config, kwargs, structured)
+        stream = live and (expected is None or expected >= self.min_output_tokens)
+        logger.debug(f"[LLM] Streaming={stream} (live={live}, expected_output_tokens={expected})")
+        return stream
+
+    def _runnable(self, live: bool, config: RunnableConfig | None, kwargs: dict[str, Any]) -> Any:
+        if self.should_stream(live, config, kwargs):
+            return self.bound
+        # Without a live consumer the model does not stream on its own
+        return self._non_streaming_runnable() if live else self.bound
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        return self._runnable(has_live_consumer(config), config, kwargs).invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        return await self._runnable(has_live_consumer(config), config, kwargs).ainvoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        yield from self._runnable(True, config, kwargs).stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async for chunk in self._runnable(True, config, kwargs).astream(input, config, **kwargs):
+            yield chunk
@@ -0,0 +1,414 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Offline batch inference through provider batch APIs.
+
+Bulk jobs that do not need interactive latency (evaluations, backfills,
+offline enrichment) should not compete with user traffic for the
+synchronous chat quota. ``BatchRunner`` submits prompts as provider batch
+jobs (OpenAI / Azure OpenAI Batch, Amazon Bedrock batch inference), polls
+them and yields results as each job finishes.
+
+Large inputs are split into several jobs of ``chunk_size`` requests, so the
+first results arrive while later jobs are still running.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+    from cnoe_agent_utils.batch import load_batch_requests
+
+    runner = LLMFactory("openai").get_batch_runner(chunk_size=500)
+    for result in runner.run(load_batch_requests("prompts.jsonl")):
+        print(result.custom_id, result.content or result.error)
+"""
+
+import asyncio
+import io
+import json
+import logging
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of requests per batch job, per provider
+PROVIDER_BATCH_LIMITS: dict[str, int] = {
+    "openai": 50_000,
+    "azure_openai": 100_000,
+    "aws_bedrock": 50_000,
+}
+DEFAULT_BATCH_POLL_INTERVAL = 30.0
+
+# (custom_id, messages, per-request body parameters)
+BatchRecord = tuple[str, list[dict[str, Any]], dict[str, Any]]
+
+
+class BatchResult:
+    """
+    Result of one request in a batch job.
+
+    Args:
+        custom_id: Identifier of the originating request
+        content: Response text, or None if the request failed
+        usage: Token usage reported by the provider
+        error: Error description if the request failed
+        raw: The provider's raw result record
+    """
+
+    def __init__(
+        self,
+        custom_id: str,
+        content: str | None = None,
+        usage: dict[str, Any] | None = None,
+        error: str | None = None,
+        raw: Any = None,
+    ):
+        self.custom_id = custom_id
+        self.content = content
+        self.usage = usage or {}
+        self.error = error
+        self.raw = raw
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"BatchResult(custom_id={self.custom_id!r}, {status})"
+
+
+def _to_messages(prompt: Any) -> list[dict[str, Any]]:
+    """Convert a prompt (string, message dicts, LangChain messages or tuples) to role/content dicts."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    messages = []
+    for message in prompt:
+        if isinstance(message, dict):
+            messages.append({"role": message["role"], "content": message["content"]})
+        elif isinstance(message, tuple):
+            messages.append({"role": message[0], "content": message[1]})
+        else:
+            role = {"human": "user", "ai": "assistant"}.get(message.type, message.type)
+            messages.append({"role": role, "content": message.content})
+    return messages
+
+
+def normalize_batch_requests(requests: Iterable[Any]) -> list[BatchRecord]:
+    """
+    Normalize batch inputs to ``(custom_id, messages, params)`` records.
+
+    Each item may be a prompt string, a list of messages, or a dict with
+    ``prompt`` or ``messages`` plus optional ``custom_id`` and extra body
+    parameters (e.g. ``max_tokens``). Missing ids default to ``request-<n>``.
+
+    Raises:
+        ValueError: If custom ids are duplicated or an item has no prompt
+    """
+    records: list[BatchRecord] = []
+    seen = set()
+    for index, item in enumerate(requests):
+        params: dict[str, Any] = {}
+        custom_id = f"request-{index}"
+        if isinstance(item, dict):
+            params = dict(item)
+            custom_id = str(params.pop("custom_id", custom_id))
+            prompt = params.pop("messages", None) or params.pop("prompt", None)
+            if prompt is None:
+                raise ValueError(f"Batch request {custom_id} has no 'prompt' or 'messages'")
+        else:
+            prompt = item
+        if custom_id in seen:
+            raise ValueError(f"Duplicate batch custom_id: {custom_id}")
+        seen.add(custom_id)
+        records.append((custom_id, _to_messages(prompt), params))
+    return records
+
+
+def load_batch_requests(path: str) -> list[Any]:
+    """Read batch requests from a JSONL file (one JSON string or object per line)."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class OpenAIBatchBackend:
+    """
+    Batch backend for the OpenAI Batch API (also used for Azure OpenAI).
+
+    Args:
+        client: ``openai.OpenAI`` or ``openai.AzureOpenAI`` client
+        model: Model name (deployment name on Azure)
+        endpoint: Batch endpoint for every request
+        completion_window: Completion window requested from the provider
+        default_params: Body parameters added to every request
+    """
+
+    TERMINAL_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        endpoint: str = "/v1/chat/completions",
+        completion_window: str = "24h",
+        default_params: dict[str, Any] | None = None,
+    ):
+        self.client = client
+        self.model = model
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+        self.default_params = default_params or {}
+
+    def submit(self, records: list[BatchRecord]) -> str:
+        lines = []
+        for custom_id, messages, params in records:
+            body = {"model": self.model, "messages": messages, **self.default_params, **params}
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": body}))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        input_file = self.client.files.create(file=("batch.jsonl", io.BytesIO(data)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self.endpoint,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def poll(self, job_id: str) -> tuple[str, bool]:
+        status = self.client.batches.retrieve(job_id).status
+        return status, status in self.TERMINAL_STATES
+
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        batch = self.client.batches.retrieve(job_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield self._parse(json.loads(line))
+
+    def cancel(self, job_id: str) -> None:
+        self.client.batches.cancel(job_id)
+
+    @staticmethod
+    def _parse(record: dict[str, Any]) -> BatchResult:
+        custom_id = record.get("custom_id", "")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        error = record.get("error") or body.get("error")
+        if error or response.get("status_code", 200) >= 400:
+            message = error.get("message") if isinstance(error, dict) else error
+            return BatchResult(custom_id, error=str(message or f"status {response.get('status_code')}"), raw=record)
+        choices = body.get("choices") or [{}]
+        content = (choices[0].get("message") or {}).get("content")
+        return BatchResult(custom_id, content=content, usage=body.get("usage"), raw=record)
+
+
+def anthropic_bedrock_body(messages: list[dict[str, Any]], params: dict[str, Any]) -> dict[str, Any]:
+    """Build an Anthropic Messages request body for Bedrock batch inference."""
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 1024,
+        "messages": [m for m in messages if m["role"] != "system"],
+        **params,
+    }
+    if system:
+        body["system"] = system
+    return body
+
+
+class BedrockBatchBackend:
+    """
+    Batch backend for Amazon Bedrock batch inference (``CreateModelInvocationJob``).
+
+    Inputs are written to S3 under ``input_s3_uri``; Bedrock writes results
+    under ``output_s3_uri/<job id>/``. Bedrock requires at least 100 records
+    per job, so keep ``chunk_size`` at or above that.
+
+    Args:
+        bedrock_client: boto3 ``bedrock`` control-plane client
+        s3_client: boto3 ``s3`` client
+        model_id: Bedrock model ID
+        role_arn: IAM role Bedrock assumes to read and write the S3 locations
+        input_s3_uri: S3 prefix for job input files
+        output_s3_uri: S3 prefix for job output
+        body_builder: Builds the model request body from (messages, params);
+                      defaults to the Anthropic Messages format
+        default_params: Body parameters added to every request
+    """
+
+    TERMINAL_STATES = frozenset({"Completed", "PartiallyCompleted", "Failed", "Stopped", "Expired"})
+
+    def __init__(
+        self,
+        bedrock_client: Any,
+        s3_client: Any,
+        model_id: str,
+        role_arn: str,
+        input_s3_uri: str,
+        output_s3_uri: str,
+        body_builder: Callable[[list[dict[str, Any]], dict[str, Any]], dict[str, Any]] = anthropic_bedrock_body,
+        default_params: dict[str, Any] | None = None,
+    ):
+        self.bedrock = bedrock_client
+        self.s3 = s3_client
+        self.model_id = model_id
+        self.role_arn = role_arn
+        self.input_s3_uri = input_s3_uri.rstrip("/")
+        self.output_s3_uri = output_s3_uri.rstrip("/")
+        self.body_builder = body_builder
+        self.default_params = default_params or {}
+        self._input_names: dict[str, str] = {}
+
+    @staticmethod
+    def _split_s3_uri(uri: str) -> tuple[str, str]:
+        bucket, _, key = uri.removeprefix("s3://").partition("/")
+        return bucket, key
+
+    def submit(self, records: list[BatchRecord]) -> str:
+        job_name = f"cnoe-batch-{uuid.uuid4().hex[:12]}"
+        file_name = f"{job_name}.jsonl"
+        lines = [
+            json.dumps({"recordId": custom_id, "modelInput": self.body_builder(messages, {**self.default_params, **params})})
+            for custom_id, messages, params in records
+        ]
+        bucket, prefix = self._split_s3_uri(f"{self.input_s3_uri}/{file_name}")
+        self.s3.put_object(Bucket=bucket, Key=prefix, Body=("\n".join(lines) + "\n").encode("utf-8"))
+        response = self.bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=self.model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"{self.input_s3_uri}/{file_name}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"{self.output_s3_uri}/"}},
+        )
+        job_arn = response["jobArn"]
+        self._input_names[job_arn] = file_name
+        return job_arn
+
+    def poll(self, job_id: str) -> tuple[str, bool]:
+        status = self.bedrock.get_model_invocation_job(jobIdentifier=job_id)["status"]
+        return status, status in self.TERMINAL_STATES
+
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        file_name = self._input_names.get(job_id)
+        if file_name is None:
+            job = self.bedrock.get_model_invocation_job(jobIdentifier=job_id)
+            file_name = job["inputDataConfig"]["s3InputDataConfig"]["s3Uri"].rsplit("/", 1)[-1]
+        bucket, key = self._split_s3_uri(f"{self.output_s3_uri}/{job_id.rsplit('/', 1)[-1]}/{file_name}.out")
+        try:
+            body = self.s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"[LLM][batch] No Bedrock output for {job_id}: {e}")
+            return
+        for line in body.splitlines():
+            if line.strip():
+                yield self._parse(json.loads(line))
+
+    def cancel(self, job_id: str) -> None:
+        self.bedrock.stop_model_invocation_job(jobIdentifier=job_id)
+
+    @staticmethod
+    def _parse(record: dict[str, Any]) -> BatchResult:
+        custom_id = record.get("recordId", "")
+        error = record.get("error")
+        if error:
+            message = error.get("errorMessage") if isinstance(error, dict) else error
+            return BatchResult(custom_id, error=str(message), raw=record)
+        output = record.get("modelOutput") or {}
+        content = "".join(
+            part.get("text", "") for part in output.get("content", []) if isinstance(part, dict)
+        )
+        return BatchResult(custom_id, content=content, usage=output.get("usage"), raw=record)
+
+
+class BatchRunner:
+    """
+    Submit requests as provider batch jobs and yield results as jobs finish.
+
+    Args:
+        backend: Provider backend (``OpenAIBatchBackend`` or ``BedrockBatchBackend``)
+        chunk_size: Maximum requests per job; larger inputs are split into several jobs
+        poll_interval: Seconds between status polls
+        timeout: Give up (and cancel outstanding jobs) after this many seconds; None waits forever
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        chunk_size: int = 50_000,
+        poll_interval: float = DEFAULT_BATCH_POLL_INTERVAL,
+        timeout: float | None = None,
+    ):
+        self.backend = backend
+        self.chunk_size = max(1, chunk_size)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._job_ids: dict[str, list[str]] = {}
+
+    def submit(self, requests: Iterable[Any]) -> list[str]:
+        """Submit requests and return the provider job ids, one per chunk."""
+        records = normalize_batch_requests(requests)
+        job_ids = []
+        for i in range(0, len(records), self.chunk_size):
+            chunk = records[i:i + self.chunk_size]
+            job_id = self.backend.submit(chunk)
+            self._job_ids[job_id] = [custom_id for custom_id, _, _ in chunk]
+            job_ids.append(job_id)
+            logger.info(f"[LLM][batch] Submitted job {job_id} with {len(chunk)} requests")
+        return job_ids
+
+    def _collect(self, job_id: str, status: str) -> Iterator[BatchResult]:
+        """Yield a finished job's results plus an error result for every request it dropped."""
+        expected = self._job_ids.pop(job_id, [])
+        returned = set()
+        for result in self.backend.results(job_id):
+            returned.add(result.custom_id)
+            yield result
+        for custom_id in expected:
+            if custom_id not in returned:
+                yield BatchResult(custom_id, error=f"batch job {job_id} ended with status {status}")
+
+    def _check_timeout(self, started: float, pending: list[str]) -> None:
+        if self.timeout is not None and time.monotonic() - started > self.timeout:
+            for job_id in pending:
+                try:
+                    self.backend.cancel(job_id)
+                except Exception as e:  # noqa: BLE001
+                    logger.warning(f"[LLM][batch] Failed to cancel job {job_id}: {e}")
+            raise TimeoutError(f"Batch jobs still running after {self.timeout}s: {', '.join(pending)}")
+
+    def iter_results(self, job_ids: Iterable[str]) -> Iterator[BatchResult]:
+        """Poll jobs and yield their results as each one reaches a terminal state."""
+        pending = list(job_ids)
+        started = time.monotonic()
+        while pending:
+            for job_id in list(pending):
+                status, done = self.backend.poll(job_id)
+                if done:
+                    pending.remove(job_id)
+                    logger.info(f"[LLM][batch] Job {job_id} finished with status {status}")
+                    yield from self._collect(job_id, status)
+            if pending:
+                self._check_timeout(started, pending)
+                time.sleep(self.poll_interval)
+
+    def run(self, requests: Iterable[Any]) -> Iterator[BatchResult]:
+        """Submit requests and yield results as they become available."""
+        return self.iter_results(self.submit(requests))
+
+    async def arun(self, requests: Iterable[Any]) -> AsyncIterator[BatchResult]:
+        """Async variant of ``run``; provider calls run in a worker thread."""
+        pending = await asyncio.to_thread(self.submit, requests)
+        started = time.monotonic()
+        while pending:
+            for job_id in list(pending):
+                status, done = await asyncio.to_thread(self.backend.poll, job_id)
+                if done:
+                    pending.remove(job_id)
+                    logger.info(f"[LLM][batch] Job {job_id} finished with status {status}")
+                    for result in await asyncio.to_thread(list, self._collect(job_id, status)):
+                        yield result
+            if pending:
+                self._check_timeout(started, pending)
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,241 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Cascading escalation from a fast model to a strong model.
+
+``CascadeLLM`` sends each request to the fastest tier first and only
+escalates to the next, stronger tier when a validator rejects the answer:
+structured output that does not parse, a self-reported confidence below a
+threshold, or any custom check. Most traffic then stays on the low-latency
+tier while quality holds for the requests that need more.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+    from cnoe_agent_utils.cascade import confidence_validator, structured_output_validator
+
+    llm = LLMFactory("openai").get_cascade_llm(
+        models=["gpt-4o-mini", "gpt-4o"],
+        validators=[structured_output_validator(Answer), confidence_validator(0.7)],
+    )
+    llm.invoke("...")
+    llm.get_stats()  # escalation rate and added latency
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, ValidationError
+
+from .routing import ModelTier, TieredLLM, request_text
+
+logger = logging.getLogger(__name__)
+
+# A validator receives the model response and returns True/None to accept it,
+# or False / a rejection reason string to escalate.
+Validator = Callable[[Any], bool | str | None]
+
+_CONFIDENCE_RE = re.compile(r'"?confidence"?\s*[:=]\s*"?([0-9]*\.?[0-9]+)\s*(%?)', re.IGNORECASE)
+
+
+def _extract_json(text: str) -> Any:
+    """Parse the first JSON object in ``text`` (tolerates markdown fences and prose)."""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object found")
+    return json.loads(text[start:end + 1])
+
+
+def structured_output_validator(schema: type[BaseModel]) -> Validator:
+    """Reject responses whose JSON body does not validate against ``schema``."""
+    def validate(response: Any) -> bool | str:
+        if isinstance(response, schema):
+            return True
+        tool_calls = getattr(response, "tool_calls", None)
+        try:
+            if tool_calls:
+                schema.model_validate(tool_calls[0].get("args") or {})
+            else:
+                schema.model_validate(_extract_json(request_text(response)))
+        except (ValueError, ValidationError) as e:
+            return f"structured output invalid: {str(e).splitlines()[0]}"
+        return True
+
+    validate.__name__ = f"structured_output[{schema.__name__}]"
+    return validate
+
+
+def confidence_validator(threshold: float, field: str = "confidence") -> Validator:
+    """
+    Reject responses whose self-reported confidence is below ``threshold``.
+
+    Confidence is read from a ``field`` attribute (structured output), a JSON
+    key, or a ``confidence: 0.8`` / ``confidence: 80%`` marker in the text.
+    Responses without a confidence value are rejected.
+    """
+    def validate(response: Any) -> bool | str:
+        value = getattr(response, field, None) if not hasattr(response, "content") else None
+        if value is None:
+            text = request_text(response)
+            try:
+                data = _extract_json(text)
+                value = data.get(field) if isinstance(data, dict) else None
+            except ValueError:
+                value = None
+            if value is None:
+                match = _CONFIDENCE_RE.search(text)
+                if match:
+                    value = float(match.group(1)) / (100 if match.group(2) else 1)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return "no self-reported confidence"
+        if value > 1.0:
+            value = value / 100
+        if value < threshold:
+            return f"confidence {value:.2f} below {threshold:.2f}"
+        return True
+
+    validate.__name__ = f"confidence>={threshold}"
+    return validate
+
+
+class CascadeStats:
+    """Thread-safe counters for cascade escalations."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.escalations = 0
+        self.added_latency = 0.0
+        self.accepted_by_tier: dict[str, int] = {}
+        self.rejections_by_reason: dict[str, int] = {}
+
+    def record(self, accepted_tier: str, rejected: list[tuple[str, str, float]]) -> None:
+        with self._lock:
+            self.requests += 1
+            self.accepted_by_tier[accepted_tier] = self.accepted_by_tier.get(accepted_tier, 0) + 1
+            if rejected:
+                self.escalations += 1
+            for _, reason, latency in rejected:
+                self.added_latency += latency
+                key = reason.split(":")[0]
+                self.rejections_by_reason[key] = self.rejections_by_reason.get(key, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return escalation rate, added latency and per-tier acceptance counts."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "escalations": self.escalations,
+                "escalation_rate": self.escalations / self.requests if self.requests else 0.0,
+                "added_latency": self.added_latency,
+                "avg_added_latency_per_escalation": self.added_latency / self.escalations if self.escalations else 0.0,
+                "accepted_by_tier": dict(self.accepted_by_tier),
+                "rejections_by_reason": dict(self.rejections_by_reason),
+            }
+
+
+class CascadeLLM(TieredLLM):
+    """
+    Chat-model runnable that escalates through tiers until validators accept.
+
+    Tiers are tried in order (fastest first). The last tier's answer is
+    returned even if validators reject it. Responses that call tools are
+    accepted without validation: in an agent's tool loop they are steps
+    toward an answer, not the answer itself. Because answers must be validated
+    before they are released, ``stream`` yields the accepted response as a
+    single chunk.
+    """
+
+    def __init__(
+        self,
+        factory: Any,
+        tiers: Iterable[ModelTier],
+        validators: Iterable[Validator] = (),
+        tools: list[Any] | None = None,
+        llm_kwargs: dict[str, Any] | None = None,
+        stats: CascadeStats | None = None,
+    ):
+        super().__init__(factory, tools, llm_kwargs)
+        self.tiers = list(tiers)
+        if not self.tiers:
+            raise ValueError("CascadeLLM requires at least one ModelTier")
+        self.validators = list(validators)
+        self.stats = stats or CascadeStats()
+
+    def bind_tools(self, tools: Iterable[Any], **kwargs: Any) -> "CascadeLLM":
+        """Return a cascade with *tools* bound on every tier."""
+        return CascadeLLM(self.factory, self.tiers, self.validators, list(tools), self._bound_kwargs(kwargs), self.stats)
+
+    def check(self, response: Any) -> str | None:
+        """Run validators; return the first ``"<validator>: <reason>"`` rejection or None."""
+        if getattr(response, "tool_calls", None):
+            return None
+        for validator in self.validators:
+            name = getattr(validator, "__name__", "validator")
+            try:
+                result = validator(response)
+            except Exception as e:  # noqa: BLE001
+                return f"{name}: raised {e}"
+            if result is False:
+                return f"{name}: failed"
+            if isinstance(result, str):
+                return f"{name}: {result}"
+        return None
+
+    def _finish(self, tier: ModelTier, rejected: list[tuple[str, str, float]]) -> None:
+        self.stats.record(tier.name, rejected)
+        if rejected:
+            added = sum(latency for _, _, latency in rejected)
+            path = " -> ".join([name for name, _, _ in rejected] + [tier.name])
+            logger.info(
+                f"[LLM][cascade] escalated {path} ({rejected[-1][1]}); added_latency={added:.2f}s"
+            )
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        rejected: list[tuple[str, str, float]] = []
+        for index, tier in enumerate(self.tiers):
+            started = time.perf_counter()
+            response = self.get_model(tier).invoke(input, config, **kwargs)
+            reason = self.check(response) if index < len(self.tiers) - 1 else None
+            if reason is None:
+                self._finish(tier, rejected)
+                return response
+            rejected.append((tier.name, reason, time.perf_counter() - started))
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        rejected: list[tuple[str, str, float]] = []
+        for index, tier in enumerate(self.tiers):
+            started = time.perf_counter()
+            response = await self.get_model(tier).ainvoke(input, config, **kwargs)
+            reason = self.check(response) if index < len(self.tiers) - 1 else None
+            if reason is None:
+                self._finish(tier, rejected)
+                return response
+            rejected.append((tier.name, reason, time.perf_counter() - started))
+
+    def get_stats(self) -> dict[str, Any]:
+        """Return escalation rate, added latency and per-tier acceptance counts."""
+        return self.stats.snapshot()
+
+
+def tiers_from_env() -> list[ModelTier]:
+    """
+    Build cascade tiers from ``LLM_CASCADE_MODELS`` (comma-separated, fastest first).
+
+    Raises:
+        EnvironmentError: If the variable is not set
+    """
+    raw = os.getenv("LLM_CASCADE_MODELS")
+    if not raw:
+        raise OSError("LLM_CASCADE_MODELS environment variable is required for cascade mode")
+    models = [m.strip() for m in raw.split(",") if m.strip()]
+    return [ModelTier(m, model=m) for m in models]
@@ -0,0 +1,102 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Base class for the per-call chat model wrappers built by ``LLMFactory.get_llm()``.
+
+``token_budget.ContextSizedLLM``, ``quota.QuotaLimitedLLM``,
+``context_cache.ContextCachedLLM``, ``latency_profile.LatencyProfiledLLM``
+and ``auto_streaming.AutoStreamingLLM`` each adjust a call and forward it to
+the model they wrap. They are ``BaseChatModel`` subclasses, so code that
+requires a chat model accepts them (LangGraph's
+``create_react_agent(..., response_format=...)`` unwraps its model to a
+``BaseChatModel`` for the structured response), and ``bind``,
+``with_config`` and ``with_structured_output`` return runnables that still
+call the wrapper.
+
+Usage:
+    class TaggedLLM(ChatModelWrapper):
+        def invoke(self, input, config=None, **kwargs):
+            return self.bound.invoke(input, config, tags=["tagged"], **kwargs)
+"""
+
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableBinding, RunnableParallel, RunnableSequence
+
+
+class ChatModelWrapper(BaseChatModel):
+    """
+    Chat model that forwards every call to *bound*.
+
+    Subclasses override ``invoke``, ``ainvoke``, ``stream`` and ``astream``
+    to adjust calls, and ``bind_tools`` to return a wrapper around the
+    tool-bound model. Attributes the wrapper does not define (``model_name``,
+    ``temperature``, ...) are read from *model*.
+
+    Args:
+        model: Underlying chat model (or another wrapper)
+        bound: Runnable to call; defaults to *model* (a tool-bound model when tools are bound)
+    """
+
+    model: Any
+    bound: Any = None
+
+    def __init__(self, model: Any, bound: Any = None, **kwargs: Any):
+        super().__init__(model=model, bound=bound if bound is not None else model, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return getattr(self.model, "_llm_type", type(self).__name__)
+
+    def _resolve_model_profile(self) -> Any:
+        return getattr(self.model, "profile", None)
+
+    def _generate(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any,
+    ) -> ChatResult:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        return ChatResult(generations=[ChatGeneration(message=self.invoke(messages, config, stop=stop, **kwargs))])
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any,
+    ) -> ChatResult:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        return ChatResult(generations=[ChatGeneration(message=await self.ainvoke(messages, config, stop=stop, **kwargs))])
+
+    def get_num_tokens_from_messages(self, *args: Any, **kwargs: Any) -> int:
+        return self.model.get_num_tokens_from_messages(*args, **kwargs)
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.model.get_num_tokens(text)
+
+    def get_token_ids(self, text: str) -> list[int]:
+        return self.model.get_token_ids(text)
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        raise NotImplementedError(f"{type(self).__name__} does not support tools")
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        """Build structured output with *model*'s own method, calling the model through this wrapper."""
+        return self._reroute(self.model.with_structured_output(schema, **kwargs))
+
+    def _reroute(self, runnable: Any) -> Any:
+        """Return *runnable* with calls to *model* replaced by calls to this wrapper."""
+        if runnable is self.model:
+            return self
+        if isinstance(runnable, RunnableBinding):
+            return runnable.model_copy(update={"bound": self._reroute(runnable.bound)})
+        if isinstance(runnable, RunnableSequence):
+            return RunnableSequence(*(self._reroute(step) for step in runnable.steps), name=runnable.name)
+        if isinstance(runnable, RunnableParallel):
+            steps: dict[str, Any] = {key: self._reroute(step) for key, step in runnable.steps__.items()}
+            return RunnableParallel(steps)
+        return runnable
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose the wrapped model's attributes (model_name, temperature, ...)
+        if name.startswith("__") or name in self.__private_attributes__ or name in type(self).model_fields:
+            return super().__getattr__(name)
+        return getattr(self.model, name)
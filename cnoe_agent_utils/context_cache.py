@@ -0,0 +1,421 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Explicit context caching for Gemini (Google AI) and Vertex AI.
+
+Agents resend the same system prompt and tool schemas on every turn. Gemini
+can store that stable prefix server-side as *cached content* and bill it at
+the cached-token rate. ``ContextCachedLLM`` does this transparently:
+
+- the prefix (leading system messages plus bound tools) is hashed together
+  with the model; one cached-content handle is created per distinct prefix
+  and reused by every call in the process
+- the handle's TTL (``LLM_CONTEXT_CACHE_TTL``, default one hour) is renewed
+  when a call finds it close to expiry; a handle the provider no longer
+  knows is recreated once and the call retried
+- prefixes below the provider's minimum cacheable size
+  (``CONTEXT_CACHE_MIN_TOKENS`` or ``LLM_CONTEXT_CACHE_MIN_TOKENS``), calls
+  with ``tool_choice`` and failed cache creations use a normal request
+
+Cached calls send only the remaining messages with ``cached_content``; the
+system instruction and tools come from the cache. Cache reads show up as
+``cache_read`` tokens in the usage ledger.
+
+Usage:
+    export LLM_CONTEXT_CACHE=true   # or get_llm(context_cache=True)
+    llm = LLMFactory("google-gemini").get_llm(tools=tools)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableConfig
+from pydantic import Field
+
+from .chat_wrapper import ChatModelWrapper
+from .token_counting import TokenCounter, message_text
+from .tool_schemas import convert_tools_cached, tool_set_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_PROVIDERS = ("google_gemini", "gcp_vertexai")
+DEFAULT_CONTEXT_CACHE_TTL = 3600
+# Renew a handle when less than this fraction of its TTL is left
+RENEW_FRACTION = 0.25
+# How long a prefix whose cache creation failed uses normal requests
+CREATE_FAILURE_BACKOFF = 60.0
+
+# Minimum cacheable prefix by model-name prefix; the longest match wins
+CONTEXT_CACHE_MIN_TOKENS: dict[str, int] = {
+    "gemini-1.5": 32_768,
+    "gemini-2.0": 4_096,
+    "gemini-2.5-flash": 1_024,
+    "gemini-2.5-pro": 4_096,
+}
+VERTEXAI_CONTEXT_CACHE_MIN_TOKENS: dict[str, int] = {
+    "gemini-1.5": 32_768,
+    "gemini-2.0": 4_096,
+    "gemini-2.5": 2_048,
+}
+DEFAULT_CONTEXT_CACHE_MIN_TOKENS = 4_096
+
+
+def min_cache_tokens(provider: str, model_name: str | None) -> int:
+    """Return the provider's minimum cacheable prefix size for *model_name*."""
+    table = VERTEXAI_CONTEXT_CACHE_MIN_TOKENS if provider == "gcp_vertexai" else CONTEXT_CACHE_MIN_TOKENS
+    name = (model_name or "").lower().rsplit("/", 1)[-1]
+    matches = [prefix for prefix in table if name.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else DEFAULT_CONTEXT_CACHE_MIN_TOKENS
+
+
+def _is_cache_miss(error: Exception) -> bool:
+    """True when *error* says the cached-content handle is gone or expired."""
+    text = str(error).lower()
+    return ("cachedcontent" in text or "cached content" in text or "cached_content" in text) and (
+        "not found" in text or "expired" in text or "404" in text or "permission denied" in text
+    )
+
+
+class GenAICacheBackend:
+    """
+    Cached-content API of the Google AI (Gemini API) client of a ``ChatGoogleGenerativeAI``.
+
+    Args:
+        llm: ``ChatGoogleGenerativeAI`` whose ``client`` creates the caches
+    """
+
+    def __init__(self, llm: Any):
+        self.llm = llm
+        self.scope = "genai"
+
+    def create(self, model_name: str, system_text: str, tools: list[Any], ttl: int) -> str:
+        from google.genai import types
+        config: dict[str, Any] = {"ttl": f"{ttl}s"}
+        if system_text:
+            config["system_instruction"] = system_text
+        if tools:
+            from langchain_google_genai._function_utils import convert_to_genai_function_declarations
+            config["tools"] = convert_to_genai_function_declarations(tools)
+        cache = self.llm.client.caches.create(model=model_name, config=types.CreateCachedContentConfig(**config))
+        return cache.name
+
+    def renew(self, name: str, ttl: int) -> None:
+        from google.genai import types
+        self.llm.client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+
+    def delete(self, name: str) -> None:
+        self.llm.client.caches.delete(name=name)
+
+
+class VertexCacheBackend:
+    """
+    Vertex AI cached-content API for a ``ChatVertexAI``.
+
+    Args:
+        llm: ``ChatVertexAI`` whose project, location and credentials own the caches
+    """
+
+    def __init__(self, llm: Any):
+        self.llm = llm
+        self.scope = f"vertexai:{getattr(llm, 'project', '')}:{getattr(llm, 'location', '')}"
+
+    def create(self, model_name: str, system_text: str, tools: list[Any], ttl: int) -> str:
+        from datetime import timedelta
+
+        from langchain_google_vertexai.utils import create_context_cache
+        messages = [SystemMessage(content=system_text)] if system_text else []
+        return create_context_cache(self.llm, messages, time_to_live=timedelta(seconds=ttl), tools=tools or None)
+
+    def renew(self, name: str, ttl: int) -> None:
+        from datetime import timedelta
+
+        from vertexai.caching import CachedContent
+        CachedContent(cached_content_name=name).update(ttl=timedelta(seconds=ttl))
+
+    def delete(self, name: str) -> None:
+        from vertexai.caching import CachedContent
+        CachedContent(cached_content_name=name).delete()
+
+
+def cache_backend_for(provider: str, llm: Any) -> Any:
+    """Return the cached-content backend for *provider*, or None when it has none."""
+    if provider == "google_gemini":
+        return GenAICacheBackend(llm)
+    if provider == "gcp_vertexai":
+        return VertexCacheBackend(llm)
+    return None
+
+
+class ContextCacheStore:
+    """
+    Process-wide map from prefix hash to a cached-content handle and its expiry.
+
+    A ``None`` handle records a failed creation until it expires.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[str | None, float]] = {}
+        self._lock = threading.Lock()
+        # One lock per prefix serializes its create/renew calls; the store lock is never held across them
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._stats = {"created": 0, "renewed": 0, "hits": 0, "recreated": 0, "uncached": 0, "errors": 0}
+
+    def _lookup(self, key: str, ttl: int) -> tuple[bool, str | None, float]:
+        """Return (settled, handle, expiry): settled when the entry needs no network call. Call under ``_lock``."""
+        name, expires_at = self._entries.get(key, (None, 0.0))
+        now = time.time()
+        if expires_at > now and name is None:
+            return True, None, expires_at
+        if expires_at > now + ttl * RENEW_FRACTION:
+            self._stats["hits"] += 1
+            return True, name, expires_at
+        return False, name, expires_at
+
+    def handle(self, key: str, backend: Any, model_name: str, system_text: str, tools: list[Any], ttl: int) -> str | None:
+        """Return a live handle for *key*, creating or renewing it as needed."""
+        with self._lock:
+            settled, name, expires_at = self._lookup(key, ttl)
+            if settled:
+                return name
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another caller may have created or renewed the handle while this one waited
+            with self._lock:
+                settled, name, expires_at = self._lookup(key, ttl)
+            if settled:
+                return name
+            now = time.time()
+            try:
+                if expires_at > now:
+                    try:
+                        backend.renew(name, ttl)
+                        logger.debug(f"[LLM][cache] Renewed {name} for {ttl}s")
+                        with self._lock:
+                            self._stats["renewed"] += 1
+                            self._entries[key] = (name, now + ttl)
+                        return name
+                    except Exception as e:
+                        if not _is_cache_miss(e):
+                            raise
+                        with self._lock:
+                            self._stats["recreated"] += 1
+                name = backend.create(model_name, system_text, tools, ttl)
+                logger.info(f"[LLM][cache] Created {name} for {model_name} (ttl={ttl}s)")
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"[LLM][cache] Could not cache prefix for {model_name}, using normal requests: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._entries[key] = (None, now + CREATE_FAILURE_BACKOFF)
+                return None
+            with self._lock:
+                self._stats["created"] += 1
+                self._entries[key] = (name, now + ttl)
+            return name
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.pop(key)
+                self._stats["recreated"] += 1
+
+    def count_uncached(self) -> None:
+        with self._lock:
+            self._stats["uncached"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._key_locks.clear()
+            for stat in self._stats:
+                self._stats[stat] = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"entries": sum(1 for name, _ in self._entries.values() if name), **self._stats}
+
+
+_store = ContextCacheStore()
+
+
+def get_context_cache_store() -> ContextCacheStore:
+    """Return the process-wide cached-content store."""
+    return _store
+
+
+class ContextCachedLLM(ChatModelWrapper):
+    """
+    Chat model that serves the system prompt and tools from a cached-content handle.
+
+    Args:
+        model: Underlying ``ChatGoogleGenerativeAI`` or ``ChatVertexAI``
+        provider: Normalized provider name ("google_gemini" or "gcp_vertexai")
+        model_name: Model the caches are created for
+        backend: Cached-content backend; defaults to ``cache_backend_for(provider, model)``
+        ttl: Handle lifetime in seconds, renewed on use
+        min_tokens: Smallest prefix worth caching; defaults to ``min_cache_tokens``
+        counter: Token counter for the prefix estimate
+        store: Handle store; defaults to the process-wide store
+        tools: Tools baked into the cached prefix
+        bound: Runnable for uncached calls; defaults to *model*
+        tool_choice: Forces uncached calls, since a forced tool choice is not part of the cache
+    """
+
+    provider: str
+    model_name: str | None = None
+    backend: Any
+    ttl: int = DEFAULT_CONTEXT_CACHE_TTL
+    min_tokens: int
+    counter: TokenCounter
+    store: ContextCacheStore
+    tools: list[Any] = Field(default_factory=list)
+    tool_choice: Any = None
+    tool_tokens: int = 0
+
+    def __init__(
+        self,
+        model: Any,
+        provider: str,
+        model_name: str,
+        backend: Any = None,
+        ttl: int = DEFAULT_CONTEXT_CACHE_TTL,
+        min_tokens: int | None = None,
+        counter: TokenCounter | None = None,
+        store: ContextCacheStore | None = None,
+        tools: list[Any] | None = None,
+        bound: Any = None,
+        tool_choice: Any = None,
+    ):
+        counter = counter or TokenCounter(provider, model_name)
+        tools = tools or []
+        super().__init__(
+            model,
+            bound,
+            provider=provider,
+            model_name=model_name,
+            backend=backend if backend is not None else cache_backend_for(provider, model),
+            ttl=ttl,
+            min_tokens=min_tokens if min_tokens is not None else min_cache_tokens(provider, model_name),
+            counter=counter,
+            store=store or get_context_cache_store(),
+            tools=tools,
+            tool_choice=tool_choice,
+            tool_tokens=(
+                counter.count_text(json.dumps(convert_tools_cached(tools, strict=False), default=str)) if tools else 0
+            ),
+        )
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ContextCachedLLM":
+        """Bind tools: cached calls take them from the cache, uncached calls from a tool-bound model."""
+        tools = list(tools)
+        return ContextCachedLLM(
+            self.model, self.provider, self.model_name, self.backend, self.ttl, self.min_tokens,
+            self.counter, self.store, tools=tools, bound=self.model.bind_tools(tools, **kwargs),
+            tool_choice=kwargs.get("tool_choice"),
+        )
+
+    def _plan(self, input: Any, kwargs: dict[str, Any]) -> tuple[str | None, Any, str | None]:
+        """Return (prefix key, remaining messages, system text), or a None key when the call is uncached."""
+        # Tools passed per call (e.g. by with_structured_output) are not part of the cache
+        if self.tool_choice or kwargs.get("tools") or kwargs.get("tool_choice"):
+            return None, input, None
+        messages = self.model._convert_input(input).to_messages()
+        split = 0
+        while split < len(messages) and isinstance(messages[split], SystemMessage):
+            split += 1
+        if split == len(messages) or (split == 0 and not self.tools):
+            return None, input, None
+        system_text = "\n\n".join(message_text(message) for message in messages[:split])
+        prefix_tokens = (self.counter.count_text(system_text) if system_text else 0) + self.tool_tokens
+        if prefix_tokens < self.min_tokens:
+            logger.debug(f"[LLM][cache] Prefix ~{prefix_tokens} tokens is below the {self.min_tokens} minimum")
+            return None, input, None
+        digest = hashlib.sha256()
+        for part in (self.backend.scope, self.model_name, system_text, tool_set_fingerprint(self.tools)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest(), messages[split:], system_text
+
+    def _handle(self, key: str, system_text: str) -> str | None:
+        return self.store.handle(key, self.backend, self.model_name, system_text, self.tools, self.ttl)
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        key, rest, system_text = self._plan(input, kwargs)
+        for _ in range(2):
+            name = self._handle(key, system_text) if key else None
+            if name is None:
+                self.store.count_uncached()
+                return self.bound.invoke(input, config, **kwargs)
+            try:
+                return self.model.invoke(rest, config, cached_content=name, **kwargs)
+            except Exception as e:
+                if not _is_cache_miss(e):
+                    raise
+                logger.info(f"[LLM][cache] {name} is gone, recreating it")
+                self.store.invalidate(key)
+        self.store.count_uncached()
+        return self.bound.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        key, rest, system_text = self._plan(input, kwargs)
+        for _ in range(2):
+            name = await asyncio.to_thread(self._handle, key, system_text) if key else None
+            if name is None:
+                self.store.count_uncached()
+                return await self.bound.ainvoke(input, config, **kwargs)
+            try:
+                return await self.model.ainvoke(rest, config, cached_content=name, **kwargs)
+            except Exception as e:
+                if not _is_cache_miss(e):
+                    raise
+                logger.info(f"[LLM][cache] {name} is gone, recreating it")
+                self.store.invalidate(key)
+        self.store.count_uncached()
+        return await self.bound.ainvoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        key, rest, system_text = self._plan(input, kwargs)
+        for _ in range(2):
+            name = self._handle(key, system_text) if key else None
+            if name is None:
+                break
+            started = False
+            try:
+                for chunk in self.model.stream(rest, config, cached_content=name, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not _is_cache_miss(e):
+                    raise
+                logger.info(f"[LLM][cache] {name} is gone, recreating it")
+                self.store.invalidate(key)
+        self.store.count_uncached()
+        yield from self.bound.stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        key, rest, system_text = self._plan(input, kwargs)
+        for _ in range(2):
+            name = await asyncio.to_thread(self._handle, key, system_text) if key else None
+            if name is None:
+                break
+            started = False
+            try:
+                async for chunk in self.model.astream(rest, config, cached_content=name, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not _is_cache_miss(e):
+                    raise
+                logger.info(f"[LLM][cache] {name} is gone, recreating it")
+                self.store.invalidate(key)
+        self.store.count_uncached()
+        async for chunk in self.bound.astream(input, config, **kwargs):
+            yield chunk
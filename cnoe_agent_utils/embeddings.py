@@ -0,0 +1,260 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Batching, de-duplicating and caching wrapper for embedding clients.
+
+``LLMFactory.get_embeddings()`` wraps the provider's LangChain embeddings
+client in ``BatchedEmbeddings``, which:
+
+- looks every text up in a content-hash cache (in-memory by default, or a
+  persistent SQLite file via ``EMBEDDINGS_CACHE_PATH``)
+- drops duplicate texts so each distinct text is embedded once
+- splits the remaining texts into batches up to the provider's limit
+- sends batches concurrently, bounded by ``EMBEDDINGS_MAX_CONCURRENCY``
+
+Results are returned in input order, so the wrapper is a drop-in
+replacement for any LangChain ``Embeddings`` object.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from .utils import env_int
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of inputs per embeddings request, per provider
+PROVIDER_EMBEDDING_BATCH_LIMITS: dict[str, int] = {
+    "openai": 2048,
+    "azure_openai": 2048,
+    "aws_bedrock": 1,       # Titan InvokeModel embeds one text per request
+    "google_gemini": 100,
+    "gcp_vertexai": 250,
+}
+DEFAULT_EMBEDDING_BATCH_SIZE = 100
+DEFAULT_EMBEDDING_MAX_CONCURRENCY = 4
+DEFAULT_MEMORY_CACHE_SIZE = 100_000
+
+
+def _pack(vector: list[float]) -> bytes:
+    return array("d", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    values = array("d")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class InMemoryEmbeddingCache:
+    """Bounded LRU cache of embeddings keyed by content hash."""
+
+    def __init__(self, max_entries: int = DEFAULT_MEMORY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                blob = self._data.get(key)
+                if blob is not None:
+                    self._data.move_to_end(key)
+                    found[key] = _unpack(blob)
+        return found
+
+    def set_many(self, items: dict[str, list[float]]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._data[key] = _pack(vector)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteEmbeddingCache:
+    """Persistent embedding cache stored in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, list[float]]:
+        keys = list(keys)
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = _unpack(blob)
+        return found
+
+    def set_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, _pack(vector)) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_embedding_cache():
+    """Return a SQLite cache if ``EMBEDDINGS_CACHE_PATH`` is set, else an in-memory cache."""
+    path = os.getenv("EMBEDDINGS_CACHE_PATH")
+    if path:
+        logger.info(f"[LLM] Using persistent embeddings cache at {path}")
+        return SQLiteEmbeddingCache(path)
+    return InMemoryEmbeddingCache(env_int("EMBEDDINGS_MEMORY_CACHE_SIZE", DEFAULT_MEMORY_CACHE_SIZE))
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper adding caching, de-duplication, batching and bounded concurrency.
+
+    Args:
+        embeddings: Underlying provider embeddings client
+        model_id: Identifier mixed into cache keys so models never share vectors
+        batch_size: Maximum texts per provider request
+        max_concurrency: Maximum provider requests in flight
+        cache: Cache object with ``get_many``/``set_many``; None disables caching
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_id: str,
+        batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = DEFAULT_EMBEDDING_MAX_CONCURRENCY,
+        cache=None,
+    ):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache = cache
+        self._stats_lock = threading.Lock()
+        self.stats = {"texts": 0, "cache_hits": 0, "duplicates": 0, "embedded": 0, "requests": 0}
+
+    def _key(self, text: str, kind: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\0{kind}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _plan(self, texts: list[str]) -> tuple[list[str], dict[str, list[float]], list[str]]:
+        """Return (keys per input, cached vectors, distinct texts still to embed)."""
+        keys = [self._key(text, "doc") for text in texts]
+        cached = self.cache.get_many(set(keys)) if self.cache is not None else {}
+        pending: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in pending:
+                pending[key] = text
+        with self._stats_lock:
+            self.stats["texts"] += len(texts)
+            self.stats["cache_hits"] += sum(1 for key in keys if key in cached)
+            self.stats["duplicates"] += len(texts) - len(set(keys))
+            self.stats["embedded"] += len(pending)
+        return keys, cached, list(pending.values())
+
+    def _batches(self, texts: list[str]) -> list[list[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _store(self, texts: list[str], vectors: list[list[float]], results: dict[str, list[float]]) -> None:
+        new = {self._key(text, "doc"): vector for text, vector in zip(texts, vectors)}
+        results.update(new)
+        if self.cache is not None:
+            self.cache.set_many(new)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, results, pending = self._plan(list(texts))
+        batches = self._batches(pending)
+        if batches:
+            with self._stats_lock:
+                self.stats["requests"] += len(batches)
+            if len(batches) == 1 or self.max_concurrency == 1:
+                outputs = [self.embeddings.embed_documents(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                    outputs = list(pool.map(self.embeddings.embed_documents, batches))
+            for batch, vectors in zip(batches, outputs):
+                self._store(batch, vectors, results)
+        return [results[key] for key in keys]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, results, pending = self._plan(list(texts))
+        batches = self._batches(pending)
+        if batches:
+            with self._stats_lock:
+                self.stats["requests"] += len(batches)
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def run(batch: list[str]) -> list[list[float]]:
+                async with semaphore:
+                    return await self.embeddings.aembed_documents(batch)
+
+            outputs = await asyncio.gather(*(run(batch) for batch in batches))
+            for batch, vectors in zip(batches, outputs):
+                self._store(batch, vectors, results)
+        return [results[key] for key in keys]
+
+    def _cached_query(self, text: str) -> tuple[str, list[float] | None]:
+        key = self._key(text, "query")
+        if self.cache is None:
+            return key, None
+        return key, self.cache.get_many([key]).get(key)
+
+    def embed_query(self, text: str) -> list[float]:
+        key, vector = self._cached_query(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            if self.cache is not None:
+                self.cache.set_many({key: vector})
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key, vector = self._cached_query(text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            if self.cache is not None:
+                self.cache.set_many({key: vector})
+        return vector
+
+    def get_stats(self) -> dict[str, int]:
+        """Return counts of texts seen, cache hits, duplicates dropped and provider requests."""
+        with self._stats_lock:
+            return dict(self.stats)
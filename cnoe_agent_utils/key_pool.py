@@ -0,0 +1,465 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""API key pools that spread requests over several keys of one provider.
+
+Providers rate-limit per key. With ``OPENAI_API_KEYS``, ``GROQ_API_KEYS`` or
+``ANTHROPIC_API_KEYS`` set to a comma-separated list, the chat model's HTTP
+client picks a key per request through an httpx transport that:
+
+- selects the least loaded key (fewest requests in flight) or rotates
+  round-robin (``LLM_KEY_POOL_STRATEGY``)
+- tracks each key's throttling state from the rate-limit response headers;
+  a key that gets a 429, or reports no remaining requests or tokens, sits
+  out until the reset time the provider announced
+- retries a 429 right away on another key that is not throttled, and waits
+  for the earliest reset when every key is throttled
+
+Pools are shared by every model of the process that uses the same keys, so
+throttling state is not lost when models are rebuilt.
+
+Usage:
+    OPENAI_API_KEYS=sk-a,sk-b,sk-c
+    LLM_KEY_POOL_STRATEGY=least_loaded   # or round_robin
+
+    from cnoe_agent_utils.key_pool import key_pool_stats
+    key_pool_stats()   # per key: in flight, requests, throttled, cooldown left
+"""
+
+import asyncio
+import email.utils
+import functools
+import importlib
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+import httpx
+from pydantic import Field
+
+from .openai_compatible import (
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    DEFAULT_TIMEOUT,
+    call_once,
+    tracked_stream_classes,
+)
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("least_loaded", "round_robin")
+# Cooldown after a 429 that carries no reset information
+DEFAULT_COOLDOWN = 10.0
+# Longest a request waits for a throttled key before it is sent anyway
+DEFAULT_MAX_WAIT = 60.0
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# (remaining header, reset header) pairs, OpenAI/Groq style then Anthropic style
+_LIMIT_HEADERS = (
+    ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+    ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+    ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+    ("anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+    ("anthropic-ratelimit-input-tokens-remaining", "anthropic-ratelimit-input-tokens-reset"),
+    ("anthropic-ratelimit-output-tokens-remaining", "anthropic-ratelimit-output-tokens-reset"),
+)
+
+
+def parse_api_keys(value: str | None) -> list[str]:
+    """Split a comma-separated list of API keys, dropping blanks and duplicates."""
+    keys: list[str] = []
+    for key in (value or "").split(","):
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def _mask(key: str) -> str:
+    return f"...{key[-4:]}" if len(key) > 8 else "..."
+
+
+def parse_reset(value: str | None, now: float | None = None) -> float | None:
+    """
+    Return the seconds until a rate-limit reset header value, or None if it cannot be parsed.
+
+    Accepts plain seconds (``retry-after: 12``), Go-style durations
+    (``6m0s``, ``20ms``), RFC 3339 timestamps and HTTP dates.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    now = time.time() if now is None else now
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value).timestamp() - now)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return None
+
+
+def throttle_seconds(status_code: int, headers: Any, default_cooldown: float = DEFAULT_COOLDOWN) -> float:
+    """
+    Return how long a key should sit out after a response, or 0 if it stays available.
+
+    A 429 sits out until the latest announced reset (``retry-after`` or the
+    rate-limit reset headers), else *default_cooldown*. Other responses sit
+    out only when a rate-limit header reports nothing remaining.
+    """
+    now = time.time()
+    waits = []
+    for remaining_header, reset_header in _LIMIT_HEADERS:
+        try:
+            exhausted = float(headers.get(remaining_header)) <= 0
+        except (TypeError, ValueError):
+            continue
+        reset = parse_reset(headers.get(reset_header), now) if exhausted else None
+        if reset is not None:
+            waits.append(reset)
+    if status_code == 429:
+        retry_after = parse_reset(headers.get("retry-after"), now)
+        if retry_after is not None:
+            waits.append(retry_after)
+        return max(waits) if waits else default_cooldown
+    return max(waits) if waits else 0.0
+
+
+class ApiKeyState:
+    """One key of a pool and its throttling state."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.available_at = 0.0
+
+    def __repr__(self) -> str:
+        return f"ApiKeyState({_mask(self.key)}, in_flight={self.in_flight})"
+
+
+class KeyPool:
+    """
+    Thread-safe selection of API keys with per-key throttling.
+
+    Args:
+        keys: API keys of one provider account set
+        strategy: "least_loaded" (fewest requests in flight) or "round_robin"
+        default_cooldown: Seconds a key sits out after a 429 without reset headers
+        max_wait: Longest a request waits when every key is throttled
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str],
+        strategy: str = "least_loaded",
+        default_cooldown: float = DEFAULT_COOLDOWN,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ):
+        self.keys = [ApiKeyState(key) for key in parse_api_keys(",".join(keys))]
+        if not self.keys:
+            raise ValueError("KeyPool requires at least one API key")
+        strategy = strategy.lower().replace("-", "_")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown key pool strategy '{strategy}'. Expected one of: {', '.join(STRATEGIES)}")
+        self.strategy = strategy
+        self.default_cooldown = default_cooldown
+        self.max_wait = max_wait
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude: Iterable[ApiKeyState] = ()) -> tuple[ApiKeyState, float]:
+        """
+        Pick a key for one request and count it as in flight.
+
+        Returns the key and how long to wait before using it: 0 unless every
+        candidate is throttled, in which case the key that resets first is
+        returned with the time left until its reset (capped at ``max_wait``).
+        """
+        excluded = {id(state) for state in exclude}
+        now = time.monotonic()
+        with self._lock:
+            candidates = [state for state in self.keys if id(state) not in excluded] or self.keys
+            ready = [state for state in candidates if state.available_at <= now]
+            if not ready:
+                state = min(candidates, key=lambda s: s.available_at)
+                wait = min(self.max_wait, state.available_at - now)
+            elif self.strategy == "round_robin":
+                state = min(ready, key=lambda s: (self.keys.index(s) - self._next) % len(self.keys))
+                self._next = (self.keys.index(state) + 1) % len(self.keys)
+                wait = 0.0
+            else:
+                state = min(ready, key=lambda s: (s.in_flight, s.requests))
+                wait = 0.0
+            state.in_flight += 1
+            state.requests += 1
+            return state, wait
+
+    def release(self, state: ApiKeyState) -> None:
+        with self._lock:
+            state.in_flight = max(0, state.in_flight - 1)
+
+    def observe(self, state: ApiKeyState, status_code: int, headers: Any) -> float:
+        """Update *state* from a response; return the seconds it now sits out."""
+        seconds = throttle_seconds(status_code, headers, self.default_cooldown)
+        if seconds <= 0:
+            return 0.0
+        with self._lock:
+            state.available_at = max(state.available_at, time.monotonic() + seconds)
+            state.throttled += status_code == 429
+        logger.info(f"[LLM][keys] key {_mask(state.key)} throttled (HTTP {status_code}) for {seconds:.1f}s")
+        return seconds
+
+    def has_ready(self, exclude: Iterable[ApiKeyState] = ()) -> bool:
+        """Return True if a key outside *exclude* is not throttled."""
+        excluded = {id(state) for state in exclude}
+        now = time.monotonic()
+        with self._lock:
+            return any(state.available_at <= now for state in self.keys if id(state) not in excluded)
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": _mask(state.key),
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "throttled": state.throttled,
+                    "cooldown_seconds": round(max(0.0, state.available_at - now), 3),
+                }
+                for state in self.keys
+            ]
+
+
+def _with_key(http: Any, request: Any, header: str, scheme: str, key: str, body: bytes) -> Any:
+    headers = [(k, v) for k, v in request.headers.raw if k.decode().lower() != header]
+    headers.append((header.encode(), f"{scheme}{key}".encode()))
+    return http.Request(request.method, request.url, headers=headers, content=body, extensions=request.extensions)
+
+
+@functools.cache
+def transport_classes(http: Any = httpx) -> tuple[type, type]:
+    """
+    Return the sync and async key pool transport classes for an httpx-compatible module.
+
+    Provider SDKs that ship their own fork of httpx only accept transports
+    and streams built on that fork.
+    """
+
+    def default_limits():
+        return http.Limits(
+            max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        )
+
+    TrackedStream, AsyncTrackedStream = tracked_stream_classes(http)
+
+    class KeyPoolTransport(http.BaseTransport):
+        """
+        Sync httpx transport that sends each request with a key from a ``KeyPool``.
+
+        Args:
+            pool: Key pool to draw from
+            header: Credential header, e.g. "authorization" or "x-api-key"
+            scheme: Prefix of the header value, e.g. "Bearer "
+            transport: Inner transport; defaults to an ``HTTPTransport``
+        """
+
+        def __init__(self, pool: KeyPool, header: str = "authorization", scheme: str = "Bearer ",
+                     transport: Any = None):
+            self.pool = pool
+            self.header = header.lower()
+            self.scheme = scheme
+            self._transport = transport or http.HTTPTransport(limits=default_limits())
+
+        def handle_request(self, request: Any) -> Any:
+            body = request.read()
+            tried: list[ApiKeyState] = []
+            while True:
+                state, wait = self.pool.acquire(exclude=tried)
+                release = call_once(lambda s=state: self.pool.release(s))
+                try:
+                    if wait > 0:
+                        time.sleep(wait)
+                    response = self._transport.handle_request(
+                        _with_key(http, request, self.header, self.scheme, state.key, body)
+                    )
+                except BaseException:
+                    release()
+                    raise
+                self.pool.observe(state, response.status_code, response.headers)
+                tried.append(state)
+                if response.status_code == 429 and self.pool.has_ready(exclude=tried):
+                    response.close()
+                    release()
+                    continue
+                return http.Response(
+                    response.status_code, headers=response.headers,
+                    stream=TrackedStream(response.stream, release), extensions=response.extensions,
+                )
+
+        def close(self) -> None:
+            self._transport.close()
+
+    class AsyncKeyPoolTransport(http.AsyncBaseTransport):
+        """Async counterpart of ``KeyPoolTransport``."""
+
+        def __init__(self, pool: KeyPool, header: str = "authorization", scheme: str = "Bearer ",
+                     transport: Any = None):
+            self.pool = pool
+            self.header = header.lower()
+            self.scheme = scheme
+            self._transport = transport or http.AsyncHTTPTransport(limits=default_limits())
+
+        async def handle_async_request(self, request: Any) -> Any:
+            body = await request.aread()
+            tried: list[ApiKeyState] = []
+            while True:
+                state, wait = self.pool.acquire(exclude=tried)
+                release = call_once(lambda s=state: self.pool.release(s))
+                try:
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    response = await self._transport.handle_async_request(
+                        _with_key(http, request, self.header, self.scheme, state.key, body)
+                    )
+                except BaseException:
+                    release()
+                    raise
+                self.pool.observe(state, response.status_code, response.headers)
+                tried.append(state)
+                if response.status_code == 429 and self.pool.has_ready(exclude=tried):
+                    await response.aclose()
+                    release()
+                    continue
+                return http.Response(
+                    response.status_code, headers=response.headers,
+                    stream=AsyncTrackedStream(response.stream, release), extensions=response.extensions,
+                )
+
+        async def aclose(self) -> None:
+            await self._transport.aclose()
+
+    return KeyPoolTransport, AsyncKeyPoolTransport
+
+
+KeyPoolTransport, AsyncKeyPoolTransport = transport_classes(httpx)
+
+
+_pools: dict[tuple[str, tuple[str, ...]], KeyPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_key_pool(name: str, keys: Iterable[str], strategy: str | None = None) -> KeyPool:
+    """
+    Return the process-wide pool for *name* and *keys*, creating it on first use.
+
+    *strategy* defaults to ``LLM_KEY_POOL_STRATEGY`` (least_loaded).
+    """
+    keys = tuple(parse_api_keys(",".join(keys)))
+    strategy = strategy or os.getenv("LLM_KEY_POOL_STRATEGY", "least_loaded")
+    with _pools_lock:
+        pool = _pools.get((name, keys))
+        if pool is None:
+            pool = _pools[(name, keys)] = KeyPool(keys, strategy=strategy)
+            logger.info(f"[LLM][keys] {name}: pool of {len(keys)} API keys, strategy={pool.strategy}")
+        return pool
+
+
+def key_pool_from_env(env_var: str) -> KeyPool | None:
+    """Return the pool for the keys in *env_var* (e.g. ``OPENAI_API_KEYS``), or None when it is unset."""
+    keys = parse_api_keys(os.getenv(env_var))
+    return get_key_pool(env_var, keys) if keys else None
+
+
+def key_pool_clients(
+    pool: KeyPool,
+    header: str = "authorization",
+    scheme: str = "Bearer ",
+    timeout: float | None = DEFAULT_TIMEOUT,
+    client_classes: tuple[type, type] | None = None,
+) -> tuple[Any, Any]:
+    """
+    Return sync and async HTTP clients that send every request with a key from *pool*.
+
+    *client_classes* are the (sync, async) client classes to build, e.g. a
+    provider SDK's default clients; they default to ``httpx.Client`` and
+    ``httpx.AsyncClient``. The transports are built on the same httpx module
+    as the classes.
+    """
+    sync_cls, async_cls = client_classes or (httpx.Client, httpx.AsyncClient)
+    http = importlib.import_module(
+        next(base for base in sync_cls.__mro__ if base.__name__ == "Client").__module__.partition(".")[0]
+    )
+    sync_transport, async_transport = transport_classes(http)
+    return (
+        sync_cls(transport=sync_transport(pool, header, scheme), timeout=timeout),
+        async_cls(transport=async_transport(pool, header, scheme), timeout=timeout),
+    )
+
+
+@functools.cache
+def key_pool_chat_anthropic() -> type:
+    """
+    Return a ``ChatAnthropic`` subclass that sends every request with a key from its ``key_pool``.
+
+    ChatAnthropic takes no HTTP client, so the subclass builds its SDK clients
+    itself, from the model's public settings and the key pool clients.
+    """
+    import anthropic
+    from langchain_anthropic import ChatAnthropic
+
+    class KeyPoolChatAnthropic(ChatAnthropic):
+        key_pool: Any = Field(default=None, exclude=True)
+
+        def _sdk_client(self, client_cls: type, http_client: Any) -> Any:
+            params: dict[str, Any] = {
+                "api_key": self.anthropic_api_key.get_secret_value(),
+                "base_url": self.anthropic_api_url,
+                "max_retries": self.max_retries,
+                "default_headers": self.default_headers,
+                "http_client": http_client,
+            }
+            # <= 0 means "not set"; None disables the SDK timeout
+            if self.default_request_timeout is None or self.default_request_timeout > 0:
+                params["timeout"] = self.default_request_timeout
+            return client_cls(**params)
+
+        def _http_clients(self) -> tuple[Any, Any]:
+            return key_pool_clients(
+                self.key_pool, header="x-api-key", scheme="",
+                client_classes=(anthropic.DefaultHttpxClient, anthropic.DefaultAsyncHttpxClient),
+            )
+
+        @functools.cached_property
+        def _client(self) -> Any:
+            return self._sdk_client(anthropic.Client, self._http_clients()[0])
+
+        @functools.cached_property
+        def _async_client(self) -> Any:
+            return self._sdk_client(anthropic.AsyncClient, self._http_clients()[1])
+
+    return KeyPoolChatAnthropic
+
+
+def key_pool_stats() -> dict[str, list[dict[str, Any]]]:
+    """Return per-key state for every pool of the process, keyed by the env var it came from."""
+    with _pools_lock:
+        items = list(_pools.items())
+    return {name: pool.stats() for (name, _), pool in items}
@@ -0,0 +1,177 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Latency profiles: one knob for the providers' cost-versus-latency tiers.
+
+Providers sell faster or cheaper processing for the same model under
+different names. ``LatencyProfiledLLM`` maps a provider-neutral profile onto
+each one per call:
+
+============  ====================  =================  ==========================================
+profile       OpenAI service_tier   Groq service_tier  AWS Bedrock
+============  ====================  =================  ==========================================
+fast          priority              on_demand          performanceConfig latency=optimized
+                                                       (InvokeModel API: service_tier=priority)
+standard      default               on_demand          performanceConfig latency=standard
+bulk          flex                  flex               service tier flex
+============  ====================  =================  ==========================================
+
+Anthropic maps fast to ``service_tier="auto"`` (Priority Tier capacity when
+the account has it) and the others to ``"standard_only"``. Providers without
+tiers (Azure OpenAI, Gemini, Vertex AI, OpenAI-compatible servers) run every
+profile unchanged.
+
+The profile of each call is recorded as the ``latency_profile`` label of the
+usage ledger, so tiers can be compared on latency and cost.
+
+Usage:
+    llm = LLMFactory("openai").get_llm(latency_profile="standard")  # or LLM_LATENCY_PROFILE
+    llm.invoke(messages, latency_profile="bulk")                     # per call
+    llm.invoke(messages, config={"metadata": {"latency_profile": "fast"}})
+"""
+
+import logging
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import PrivateAttr
+
+from .chat_wrapper import ChatModelWrapper
+
+logger = logging.getLogger(__name__)
+
+LATENCY_PROFILES = ("fast", "standard", "bulk")
+
+# Call-time keyword arguments per provider and profile
+PROFILE_KWARGS: dict[str, dict[str, dict[str, Any]]] = {
+    "openai": {
+        "fast": {"service_tier": "priority"},
+        "standard": {"service_tier": "default"},
+        "bulk": {"service_tier": "flex"},
+    },
+    "groq": {
+        "fast": {"service_tier": "on_demand"},
+        "standard": {"service_tier": "on_demand"},
+        "bulk": {"service_tier": "flex"},
+    },
+    "anthropic_claude": {
+        "fast": {"service_tier": "auto"},
+        "standard": {"service_tier": "standard_only"},
+        "bulk": {"service_tier": "standard_only"},
+    },
+    "aws_bedrock": {
+        "fast": {"performanceConfig": {"latency": "optimized"}},
+        "standard": {"performanceConfig": {"latency": "standard"}},
+        "bulk": {"serviceTier": "flex"},
+    },
+}
+
+# Bedrock's InvokeModel API takes the tier as a model field, not a call argument
+BEDROCK_INVOKE_SERVICE_TIERS = {"fast": "priority", "standard": "default", "bulk": "flex"}
+
+
+def normalize_latency_profile(profile: str | None) -> str | None:
+    """Return *profile* lower-cased, or None when unset; raise ValueError for unknown profiles."""
+    if profile is None or not str(profile).strip():
+        return None
+    normalized = str(profile).strip().lower()
+    if normalized not in LATENCY_PROFILES:
+        raise ValueError(f"Unknown latency profile '{profile}'; expected one of {', '.join(LATENCY_PROFILES)}")
+    return normalized
+
+
+def _uses_invoke_api(provider: str, model: Any) -> bool:
+    # ChatBedrock without the Converse API; ChatBedrockConverse has additional_model_request_fields
+    return (
+        provider == "aws_bedrock"
+        and not getattr(model, "beta_use_converse_api", False)
+        and not hasattr(model, "additional_model_request_fields")
+    )
+
+
+def latency_profile_kwargs(provider: str, model: Any, profile: str) -> dict[str, Any]:
+    """Map *profile* onto the call-time keyword arguments *model* accepts (empty when it has no tiers)."""
+    if _uses_invoke_api(provider, model):
+        return {}
+    return dict(PROFILE_KWARGS.get(provider, {}).get(profile, {}))
+
+
+class LatencyProfiledLLM(ChatModelWrapper):
+    """
+    Chat model that applies a latency profile per call.
+
+    The profile comes from a ``latency_profile`` keyword, the
+    ``latency_profile`` run metadata, or the default given here.
+
+    Args:
+        model: Underlying chat model
+        provider: Normalized provider name (e.g. "aws_bedrock")
+        profile: Default profile ("fast", "standard" or "bulk")
+        bound: Runnable to call; defaults to *model* (a tool-bound model when tools are bound)
+        tools: Tools and ``bind_tools`` kwargs bound on *bound*, rebound on per-profile model copies
+    """
+
+    provider: str
+    # Not "profile", which chat models use for the model's capabilities
+    default_profile: str = "standard"
+    tools: tuple[Any, dict[str, Any]] | None = None
+    _variants: dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    def __init__(
+        self,
+        model: Any,
+        provider: str,
+        profile: str = "standard",
+        bound: Any = None,
+        tools: tuple[Any, dict[str, Any]] | None = None,
+    ):
+        super().__init__(
+            model, bound, provider=provider, default_profile=normalize_latency_profile(profile) or "standard", tools=tools,
+        )
+        if provider not in PROFILE_KWARGS:
+            logger.debug(f"[LLM] Provider {provider} has no service tiers; latency profiles are recorded only")
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "LatencyProfiledLLM":
+        tools = list(tools)
+        return LatencyProfiledLLM(
+            self.model, self.provider, self.default_profile,
+            bound=self.model.bind_tools(tools, **kwargs), tools=(tools, kwargs),
+        )
+
+    def _variant(self, profile: str) -> Any:
+        """Return a copy of an InvokeModel-API Bedrock model with the profile's service tier."""
+        variant = self._variants.get(profile)
+        if variant is None:
+            variant = self.model.model_copy(update={"service_tier": BEDROCK_INVOKE_SERVICE_TIERS[profile]})
+            if self.tools is not None:
+                variant = variant.bind_tools(self.tools[0], **self.tools[1])
+            self._variants[profile] = variant
+        return variant
+
+    def _prepare(self, config: RunnableConfig | None, kwargs: dict[str, Any]) -> tuple[Any, RunnableConfig, dict[str, Any]]:
+        metadata = dict((config or {}).get("metadata") or {})
+        profile = normalize_latency_profile(kwargs.pop("latency_profile", None))
+        profile = profile or normalize_latency_profile(metadata.get("latency_profile")) or self.default_profile
+        metadata["latency_profile"] = profile
+        config = {**(config or {}), "metadata": metadata}
+        if _uses_invoke_api(self.provider, self.model):
+            return self._variant(profile), config, kwargs
+        return self.bound, config, {**latency_profile_kwargs(self.provider, self.model, profile), **kwargs}
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        runnable, config, kwargs = self._prepare(config, kwargs)
+        return runnable.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        runnable, config, kwargs = self._prepare(config, kwargs)
+        return await runnable.ainvoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        runnable, config, kwargs = self._prepare(config, kwargs)
+        yield from runnable.stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        runnable, config, kwargs = self._prepare(config, kwargs)
+        async for chunk in runnable.astream(input, config, **kwargs):
+            yield chunk
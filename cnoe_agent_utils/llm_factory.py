@@ -4,12 +4,19 @@
 from __future__ import annotations
 
 import importlib.util
-import logging
 import json
+import logging
 import os
-from typing import Any, Iterable, Optional, Dict, Literal, TypedDict
+from typing import Any, Dict, Iterable, Literal, Optional, TypedDict
+
 import dotenv
+from langchain_core.language_models import BaseLanguageModel
+from pydantic import BaseModel
+
+from .tool_schemas import convert_tools_cached
+from .utils import env_int
 
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # Lazy provider loading
@@ -50,10 +57,75 @@ def _as_bool(v: Optional[str], default: bool=False) -> bool:
         return False
     return default
 
+# Provider-specific streaming settings; each falls back to LLM_STREAMING
+_STREAMING_ENV_VARS = {
+    "aws_bedrock": "AWS_BEDROCK_STREAMING",
+    "azure_openai": "AZURE_OPENAI_STREAMING",
+    "groq": "GROQ_STREAMING",
+    "openai": "OPENAI_STREAMING",
+    "openai_compatible": "OPENAI_COMPATIBLE_STREAMING",
+}
+
+def _streaming_setting(provider: str) -> bool | None:
+    """Return the provider's streaming flag (default true), or None when it is "auto"."""
+    env_var = _STREAMING_ENV_VARS.get(provider, "LLM_STREAMING")
+    value = os.getenv(env_var, os.getenv("LLM_STREAMING", "true"))
+    if value.strip().lower() == "auto":
+        return None
+    return _as_bool(value, True)
+
+def _streaming_kwargs(provider: str) -> dict[str, Any]:
+    """Constructor kwargs for the provider's streaming setting; "auto" leaves ``streaming`` unset."""
+    streaming = _streaming_setting(provider)
+    return {} if streaming is None else {"streaming": streaming}
+
+def _model_name_of(llm: Any) -> str | None:
+    """Return the model name a built chat model was configured with."""
+    for attr in ("model_name", "model", "model_id", "deployment_name"):
+        value = getattr(llm, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+def _add_callback(llm: Any, handler: Any) -> None:
+    """Append *handler* to a chat model's callbacks."""
+    if llm.callbacks is None:
+        llm.callbacks = [handler]
+    elif isinstance(llm.callbacks, list):
+        llm.callbacks = [*llm.callbacks, handler]
+    else:
+        llm.callbacks.add_handler(handler)
+
+def _api_key_pool(env_var: str) -> Any:
+    """Return the shared ``key_pool.KeyPool`` for the comma-separated keys in *env_var*, or None."""
+    if not os.getenv(env_var):
+        return None
+    from .key_pool import key_pool_from_env
+    return key_pool_from_env(env_var)
+
 # Extended thinking configuration constants
 THINKING_DEFAULT_BUDGET = 1024
 THINKING_MIN_BUDGET = 1024
 
+# Env var prefixes (<prefix>_ENABLED / <prefix>_BUDGET) for providers with extended thinking
+_THINKING_ENV_PREFIXES = {
+    "anthropic_claude": "ANTHROPIC_THINKING",
+    "aws_bedrock": "AWS_BEDROCK_THINKING",
+    "gcp_vertexai": "VERTEXAI_THINKING",
+}
+
+# Env vars holding each provider's model name (and its default, if any)
+_MODEL_ENV_VARS = {
+  "anthropic_claude": ("ANTHROPIC_MODEL_NAME", None),
+  "aws_bedrock": ("AWS_BEDROCK_MODEL_ID", None),
+  "azure_openai": ("AZURE_OPENAI_DEPLOYMENT", None),
+  "gcp_vertexai": ("VERTEXAI_MODEL_NAME", None),
+  "google_gemini": ("GOOGLE_GEMINI_MODEL_NAME", "gemini-2.0-flash"),
+  "groq": ("GROQ_MODEL_NAME", None),
+  "openai": ("OPENAI_MODEL_NAME", None),
+  "openai_compatible": ("OPENAI_COMPATIBLE_MODEL_NAME", None),
+}
+
 # TypedDict for extended thinking configuration
 class ThinkingConfig(TypedDict):
     """Configuration for extended thinking models."""
@@ -129,6 +201,7 @@ class LLMFactory:
     if _LANGCHAIN_OPENAI_AVAILABLE:
         providers.add("azure-openai")
         providers.add("openai")
+        providers.add("openai-compatible")
 
     if _LANGCHAIN_GOOGLE_GENAI_AVAILABLE:
         providers.add("google-gemini")
@@ -155,7 +228,7 @@ class LLMFactory:
         return ["langchain-aws", "boto3"]
     elif provider == "openai" and not _LANGCHAIN_OPENAI_AVAILABLE:
         return ["langchain-openai"]
-    elif provider == "azure-openai" and not _LANGCHAIN_OPENAI_AVAILABLE:
+    elif provider in ("azure-openai", "openai-compatible") and not _LANGCHAIN_OPENAI_AVAILABLE:
         return ["langchain-openai"]
     elif provider == "google-gemini" and not _LANGCHAIN_GOOGLE_GENAI_AVAILABLE:
         return ["langchain-google-genai"]
@@ -215,6 +288,7 @@ class LLMFactory:
     # Note: Overlapping keys (aws/bedrock, google/gemini) provide fallback coverage
     provider_temp_vars = {
         "azure": "AZURE_TEMPERATURE",  # Check Azure before OpenAI
+        "compatible": "OPENAI_COMPATIBLE_TEMPERATURE",  # Matches openai_compatible
         "openai": "OPENAI_TEMPERATURE",
         "anthropic": "ANTHROPIC_TEMPERATURE",
         "bedrock": "BEDROCK_TEMPERATURE",  # Matches aws_bedrock
@@ -257,11 +331,18 @@ class LLMFactory:
 
   def get_llm(
     self,
-    response_format: str | dict | None = None,
+    response_format: str | dict | type[BaseModel] | None = None,
     tools: Iterable[Any] | None = None,
     strict_tools: bool = True,
     temperature: float | None = None,
     model: str | None = None,
+    stream_partial: bool = False,
+    auto_max_tokens: bool | None = None,
+    thinking_policy: Any | None = None,
+    quota: Any | None = None,
+    priority: str | int | None = None,
+    context_cache: bool | None = None,
+    latency_profile: str | None = None,
     **kwargs,
   ):
     """Return a LangChain chat model, optionally bound to *tools*.
@@ -277,7 +358,67 @@ class LLMFactory:
     If model is specified, it overrides the provider's default model
     environment variable (e.g., OPENAI_MODEL_NAME, AWS_BEDROCK_MODEL_ID,
     ANTHROPIC_MODEL_NAME). When None, uses the environment variable.
+
+    Every model feeds the process-wide usage ledger from its response usage
+    metadata (see ``cnoe_agent_utils.usage``); set LLM_USAGE_LEDGER_ENABLED=false
+    to opt out. It also calibrates local token estimates against the reported
+    input tokens (see ``cnoe_agent_utils.token_counting``); set
+    LLM_TOKEN_CALIBRATION_ENABLED=false to opt out.
+
+    Tool schemas are converted to OpenAI-format dicts once per distinct tool
+    set and ``strict_tools`` value and reused across calls; providers with
+    their own tool format still map the dicts in ``bind_tools`` (see
+    ``cnoe_agent_utils.tool_schemas``).
+
+    If stream_partial is True, response_format must be a Pydantic model class
+    and the model is composed with an incremental parser: ``stream()`` yields
+    partially validated instances as top-level fields complete, followed by
+    the fully validated object (see ``cnoe_agent_utils.structured_stream``).
+
+    If auto_max_tokens is True (default: LLM_AUTO_MAX_TOKENS, off), max_tokens
+    and the thinking budget are sized per call from the model's context
+    window, the estimated prompt size and LLM_OUTPUT_RESERVE_TOKENS; an
+    explicit max_tokens becomes the upper bound (see
+    ``cnoe_agent_utils.token_budget``).
+
+    If thinking_policy is a ``cnoe_agent_utils.thinking_policy.ThinkingPolicy``
+    (default: one built from the environment when LLM_THINKING_POLICY=adaptive),
+    the extended-thinking budget is sized or disabled per call from the
+    request's complexity and latency SLO; this implies per-call max_tokens
+    sizing. Providers without a thinking budget ignore the policy.
+
+    If quota is a ``cnoe_agent_utils.quota.Quota`` (default: one built from
+    LLM_QUOTA_* when any limit is set), every call waits for the shared
+    request-rate, token-rate and concurrency buckets, which can be shared by
+    all processes on a host (LLM_QUOTA_BACKEND=shm) or across hosts (redis).
+    Queued calls are served by priority ("interactive", "default",
+    "background" or an int, lower first) with aging; priority sets the
+    default for this model, overridden per call by a priority keyword, run
+    metadata or ``cnoe_agent_utils.quota.priority_context``.
+
+    If context_cache is True (default: LLM_CONTEXT_CACHE, off), Gemini and
+    Vertex AI models serve the system prompt and tools from a server-side
+    cached-content handle reused across calls, falling back to normal
+    requests below the provider's minimum prefix size (see
+    ``cnoe_agent_utils.context_cache``). Other providers ignore it.
+
+    If latency_profile is "fast", "standard" or "bulk" (default:
+    LLM_LATENCY_PROFILE, unset), it is mapped onto the provider's service
+    tier (OpenAI and Groq service_tier, Anthropic Priority Tier, Bedrock
+    latency-optimized inference or flex tier) for every call, overridable per
+    call with a latency_profile keyword or run metadata, and recorded in the
+    usage ledger (see ``cnoe_agent_utils.latency_profile``).
+
+    If the provider's streaming setting (e.g. OPENAI_STREAMING, falling back
+    to LLM_STREAMING) is "auto", each call streams only when its tokens are
+    consumed live (``stream()``, LangGraph messages mode, ``astream_events``)
+    and its expected output reaches LLM_STREAMING_MIN_OUTPUT_TOKENS; other
+    calls are single non-streaming requests (see
+    ``cnoe_agent_utils.auto_streaming``).
     """
+    if stream_partial and not (isinstance(response_format, type) and issubclass(response_format, BaseModel)):
+        raise ValueError("stream_partial=True requires response_format to be a Pydantic model class")
+
     # Use environment variable if temperature not explicitly provided
     if temperature is None:
         temperature = self._get_default_temperature()
@@ -298,7 +439,294 @@ class LLMFactory:
     builder = getattr(self, f"_build_{self.provider}_llm")
     builder_kwargs = {"model_override": model} if model else {}
     llm = builder(response_format, temperature, **builder_kwargs, **kwargs)
-    return llm.bind_tools(tools, strict=strict_tools) if tools else llm
+    self._attach_usage_ledger(llm)
+    self._attach_token_calibration(llm)
+    base_llm = llm
+    if _streaming_setting(self.provider) is None:
+      from .auto_streaming import DEFAULT_STREAMING_MIN_OUTPUT_TOKENS, AutoStreamingLLM
+      llm = AutoStreamingLLM(
+        llm,
+        min_output_tokens=env_int("LLM_STREAMING_MIN_OUTPUT_TOKENS", DEFAULT_STREAMING_MIN_OUTPUT_TOKENS),
+        structured=response_format is not None and not stream_partial,
+      )
+    if context_cache is None:
+      context_cache = _as_bool(os.getenv("LLM_CONTEXT_CACHE"), False)
+    if context_cache:
+      llm = self._cache_context(llm, base_llm)
+    from .latency_profile import LatencyProfiledLLM, normalize_latency_profile
+    latency_profile = normalize_latency_profile(latency_profile or os.getenv("LLM_LATENCY_PROFILE"))
+    if latency_profile is not None:
+      llm = LatencyProfiledLLM(llm, self.provider, latency_profile)
+    if auto_max_tokens is None:
+      auto_max_tokens = _as_bool(os.getenv("LLM_AUTO_MAX_TOKENS"), False)
+    thinking_policy = self._resolve_thinking_policy(thinking_policy)
+    if auto_max_tokens or thinking_policy is not None:
+      llm = self._size_per_call(llm, kwargs.get("max_tokens"), thinking_policy)
+    from .quota import QuotaLimitedLLM, quota_from_env
+    if quota is None:
+      quota = quota_from_env(self.provider.replace("_", "-"), _model_name_of(llm))
+    if quota is not None:
+      llm = QuotaLimitedLLM(llm, quota, priority=priority)
+    if tools:
+      llm = llm.bind_tools(convert_tools_cached(tools, strict_tools), strict=strict_tools)
+    if stream_partial:
+      from .structured_stream import partial_structured_output
+      return llm | partial_structured_output(response_format)
+    return llm
+
+  def _attach_usage_ledger(self, llm: Any) -> None:
+    """Add a ``UsageCallbackHandler`` to *llm* so every call feeds the usage ledger."""
+    if not _as_bool(os.getenv("LLM_USAGE_LEDGER_ENABLED"), True) or not isinstance(llm, BaseLanguageModel):
+      return
+    from .usage import UsageCallbackHandler
+    _add_callback(llm, UsageCallbackHandler(self.provider.replace("_", "-"), _model_name_of(llm) or "unknown"))
+
+  def _attach_token_calibration(self, llm: Any) -> None:
+    """Add a ``TokenCalibrationHandler`` so local token estimates are calibrated against reported usage."""
+    if not _as_bool(os.getenv("LLM_TOKEN_CALIBRATION_ENABLED"), True) or not isinstance(llm, BaseLanguageModel):
+      return
+    from .token_counting import TokenCalibrationHandler, TokenCounter
+    _add_callback(llm, TokenCalibrationHandler(TokenCounter(self.provider, _model_name_of(llm))))
+
+  def _cache_context(self, llm: Any, base_llm: Any = None) -> Any:
+    """Wrap *llm* in a ``ContextCachedLLM`` when the provider supports explicit context caching.
+
+    *base_llm* is the unwrapped chat model whose client creates the caches (default: *llm*).
+    """
+    from .context_cache import (
+      CONTEXT_CACHE_PROVIDERS,
+      DEFAULT_CONTEXT_CACHE_TTL,
+      ContextCachedLLM,
+      cache_backend_for,
+    )
+    if self.provider not in CONTEXT_CACHE_PROVIDERS:
+      logger.warning(f"[LLM] Provider {self.provider} has no explicit context caching; ignoring context_cache")
+      return llm
+    # Unset uses the model's minimum cacheable prefix; 0 caches every prefix
+    min_tokens = None
+    if os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS"):
+      min_tokens = env_int("LLM_CONTEXT_CACHE_MIN_TOKENS", None, minimum=0)
+    return ContextCachedLLM(
+      llm,
+      self.provider,
+      _model_name_of(llm),
+      backend=cache_backend_for(self.provider, base_llm if base_llm is not None else llm),
+      ttl=env_int("LLM_CONTEXT_CACHE_TTL", DEFAULT_CONTEXT_CACHE_TTL),
+      min_tokens=min_tokens,
+    )
+
+  def _resolve_thinking_policy(self, thinking_policy: Any | None) -> Any | None:
+    """Return the thinking policy to apply, or None when there is none or the provider has no thinking budget."""
+    if thinking_policy is None and os.getenv("LLM_THINKING_POLICY", "").strip().lower() == "adaptive":
+      from .thinking_policy import ThinkingPolicy
+      thinking_env = _THINKING_ENV_PREFIXES.get(self.provider)
+      max_budget = None
+      if thinking_env and os.getenv(f"{thinking_env}_BUDGET"):
+        max_budget = _parse_thinking_budget(f"{thinking_env}_BUDGET")
+      thinking_policy = ThinkingPolicy.from_env(max_budget=max_budget)
+    if thinking_policy is None:
+      return None
+    from .thinking_policy import THINKING_PROVIDERS
+    if self.provider not in THINKING_PROVIDERS:
+      logger.warning(f"[LLM] Provider {self.provider} has no thinking budget; ignoring thinking_policy")
+      return None
+    return thinking_policy
+
+  def _size_per_call(self, llm: Any, max_tokens: int | None, thinking_policy: Any | None = None) -> Any:
+    """Wrap *llm* in a ``ContextSizedLLM`` using the provider's thinking settings."""
+    from .token_budget import DEFAULT_OUTPUT_RESERVE_TOKENS, ContextSizedLLM
+    thinking_env = _THINKING_ENV_PREFIXES.get(self.provider)
+    thinking_budget = None
+    if thinking_env and _as_bool(os.getenv(f"{thinking_env}_ENABLED"), False):
+      thinking_budget = _parse_thinking_budget(f"{thinking_env}_BUDGET")
+    return ContextSizedLLM(
+      llm,
+      self.provider,
+      _model_name_of(llm),
+      output_reserve=env_int("LLM_OUTPUT_RESERVE_TOKENS", DEFAULT_OUTPUT_RESERVE_TOKENS),
+      thinking_budget=thinking_budget,
+      max_output_cap=max_tokens,
+      thinking_policy=thinking_policy,
+    )
+
+  def get_token_counter(
+    self,
+    model: str | None = None,
+    llm: Any | None = None,
+    exact: bool | None = None,
+    mode: str | None = None,
+  ):
+    """Return a ``cnoe_agent_utils.token_counting.TokenCounter`` for this provider.
+
+    Tokens are counted locally with the provider's tokenizer (tiktoken for
+    OpenAI-style models) or a per-provider approximation (Claude, Gemini),
+    and memoized by message content hash. The model name comes from *llm*,
+    *model* or the provider's model environment variable.
+
+    If exact is True (default: LLM_TOKEN_COUNT_EXACT, off), ``count_total``
+    comes from the provider's count API via *llm*'s
+    ``get_num_tokens_from_messages``; without *llm* a chat model is built on
+    first use. Per-message counts, and totals whose API call fails, are local.
+
+    mode (default: LLM_TOKENIZER_MODE, "hybrid") picks exact tokenization,
+    a fast byte/word estimate, or estimates until a context nears its limit.
+    """
+    from .token_counting import token_counter_from_env
+    env_var, default = _MODEL_ENV_VARS.get(self.provider, (None, None))
+    model_name = (_model_name_of(llm) if llm is not None else None) or model or (
+      os.getenv(env_var, default) if env_var else None
+    )
+    builder_kwargs = {"model_override": model} if model else {}
+    return token_counter_from_env(
+      self.provider,
+      model_name,
+      llm=llm if llm is not None else lambda: getattr(self, f"_build_{self.provider}_llm")(None, 0.0, **builder_kwargs),
+      exact=exact,
+      mode=mode,
+    )
+
+  def get_routed_llm(
+    self,
+    router: Any | None = None,
+    tools: Iterable[Any] | None = None,
+    **kwargs,
+  ):
+    """Return a runnable that picks a model tier per request.
+
+    Each request is scored with cheap local features by a
+    ``cnoe_agent_utils.routing.ComplexityRouter`` and sent to the cheapest
+    tier that accepts the score; failing tiers fall back to stronger ones.
+    If router is None, tiers are read from ``LLM_ROUTER_TIERS``. Remaining
+    keyword arguments are passed to ``get_llm`` for every tier.
+    """
+    from .routing import ComplexityRouter, RoutedLLM
+    if router is None:
+      router = ComplexityRouter.from_env()
+    return RoutedLLM(self, router, list(tools) if tools else None, kwargs)
+
+  def get_cascade_llm(
+    self,
+    models: Iterable[str] | None = None,
+    validators: Iterable[Any] = (),
+    tools: Iterable[Any] | None = None,
+    **kwargs,
+  ):
+    """Return a runnable that escalates from a fast model to stronger ones.
+
+    Each request goes to the first model; the answer is checked by
+    *validators* (see ``cnoe_agent_utils.cascade``) and the request is
+    escalated to the next model only when a validator rejects it. If models
+    is None, they are read from ``LLM_CASCADE_MODELS`` (comma-separated,
+    fastest first). Remaining keyword arguments are passed to ``get_llm``.
+    """
+    from .cascade import CascadeLLM, tiers_from_env
+    from .routing import ModelTier
+    tiers = [ModelTier(m, model=m) for m in models] if models else tiers_from_env()
+    return CascadeLLM(self, tiers, validators, list(tools) if tools else None, kwargs)
+
+  def get_embeddings(
+    self,
+    model: str | None = None,
+    batch_size: int | None = None,
+    max_concurrency: int | None = None,
+    cache: Any | None = None,
+    **kwargs,
+  ):
+    """Return a LangChain embeddings client for the selected provider.
+
+    The client is wrapped in ``cnoe_agent_utils.embeddings.BatchedEmbeddings``:
+    texts are looked up in a content-hash cache, de-duplicated, split into
+    batches up to the provider limit and sent with bounded concurrency.
+
+    If model is specified, it overrides the provider's embeddings model
+    environment variable (e.g., OPENAI_EMBEDDINGS_MODEL). batch_size and
+    max_concurrency default to EMBEDDINGS_BATCH_SIZE (capped at the provider
+    limit) and EMBEDDINGS_MAX_CONCURRENCY. If cache is None, a SQLite cache is
+    used when EMBEDDINGS_CACHE_PATH is set, otherwise an in-memory cache;
+    pass cache=False to disable caching.
+
+    Raises
+    ------
+    ValueError
+        If the provider has no embeddings API (anthropic-claude, groq).
+    """
+    from .embeddings import (
+        DEFAULT_EMBEDDING_BATCH_SIZE,
+        DEFAULT_EMBEDDING_MAX_CONCURRENCY,
+        PROVIDER_EMBEDDING_BATCH_LIMITS,
+        BatchedEmbeddings,
+        get_default_embedding_cache,
+    )
+    builder = getattr(self, f"_build_{self.provider}_embeddings", None)
+    if builder is None:
+      raise ValueError(f"Provider {self.provider.replace('_', '-')} does not provide an embeddings API")
+
+    embeddings, model_id = builder(model_override=model, **kwargs)
+
+    provider_limit = PROVIDER_EMBEDDING_BATCH_LIMITS.get(self.provider, DEFAULT_EMBEDDING_BATCH_SIZE)
+    if batch_size is None:
+      batch_size = env_int("EMBEDDINGS_BATCH_SIZE", provider_limit)
+    batch_size = min(batch_size, provider_limit)
+    if max_concurrency is None:
+      max_concurrency = env_int("EMBEDDINGS_MAX_CONCURRENCY", DEFAULT_EMBEDDING_MAX_CONCURRENCY)
+    if cache is None:
+      cache = get_default_embedding_cache()
+    elif cache is False:
+      cache = None
+
+    logger.info(
+      f"[LLM] Embeddings model={model_id} batch_size={batch_size} max_concurrency={max_concurrency}"
+    )
+    return BatchedEmbeddings(
+      embeddings,
+      model_id=f"{self.provider}:{model_id}",
+      batch_size=batch_size,
+      max_concurrency=max_concurrency,
+      cache=cache,
+    )
+
+  def get_batch_runner(
+    self,
+    model: str | None = None,
+    chunk_size: int | None = None,
+    poll_interval: float | None = None,
+    timeout: float | None = None,
+    **kwargs,
+  ):
+    """Return a ``cnoe_agent_utils.batch.BatchRunner`` for offline batch inference.
+
+    Prompts are submitted as provider batch jobs (OpenAI / Azure OpenAI Batch
+    API, Bedrock batch inference) instead of synchronous chat calls, so bulk
+    work runs on the provider's cheaper, higher-throughput lane. Results are
+    yielded as each job finishes.
+
+    If model is specified, it overrides the provider's model environment
+    variable. chunk_size (requests per job) and poll_interval (seconds)
+    default to LLM_BATCH_CHUNK_SIZE (capped at the provider limit) and
+    LLM_BATCH_POLL_INTERVAL. Extra kwargs are added to every request body
+    (e.g. max_tokens).
+
+    Raises
+    ------
+    ValueError
+        If the provider has no batch API.
+    """
+    from .batch import DEFAULT_BATCH_POLL_INTERVAL, PROVIDER_BATCH_LIMITS, BatchRunner
+    builder = getattr(self, f"_build_{self.provider}_batch_backend", None)
+    if builder is None:
+      raise ValueError(f"Provider {self.provider.replace('_', '-')} does not provide a batch API")
+
+    backend = builder(model_override=model, default_params=kwargs)
+
+    provider_limit = PROVIDER_BATCH_LIMITS[self.provider]
+    if chunk_size is None:
+      chunk_size = env_int("LLM_BATCH_CHUNK_SIZE", provider_limit)
+    chunk_size = min(chunk_size, provider_limit)
+    if poll_interval is None:
+      poll_interval = float(os.getenv("LLM_BATCH_POLL_INTERVAL", DEFAULT_BATCH_POLL_INTERVAL))
+
+    logger.info(f"[LLM] Batch runner provider={self.provider} chunk_size={chunk_size} poll_interval={poll_interval}s")
+    return BatchRunner(backend, chunk_size=chunk_size, poll_interval=poll_interval, timeout=timeout)
 
   # ------------------------------------------------------------------ #
   # Internal builders (one per provider)
@@ -316,8 +744,8 @@ class LLMFactory:
         "AWS Bedrock support requires langchain-aws. "
         "Install with: pip install 'cnoe-agent-utils[aws]'"
       )
-    from langchain_aws import ChatBedrock, ChatBedrockConverse
     from botocore.config import Config as BotocoreConfig
+    from langchain_aws import ChatBedrock, ChatBedrockConverse
     aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
     aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
     credentials_profile = None
@@ -464,11 +892,10 @@ class LLMFactory:
         logging.info("[LLM] Using ChatBedrockConverse with native prompt caching support")
     else:
         # ChatBedrock supports streaming and needs beta_use_converse_api
-        streaming = _as_bool(os.getenv("AWS_BEDROCK_STREAMING", os.getenv("LLM_STREAMING", "true")), True)
         use_converse_api = _as_bool(os.getenv("AWS_BEDROCK_USE_CONVERSE_API", "true"), True)
         llm = ChatBedrock(
           **common_args,
-          streaming=streaming,
+          **_streaming_kwargs("aws_bedrock"),
           beta_use_converse_api=use_converse_api
         )
         logging.info("[LLM] Using ChatBedrock")
@@ -488,7 +915,8 @@ class LLMFactory:
         "Install with: pip install 'cnoe-agent-utils[anthropic]'"
       )
     from langchain_anthropic import ChatAnthropic
-    api_key = os.getenv("ANTHROPIC_API_KEY")
+    key_pool = _api_key_pool("ANTHROPIC_API_KEYS")
+    api_key = os.getenv("ANTHROPIC_API_KEY") or (key_pool and key_pool.keys[0].key)
     model_name = model_override or os.getenv("ANTHROPIC_MODEL_NAME")
 
     if not api_key:
@@ -511,13 +939,19 @@ class LLMFactory:
       model_kwargs["thinking_budget"] = thinking_budget
       logging.info(f"[LLM] Extended thinking configured with thinking_budget={thinking_budget}")
 
-    return ChatAnthropic(
+    chat_cls, pooled = ChatAnthropic, {}
+    if key_pool:
+      from .key_pool import key_pool_chat_anthropic
+      chat_cls, pooled = key_pool_chat_anthropic(), {"key_pool": key_pool}
+    llm = chat_cls(
       model_name=model_name,
       anthropic_api_key=api_key,
       temperature=temperature if temperature is not None else 0,
       model_kwargs=model_kwargs,
+      **pooled,
       **kwargs,
     )
+    return llm
 
   def _build_azure_openai_llm(
     self,
@@ -565,9 +999,6 @@ class LLMFactory:
     verbosity         = os.getenv("AZURE_OPENAI_VERBOSITY")          # low|medium|high
     os.getenv("AZURE_OPENAI_OUTPUT_VERSION", "responses/v1" if use_responses else "v0")
 
-    streaming = _as_bool(os.getenv("AZURE_OPENAI_STREAMING",
-                                  os.getenv("LLM_STREAMING","true")), True)
-
     model_kwargs: Dict[str, Any] = {"response_format": response_format} if response_format else {}
     if verbosity:
         model_kwargs["verbosity"] = verbosity
@@ -592,7 +1023,7 @@ class LLMFactory:
         model=deployment,  # Add model parameter for newer LangChain versions
         api_key=api_key,
         api_version=api_version,
-        streaming=streaming,
+        **_streaming_kwargs("azure_openai"),
         **kwargs_to_pass,
         **kwargs,
       )
@@ -610,7 +1041,8 @@ class LLMFactory:
         "Install with: pip install 'cnoe-agent-utils[groq]'"
       )
     from langchain_groq import ChatGroq
-    api_key = os.getenv("GROQ_API_KEY")
+    key_pool = _api_key_pool("GROQ_API_KEYS")
+    api_key = os.getenv("GROQ_API_KEY") or (key_pool and key_pool.keys[0].key)
     model_name = model_override or os.getenv("GROQ_MODEL_NAME")
 
     # Validate required environment variables
@@ -636,17 +1068,17 @@ class LLMFactory:
 
     logging.info(f"[LLM] Groq model={model_name}")
 
-    # Configure streaming based on global and provider-specific settings
-    streaming = _as_bool(os.getenv("GROQ_STREAMING",
-                                os.getenv("LLM_STREAMING", "true")), True)
-
     model_kwargs = {"response_format": response_format} if response_format else {}
+    if key_pool:
+      from .key_pool import key_pool_clients
+      kwargs["http_client"], kwargs["http_async_client"] = key_pool_clients(key_pool)
 
     return ChatGroq(
       model_name=model_name,
       groq_api_key=api_key,
       temperature=temperature if temperature is not None else 0,
-      streaming=streaming,
+      # Configure streaming based on global and provider-specific settings
+      **_streaming_kwargs("groq"),
       model_kwargs=model_kwargs,
       **kwargs,
     )
@@ -664,7 +1096,8 @@ class LLMFactory:
         "Install with: pip install 'cnoe-agent-utils[openai]'"
       )
     from langchain_openai import ChatOpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
+    key_pool = _api_key_pool("OPENAI_API_KEYS")
+    api_key = os.getenv("OPENAI_API_KEY") or (key_pool and key_pool.keys[0].key)
     base_url = os.getenv("OPENAI_ENDPOINT", "https://api.openai.com/v1")
     model_name = model_override or os.getenv("OPENAI_MODEL_NAME")
     user = os.getenv("OPENAI_USER")
@@ -692,9 +1125,6 @@ class LLMFactory:
     verbosity         = os.getenv("OPENAI_VERBOSITY")          # low|medium|high
     os.getenv("OPENAI_OUTPUT_VERSION", "responses/v1" if use_responses else "v0")
 
-    streaming = _as_bool(os.getenv("OPENAI_STREAMING",
-                                  os.getenv("LLM_STREAMING","true")), True)
-
     model_kwargs: Dict[str, Any] = {"response_format": response_format} if response_format else {}
     if verbosity:
         model_kwargs["verbosity"] = verbosity
@@ -714,9 +1144,13 @@ class LLMFactory:
         "api_key": api_key,
         "base_url": base_url,
         "use_responses_api": use_responses,
-        "streaming": streaming,
+        **_streaming_kwargs("openai"),
     }
 
+    if key_pool:
+        from .key_pool import key_pool_clients
+        openai_kwargs["http_client"], openai_kwargs["http_async_client"] = key_pool_clients(key_pool)
+
     # Only add model_kwargs and extra_body if they have content
     if model_kwargs:
         openai_kwargs["model_kwargs"] = model_kwargs
@@ -749,6 +1183,79 @@ class LLMFactory:
         **kwargs,
     )
 
+  def _build_openai_compatible_llm(
+    self,
+    response_format: str | dict | None,
+    temperature: float | None,
+    model_override: str | None = None,
+    **kwargs,
+  ):
+    if not _LANGCHAIN_OPENAI_AVAILABLE:
+      raise ImportError(
+        "OpenAI-compatible server support requires langchain-openai. "
+        "Install with: pip install 'cnoe-agent-utils[openai]'"
+      )
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    from .openai_compatible import (
+        DEFAULT_MAX_CONNECTIONS,
+        DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        DEFAULT_TIMEOUT,
+        AsyncLoadBalancedTransport,
+        BackendPool,
+        LoadBalancedTransport,
+        parse_base_urls,
+        verify_server_model,
+    )
+
+    base_urls = parse_base_urls(os.getenv("OPENAI_COMPATIBLE_BASE_URLS") or os.getenv("OPENAI_COMPATIBLE_BASE_URL"))
+    api_key = os.getenv("OPENAI_COMPATIBLE_API_KEY", "EMPTY")
+    model_name = model_override or os.getenv("OPENAI_COMPATIBLE_MODEL_NAME")
+
+    if not base_urls:
+      raise OSError(
+        "Missing the following OpenAI-compatible environment variable(s): OPENAI_COMPATIBLE_BASE_URLS."
+      )
+
+    if _as_bool(os.getenv("OPENAI_COMPATIBLE_VERIFY_MODEL"), True):
+      model_name = verify_server_model(base_urls, model_name, api_key)
+    elif not model_name:
+      raise OSError(
+        "Missing the following OpenAI-compatible environment variable(s): OPENAI_COMPATIBLE_MODEL_NAME."
+      )
+
+    pool = BackendPool(base_urls, strategy=os.getenv("OPENAI_COMPATIBLE_LB_STRATEGY", "prefix_affinity"))
+    limits = httpx.Limits(
+      max_connections=env_int("OPENAI_COMPATIBLE_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+      max_keepalive_connections=env_int("OPENAI_COMPATIBLE_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+    )
+    timeout = float(os.getenv("OPENAI_COMPATIBLE_TIMEOUT", DEFAULT_TIMEOUT))
+
+    logger.info(
+      f"[LLM] OpenAI-compatible model={model_name} servers={len(base_urls)} "
+      f"strategy={pool.strategy} max_connections={limits.max_connections}"
+    )
+
+    model_kwargs: dict[str, Any] = {"response_format": response_format} if response_format else {}
+
+    # Local servers ignore the Responses API and GPT-5 heuristics; always send
+    # an explicit temperature so sampling matches across backends.
+    compatible_kwargs: dict[str, Any] = {
+      "model_name": model_name,
+      "api_key": api_key,
+      "base_url": base_urls[0],
+      **_streaming_kwargs("openai_compatible"),
+      "stream_usage": _as_bool(os.getenv("OPENAI_COMPATIBLE_STREAM_USAGE"), True),
+      "temperature": temperature if temperature is not None else 0,
+      "http_client": httpx.Client(transport=LoadBalancedTransport(pool, limits), timeout=timeout),
+      "http_async_client": httpx.AsyncClient(transport=AsyncLoadBalancedTransport(pool, limits), timeout=timeout),
+    }
+    if model_kwargs:
+      compatible_kwargs["model_kwargs"] = model_kwargs
+
+    return ChatOpenAI(**compatible_kwargs, **kwargs)
+
   def _build_google_gemini_llm(
     self,
     response_format: str | dict | None,
@@ -794,8 +1301,8 @@ class LLMFactory:
         "Google Vertex AI support requires langchain-google-vertexai. "
         "Install with: pip install 'cnoe-agent-utils[gcp]'"
       )
-    from langchain_google_vertexai import ChatVertexAI
     import google.auth
+    from langchain_google_vertexai import ChatVertexAI
 
     # Check for credentials
     os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -857,3 +1364,233 @@ class LLMFactory:
       vertexai_args["max_tokens"] = max_tokens_value
 
     return ChatVertexAI(**vertexai_args, **filtered_kwargs)
+
+  # ------------------------------------------------------------------ #
+  # Internal embeddings builders (one per provider with an embeddings API)
+  # Each returns (embeddings_client, model_id).
+  # ------------------------------------------------------------------ #
+
+  def _build_openai_embeddings(self, model_override: str | None = None, **kwargs):
+    if not _LANGCHAIN_OPENAI_AVAILABLE:
+      raise ImportError(
+        "OpenAI (openai.com) support requires langchain-openai. "
+        "Install with: pip install 'cnoe-agent-utils[openai]'"
+      )
+    from langchain_openai import OpenAIEmbeddings
+    api_key = os.getenv("OPENAI_API_KEY")
+    base_url = os.getenv("OPENAI_ENDPOINT", "https://api.openai.com/v1")
+    model_name = model_override or os.getenv("OPENAI_EMBEDDINGS_MODEL", "text-embedding-3-small")
+
+    if not api_key:
+      raise OSError("OPENAI_API_KEY environment variable is required")
+
+    logger.info(f"[LLM] OpenAI embeddings model={model_name} endpoint={base_url}")
+    return OpenAIEmbeddings(model=model_name, api_key=api_key, base_url=base_url, **kwargs), model_name
+
+  def _build_azure_openai_embeddings(self, model_override: str | None = None, **kwargs):
+    if not _LANGCHAIN_OPENAI_AVAILABLE:
+      raise ImportError(
+        "Azure OpenAI support requires langchain-openai. "
+        "Install with: pip install 'cnoe-agent-utils[azure]'"
+      )
+    from langchain_openai import AzureOpenAIEmbeddings
+    deployment = model_override or os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT")
+    api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    api_key = os.getenv("AZURE_OPENAI_API_KEY")
+
+    missing_vars = []
+    if not deployment:
+      missing_vars.append("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT")
+    if not api_version:
+      missing_vars.append("AZURE_OPENAI_API_VERSION")
+    if not endpoint:
+      missing_vars.append("AZURE_OPENAI_ENDPOINT")
+    if not api_key:
+      missing_vars.append("AZURE_OPENAI_API_KEY")
+    if missing_vars:
+      raise OSError(
+        f"Missing the following Azure OpenAI environment variable(s): {', '.join(missing_vars)}."
+      )
+
+    logger.info(f"[LLM] AzureOpenAI embeddings deployment={deployment} api_version={api_version}")
+    return AzureOpenAIEmbeddings(
+      azure_endpoint=endpoint,
+      azure_deployment=deployment,
+      api_key=api_key,
+      api_version=api_version,
+      **kwargs,
+    ), deployment
+
+  def _build_aws_bedrock_embeddings(self, model_override: str | None = None, **kwargs):
+    if not _LANGCHAIN_AWS_AVAILABLE:
+      raise ImportError(
+        "AWS Bedrock support requires langchain-aws. "
+        "Install with: pip install 'cnoe-agent-utils[aws]'"
+      )
+    from langchain_aws import BedrockEmbeddings
+    aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
+    aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
+    region_name = os.getenv("AWS_REGION")
+    model_id = model_override or os.getenv("AWS_BEDROCK_EMBEDDINGS_MODEL_ID", "amazon.titan-embed-text-v2:0")
+
+    if not region_name:
+      raise OSError("Missing the following AWS Bedrock environment variable(s): AWS_REGION.")
+
+    embeddings_args: dict[str, Any] = {"model_id": model_id, "region_name": region_name, **kwargs}
+    if aws_access_key_id and aws_secret_access_key:
+      embeddings_args["aws_access_key_id"] = aws_access_key_id
+      embeddings_args["aws_secret_access_key"] = aws_secret_access_key
+    elif os.getenv("AWS_PROFILE"):
+      embeddings_args["credentials_profile_name"] = os.getenv("AWS_PROFILE")
+
+    logger.info(f"[LLM] Bedrock embeddings model={model_id} region={region_name}")
+    return BedrockEmbeddings(**embeddings_args), model_id
+
+  def _build_google_gemini_embeddings(self, model_override: str | None = None, **kwargs):
+    if not _LANGCHAIN_GOOGLE_GENAI_AVAILABLE:
+      raise ImportError(
+        "Google Gemini support requires langchain-google-genai. "
+        "Install with: pip install 'cnoe-agent-utils[gcp]'"
+      )
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    api_key = os.getenv("GOOGLE_API_KEY")
+    model_name = model_override or os.getenv("GOOGLE_GEMINI_EMBEDDINGS_MODEL", "models/text-embedding-004")
+
+    if not api_key:
+      raise OSError("GOOGLE_API_KEY environment variable is required")
+
+    logger.info(f"[LLM] Google Gemini embeddings model={model_name}")
+    return GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=api_key, **kwargs), model_name
+
+  def _build_gcp_vertexai_embeddings(self, model_override: str | None = None, **kwargs):
+    if not _LANGCHAIN_GOOGLE_VERTEXAI_AVAILABLE:
+      raise ImportError(
+        "Google Vertex AI support requires langchain-google-vertexai. "
+        "Install with: pip install 'cnoe-agent-utils[gcp]'"
+      )
+    import google.auth
+    from langchain_google_vertexai import VertexAIEmbeddings
+
+    try:
+      credentials, _ = google.auth.default()
+    except Exception as e:  # noqa: BLE001
+      raise OSError(
+        "Could not load Google Cloud credentials. "
+        "Set the GOOGLE_APPLICATION_CREDENTIALS environment variable to the path of your service account JSON file. "
+        f"Original error: {e}"
+      )
+
+    model_name = model_override or os.getenv("VERTEXAI_EMBEDDINGS_MODEL", "text-embedding-005")
+    project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
+    location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
+
+    if not project_id:
+      raise OSError("GOOGLE_CLOUD_PROJECT environment variable is required for Vertex AI")
+
+    logger.info(f"[LLM] Google VertexAI embeddings model={model_name} project={project_id} location={location}")
+    return VertexAIEmbeddings(
+      model_name=model_name,
+      project=project_id,
+      location=location,
+      credentials=credentials,
+      **kwargs,
+    ), model_name
+
+  # ------------------------------------------------------------------ #
+  # Internal batch backends (one per provider with a batch API)
+  # ------------------------------------------------------------------ #
+
+  def _build_openai_batch_backend(self, model_override: str | None = None, default_params: dict[str, Any] | None = None):
+    from openai import OpenAI
+
+    from .batch import OpenAIBatchBackend
+    api_key = os.getenv("OPENAI_API_KEY")
+    base_url = os.getenv("OPENAI_ENDPOINT", "https://api.openai.com/v1")
+    model_name = model_override or os.getenv("OPENAI_MODEL_NAME")
+
+    missing_vars = []
+    if not api_key:
+      missing_vars.append("OPENAI_API_KEY")
+    if not model_name:
+      missing_vars.append("OPENAI_MODEL_NAME")
+    if missing_vars:
+      raise OSError(
+        f"Missing the following OpenAI environment variable(s): {', '.join(missing_vars)}."
+      )
+
+    logger.info(f"[LLM] OpenAI batch model={model_name} endpoint={base_url}")
+    return OpenAIBatchBackend(OpenAI(api_key=api_key, base_url=base_url), model_name, default_params=default_params)
+
+  def _build_azure_openai_batch_backend(self, model_override: str | None = None, default_params: dict[str, Any] | None = None):
+    from openai import AzureOpenAI
+
+    from .batch import OpenAIBatchBackend
+    deployment = model_override or os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT") or os.getenv("AZURE_OPENAI_DEPLOYMENT")
+    api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    api_key = os.getenv("AZURE_OPENAI_API_KEY")
+
+    missing_vars = []
+    if not deployment:
+      missing_vars.append("AZURE_OPENAI_DEPLOYMENT")
+    if not api_version:
+      missing_vars.append("AZURE_OPENAI_API_VERSION")
+    if not endpoint:
+      missing_vars.append("AZURE_OPENAI_ENDPOINT")
+    if not api_key:
+      missing_vars.append("AZURE_OPENAI_API_KEY")
+    if missing_vars:
+      raise OSError(
+        f"Missing the following Azure OpenAI environment variable(s): {', '.join(missing_vars)}."
+      )
+
+    logger.info(f"[LLM] AzureOpenAI batch deployment={deployment} api_version={api_version}")
+    client = AzureOpenAI(azure_endpoint=endpoint, api_key=api_key, api_version=api_version)
+    # Azure batch jobs require a Global-Batch deployment and omit the /v1 prefix
+    return OpenAIBatchBackend(client, deployment, endpoint="/chat/completions", default_params=default_params)
+
+  def _build_aws_bedrock_batch_backend(self, model_override: str | None = None, default_params: dict[str, Any] | None = None):
+    import boto3
+
+    from .batch import BedrockBatchBackend
+    model_id = model_override or os.getenv("AWS_BEDROCK_MODEL_ID")
+    region_name = os.getenv("AWS_REGION")
+    role_arn = os.getenv("AWS_BEDROCK_BATCH_ROLE_ARN")
+    input_s3_uri = os.getenv("AWS_BEDROCK_BATCH_INPUT_S3_URI")
+    output_s3_uri = os.getenv("AWS_BEDROCK_BATCH_OUTPUT_S3_URI")
+
+    required = {
+      "AWS_BEDROCK_MODEL_ID": model_id,
+      "AWS_REGION": region_name,
+      "AWS_BEDROCK_BATCH_ROLE_ARN": role_arn,
+      "AWS_BEDROCK_BATCH_INPUT_S3_URI": input_s3_uri,
+      "AWS_BEDROCK_BATCH_OUTPUT_S3_URI": output_s3_uri,
+    }
+    missing_vars = [name for name, value in required.items() if not value]
+    if missing_vars:
+      raise OSError(
+        f"Missing the following AWS Bedrock environment variable(s): {', '.join(missing_vars)}."
+      )
+
+    aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
+    aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
+    if aws_access_key_id and aws_secret_access_key:
+      session = boto3.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=region_name,
+      )
+    else:
+      session = boto3.Session(profile_name=os.getenv("AWS_PROFILE") or None, region_name=region_name)
+
+    logger.info(f"[LLM] Bedrock batch model={model_id} region={region_name} input={input_s3_uri}")
+    return BedrockBatchBackend(
+      session.client("bedrock"),
+      session.client("s3"),
+      model_id=model_id,
+      role_arn=role_arn,
+      input_s3_uri=input_s3_uri,
+      output_s3_uri=output_s3_uri,
+      default_params=default_params,
+    )
@@ -0,0 +1,361 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""HTTP plumbing for self-hosted OpenAI-compatible servers (vLLM, Ollama, llama.cpp).
+
+The ``openai-compatible`` provider spreads requests over one or more base
+URLs through an httpx transport that:
+
+- routes requests sharing a prompt prefix (system prompt and tools) to the
+  same server, so server-side prefix caching keeps hitting
+- falls back to the least busy server when the preferred one is saturated
+  or down, and takes servers that refuse connections out of rotation for a
+  cooldown
+- uses connection limits sized for high-concurrency local endpoints
+
+``list_server_models`` / ``verify_server_model`` check at startup that the
+configured model is served.
+"""
+
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Iterable, Iterator
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 256
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 64
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_AFFINITY_SLACK = 8
+DEFAULT_COOLDOWN = 30.0
+STRATEGIES = ("prefix_affinity", "least_busy", "round_robin")
+
+
+def parse_base_urls(value: str | None) -> list[str]:
+    """Split a comma-separated list of base URLs, dropping blanks and trailing slashes."""
+    return [url.strip().rstrip("/") for url in (value or "").split(",") if url.strip()]
+
+
+def prefix_key(body: bytes) -> str | None:
+    """
+    Return a hash of the stable prompt prefix of a chat completions request body.
+
+    The prefix is the model, the tool schemas and the leading system
+    messages (or the first message if there is no system prompt).
+    """
+    try:
+        payload = json.loads(body)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    messages = payload.get("messages") or []
+    prefix = [m for m in itertools.takewhile(lambda m: m.get("role") in ("system", "developer"), messages)]
+    if not prefix and messages:
+        prefix = messages[:1]
+    if not prefix and not payload.get("tools"):
+        return None
+    material = json.dumps([payload.get("model"), payload.get("tools"), prefix], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class Backend:
+    """One OpenAI-compatible server and its in-flight request count."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.url = httpx.URL(base_url)
+        self.in_flight = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def __repr__(self) -> str:
+        return f"Backend({self.base_url!r}, in_flight={self.in_flight})"
+
+
+class BackendPool:
+    """
+    Selects a backend per request.
+
+    Args:
+        base_urls: Server base URLs (e.g. "http://gpu-0:8000/v1")
+        strategy: "prefix_affinity" (default), "least_busy" or "round_robin"
+        affinity_slack: With prefix affinity, leave the preferred server once it
+                        has this many more requests in flight than the least busy one
+        cooldown: Seconds a server stays out of rotation after a connection failure
+    """
+
+    def __init__(
+        self,
+        base_urls: Iterable[str],
+        strategy: str = "prefix_affinity",
+        affinity_slack: int = DEFAULT_AFFINITY_SLACK,
+        cooldown: float = DEFAULT_COOLDOWN,
+    ):
+        self.backends = [Backend(url) for url in base_urls]
+        if not self.backends:
+            raise ValueError("BackendPool requires at least one base URL")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load-balancing strategy '{strategy}'; expected one of {STRATEGIES}")
+        self.strategy = strategy
+        self.affinity_slack = affinity_slack
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+
+    def acquire(self, key: str | None = None, exclude: Iterable[Backend] = ()) -> Backend:
+        """Pick a backend for a request with prefix hash *key* and count it as in flight."""
+        excluded = {id(b) for b in exclude}
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if id(b) not in excluded]
+            healthy = [b for b in candidates if b.down_until <= now] or candidates
+            if not healthy:
+                raise httpx.ConnectError("No OpenAI-compatible backends left to try")
+            least = min(healthy, key=lambda b: b.in_flight)
+            if self.strategy == "round_robin":
+                chosen = healthy[next(self._round_robin) % len(healthy)]
+            elif self.strategy == "prefix_affinity" and key is not None:
+                # Rendezvous hashing keeps a prefix on the same server as servers come and go
+                preferred = max(healthy, key=lambda b: hashlib.sha256(f"{key}{b.base_url}".encode()).digest())
+                chosen = preferred if preferred.in_flight - least.in_flight < self.affinity_slack else least
+            else:
+                chosen = least
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+
+    def mark_down(self, backend: Backend) -> None:
+        with self._lock:
+            backend.failures += 1
+            backend.down_until = time.monotonic() + self.cooldown
+        logger.warning(f"[LLM] OpenAI-compatible backend {backend.base_url} unreachable; cooling down {self.cooldown:.0f}s")
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Return per-backend request, failure and in-flight counts."""
+        with self._lock:
+            return [
+                {"base_url": b.base_url, "in_flight": b.in_flight, "requests": b.requests, "failures": b.failures}
+                for b in self.backends
+            ]
+
+
+def _rewrite(request: httpx.Request, primary: httpx.URL, backend: Backend, body: bytes) -> httpx.Request:
+    """Re-target *request* (built against the primary base URL) at *backend*."""
+    path = request.url.raw_path.decode()
+    relative = path[len(primary.raw_path.rstrip(b"/").decode()):]
+    url = httpx.URL(backend.base_url + relative)
+    headers = [(k, v) for k, v in request.headers.raw if k.lower() != b"host"]
+    return httpx.Request(request.method, url, headers=headers, content=body, extensions=request.extensions)
+
+
+def _body(request: httpx.Request) -> bytes:
+    try:
+        return request.content
+    except httpx.RequestNotRead:
+        return request.read()
+
+
+@functools.cache
+def tracked_stream_classes(http: Any = httpx) -> tuple[type, type]:
+    """
+    Return sync and async response streams, built on an httpx-compatible module, that call back when closed.
+
+    Transports wrap response bodies in them to release the backend or key a
+    request holds once the body has been read. Provider SDKs that ship
+    their own fork of httpx only accept streams built on that fork.
+    """
+
+    class TrackedStream(http.SyncByteStream):
+        def __init__(self, stream: Any, on_close):
+            self._stream = stream
+            self._on_close = on_close
+
+        def __iter__(self) -> Iterator[bytes]:
+            yield from self._stream
+
+        def close(self) -> None:
+            try:
+                self._stream.close()
+            finally:
+                self._on_close()
+
+    class AsyncTrackedStream(http.AsyncByteStream):
+        def __init__(self, stream: Any, on_close):
+            self._stream = stream
+            self._on_close = on_close
+
+        async def __aiter__(self) -> AsyncIterator[bytes]:
+            async for chunk in self._stream:
+                yield chunk
+
+        async def aclose(self) -> None:
+            try:
+                await self._stream.aclose()
+            finally:
+                self._on_close()
+
+    return TrackedStream, AsyncTrackedStream
+
+
+_TrackedStream, _AsyncTrackedStream = tracked_stream_classes(httpx)
+
+
+def call_once(fn):
+    """Return a callable that runs *fn* on its first call only."""
+    done = []
+
+    def wrapper():
+        if not done:
+            done.append(True)
+            fn()
+    return wrapper
+
+
+class LoadBalancedTransport(httpx.BaseTransport):
+    """Sync httpx transport that spreads requests over a ``BackendPool``."""
+
+    def __init__(self, pool: BackendPool, limits: httpx.Limits | None = None):
+        self.pool = pool
+        self.primary = pool.backends[0].url
+        self._transport = httpx.HTTPTransport(limits=limits or httpx.Limits(
+            max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        ))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = _body(request)
+        key = prefix_key(body) if self.pool.strategy == "prefix_affinity" else None
+        tried: list[Backend] = []
+        while True:
+            backend = self.pool.acquire(key, exclude=tried)
+            release = call_once(lambda b=backend: self.pool.release(b))
+            try:
+                response = self._transport.handle_request(_rewrite(request, self.primary, backend, body))
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                release()
+                self.pool.mark_down(backend)
+                tried.append(backend)
+                if len(tried) >= len(self.pool.backends):
+                    raise
+                continue
+            except Exception:
+                release()
+                raise
+            return httpx.Response(
+                response.status_code, headers=response.headers,
+                stream=_TrackedStream(response.stream, release), extensions=response.extensions,
+            )
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncLoadBalancedTransport(httpx.AsyncBaseTransport):
+    """Async httpx transport that spreads requests over a ``BackendPool``."""
+
+    def __init__(self, pool: BackendPool, limits: httpx.Limits | None = None):
+        self.pool = pool
+        self.primary = pool.backends[0].url
+        self._transport = httpx.AsyncHTTPTransport(limits=limits or httpx.Limits(
+            max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        ))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = prefix_key(body) if self.pool.strategy == "prefix_affinity" else None
+        tried: list[Backend] = []
+        while True:
+            backend = self.pool.acquire(key, exclude=tried)
+            release = call_once(lambda b=backend: self.pool.release(b))
+            try:
+                response = await self._transport.handle_async_request(_rewrite(request, self.primary, backend, body))
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                release()
+                self.pool.mark_down(backend)
+                tried.append(backend)
+                if len(tried) >= len(self.pool.backends):
+                    raise
+                continue
+            except Exception:
+                release()
+                raise
+            return httpx.Response(
+                response.status_code, headers=response.headers,
+                stream=_AsyncTrackedStream(response.stream, release), extensions=response.extensions,
+            )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def list_server_models(base_url: str, api_key: str | None = None, timeout: float = 10.0) -> list[str]:
+    """Return the model ids served at *base_url* (``GET /models``)."""
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    response = httpx.get(f"{base_url.rstrip('/')}/models", headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return [m["id"] for m in response.json().get("data", [])]
+
+
+_verified: dict[tuple, str] = {}
+_verified_lock = threading.Lock()
+
+
+def verify_server_model(base_urls: list[str], model: str | None, api_key: str | None = None) -> str:
+    """
+    Check that *model* is served by the configured servers and return it.
+
+    If *model* is None and every reachable server serves exactly the same
+    single model, that model is returned. Results are cached per
+    (base URLs, model) so repeated ``get_llm()`` calls do not re-list.
+
+    Raises:
+        EnvironmentError: If no server is reachable, the model is not served
+            anywhere, or no model is configured and it cannot be inferred
+    """
+    cache_key = (tuple(base_urls), model)
+    with _verified_lock:
+        if cache_key in _verified:
+            return _verified[cache_key]
+
+    served: dict[str, list[str]] = {}
+    for url in base_urls:
+        try:
+            served[url] = list_server_models(url, api_key)
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"[LLM] Could not list models at {url}: {e}")
+    if not served:
+        raise OSError(f"None of the OpenAI-compatible servers are reachable: {', '.join(base_urls)}")
+
+    if model is None:
+        distinct = {m for models in served.values() for m in models}
+        if len(distinct) != 1:
+            raise OSError(
+                "OPENAI_COMPATIBLE_MODEL_NAME is required when the servers do not serve exactly one model "
+                f"(served: {sorted(distinct)})"
+            )
+        model = distinct.pop()
+        logger.info(f"[LLM] Using the only model served: {model}")
+    else:
+        missing = [url for url, models in served.items() if model not in models]
+        if len(missing) == len(served):
+            available = sorted({m for models in served.values() for m in models})
+            raise OSError(f"Model '{model}' is not served by any OpenAI-compatible server (served: {available})")
+        for url in missing:
+            logger.warning(f"[LLM] Model '{model}' is not served at {url}")
+
+    with _verified_lock:
+        _verified[cache_key] = model
+    return model
@@ -0,0 +1,736 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Request-rate, token-rate and concurrency quotas shared across processes.
+
+A limiter inside one process only sees that process's share of traffic.
+With several workers per pod and several pods per provider account, each
+one would need a static slice of the account quota, wasting capacity when
+traffic is uneven. Here every worker draws from the same buckets:
+
+- ``LocalQuotaBackend``: in-process (threads and asyncio tasks)
+- ``SharedMemoryQuotaBackend``: all processes on a host, through a
+  memory-mapped file (``/dev/shm`` by default) guarded by ``flock``
+- ``RedisQuotaBackend``: all hosts, through atomic Lua scripts (requires
+  the ``redis`` package)
+
+Custom backends implement ``QuotaBackend.acquire`` / ``release``.
+
+Each call takes one request token, its estimated prompt tokens from the
+token bucket, and a concurrency lease held until the call (or stream)
+finishes. Leases of crashed processes are reclaimed (shared memory: dead
+PIDs; Redis: lease TTL).
+
+Calls carry a priority ("interactive" 0, "default" 1, "background" 2, or
+any int; lower runs first): per call (``priority=`` or ``priority`` in the
+run metadata), from ``priority_context()``, or per model
+(``get_llm(priority=...)``). Calls queued in a process are served in
+priority order; waiting ages a call by one level every ``aging_seconds`` so
+background work never starves. ``interactive_reserve`` keeps a fraction of
+the concurrency limit for interactive calls across all processes.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+
+    # LLM_QUOTA_BACKEND=shm LLM_QUOTA_RPS=5 LLM_QUOTA_TPM=400000 LLM_QUOTA_MAX_CONCURRENCY=16
+    llm = LLMFactory("openai").get_llm()
+
+    # or explicitly
+    from cnoe_agent_utils.quota import Quota, QuotaLimits, SharedMemoryQuotaBackend
+    quota = Quota(SharedMemoryQuotaBackend(), "openai:gpt-4o", QuotaLimits(requests_per_second=5))
+    llm = LLMFactory("openai").get_llm(quota=quota)
+
+    with priority_context("background"):
+        llm.invoke("Summarize yesterday's incidents")
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Generator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+
+from .chat_wrapper import ChatModelWrapper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 0.05
+DEFAULT_LEASE_TTL = 900.0
+DEFAULT_SHM_NAME = "cnoe-agent-utils-quota"
+DEFAULT_AGING_SECONDS = 10.0
+
+PRIORITIES: dict[str, int] = {"interactive": 0, "default": 1, "background": 2}
+DEFAULT_PRIORITY = PRIORITIES["default"]
+
+_priority_var: contextvars.ContextVar[int | None] = contextvars.ContextVar("cnoe_llm_priority", default=None)
+
+
+def resolve_priority(priority: str | int | None) -> int | None:
+    """Map a lane name ("interactive", "default", "background") or int to an int priority."""
+    if priority is None or isinstance(priority, int):
+        return priority
+    try:
+        return PRIORITIES[priority.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown priority '{priority}'; expected one of {list(PRIORITIES)} or an int") from None
+
+
+@contextmanager
+def priority_context(priority: str | int) -> Generator[None]:
+    """Run LLM calls inside the block at *priority* unless a call sets its own."""
+    token = _priority_var.set(resolve_priority(priority))
+    try:
+        yield
+    finally:
+        _priority_var.reset(token)
+
+
+def current_priority() -> int | None:
+    """Return the priority set by the enclosing ``priority_context``, if any."""
+    return _priority_var.get()
+
+
+def _priority_name(priority: int) -> str:
+    return next((name for name, value in PRIORITIES.items() if value == priority), str(priority))
+
+
+class QuotaLimits:
+    """
+    Limits for one quota key. None means unlimited.
+
+    Args:
+        requests_per_second: Sustained request rate
+        burst: Requests allowed at once before the rate applies (default: max(1, rate))
+        tokens_per_minute: Sustained prompt-token rate
+        max_concurrency: Calls in flight at once
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float | None = None,
+        burst: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_concurrency: int | None = None,
+    ):
+        self.requests_per_second = requests_per_second or 0.0
+        self.burst = burst or max(1.0, self.requests_per_second)
+        self.tokens_per_second = (tokens_per_minute or 0.0) / 60.0
+        # Allow a full minute of tokens in one burst, like provider TPM windows
+        self.token_burst = tokens_per_minute or 0.0
+        self.max_concurrency = max_concurrency or 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_second or self.tokens_per_second or self.max_concurrency)
+
+    def __repr__(self) -> str:
+        return (
+            f"QuotaLimits(rps={self.requests_per_second}, burst={self.burst}, "
+            f"tpm={self.token_burst}, max_concurrency={self.max_concurrency})"
+        )
+
+
+def _refill(tokens: float, stamp: float, rate: float, burst: float, now: float) -> float:
+    if rate <= 0:
+        return burst
+    if stamp <= 0 or stamp > now:
+        return burst
+    return min(burst, tokens + (now - stamp) * rate)
+
+
+def _check(
+    limits: QuotaLimits, requests: float, tokens: float, cost: float, in_flight: int, poll_interval: float,
+) -> float:
+    """Return 0 when a call can start now, else the seconds to wait before retrying."""
+    wait = 0.0
+    if limits.requests_per_second and requests < 1:
+        wait = max(wait, (1 - requests) / limits.requests_per_second)
+    if limits.tokens_per_second and tokens < cost:
+        wait = max(wait, (cost - tokens) / limits.tokens_per_second)
+    if limits.max_concurrency and in_flight >= limits.max_concurrency:
+        wait = max(wait, poll_interval)
+    return wait
+
+
+class QuotaBackend:
+    """
+    Storage for quota buckets and concurrency leases.
+
+    ``acquire`` must atomically refill the key's buckets, and either take one
+    request, *tokens* prompt tokens and a concurrency lease (returning the
+    lease id and 0), or take nothing (returning None and the seconds to wait).
+    """
+
+    poll_interval = DEFAULT_POLL_INTERVAL
+
+    def acquire(self, key: str, limits: QuotaLimits, tokens: float = 0) -> tuple[str | None, float]:
+        raise NotImplementedError
+
+    def release(self, key: str, lease: str) -> None:
+        raise NotImplementedError
+
+
+class LocalQuotaBackend(QuotaBackend):
+    """In-process backend: shares buckets between the threads and tasks of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: dict[str, list] = {}
+        self._ids = itertools.count()
+
+    def acquire(self, key: str, limits: QuotaLimits, tokens: float = 0) -> tuple[str | None, float]:
+        now = time.time()
+        cost = min(tokens, limits.token_burst) if limits.token_burst else 0
+        with self._lock:
+            state = self._state.setdefault(key, [0.0, 0.0, 0.0, 0.0, set()])
+            requests = _refill(state[0], state[1], limits.requests_per_second, limits.burst, now)
+            bucket = _refill(state[2], state[3], limits.tokens_per_second, limits.token_burst, now)
+            state[0:4] = [requests, now, bucket, now]
+            wait = _check(limits, requests, bucket, cost, len(state[4]), self.poll_interval)
+            if wait:
+                return None, wait
+            state[0] -= 1
+            state[2] -= cost
+            lease = str(next(self._ids))
+            state[4].add(lease)
+            return lease, 0.0
+
+    def release(self, key: str, lease: str) -> None:
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None:
+                state[4].discard(lease)
+
+
+class SharedMemoryQuotaBackend(QuotaBackend):
+    """
+    Host-wide backend over a memory-mapped file, locked with ``flock``.
+
+    Every process that opens the same *path* shares the buckets. Leases
+    record the holder's PID; when a key is at its concurrency limit, leases
+    held by processes that no longer exist are reclaimed.
+
+    Args:
+        path: File backing the shared segment (default: /dev/shm/cnoe-agent-utils-quota,
+              or the temp directory when /dev/shm does not exist)
+        max_keys: Number of distinct quota keys the segment can hold
+        max_leases: Number of concurrent leases across all keys
+    """
+
+    MAGIC = b"CNOEQTA1"
+    HEADER = struct.Struct("<8sII")
+    # key hash, request tokens, request stamp, prompt tokens, prompt stamp, in flight
+    SLOT = struct.Struct("<8sddddq")
+    # slot index + 1 (0 = free), pid
+    LEASE = struct.Struct("<ii")
+
+    def __init__(self, path: str | None = None, max_keys: int = 256, max_leases: int = 4096):
+        import fcntl
+        self._fcntl = fcntl
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(directory, DEFAULT_SHM_NAME)
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.HEADER.size + max_keys * self.SLOT.size + max_leases * self.LEASE.size
+        with self._locked_file():
+            if os.fstat(self._fd).st_size < self.HEADER.size:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, max_keys, max_leases), 0)
+            magic, self.max_keys, self.max_leases = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))
+            if magic != self.MAGIC:
+                raise ValueError(f"{path} is not a quota segment")
+        self._leases_offset = self.HEADER.size + self.max_keys * self.SLOT.size
+        self._map = mmap.mmap(self._fd, self._leases_offset + self.max_leases * self.LEASE.size)
+
+    @contextmanager
+    def _locked_file(self) -> Generator[None]:
+        # flock excludes other processes; the thread lock excludes threads sharing this descriptor
+        with self._thread_lock:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _slot_offset(self, index: int) -> int:
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _find_slot(self, key: str) -> int:
+        digest = hashlib.sha256(key.encode()).digest()[:8]
+        start = int.from_bytes(digest, "little") % self.max_keys
+        for probe in range(self.max_keys):
+            index = (start + probe) % self.max_keys
+            stored = self._map[self._slot_offset(index):self._slot_offset(index) + 8]
+            if stored == digest:
+                return index
+            if stored == b"\0" * 8:
+                self.SLOT.pack_into(self._map, self._slot_offset(index), digest, 0.0, 0.0, 0.0, 0.0, 0)
+                return index
+        raise RuntimeError(f"Quota segment {self.path} is full ({self.max_keys} keys)")
+
+    def _reclaim_dead_leases(self, slot: int) -> int:
+        reclaimed = 0
+        for index in range(self.max_leases):
+            offset = self._leases_offset + index * self.LEASE.size
+            owner, pid = self.LEASE.unpack_from(self._map, offset)
+            if owner == slot + 1 and not _pid_alive(pid):
+                self.LEASE.pack_into(self._map, offset, 0, 0)
+                reclaimed += 1
+        if reclaimed:
+            logger.warning(f"[LLM][quota] reclaimed {reclaimed} lease(s) from exited processes")
+        return reclaimed
+
+    def acquire(self, key: str, limits: QuotaLimits, tokens: float = 0) -> tuple[str | None, float]:
+        cost = min(tokens, limits.token_burst) if limits.token_burst else 0
+        with self._locked_file():
+            now = time.time()
+            slot = self._find_slot(key)
+            offset = self._slot_offset(slot)
+            digest, requests, request_stamp, bucket, bucket_stamp, in_flight = self.SLOT.unpack_from(self._map, offset)
+            requests = _refill(requests, request_stamp, limits.requests_per_second, limits.burst, now)
+            bucket = _refill(bucket, bucket_stamp, limits.tokens_per_second, limits.token_burst, now)
+            if limits.max_concurrency and in_flight >= limits.max_concurrency:
+                in_flight -= self._reclaim_dead_leases(slot)
+            wait = _check(limits, requests, bucket, cost, in_flight, self.poll_interval)
+            lease = None
+            if not wait:
+                lease = self._take_lease(slot)
+                if lease is None:
+                    wait = self.poll_interval
+                else:
+                    requests, bucket, in_flight = requests - 1, bucket - cost, in_flight + 1
+            self.SLOT.pack_into(self._map, offset, digest, requests, now, bucket, now, in_flight)
+            return lease, wait
+
+    def _take_lease(self, slot: int) -> str | None:
+        free = b"\0" * self.LEASE.size
+        end = self._leases_offset + self.max_leases * self.LEASE.size
+        offset = self._map.find(free, self._leases_offset, end)
+        while offset != -1 and (offset - self._leases_offset) % self.LEASE.size:
+            offset = self._map.find(free, offset + 1, end)
+        if offset == -1:
+            return None
+        self.LEASE.pack_into(self._map, offset, slot + 1, os.getpid())
+        return str((offset - self._leases_offset) // self.LEASE.size)
+
+    def release(self, key: str, lease: str) -> None:
+        with self._locked_file():
+            offset = self._leases_offset + int(lease) * self.LEASE.size
+            owner, pid = self.LEASE.unpack_from(self._map, offset)
+            if owner == 0 or pid != os.getpid():
+                return  # already reclaimed
+            self.LEASE.pack_into(self._map, offset, 0, 0)
+            slot_offset = self._slot_offset(owner - 1)
+            fields = list(self.SLOT.unpack_from(self._map, slot_offset))
+            fields[5] = max(0, fields[5] - 1)
+            self.SLOT.pack_into(self._map, slot_offset, *fields)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_REDIS_ACQUIRE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rps, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tps, token_burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+local cost, max_concurrency = tonumber(ARGV[5]), tonumber(ARGV[6])
+local lease, ttl, poll = ARGV[7], tonumber(ARGV[8]), tonumber(ARGV[9])
+local state = redis.call('HMGET', KEYS[1], 'r', 'rs', 't', 'ts')
+local function refill(tokens, stamp, rate, cap)
+  if rate <= 0 or not tokens then return cap end
+  stamp = tonumber(stamp)
+  if stamp > now then return cap end
+  return math.min(cap, tonumber(tokens) + (now - stamp) * rate)
+end
+local requests = refill(state[1], state[2], rps, burst)
+local bucket = refill(state[3], state[4], tps, token_burst)
+local wait = 0
+if rps > 0 and requests < 1 then wait = math.max(wait, (1 - requests) / rps) end
+if tps > 0 and bucket < cost then wait = math.max(wait, (cost - bucket) / tps) end
+if max_concurrency > 0 then
+  redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+  if redis.call('ZCARD', KEYS[2]) >= max_concurrency then wait = math.max(wait, poll) end
+end
+if wait == 0 then
+  requests = requests - 1
+  bucket = bucket - cost
+  redis.call('ZADD', KEYS[2], now + ttl, lease)
+  redis.call('EXPIRE', KEYS[2], math.ceil(ttl) * 2)
+end
+redis.call('HSET', KEYS[1], 'r', requests, 'rs', now, 't', bucket, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+
+class RedisQuotaBackend(QuotaBackend):
+    """
+    Distributed backend: buckets in a Redis hash, leases in a sorted set with a TTL.
+
+    Args:
+        client: ``redis.Redis`` client (or built from *url*)
+        url: Redis URL, used when *client* is None
+        prefix: Key prefix
+        lease_ttl: Seconds after which a lease whose holder never released it expires
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        url: str | None = None,
+        prefix: str = "llm-quota",
+        lease_ttl: float = DEFAULT_LEASE_TTL,
+    ):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("RedisQuotaBackend requires redis. Install with: pip install redis") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self._script = client.register_script(_REDIS_ACQUIRE)
+
+    def _keys(self, key: str) -> list:
+        return [f"{self.prefix}:{key}:buckets", f"{self.prefix}:{key}:leases"]
+
+    def acquire(self, key: str, limits: QuotaLimits, tokens: float = 0) -> tuple[str | None, float]:
+        lease = uuid.uuid4().hex
+        cost = min(tokens, limits.token_burst) if limits.token_burst else 0
+        wait = float(self._script(keys=self._keys(key), args=[
+            limits.requests_per_second, limits.burst, limits.tokens_per_second, limits.token_burst,
+            cost, limits.max_concurrency, lease, self.lease_ttl, self.poll_interval,
+        ]))
+        return (None, wait) if wait else (lease, 0.0)
+
+    def release(self, key: str, lease: str) -> None:
+        self.client.zrem(self._keys(key)[1], lease)
+
+
+class Quota:
+    """
+    Blocking client for one quota key on a backend.
+
+    Args:
+        backend: Shared bucket storage
+        key: Quota key, e.g. "openai:gpt-4o" or an account name
+        limits: Limits for the key (every process should use the same)
+        timeout: Seconds to wait for capacity before raising TimeoutError (None waits forever)
+        aging_seconds: Waiting this long raises a queued call's priority by one level
+        interactive_reserve: Fraction of ``max_concurrency`` only interactive (priority <= 0)
+                             calls may use
+    """
+
+    def __init__(
+        self,
+        backend: QuotaBackend,
+        key: str,
+        limits: QuotaLimits,
+        timeout: float | None = None,
+        aging_seconds: float = DEFAULT_AGING_SECONDS,
+        interactive_reserve: float = 0.0,
+    ):
+        self.backend = backend
+        self.key = key
+        self.limits = limits
+        self.timeout = timeout
+        self.aging_seconds = max(1e-3, aging_seconds)
+        self.interactive_reserve = interactive_reserve
+        self._shared_limits = limits
+        if interactive_reserve and limits.max_concurrency:
+            self._shared_limits = QuotaLimits(
+                requests_per_second=limits.requests_per_second,
+                burst=limits.burst,
+                tokens_per_minute=limits.token_burst,
+                max_concurrency=max(1, math.floor(limits.max_concurrency * (1 - interactive_reserve))),
+            )
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+        self._waiting: dict[int, tuple[int, float]] = {}
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def _effective(self, priority: int, enqueued: float, now: float) -> float:
+        return priority - (now - enqueued) / self.aging_seconds
+
+    def _enqueue(self, priority: int) -> tuple[int, float]:
+        enqueued = time.monotonic()
+        with self._lock:
+            ticket = next(self._tickets)
+            self._waiting[ticket] = (priority, enqueued)
+        return ticket, enqueued
+
+    def _dequeue(self, ticket: int) -> None:
+        with self._lock:
+            self._waiting.pop(ticket, None)
+
+    def _turn(self, ticket: int) -> QuotaLimits | None:
+        """
+        Return the limits to acquire with, or None while a queued call sits in a
+        higher priority level than *ticket* (calls within a level compete freely).
+        """
+        now = time.monotonic()
+        with self._lock:
+            effective = self._effective(*self._waiting[ticket], now)
+            best = min(self._effective(priority, enqueued, now) for priority, enqueued in self._waiting.values())
+        if math.ceil(effective - 1e-9) > math.ceil(best - 1e-9):
+            return None
+        return self.limits if effective <= 0 else self._shared_limits
+
+    def _record(self, priority: int, started: float, waited: bool) -> None:
+        with self._lock:
+            lane = self._stats.setdefault(_priority_name(priority), {"acquired": 0, "waited": 0, "wait_seconds": 0.0})
+            lane["acquired"] += 1
+            if waited:
+                lane["waited"] += 1
+                lane["wait_seconds"] += time.monotonic() - started
+
+    def _deadline_wait(self, started: float, wait: float) -> float:
+        if self.timeout is not None and time.monotonic() - started + wait > self.timeout:
+            raise TimeoutError(f"Timed out after {self.timeout}s waiting for LLM quota '{self.key}'")
+        return wait
+
+    def _priority(self, priority: str | int | None) -> int:
+        priority = resolve_priority(priority)
+        if priority is None:
+            priority = current_priority()
+        return DEFAULT_PRIORITY if priority is None else priority
+
+    def acquire(self, tokens: float = 0, priority: str | int | None = None) -> str:
+        """Block until the call may start; return the lease to release afterwards."""
+        priority = self._priority(priority)
+        ticket, started = self._enqueue(priority)
+        waited = False
+        try:
+            while True:
+                limits = self._turn(ticket)
+                if limits is None:
+                    wait = self.backend.poll_interval
+                else:
+                    lease, wait = self.backend.acquire(self.key, limits, tokens)
+                    if lease is not None:
+                        self._record(priority, started, waited)
+                        return lease
+                waited = True
+                time.sleep(self._deadline_wait(started, wait))
+        finally:
+            self._dequeue(ticket)
+
+    async def aacquire(self, tokens: float = 0, priority: str | int | None = None) -> str:
+        """Async ``acquire``; the backend call runs in a thread so the event loop is not blocked by the lock."""
+        priority = self._priority(priority)
+        ticket, started = self._enqueue(priority)
+        waited = False
+        try:
+            while True:
+                limits = self._turn(ticket)
+                if limits is None:
+                    wait = self.backend.poll_interval
+                else:
+                    acquiring = asyncio.ensure_future(asyncio.to_thread(self.backend.acquire, self.key, limits, tokens))
+                    try:
+                        lease, wait = await asyncio.shield(acquiring)
+                    except asyncio.CancelledError:
+                        # The backend call still finishes in its thread: hand back any lease it takes
+                        acquiring.add_done_callback(self._release_abandoned)
+                        raise
+                    if lease is not None:
+                        self._record(priority, started, waited)
+                        return lease
+                waited = True
+                await asyncio.sleep(self._deadline_wait(started, wait))
+        finally:
+            self._dequeue(ticket)
+
+    def _release_abandoned(self, acquiring: "asyncio.Future[tuple[str | None, float]]") -> None:
+        """Release the lease of an acquire whose caller was cancelled while it ran."""
+        if acquiring.cancelled() or acquiring.exception() is not None:
+            return
+        lease, _ = acquiring.result()
+        if lease is not None:
+            logger.debug(f"[LLM][quota] released lease {lease} of '{self.key}' acquired after its caller was cancelled")
+            asyncio.get_running_loop().run_in_executor(None, self.release, lease)
+
+    def release(self, lease: str) -> None:
+        self.backend.release(self.key, lease)
+
+    @contextmanager
+    def slot(self, tokens: float = 0, priority: str | int | None = None) -> Generator[None]:
+        lease = self.acquire(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release(lease)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: float = 0, priority: str | int | None = None) -> AsyncGenerator[None]:
+        lease = await self.aacquire(tokens, priority)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.release, lease)
+
+    def stats(self) -> dict[str, Any]:
+        """Return this process's acquisitions and time spent waiting, in total and per priority lane."""
+        with self._lock:
+            lanes = {name: dict(lane) for name, lane in self._stats.items()}
+            queued = len(self._waiting)
+        totals = {field: sum(lane[field] for lane in lanes.values()) for field in ("acquired", "waited", "wait_seconds")}
+        return {**totals, "queued": queued, "by_priority": lanes}
+
+
+_backends: dict[tuple, QuotaBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_quota_backend(kind: str | None = None) -> QuotaBackend:
+    """
+    Return the process-wide backend selected by *kind* or ``LLM_QUOTA_BACKEND``.
+
+    "local" (default), "shm" (``LLM_QUOTA_SHM_PATH``) or "redis" (``LLM_QUOTA_REDIS_URL``).
+    """
+    kind = (kind or os.getenv("LLM_QUOTA_BACKEND") or "local").strip().lower()
+    cache_key = (kind, os.getenv("LLM_QUOTA_SHM_PATH"), os.getenv("LLM_QUOTA_REDIS_URL"))
+    with _backends_lock:
+        if cache_key not in _backends:
+            if kind == "local":
+                _backends[cache_key] = LocalQuotaBackend()
+            elif kind in ("shm", "shared_memory"):
+                _backends[cache_key] = SharedMemoryQuotaBackend(os.getenv("LLM_QUOTA_SHM_PATH"))
+            elif kind == "redis":
+                _backends[cache_key] = RedisQuotaBackend(url=os.getenv("LLM_QUOTA_REDIS_URL"))
+            else:
+                raise ValueError(f"Unknown LLM_QUOTA_BACKEND '{kind}'; expected local, shm or redis")
+        return _backends[cache_key]
+
+
+def quota_from_env(provider: str, model: str | None) -> Quota | None:
+    """
+    Build a ``Quota`` from ``LLM_QUOTA_*`` environment variables, or None when no limit is set.
+
+    ``LLM_QUOTA_RPS``, ``LLM_QUOTA_BURST``, ``LLM_QUOTA_TPM``,
+    ``LLM_QUOTA_MAX_CONCURRENCY``, ``LLM_QUOTA_TIMEOUT``, ``LLM_QUOTA_KEY``
+    (default "<provider>:<model>"), ``LLM_PRIORITY_AGING_SECONDS`` and
+    ``LLM_QUOTA_INTERACTIVE_RESERVE`` (fraction of the concurrency limit).
+    """
+    def number(name: str) -> float | None:
+        value = os.getenv(name)
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            logger.warning(f"Invalid value for {name}='{value}', ignoring")
+            return None
+
+    concurrency = number("LLM_QUOTA_MAX_CONCURRENCY")
+    limits = QuotaLimits(
+        requests_per_second=number("LLM_QUOTA_RPS"),
+        burst=number("LLM_QUOTA_BURST"),
+        tokens_per_minute=number("LLM_QUOTA_TPM"),
+        max_concurrency=int(concurrency) if concurrency else None,
+    )
+    if not limits.enabled:
+        return None
+    key = os.getenv("LLM_QUOTA_KEY") or f"{provider}:{model or 'default'}"
+    return Quota(
+        get_quota_backend(), key, limits,
+        timeout=number("LLM_QUOTA_TIMEOUT"),
+        aging_seconds=number("LLM_PRIORITY_AGING_SECONDS") or DEFAULT_AGING_SECONDS,
+        interactive_reserve=number("LLM_QUOTA_INTERACTIVE_RESERVE") or 0.0,
+    )
+
+
+class QuotaLimitedLLM(ChatModelWrapper):
+    """
+    Chat model that holds a quota lease for the duration of each call.
+
+    The call's priority is, in order: a ``priority=`` keyword argument,
+    ``priority`` in the run metadata, the enclosing ``priority_context``,
+    then *priority*.
+
+    Args:
+        model: Underlying chat model
+        quota: Quota to draw from
+        estimator: Prompt token estimator for the token bucket
+                   (default: ``token_budget.estimate_tokens``)
+        priority: Default priority for this model's calls
+        bound: Runnable to call; defaults to *model* (a tool-bound model when tools are bound)
+    """
+
+    quota: Quota
+    estimator: Callable[[Any], int]
+    priority: int | None = None
+
+    def __init__(
+        self,
+        model: Any,
+        quota: Quota,
+        estimator: Callable[[Any], int] | None = None,
+        priority: str | int | None = None,
+        bound: Any = None,
+    ):
+        from .token_budget import estimate_tokens
+        super().__init__(
+            model, bound, quota=quota, estimator=estimator or estimate_tokens, priority=resolve_priority(priority),
+        )
+
+    def _tokens(self, input: Any) -> int:
+        return self.estimator(input) if self.quota.limits.tokens_per_second else 0
+
+    def _priority(self, config: RunnableConfig | None, kwargs: dict[str, Any]) -> int | None:
+        priority = resolve_priority(kwargs.pop("priority", None))
+        if priority is None:
+            priority = resolve_priority(((config or {}).get("metadata") or {}).get("priority"))
+        if priority is None:
+            priority = current_priority()
+        return self.priority if priority is None else priority
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "QuotaLimitedLLM":
+        return QuotaLimitedLLM(
+            self.model, self.quota, self.estimator, self.priority, bound=self.model.bind_tools(tools, **kwargs),
+        )
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        with self.quota.slot(self._tokens(input), self._priority(config, kwargs)):
+            return self.bound.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        async with self.quota.aslot(self._tokens(input), self._priority(config, kwargs)):
+            return await self.bound.ainvoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        with self.quota.slot(self._tokens(input), self._priority(config, kwargs)):
+            yield from self.bound.stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async with self.quota.aslot(self._tokens(input), self._priority(config, kwargs)):
+            async for chunk in self.bound.astream(input, config, **kwargs):
+                yield chunk
@@ -0,0 +1,453 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Complexity-based model routing for LLMFactory.
+
+Every request normally goes to the single model configured for the provider
+(``OPENAI_MODEL_NAME``, ``AWS_BEDROCK_MODEL_ID``, ...). ``ComplexityRouter``
+scores each request with cheap local features (prompt length, tool need,
+keywords, or a pluggable classifier) and picks a model tier, so trivial
+lookups go to a small, fast model and only hard requests reach the large one.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+    from cnoe_agent_utils.routing import ComplexityRouter, ModelTier
+
+    router = ComplexityRouter([
+        ModelTier("fast", model="gpt-4o-mini", max_score=0.3, input_cost_per_1k=0.00015, output_cost_per_1k=0.0006),
+        ModelTier("strong", model="gpt-4o", input_cost_per_1k=0.0025, output_cost_per_1k=0.01),
+    ])
+    llm = LLMFactory("openai").get_routed_llm(router)
+    llm.invoke("What is the capital of France?")  # -> fast tier
+
+Tiers can also be configured with ``LLM_ROUTER_TIERS`` (a JSON list of tier
+objects) and ``ComplexityRouter.from_env()``.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from typing import Any, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPLEX_KEYWORDS = (
+    "analyze", "analyse", "architecture", "compare", "debug", "design", "diagnose",
+    "explain why", "investigate", "migrate", "optimize", "plan", "refactor",
+    "root cause", "step by step", "trade-off", "tradeoff", "troubleshoot",
+)
+DEFAULT_TOOL_KEYWORDS = (
+    "create", "delete", "deploy", "fetch", "find", "list", "lookup", "query",
+    "search", "sync", "update",
+)
+
+# A classifier receives the request text and the extracted features and
+# returns a complexity score in [0, 1].
+Classifier = Callable[[str, dict[str, Any]], float]
+
+
+def request_text(request: Any) -> str:
+    """
+    Flatten a chat model input into plain text for local feature extraction.
+
+    Accepts strings, PromptValues, message lists, (role, content) tuples and
+    dicts with a ``messages`` key.
+    """
+    if request is None:
+        return ""
+    if isinstance(request, str):
+        return request
+    if hasattr(request, "to_messages"):
+        request = request.to_messages()
+    if isinstance(request, dict):
+        if "messages" in request:
+            return request_text(request["messages"])
+        return str(request.get("content", ""))
+    if isinstance(request, (list, tuple)):
+        if isinstance(request, tuple) and len(request) == 2 and isinstance(request[0], str):
+            return request_text(request[1])
+        return "\n".join(request_text(item) for item in request)
+
+    content = getattr(request, "content", request)
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, str):
+                parts.append(part)
+            elif isinstance(part, dict) and isinstance(part.get("text"), str):
+                parts.append(part["text"])
+        return "".join(parts)
+    return str(content)
+
+
+class ModelTier:
+    """
+    A model tier the router can select.
+
+    Args:
+        name: Tier name used in logs and stats (e.g. "fast", "strong")
+        model: Model override passed to ``LLMFactory.get_llm(model=...)``;
+               None uses the provider's default model env var
+        max_score: Highest complexity score this tier accepts
+        input_cost_per_1k: Price per 1K input tokens, for savings reports
+        output_cost_per_1k: Price per 1K output tokens, for savings reports
+        fallback: Name of the tier to use if this tier's call fails;
+                  defaults to the next stronger tier
+        llm_kwargs: Extra keyword arguments for ``get_llm`` for this tier
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: str | None = None,
+        max_score: float = 1.0,
+        input_cost_per_1k: float = 0.0,
+        output_cost_per_1k: float = 0.0,
+        fallback: str | None = None,
+        llm_kwargs: dict[str, Any] | None = None,
+    ):
+        self.name = name
+        self.model = model
+        self.max_score = max_score
+        self.input_cost_per_1k = input_cost_per_1k
+        self.output_cost_per_1k = output_cost_per_1k
+        self.fallback = fallback
+        self.llm_kwargs = llm_kwargs or {}
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        """Estimate the cost of a call on this tier."""
+        return (input_tokens * self.input_cost_per_1k + output_tokens * self.output_cost_per_1k) / 1000
+
+    def __repr__(self) -> str:
+        return f"ModelTier(name={self.name!r}, model={self.model!r}, max_score={self.max_score})"
+
+
+class ComplexityRouter:
+    """
+    Score requests with cheap local features and map them to a model tier.
+
+    The default score is a weighted sum of prompt length, tool need and
+    complex-task keywords, clamped to [0, 1]. Pass ``classifier`` to replace
+    the heuristic with a custom scorer (e.g. a small local model).
+
+    Args:
+        tiers: Tiers ordered from cheapest to strongest; the last tier
+               accepts any score
+        classifier: Optional callable(text, features) -> score in [0, 1]
+        long_prompt_chars: Prompt length treated as maximally complex
+        complex_keywords: Keywords that suggest multi-step reasoning
+        tool_keywords: Keywords that suggest a tool call is needed
+    """
+
+    LENGTH_WEIGHT = 0.4
+    TOOL_WEIGHT = 0.2
+    KEYWORD_WEIGHT = 0.15
+    MAX_KEYWORD_HITS = 3
+
+    def __init__(
+        self,
+        tiers: Iterable[ModelTier],
+        classifier: Classifier | None = None,
+        long_prompt_chars: int = 4000,
+        complex_keywords: Iterable[str] = DEFAULT_COMPLEX_KEYWORDS,
+        tool_keywords: Iterable[str] = DEFAULT_TOOL_KEYWORDS,
+    ):
+        self.tiers: list[ModelTier] = sorted(tiers, key=lambda t: t.max_score)
+        if not self.tiers:
+            raise ValueError("ComplexityRouter requires at least one ModelTier")
+        self.classifier = classifier
+        self.long_prompt_chars = max(1, long_prompt_chars)
+        self._complex_re = self._keyword_pattern(complex_keywords)
+        self._tool_re = self._keyword_pattern(tool_keywords)
+
+    @staticmethod
+    def _keyword_pattern(keywords: Iterable[str]) -> Optional["re.Pattern[str]"]:
+        keywords = [k for k in keywords if k]
+        if not keywords:
+            return None
+        return re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")\b", re.IGNORECASE)
+
+    @classmethod
+    def from_env(cls, classifier: Classifier | None = None) -> "ComplexityRouter":
+        """
+        Build a router from ``LLM_ROUTER_TIERS``.
+
+        ``LLM_ROUTER_TIERS`` is a JSON list of objects with the ModelTier
+        arguments, e.g.
+        ``[{"name": "fast", "model": "gpt-4o-mini", "max_score": 0.3}, {"name": "strong", "model": "gpt-4o"}]``.
+
+        Raises:
+            EnvironmentError: If the variable is missing or invalid
+        """
+        raw = os.getenv("LLM_ROUTER_TIERS")
+        if not raw:
+            raise OSError("LLM_ROUTER_TIERS environment variable is required for model routing")
+        try:
+            tiers = [ModelTier(**spec) for spec in json.loads(raw)]
+        except (ValueError, TypeError) as e:
+            raise OSError(f"Invalid LLM_ROUTER_TIERS value: {e}") from e
+        long_prompt_chars = int(os.getenv("LLM_ROUTER_LONG_PROMPT_CHARS", "4000"))
+        return cls(tiers, classifier=classifier, long_prompt_chars=long_prompt_chars)
+
+    def extract_features(self, request: Any, has_tools: bool = False) -> dict[str, Any]:
+        """Extract cheap local features from a request."""
+        text = request_text(request)
+        complex_hits = len({m.lower() for m in self._complex_re.findall(text)}) if self._complex_re else 0
+        tool_hits = len({m.lower() for m in self._tool_re.findall(text)}) if self._tool_re else 0
+        return {
+            "chars": len(text),
+            "lines": text.count("\n") + 1 if text else 0,
+            "has_tools": has_tools,
+            "tool_keyword_hits": tool_hits,
+            "complex_keyword_hits": complex_hits,
+            "code_blocks": text.count("```") // 2,
+        }
+
+    def score(self, request: Any, has_tools: bool = False) -> float:
+        """Return a complexity score in [0, 1] for a request."""
+        features = self.extract_features(request, has_tools)
+        if self.classifier is not None:
+            value = float(self.classifier(request_text(request), features))
+        else:
+            length = min(1.0, features["chars"] / self.long_prompt_chars)
+            tool_need = 1.0 if features["has_tools"] and features["tool_keyword_hits"] else 0.0
+            keywords = min(features["complex_keyword_hits"], self.MAX_KEYWORD_HITS)
+            value = (
+                self.LENGTH_WEIGHT * length
+                + self.TOOL_WEIGHT * tool_need
+                + self.KEYWORD_WEIGHT * keywords
+                + (0.1 if features["code_blocks"] else 0.0)
+            )
+        return max(0.0, min(1.0, value))
+
+    def select_tier(self, score: float) -> ModelTier:
+        """Return the cheapest tier that accepts ``score``."""
+        for tier in self.tiers:
+            if score <= tier.max_score:
+                return tier
+        return self.tiers[-1]
+
+    def fallback_chain(self, tier: ModelTier) -> list[ModelTier]:
+        """Return the tiers to try, in order, starting with ``tier``."""
+        by_name = {t.name: t for t in self.tiers}
+        chain = [tier]
+        current = tier
+        while True:
+            if current.fallback:
+                nxt = by_name.get(current.fallback)
+            else:
+                index = self.tiers.index(current)
+                nxt = self.tiers[index + 1] if index + 1 < len(self.tiers) else None
+            if nxt is None or nxt in chain:
+                return chain
+            chain.append(nxt)
+            current = nxt
+
+
+class RoutingStats:
+    """Thread-safe per-tier counters for routed calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: dict[str, dict[str, float]] = {}
+
+    def record(self, tier: str, latency: float, cost: float, baseline_cost: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._tiers.setdefault(tier, {
+                "requests": 0, "errors": 0, "total_latency": 0.0, "cost": 0.0, "baseline_cost": 0.0,
+            })
+            stats["requests"] += 1
+            if error:
+                stats["errors"] += 1
+                return
+            stats["total_latency"] += latency
+            stats["cost"] += cost
+            stats["baseline_cost"] += baseline_cost
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """Return per-tier stats with average latency and savings."""
+        with self._lock:
+            result = {}
+            for tier, stats in self._tiers.items():
+                ok = stats["requests"] - stats["errors"]
+                result[tier] = {
+                    **stats,
+                    "avg_latency": stats["total_latency"] / ok if ok else 0.0,
+                    "savings": stats["baseline_cost"] - stats["cost"],
+                }
+            return result
+
+
+def _usage_tokens(response: Any, prompt_text: str) -> tuple[int, int]:
+    """Return (input, output) tokens from usage metadata, or a chars/4 estimate."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens")
+    output_tokens = usage.get("output_tokens")
+    if input_tokens is None:
+        input_tokens = len(prompt_text) // 4
+    if output_tokens is None:
+        output_tokens = len(request_text(response)) // 4
+    return int(input_tokens), int(output_tokens)
+
+
+class TieredLLM(Runnable):
+    """
+    Base runnable holding one lazily built chat model per ``ModelTier``.
+
+    Models are built with ``factory.get_llm(model=tier.model, tools=...)``
+    and cached per tier name.
+    """
+
+    def __init__(self, factory: Any, tools: list[Any] | None = None, llm_kwargs: dict[str, Any] | None = None):
+        self.factory = factory
+        self.tools = tools
+        self.llm_kwargs = llm_kwargs or {}
+        self._models: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _bound_kwargs(self, kwargs: dict[str, Any]) -> dict[str, Any]:
+        """Return llm_kwargs updated with a ``bind_tools(strict=...)`` flag."""
+        llm_kwargs = dict(self.llm_kwargs)
+        if "strict" in kwargs:
+            llm_kwargs["strict_tools"] = kwargs["strict"]
+        return llm_kwargs
+
+    def get_model(self, tier: ModelTier) -> Any:
+        """Return the (cached) chat model for a tier."""
+        with self._lock:
+            model = self._models.get(tier.name)
+            if model is None:
+                kwargs = {**self.llm_kwargs, **tier.llm_kwargs}
+                if tier.model:
+                    kwargs["model"] = tier.model
+                model = self.factory.get_llm(tools=self.tools, **kwargs)
+                self._models[tier.name] = model
+            return model
+
+
+class RoutedLLM(TieredLLM):
+    """
+    Chat-model runnable that picks a tier per request.
+
+    When a tier's call fails, the router's fallback chain
+    is tried in order. Each call logs the tier, score, latency and estimated
+    savings against the strongest tier; ``get_stats()`` aggregates them.
+    """
+
+    def __init__(
+        self,
+        factory: Any,
+        router: ComplexityRouter,
+        tools: list[Any] | None = None,
+        llm_kwargs: dict[str, Any] | None = None,
+        stats: RoutingStats | None = None,
+    ):
+        super().__init__(factory, tools, llm_kwargs)
+        self.router = router
+        self.stats = stats or RoutingStats()
+
+    def bind_tools(self, tools: Iterable[Any], **kwargs: Any) -> "RoutedLLM":
+        """Return a routed model with *tools* bound on every tier."""
+        return RoutedLLM(self.factory, self.router, list(tools), self._bound_kwargs(kwargs), self.stats)
+
+    def route(self, input: Any) -> tuple[ModelTier, float]:
+        """Return the tier and score for a request."""
+        score = self.router.score(input, has_tools=bool(self.tools))
+        return self.router.select_tier(score), score
+
+    def _record(self, tier: ModelTier, score: float, started: float, prompt_text: str, response: Any) -> None:
+        latency = time.perf_counter() - started
+        input_tokens, output_tokens = _usage_tokens(response, prompt_text)
+        cost = tier.estimate_cost(input_tokens, output_tokens)
+        baseline = self.router.tiers[-1].estimate_cost(input_tokens, output_tokens)
+        self.stats.record(tier.name, latency, cost, baseline)
+        logger.info(
+            f"[LLM][router] tier={tier.name} model={tier.model} score={score:.2f} "
+            f"latency={latency:.2f}s est_cost=${cost:.6f} saved=${baseline - cost:.6f}"
+        )
+
+    def _record_error(self, tier: ModelTier, error: Exception, remaining: int) -> None:
+        self.stats.record(tier.name, 0.0, 0.0, 0.0, error=True)
+        if remaining:
+            logger.warning(f"[LLM][router] tier={tier.name} failed ({error}); falling back")
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        tier, score = self.route(input)
+        chain = self.router.fallback_chain(tier)
+        prompt_text = request_text(input)
+        for index, candidate in enumerate(chain):
+            started = time.perf_counter()
+            try:
+                response = self.get_model(candidate).invoke(input, config, **kwargs)
+            except Exception as e:
+                self._record_error(candidate, e, len(chain) - index - 1)
+                if index == len(chain) - 1:
+                    raise
+                continue
+            self._record(candidate, score, started, prompt_text, response)
+            return response
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        tier, score = self.route(input)
+        chain = self.router.fallback_chain(tier)
+        prompt_text = request_text(input)
+        for index, candidate in enumerate(chain):
+            started = time.perf_counter()
+            try:
+                response = await self.get_model(candidate).ainvoke(input, config, **kwargs)
+            except Exception as e:
+                self._record_error(candidate, e, len(chain) - index - 1)
+                if index == len(chain) - 1:
+                    raise
+                continue
+            self._record(candidate, score, started, prompt_text, response)
+            return response
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        tier, score = self.route(input)
+        chain = self.router.fallback_chain(tier)
+        prompt_text = request_text(input)
+        for index, candidate in enumerate(chain):
+            started = time.perf_counter()
+            final = None
+            try:
+                for chunk in self.get_model(candidate).stream(input, config, **kwargs):
+                    final = chunk if final is None else final + chunk
+                    yield chunk
+            except Exception as e:
+                # Only fall back if nothing has been emitted yet
+                self._record_error(candidate, e, 0 if final is not None else len(chain) - index - 1)
+                if final is not None or index == len(chain) - 1:
+                    raise
+                continue
+            self._record(candidate, score, started, prompt_text, final)
+            return
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        tier, score = self.route(input)
+        chain = self.router.fallback_chain(tier)
+        prompt_text = request_text(input)
+        for index, candidate in enumerate(chain):
+            started = time.perf_counter()
+            final = None
+            try:
+                async for chunk in self.get_model(candidate).astream(input, config, **kwargs):
+                    final = chunk if final is None else final + chunk
+                    yield chunk
+            except Exception as e:
+                self._record_error(candidate, e, 0 if final is not None else len(chain) - index - 1)
+                if final is not None or index == len(chain) - 1:
+                    raise
+                continue
+            self._record(candidate, score, started, prompt_text, final)
+            return
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """Return per-tier request counts, latency and estimated savings."""
+        return self.stats.snapshot()
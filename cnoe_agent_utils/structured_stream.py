@@ -0,0 +1,264 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Incremental structured output for streamed LLM responses.
+
+With ``response_format`` set, callers normally only get the Pydantic object
+once the whole response has been generated. ``PartialModelParser`` scans the
+streamed JSON as it arrives and validates each top-level field as soon as its
+value is complete, so downstream agents can act on early fields (a status or
+routing decision) before the rest of the response is generated.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+
+    chain = LLMFactory().get_llm(response_format=RouteDecision, stream_partial=True)
+    for partial in chain.stream("Which agent should handle this?"):
+        if "route" in partial.model_fields_set:
+            dispatch(partial.route)
+"""
+
+import json
+import logging
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Generic, TypeVar
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableConfig, RunnableGenerator
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class PartialModelParser(Generic[ModelT]):  # noqa: UP046
+    """
+    Incrementally parse a streamed JSON object into a Pydantic model.
+
+    Text is fed chunk by chunk. Leading prose or markdown fences before the
+    first ``{`` are ignored. Each top-level field is validated (including
+    field validators) once its value has been closed by a ``,`` or the final
+    ``}``, and a new partial instance is returned whenever the set of
+    completed fields grows. Partial instances are built with
+    ``model_construct`` so unvalidated fields are absent from
+    ``model_fields_set``; ``final()`` performs full validation.
+    """
+
+    def __init__(self, schema: type[ModelT]):
+        self.schema = schema
+        self._aliases: dict[str, str] = {}
+        for name, field in schema.model_fields.items():
+            self._aliases[name] = name
+            if field.alias:
+                self._aliases[field.alias] = name
+
+        self._text = ""
+        self._pos = 0
+        self._start: int | None = None
+        self._end: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._field_start = 0
+        self._fields: dict[str, Any] = {}
+        self._scratch = schema.model_construct()
+
+    @property
+    def done(self) -> bool:
+        """Whether the top-level JSON object has been closed."""
+        return self._end is not None
+
+    @property
+    def completed_fields(self) -> set[str]:
+        """Names of the fields validated so far."""
+        return set(self._fields)
+
+    def feed(self, chunk: str) -> ModelT | None:
+        """
+        Consume a chunk of streamed text.
+
+        Args:
+            chunk: Next piece of the model output
+
+        Returns:
+            A new partial instance if more fields completed, otherwise None
+        """
+        if not chunk or self.done:
+            return None
+
+        before = len(self._fields)
+        self._text += chunk
+        text = self._text
+
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._start is None:
+                if char == "{":
+                    self._start = i
+                    self._depth = 1
+                    self._field_start = i + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_field(self._field_start, i)
+                    self._end = i
+                    break
+            elif char == "," and self._depth == 1:
+                self._complete_field(self._field_start, i)
+                self._field_start = i + 1
+
+        self._pos = len(text) if self._end is None else self._end + 1
+
+        if len(self._fields) > before:
+            return self.partial()
+        return None
+
+    def _complete_field(self, start: int, end: int) -> None:
+        """Parse and validate one ``"key": value`` member of the top-level object."""
+        member = self._text[start:end].strip()
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError as e:
+            logger.debug(f"Could not parse streamed field {member[:80]!r}: {e}")
+            return
+
+        for key, value in parsed.items():
+            name = self._aliases.get(key)
+            if name is None:
+                continue
+            try:
+                self.schema.__pydantic_validator__.validate_assignment(self._scratch, name, value)
+            except ValidationError as e:
+                logger.debug(f"Streamed field '{name}' failed validation: {e}")
+                continue
+            self._fields[name] = self._scratch.__dict__[name]
+
+    def partial(self) -> ModelT:
+        """Return an instance holding only the fields validated so far."""
+        return self.schema.model_construct(_fields_set=set(self._fields), **self._fields)
+
+    def final(self) -> ModelT:
+        """
+        Validate the complete object.
+
+        Raises:
+            OutputParserException: If the stream did not contain a complete,
+                valid JSON object
+        """
+        if self._start is None or self._end is None:
+            raise OutputParserException(
+                f"Incomplete structured output for {self.schema.__name__}",
+                llm_output=self._text,
+            )
+        raw = self._text[self._start:self._end + 1]
+        try:
+            return self.schema.model_validate_json(raw)
+        except ValidationError as e:
+            raise OutputParserException(
+                f"Failed to validate structured output for {self.schema.__name__}: {e}",
+                llm_output=raw,
+            ) from e
+
+
+def _chunk_text(chunk: Any) -> str:
+    """Extract streamed JSON text from a message chunk (content or tool-call args)."""
+    tool_call_chunks = getattr(chunk, "tool_call_chunks", None)
+    if tool_call_chunks:
+        return "".join(tc.get("args") or "" for tc in tool_call_chunks)
+    tool_calls = getattr(chunk, "tool_calls", None)
+    if tool_calls and not getattr(chunk, "content", None):
+        return json.dumps(tool_calls[0].get("args") or {})
+
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, str):
+                parts.append(part)
+            elif isinstance(part, dict):
+                if part.get("type") in (None, "text"):
+                    parts.append(part.get("text") or "")
+                elif part.get("type") == "tool_use" and isinstance(part.get("input"), str):
+                    parts.append(part["input"])
+        return "".join(parts)
+    return ""
+
+
+def iter_partial_models(schema: type[ModelT], chunks: Iterator[Any]) -> Iterator[ModelT]:  # noqa: UP047
+    """
+    Yield partial model instances as fields complete, then the validated result.
+
+    Args:
+        schema: Pydantic model describing the expected output
+        chunks: Message chunks or strings from ``llm.stream(...)``
+    """
+    parser = PartialModelParser(schema)
+    for chunk in chunks:
+        partial = parser.feed(_chunk_text(chunk))
+        if partial is not None:
+            yield partial
+    yield parser.final()
+
+
+async def aiter_partial_models(schema: type[ModelT], chunks: AsyncIterator[Any]) -> AsyncIterator[ModelT]:  # noqa: UP047
+    """Async variant of :func:`iter_partial_models`."""
+    parser = PartialModelParser(schema)
+    async for chunk in chunks:
+        partial = parser.feed(_chunk_text(chunk))
+        if partial is not None:
+            yield partial
+    yield parser.final()
+
+
+class PartialStructuredOutputRunnable(RunnableGenerator):
+    """``RunnableGenerator`` whose ``invoke`` returns the last (validated) item."""
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        final = None
+        for final in self.stream(input, config, **kwargs):
+            pass
+        return final
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        final = None
+        async for final in self.astream(input, config, **kwargs):
+            pass
+        return final
+
+
+def partial_structured_output(schema: type[ModelT]) -> PartialStructuredOutputRunnable:  # noqa: UP047
+    """
+    Build a runnable that turns streamed message chunks into partial models.
+
+    Compose it after a chat model (``llm | partial_structured_output(Model)``).
+    ``stream``/``astream`` yield partial instances followed by the validated
+    object; ``invoke``/``ainvoke`` return the validated object.
+    """
+    def _transform(chunks: Iterator[Any]) -> Iterator[ModelT]:
+        yield from iter_partial_models(schema, chunks)
+
+    async def _atransform(chunks: AsyncIterator[Any]) -> AsyncIterator[ModelT]:
+        async for item in aiter_partial_models(schema, chunks):
+            yield item
+
+    return PartialStructuredOutputRunnable(_transform, _atransform, name=f"Partial{schema.__name__}Parser")
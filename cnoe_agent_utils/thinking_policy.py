@@ -0,0 +1,358 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Adaptive extended-thinking budget per request.
+
+``*_THINKING_ENABLED`` / ``*_THINKING_BUDGET`` give every call of a process
+the same thinking budget, so simple lookups pay full thinking latency.
+``ThinkingPolicy`` decides per user turn instead:
+
+- the latest user message is scored with the cheap local features of
+  ``routing.ComplexityRouter`` (prompt length, tool need, keywords, or a
+  custom classifier); below ``disable_below`` thinking is off, above it the
+  budget grows with the score up to ``max_budget``. The system prompt,
+  earlier turns and tool results do not count toward the score.
+- the decision is kept for the model calls of the turn's tool-use loop:
+  Anthropic and Bedrock Claude reject a call that turns thinking on or off
+  after an assistant ``tool_use`` message of the same turn
+- with a latency SLO (policy default, ``latency_slo=`` per call, or
+  ``latency_slo`` in the run metadata) the budget is capped to what the
+  observed thinking throughput can produce in time, and thinking is turned
+  off when not even the provider minimum fits
+
+Every call is recorded in ``ThinkingStats`` by budget band: thinking tokens
+used, latency, SLO misses and the pass rate of the quality validators (the
+same validators ``cascade`` uses), so budgets can be tuned against quality.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+    from cnoe_agent_utils.cascade import confidence_validator
+    from cnoe_agent_utils.thinking_policy import ThinkingPolicy
+
+    policy = ThinkingPolicy(max_budget=16000, latency_slo=20, validators=[confidence_validator(0.7)])
+    llm = LLMFactory("anthropic-claude").get_llm(thinking_policy=policy)
+    llm.invoke("What time zone is us-east-1 in?")           # thinking off
+    llm.invoke(long_incident_report, latency_slo=60)        # sized budget
+    policy.stats.snapshot()
+
+``LLM_THINKING_POLICY=adaptive`` enables a policy built from the
+environment (``ThinkingPolicy.from_env``) for every ``get_llm()`` call.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+from .routing import ComplexityRouter, ModelTier, request_text
+from .utils import env_int
+
+logger = logging.getLogger(__name__)
+
+# Providers whose chat models accept a per-call thinking budget
+THINKING_PROVIDERS = ("anthropic_claude", "aws_bedrock", "gcp_vertexai", "google_gemini")
+
+MIN_THINKING_BUDGET = 1024
+DEFAULT_MAX_THINKING_BUDGET = 8192
+DEFAULT_DISABLE_BELOW = 0.3
+DEFAULT_THINKING_TOKENS_PER_SECOND = 60.0
+DEFAULT_OVERHEAD_SECONDS = 2.0
+# Weight of the newest observation in the throughput moving average
+THROUGHPUT_SMOOTHING = 0.2
+BANDS = ("off", "low", "medium", "high")
+# User turns whose decision is remembered for their tool-use loop
+MAX_TRACKED_TURNS = 4096
+
+_ROLES = {"user": "human", "assistant": "ai", "model": "ai"}
+THINKING_BLOCK_TYPES = ("thinking", "redacted_thinking", "reasoning_content")
+
+
+def _message_role(message: Any) -> str | None:
+    """Return "human", "ai", "tool" or "system" for a chat message in any accepted form."""
+    if isinstance(message, str):
+        return "human"
+    if isinstance(message, tuple) and len(message) == 2 and isinstance(message[0], str):
+        role = message[0]
+    elif isinstance(message, dict):
+        role = message.get("type") or message.get("role")
+    else:
+        role = getattr(message, "type", None)
+    return _ROLES.get(role, role)
+
+
+def _has_thinking(message: Any) -> bool:
+    content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and block.get("type") in THINKING_BLOCK_TYPES for block in content
+    )
+
+
+def user_turn(input: Any) -> tuple[Any, tuple[Any, ...] | None, list[Any]]:
+    """
+    Split a chat model input into its latest user message and what followed it.
+
+    Returns:
+        ``(request, turn_key, replies)``: the latest user message (the whole
+        input when it has no message structure), a key identifying that user
+        turn (None without one) and the messages after it, which are the
+        assistant and tool messages of the turn's tool-use loop so far
+    """
+    messages = input.to_messages() if hasattr(input, "to_messages") else input
+    if isinstance(messages, dict) and "messages" in messages:
+        messages = messages["messages"]
+    if not isinstance(messages, list):
+        return input, None, []
+    for index in range(len(messages) - 1, -1, -1):
+        if _message_role(messages[index]) == "human":
+            request = messages[index]
+            message_id = request.get("id") if isinstance(request, dict) else getattr(request, "id", None)
+            return request, (index, message_id or request_text(request)), messages[index + 1:]
+    return input, None, []
+
+
+def _thinking_block_tokens(response: Any) -> int:
+    """Estimate thinking tokens from thinking content blocks (Anthropic does not report them separately)."""
+    content = getattr(response, "content", None)
+    if not isinstance(content, list):
+        return 0
+    chars = sum(
+        len(block.get("thinking") or block.get("reasoning_content", {}).get("text", "") or "")
+        for block in content
+        if isinstance(block, dict) and block.get("type") in ("thinking", "reasoning_content")
+    )
+    return chars // 4
+
+
+class ThinkingDecision:
+    """Budget chosen for one call."""
+
+    def __init__(self, budget: int | None, score: float, band: str, slo_capped: bool = False):
+        self.budget = budget
+        self.score = score
+        self.band = band
+        self.slo_capped = slo_capped
+
+    def __repr__(self) -> str:
+        return f"ThinkingDecision(budget={self.budget}, score={self.score:.2f}, band={self.band!r})"
+
+
+class ThinkingStats:
+    """Thread-safe per-band counters for thinking telemetry."""
+
+    FIELDS = ("calls", "budget", "thinking_tokens", "latency_seconds", "slo_misses", "slo_capped",
+              "quality_checks", "quality_passes")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bands: dict[str, dict[str, float]] = {}
+
+    def record(
+        self,
+        decision: ThinkingDecision,
+        thinking_tokens: int,
+        latency: float,
+        latency_slo: float | None = None,
+        quality: bool | None = None,
+    ) -> None:
+        with self._lock:
+            band = self._bands.setdefault(decision.band, dict.fromkeys(self.FIELDS, 0))
+            band["calls"] += 1
+            band["budget"] += decision.budget or 0
+            band["thinking_tokens"] += thinking_tokens
+            band["latency_seconds"] += latency
+            band["slo_misses"] += bool(latency_slo is not None and latency > latency_slo)
+            band["slo_capped"] += decision.slo_capped
+            if quality is not None:
+                band["quality_checks"] += 1
+                band["quality_passes"] += quality
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """Return per-band averages: budget, thinking tokens, latency, SLO miss rate and quality pass rate."""
+        with self._lock:
+            result = {}
+            for name in BANDS:
+                band = self._bands.get(name)
+                if not band:
+                    continue
+                calls = band["calls"]
+                result[name] = {
+                    "calls": calls,
+                    "avg_budget": band["budget"] / calls,
+                    "avg_thinking_tokens": band["thinking_tokens"] / calls,
+                    "budget_utilization": band["thinking_tokens"] / band["budget"] if band["budget"] else 0.0,
+                    "avg_latency_seconds": band["latency_seconds"] / calls,
+                    "slo_miss_rate": band["slo_misses"] / calls,
+                    "slo_capped": band["slo_capped"],
+                    "quality_pass_rate": (
+                        band["quality_passes"] / band["quality_checks"] if band["quality_checks"] else None
+                    ),
+                }
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._bands.clear()
+
+
+class ThinkingPolicy:
+    """
+    Size or disable the thinking budget per request.
+
+    Args:
+        max_budget: Budget for the most complex requests
+        min_budget: Smallest budget granted when thinking is on (provider minimum 1024)
+        disable_below: Complexity score below which thinking is off
+        latency_slo: Default latency target in seconds, or None for no target
+        thinking_tokens_per_second: Initial thinking throughput estimate; updated from observed calls
+        overhead_seconds: Latency outside thinking (time to first token plus the answer)
+        router: ComplexityRouter used for scoring; defaults to the keyword/length heuristic
+        validators: Quality checks (``cascade`` validators) recorded per band
+    """
+
+    def __init__(
+        self,
+        max_budget: int = DEFAULT_MAX_THINKING_BUDGET,
+        min_budget: int = MIN_THINKING_BUDGET,
+        disable_below: float = DEFAULT_DISABLE_BELOW,
+        latency_slo: float | None = None,
+        thinking_tokens_per_second: float = DEFAULT_THINKING_TOKENS_PER_SECOND,
+        overhead_seconds: float = DEFAULT_OVERHEAD_SECONDS,
+        router: ComplexityRouter | None = None,
+        validators: Iterable[Any] = (),
+    ):
+        self.min_budget = max(MIN_THINKING_BUDGET, min_budget)
+        self.max_budget = max(self.min_budget, max_budget)
+        self.disable_below = disable_below
+        self.latency_slo = latency_slo
+        self.thinking_tokens_per_second = thinking_tokens_per_second
+        self.overhead_seconds = overhead_seconds
+        self.router = router or ComplexityRouter([ModelTier("default")])
+        self.validators = list(validators)
+        self.stats = ThinkingStats()
+        self._lock = threading.Lock()
+        self._turns: OrderedDict[tuple[Any, ...], ThinkingDecision] = OrderedDict()
+
+    @classmethod
+    def from_env(cls, max_budget: int | None = None) -> "ThinkingPolicy":
+        """
+        Build a policy from ``LLM_THINKING_*`` environment variables.
+
+        ``LLM_THINKING_MAX_BUDGET`` (default: *max_budget*, i.e. the provider's
+        ``*_THINKING_BUDGET`` when set), ``LLM_THINKING_DISABLE_BELOW``,
+        ``LLM_THINKING_LATENCY_SLO`` (seconds) and ``LLM_THINKING_TOKENS_PER_SECOND``.
+        """
+        def env_float(name: str, default: float | None) -> float | None:
+            value = os.getenv(name)
+            if not value:
+                return default
+            try:
+                return float(value)
+            except ValueError:
+                logger.warning(f"Invalid value for {name}='{value}', using {default}")
+                return default
+
+        return cls(
+            max_budget=env_int("LLM_THINKING_MAX_BUDGET", max_budget or DEFAULT_MAX_THINKING_BUDGET),
+            disable_below=env_float("LLM_THINKING_DISABLE_BELOW", DEFAULT_DISABLE_BELOW),
+            latency_slo=env_float("LLM_THINKING_LATENCY_SLO", None),
+            thinking_tokens_per_second=env_float("LLM_THINKING_TOKENS_PER_SECOND", DEFAULT_THINKING_TOKENS_PER_SECOND),
+            router=ComplexityRouter.from_env() if os.getenv("LLM_ROUTER_TIERS") else None,
+        )
+
+    def decide(self, input: Any, has_tools: bool = False, latency_slo: float | None = None) -> ThinkingDecision:
+        """
+        Return the thinking budget for *input* (None when thinking should be off).
+
+        The first call of a user turn is scored from the latest user message.
+        Later calls of the same turn (its tool-use loop) reuse that decision,
+        so thinking is never switched on or off in the middle of the loop.
+        When the decision is no longer known (e.g. after a restart), whether
+        the turn's assistant messages carry thinking blocks decides.
+        """
+        request, turn_key, replies = user_turn(input)
+        if turn_key is not None and replies:
+            with self._lock:
+                decision = self._turns.get(turn_key)
+            if decision is not None:
+                return decision
+            decision = self._score(request, has_tools, latency_slo)
+            thinking_on = any(_has_thinking(reply) for reply in replies if _message_role(reply) == "ai")
+            if thinking_on and decision.budget is None:
+                return ThinkingDecision(self.min_budget, decision.score, "low", decision.slo_capped)
+            if not thinking_on and decision.budget is not None:
+                return ThinkingDecision(None, decision.score, "off", decision.slo_capped)
+            return decision
+
+        decision = self._score(request, has_tools, latency_slo)
+        if turn_key is not None:
+            with self._lock:
+                self._turns[turn_key] = decision
+                self._turns.move_to_end(turn_key)
+                while len(self._turns) > MAX_TRACKED_TURNS:
+                    self._turns.popitem(last=False)
+        return decision
+
+    def _score(self, request: Any, has_tools: bool, latency_slo: float | None) -> ThinkingDecision:
+        score = self.router.score(request, has_tools)
+        if score < self.disable_below:
+            return ThinkingDecision(None, score, "off")
+
+        span = (score - self.disable_below) / max(1e-9, 1.0 - self.disable_below)
+        budget = int(self.min_budget + span * (self.max_budget - self.min_budget))
+        slo_capped = False
+        slo = latency_slo if latency_slo is not None else self.latency_slo
+        if slo is not None:
+            affordable = int((slo - self.overhead_seconds) * self.thinking_tokens_per_second)
+            if affordable < budget:
+                budget, slo_capped = affordable, True
+            if budget < self.min_budget:
+                return ThinkingDecision(None, score, "off", slo_capped=True)
+
+        third = (self.max_budget - self.min_budget) / 3
+        band = "low" if budget < self.min_budget + third else "medium" if budget < self.min_budget + 2 * third else "high"
+        return ThinkingDecision(budget, score, band, slo_capped)
+
+    def check_quality(self, response: Any) -> bool | None:
+        """Run the validators on *response*; None when there are no validators."""
+        if not self.validators:
+            return None
+        for validator in self.validators:
+            try:
+                verdict = validator(response)
+            except Exception as e:  # noqa: BLE001
+                logger.debug(f"[LLM][thinking] validator {validator!r} failed: {e}")
+                return False
+            if verdict is False or isinstance(verdict, str):
+                return False
+        return True
+
+    def observe(
+        self,
+        decision: ThinkingDecision,
+        response: Any,
+        latency: float,
+        latency_slo: float | None = None,
+    ) -> None:
+        """Record a finished call and update the thinking throughput estimate."""
+        from .usage import extract_usage
+        usage = extract_usage(response) if response is not None else {}
+        thinking_tokens = usage.get("reasoning_tokens") or _thinking_block_tokens(response)
+        slo = latency_slo if latency_slo is not None else self.latency_slo
+        if response is not None:
+            quality = self.check_quality(response)
+        else:
+            # A failed call fails the quality check only when there is one
+            quality = False if self.validators else None
+        self.stats.record(decision, thinking_tokens, latency, slo, quality)
+
+        thinking_seconds = latency - self.overhead_seconds
+        if thinking_tokens and thinking_seconds > 0:
+            observed = thinking_tokens / thinking_seconds
+            with self._lock:
+                self.thinking_tokens_per_second += THROUGHPUT_SMOOTHING * (observed - self.thinking_tokens_per_second)
+        logger.debug(
+            f"[LLM][thinking] band={decision.band} score={decision.score:.2f} budget={decision.budget} "
+            f"thinking_tokens={thinking_tokens} latency={latency:.2f}s quality={quality}"
+        )
@@ -0,0 +1,344 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Per-call ``max_tokens`` and thinking-budget sizing.
+
+A fixed ``max_tokens`` is either too small (long prompts leave no room and
+answers are truncated and retried) or too large (the request trips the
+provider's context limit or pays latency for reserved capacity).
+``ContextSizedLLM`` sizes both per call from:
+
+- the model's context window and maximum output (``MODEL_LIMITS``, or
+  ``LLM_CONTEXT_WINDOW`` / ``LLM_MAX_OUTPUT_TOKENS``)
+- the estimated prompt size, including bound tool schemas
+- the configured output reserve for the visible answer
+  (``LLM_OUTPUT_RESERVE_TOKENS``) plus the configured thinking budget
+
+Enable it with ``LLMFactory.get_llm(auto_max_tokens=True)`` or
+``LLM_AUTO_MAX_TOKENS=true``. Values passed explicitly per call win. With a
+``thinking_policy.ThinkingPolicy`` the thinking budget is also chosen per
+user turn from its latest user message (see that module).
+"""
+
+import json
+import logging
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+
+from .chat_wrapper import ChatModelWrapper
+from .routing import request_text
+from .thinking_policy import ThinkingDecision
+from .tool_schemas import convert_tools_cached
+from .utils import env_int
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_RESERVE_TOKENS = 4096
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+MIN_THINKING_BUDGET = 1024
+# Extra headroom over the prompt estimate, as a fraction of the estimate
+ESTIMATE_SAFETY_RATIO = 0.05
+MIN_SAFETY_TOKENS = 256
+# Approximate tokenizer overhead per chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+CHARS_PER_TOKEN = 4
+
+# (context window, maximum output tokens) by model-name prefix; the longest
+# matching prefix wins. Bedrock/Vertex IDs are matched on their family part.
+MODEL_LIMITS: dict[str, tuple[int, int]] = {
+    "gpt-3.5": (16_385, 4_096),
+    "gpt-4": (8_192, 8_192),
+    "gpt-4-turbo": (128_000, 4_096),
+    "gpt-4o": (128_000, 16_384),
+    "gpt-4.1": (1_047_576, 32_768),
+    "gpt-5": (400_000, 128_000),
+    "o1": (200_000, 100_000),
+    "o3": (200_000, 100_000),
+    "o4": (200_000, 100_000),
+    "claude-3": (200_000, 4_096),
+    "claude-3-5": (200_000, 8_192),
+    "claude-3-7": (200_000, 64_000),
+    "claude-sonnet-4": (200_000, 64_000),
+    "claude-opus-4": (200_000, 32_000),
+    "claude-haiku-4": (200_000, 64_000),
+    "gemini-1.5": (1_048_576, 8_192),
+    "gemini-2.0": (1_048_576, 8_192),
+    "gemini-2.5": (1_048_576, 65_536),
+    "llama-3": (128_000, 8_192),
+    "llama3": (128_000, 8_192),
+    "mixtral": (32_768, 8_192),
+}
+
+
+def get_model_limits(model_name: str | None, provider: str | None = None) -> tuple[int, int]:
+    """
+    Return ``(context_window, max_output_tokens)`` for *model_name*.
+
+    ``LLM_CONTEXT_WINDOW`` and ``LLM_MAX_OUTPUT_TOKENS`` override the table.
+    Unknown models fall back to the provider's context limit from
+    ``agents.context_config`` and ``DEFAULT_MAX_OUTPUT_TOKENS``.
+    """
+    name = (model_name or "").lower().rsplit("/", 1)[-1]
+    # Bedrock IDs carry optional region and vendor prefixes ("us.anthropic.claude-...")
+    for vendor in ("anthropic.", "meta.", "mistral.", "openai."):
+        if vendor in name:
+            name = name.split(vendor, 1)[1]
+            break
+    matches = [prefix for prefix in MODEL_LIMITS if name.startswith(prefix)]
+    if matches:
+        context_window, max_output = MODEL_LIMITS[max(matches, key=len)]
+    else:
+        from .agents.context_config import get_context_limit_for_provider
+        context_window, max_output = get_context_limit_for_provider(provider), DEFAULT_MAX_OUTPUT_TOKENS
+    return (
+        env_int("LLM_CONTEXT_WINDOW", context_window),
+        env_int("LLM_MAX_OUTPUT_TOKENS", max_output),
+    )
+
+
+def estimate_tokens(input: Any) -> int:
+    """Cheap token estimate for a chat model input (characters / 4 plus per-message overhead)."""
+    if hasattr(input, "to_messages"):
+        input = input.to_messages()
+    messages = len(input) if isinstance(input, list) else 1
+    return len(request_text(input)) // CHARS_PER_TOKEN + messages * MESSAGE_OVERHEAD_TOKENS
+
+
+def compute_output_budget(
+    context_window: int,
+    max_output_tokens: int,
+    prompt_tokens: int,
+    output_reserve: int = DEFAULT_OUTPUT_RESERVE_TOKENS,
+    thinking_budget: int | None = None,
+) -> tuple[int, int | None]:
+    """
+    Size ``max_tokens`` and the thinking budget for one call.
+
+    ``max_tokens`` asks for the output reserve plus the desired thinking
+    budget, capped by the model's maximum output and by what is left of the
+    context window after the prompt (with a safety margin for estimate
+    error). Thinking gets whatever exceeds the answer reserve; it is dropped
+    (None) when less than the provider minimum of 1024 tokens would remain.
+
+    Raises:
+        ValueError: If the prompt leaves no room for output
+    """
+    safety = max(MIN_SAFETY_TOKENS, int(prompt_tokens * ESTIMATE_SAFETY_RATIO))
+    available = context_window - prompt_tokens - safety
+    if available <= 0:
+        raise ValueError(
+            f"Estimated prompt of {prompt_tokens:,} tokens leaves no room for output "
+            f"in a {context_window:,}-token context window"
+        )
+
+    max_tokens = min(max_output_tokens, available, output_reserve + (thinking_budget or 0))
+    if not thinking_budget:
+        return max_tokens, None
+
+    answer_tokens = min(output_reserve, max_tokens // 2)
+    thinking = min(thinking_budget, max_tokens - answer_tokens)
+    if thinking < MIN_THINKING_BUDGET:
+        return max_tokens, None
+    return max_tokens, thinking
+
+
+def sizing_kwargs(
+    provider: str,
+    model: Any,
+    max_tokens: int,
+    thinking_budget: int | None,
+    disable_thinking: bool = False,
+) -> dict[str, Any]:
+    """
+    Map a computed budget onto the call-time keyword arguments each chat model accepts.
+
+    With ``disable_thinking``, a None budget also turns off thinking the
+    model was built with (``*_THINKING_ENABLED``) for this call. Claude
+    accepts thinking only at temperature 1, so a call that turns thinking
+    on for a model built with another temperature also sends temperature 1.
+    """
+    if provider in ("google_gemini", "gcp_vertexai"):
+        kwargs: dict[str, Any] = {"max_output_tokens": max_tokens}
+        if thinking_budget is not None:
+            kwargs["thinking_budget"] = thinking_budget
+        elif disable_thinking:
+            kwargs["thinking_budget"] = 0
+        return kwargs
+
+    kwargs = {"max_tokens": max_tokens}
+    if thinking_budget is None and not disable_thinking:
+        return kwargs
+    thinking = (
+        {"type": "enabled", "budget_tokens": thinking_budget} if thinking_budget is not None else {"type": "disabled"}
+    )
+    temperature = getattr(model, "temperature", None)
+    if thinking_budget is not None and isinstance(temperature, (int, float)) and temperature != 1:
+        kwargs["temperature"] = 1
+    # ChatBedrockConverse is the only Bedrock model with additional_model_request_fields;
+    # checked by attribute so wrapped models are recognized too
+    uses_converse = getattr(model, "beta_use_converse_api", False) or hasattr(model, "additional_model_request_fields")
+    if provider == "aws_bedrock" and uses_converse:
+        existing = getattr(model, "additional_model_request_fields", None) or getattr(model, "model_kwargs", None) or {}
+        fields = {k: v for k, v in existing.items() if k != "thinking"}
+        if thinking_budget is not None:
+            fields["thinking"] = thinking
+        if fields != existing:
+            kwargs["additional_model_request_fields"] = fields
+    elif provider in ("anthropic_claude", "aws_bedrock"):
+        kwargs["thinking"] = thinking
+    return kwargs
+
+
+class ContextSizedLLM(ChatModelWrapper):
+    """
+    Chat model that sets ``max_tokens`` (and the thinking budget) per call.
+
+    Args:
+        model: Underlying chat model (used for ``bind_tools``)
+        provider: Normalized provider name (e.g. "aws_bedrock")
+        model_name: Model name used to look up context limits
+        output_reserve: Tokens reserved for the visible answer
+        thinking_budget: Desired thinking budget, or None when thinking is off
+        bound: Runnable to call; defaults to *model* (a tool-bound model when tools are bound)
+        tool_tokens: Estimated tokens of bound tool schemas
+        estimator: Prompt token estimator; defaults to ``estimate_tokens``
+        max_output_cap: Upper bound on ``max_tokens`` below the model's own maximum
+        thinking_policy: ``thinking_policy.ThinkingPolicy`` that sizes or disables
+                         the thinking budget per call (overrides *thinking_budget*)
+    """
+
+    provider: str
+    model_name: str | None = None
+    context_window: int
+    max_output_tokens: int
+    max_output_cap: int | None = None
+    output_reserve: int = DEFAULT_OUTPUT_RESERVE_TOKENS
+    thinking_budget: int | None = None
+    tool_tokens: int = 0
+    estimator: Callable[[Any], int] = estimate_tokens
+    thinking_policy: Any = None
+
+    def __init__(
+        self,
+        model: Any,
+        provider: str,
+        model_name: str | None,
+        output_reserve: int = DEFAULT_OUTPUT_RESERVE_TOKENS,
+        thinking_budget: int | None = None,
+        bound: Any = None,
+        tool_tokens: int = 0,
+        estimator: Callable[[Any], int] | None = None,
+        max_output_cap: int | None = None,
+        thinking_policy: Any = None,
+    ):
+        context_window, max_output_tokens = get_model_limits(model_name, provider.replace("_", "-"))
+        super().__init__(
+            model,
+            bound,
+            provider=provider,
+            model_name=model_name,
+            context_window=context_window,
+            max_output_tokens=min(max_output_tokens, max_output_cap) if max_output_cap else max_output_tokens,
+            max_output_cap=max_output_cap,
+            output_reserve=output_reserve,
+            thinking_budget=thinking_budget,
+            tool_tokens=tool_tokens,
+            estimator=estimator or estimate_tokens,
+            thinking_policy=thinking_policy,
+        )
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ContextSizedLLM":
+        """Bind tools on the underlying model, counting their schemas toward the prompt."""
+        tools = list(tools)
+        schema_chars = len(json.dumps(convert_tools_cached(tools, strict=False), default=str))
+        return ContextSizedLLM(
+            self.model, self.provider, self.model_name, self.output_reserve, self.thinking_budget,
+            bound=self.model.bind_tools(tools, **kwargs),
+            tool_tokens=schema_chars // CHARS_PER_TOKEN,
+            estimator=self.estimator,
+            max_output_cap=self.max_output_cap,
+            thinking_policy=self.thinking_policy,
+        )
+
+    def size(self, input: Any, latency_slo: float | None = None) -> dict[str, Any]:
+        """Return the call-time sizing kwargs for *input*."""
+        return self._plan(input, latency_slo)[0]
+
+    def _plan(self, input: Any, latency_slo: float | None, forced_tool: bool = False) -> tuple[dict[str, Any], Any]:
+        prompt_tokens = self.estimator(input) + self.tool_tokens
+        decision = None
+        # Claude rejects thinking on calls that force a tool (e.g. structured output)
+        thinking_budget = None if forced_tool else self.thinking_budget
+        if self.thinking_policy is not None and not forced_tool:
+            decision = self.thinking_policy.decide(input, has_tools=self.tool_tokens > 0, latency_slo=latency_slo)
+            thinking_budget = decision.budget
+        max_tokens, thinking = compute_output_budget(
+            self.context_window, self.max_output_tokens, prompt_tokens, self.output_reserve, thinking_budget,
+        )
+        if decision is not None and thinking != decision.budget:
+            # The context window shrank or dropped the policy's budget; the policy's
+            # decision is kept for the rest of the turn, so record a copy
+            decision = ThinkingDecision(
+                thinking, decision.score, decision.band if thinking is not None else "off", decision.slo_capped,
+            )
+        logger.debug(
+            f"[LLM] Sized call: prompt~{prompt_tokens} max_tokens={max_tokens} thinking_budget={thinking}"
+        )
+        kwargs = sizing_kwargs(
+            self.provider, self.model, max_tokens, thinking,
+            disable_thinking=self.thinking_policy is not None or forced_tool,
+        )
+        return kwargs, decision
+
+    def _prepare(self, input: Any, config: RunnableConfig | None, kwargs: dict[str, Any]) -> tuple[dict[str, Any], Any, float | None]:
+        latency_slo = kwargs.pop("latency_slo", None)
+        if latency_slo is None:
+            latency_slo = ((config or {}).get("metadata") or {}).get("latency_slo")
+        forced_tool = self.provider in ("anthropic_claude", "aws_bedrock") and kwargs.get("tool_choice") not in (None, "auto", "none")
+        sized, decision = self._plan(input, latency_slo, forced_tool)
+        return {**sized, **kwargs}, decision, latency_slo
+
+    def _observe(self, decision: Any, response: Any, started: float, latency_slo: float | None) -> None:
+        if decision is not None:
+            self.thinking_policy.observe(decision, response, time.perf_counter() - started, latency_slo)
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        call_kwargs, decision, latency_slo = self._prepare(input, config, kwargs)
+        started, response = time.perf_counter(), None
+        try:
+            response = self.bound.invoke(input, config, **call_kwargs)
+            return response
+        finally:
+            self._observe(decision, response, started, latency_slo)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        call_kwargs, decision, latency_slo = self._prepare(input, config, kwargs)
+        started, response = time.perf_counter(), None
+        try:
+            response = await self.bound.ainvoke(input, config, **call_kwargs)
+            return response
+        finally:
+            self._observe(decision, response, started, latency_slo)
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        call_kwargs, decision, latency_slo = self._prepare(input, config, kwargs)
+        started, response = time.perf_counter(), None
+        try:
+            for chunk in self.bound.stream(input, config, **call_kwargs):
+                response = chunk if response is None else response + chunk
+                yield chunk
+        finally:
+            self._observe(decision, response, started, latency_slo)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        call_kwargs, decision, latency_slo = self._prepare(input, config, kwargs)
+        started, response = time.perf_counter(), None
+        try:
+            async for chunk in self.bound.astream(input, config, **call_kwargs):
+                response = chunk if response is None else response + chunk
+                yield chunk
+        finally:
+            self._observe(decision, response, started, latency_slo)
@@ -0,0 +1,1082 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Provider-aware token counting with memoized per-message counts.
+
+Counting every provider with the GPT-4 tiktoken encoding undercounts Claude
+and miscounts Gemini, so context trimming either drops too much history or
+overflows the window. ``TokenCounter`` picks a tokenizer per provider and
+model:
+
+- OpenAI, Azure OpenAI, Groq and OpenAI-compatible servers: the model's
+  tiktoken encoding (``o200k_base`` / ``cl100k_base``)
+- Anthropic and Claude on Bedrock: a character-ratio approximation tuned
+  for the Claude tokenizer, which is not published
+- Gemini and Vertex AI: a character-ratio approximation
+
+Exact BPE over megabytes of tool output is slow, and trimming only needs a
+tight upper bound, so each counter also has a fast ``EstimateTokenizer``
+(UTF-8 bytes and words, with a conservative ratio per encoding) and a
+mode (``LLM_TOKENIZER_MODE``): ``exact`` tokenizes every message,
+``estimate`` only estimates, and ``hybrid`` (the default) estimates while
+the context is far below its limit and tokenizes near it
+(``count_for_limit``).
+
+From async code, ``acount_messages`` / ``acount_total`` /
+``acount_for_limit`` count small batches inline and send large ones
+(``LLM_TOKEN_COUNT_INLINE_CHARS``) to a shared thread pool
+(``LLM_TOKENIZER_THREADS``), so one session's multi-megabyte tool output does
+not stall every other session on the event loop.
+
+tiktoken downloads its BPE data on first use; the package bundles none.
+For air-gapped clusters, ``download_tokenizer_data`` fills a directory ahead
+of time (e.g. at image build), tiktoken's ``TIKTOKEN_CACHE_DIR`` points at
+it, and ``LLM_TOKENIZER_OFFLINE=true`` turns a missing file into an
+immediate fallback instead of a download attempt. Each encoding is loaded,
+or fails, once per process. ``preload_tokenizers_from_env`` loads the
+encodings named by ``LLM_TOKENIZER_PRELOAD``; call it from a pre-fork
+server's startup hook so all workers share one copy.
+
+Local counts are free; the provider's count API
+(``get_num_tokens_from_messages`` on the chat model) is only called by
+``count_total`` when asked for with ``exact=True`` or
+``LLM_TOKEN_COUNT_EXACT=true``, with the whole list in one request.
+Per-message counts are always local: count endpoints reject partial
+conversations such as a lone tool result. Counts are
+memoized in a process-wide LRU (``LLM_TOKEN_CACHE_SIZE``) by message ID,
+checked against a cheap fingerprint of the content, and by a hash of the
+message content. Re-counting a conversation history each turn therefore
+only reads and tokenizes the new messages, and ``count_messages`` tokenizes
+all cache misses in one batch.
+
+Local estimates still drift from what providers bill and enforce: tool
+schemas, message framing and images add tokens the messages do not show.
+Every model built by ``LLMFactory.get_llm()`` carries a
+``TokenCalibrationHandler`` that compares the pre-flight estimate of each
+call with the ``input_tokens`` the provider reports and fits a per-provider,
+per-model ``TokenCalibration`` (``actual ~= ratio * estimate + offset``).
+``BaseLangGraphAgent`` applies it to its context-limit decisions.
+
+Usage:
+    from cnoe_agent_utils import LLMFactory
+
+    counter = LLMFactory("anthropic-claude").get_token_counter()
+    counter.count_messages(history)       # [12, 840, 33, ...]
+    counter.count_total(history)          # one number
+    counter.count_total(history, exact=True)  # ask the provider
+    counter.count_for_limit(history, 150_000)  # estimated unless near the limit
+    counter.calibration.correct(counter.count_total(history))  # what the provider will see
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .utils import env_int
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_CACHE_SIZE = 50_000
+# Approximate tokenizer overhead per chat message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+DEFAULT_CHARS_PER_TOKEN = 4.0
+# Claude's tokenizer yields noticeably more tokens per character than cl100k
+CLAUDE_CHARS_PER_TOKEN = 3.5
+GEMINI_CHARS_PER_TOKEN = 4.0
+
+# Weight kept by past observations when a new one arrives
+CALIBRATION_DECAY = 0.95
+# Observations needed before a calibration is applied
+MIN_CALIBRATION_SAMPLES = 3
+MIN_CALIBRATION_RATIO = 0.5
+MAX_CALIBRATION_RATIO = 3.0
+# Residual standard deviations added to a corrected estimate by ``upper_bound``
+CALIBRATION_MARGIN_STDDEVS = 2.0
+
+TIKTOKEN_PROVIDERS = ("openai", "azure_openai", "groq", "openai_compatible")
+
+# Where tiktoken fetches each encoding's BPE ranks. Its TIKTOKEN_CACHE_DIR
+# holds them named by the SHA-1 of the URL.
+TIKTOKEN_DATA_URLS = {
+    "r50k_base": "https://openaipublic.blob.core.windows.net/encodings/r50k_base.tiktoken",
+    "p50k_base": "https://openaipublic.blob.core.windows.net/encodings/p50k_base.tiktoken",
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
+# Async counts tokenize on the event loop below this many characters of uncached content
+DEFAULT_INLINE_TOKENIZE_CHARS = 32_768
+DEFAULT_TOKENIZER_THREADS = 4
+# Encodings preloaded by LLM_TOKENIZER_PRELOAD=true
+DEFAULT_PRELOAD_ENCODINGS = ("cl100k_base", "o200k_base")
+
+# How local counts are made: "exact" runs the tokenizer on every message,
+# "estimate" uses the byte/word heuristic, "hybrid" estimates while the
+# context is far below its limit and tokenizes near it
+TOKENIZER_MODES = ("exact", "estimate", "hybrid")
+DEFAULT_TOKENIZER_MODE = "hybrid"
+# Hybrid counting tokenizes once the estimate reaches this fraction of the limit
+HYBRID_EXACT_FRACTION = 0.8
+# Conservative UTF-8 bytes per token, per tokenizer. Prose averages about 4
+# bytes per token and code or JSON about 3, so estimates rarely undercount.
+ESTIMATE_BYTES_PER_TOKEN = {
+    "cl100k_base": 3.0,
+    "o200k_base": 3.2,
+    "claude": 2.8,
+    "gemini": 3.2,
+}
+DEFAULT_ESTIMATE_BYTES_PER_TOKEN = 3.0
+
+
+class Tokenizer:
+    """Counts tokens in plain text."""
+
+    name = "tokenizer"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        return [self.count(text) for text in texts]
+
+
+class CharRatioTokenizer(Tokenizer):
+    """
+    Approximate token counts as characters divided by a fixed ratio.
+
+    Args:
+        chars_per_token: Average characters per token for the target tokenizer
+        name: Name used in cache keys and logs
+    """
+
+    def __init__(self, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN, name: str | None = None):
+        self.chars_per_token = chars_per_token
+        self.name = name or f"chars/{chars_per_token:g}"
+
+    def count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token + 0.5)
+
+
+def tiktoken_data_path(encoding_name: str, cache_dir: str) -> str | None:
+    """Return where tiktoken caches *encoding_name*'s data in *cache_dir*, or None for unknown encodings."""
+    url = TIKTOKEN_DATA_URLS.get(encoding_name)
+    return os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()) if url else None
+
+
+def _offline() -> bool:
+    return os.getenv("LLM_TOKENIZER_OFFLINE", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+# Encodings loaded by this process, and the error of each one that failed to load
+_encodings: dict[str, Any] = {}
+_encoding_errors: dict[str, Exception] = {}
+_encodings_lock = threading.Lock()
+
+
+def load_tiktoken_encoding(encoding_name: str) -> Any:
+    """
+    Return a tiktoken encoding, loaded once and shared by every tokenizer in the process.
+
+    A failed load is remembered: it is logged once, and later calls raise
+    at once instead of trying (and downloading) again. With
+    ``LLM_TOKENIZER_OFFLINE=true``, data missing from ``TIKTOKEN_CACHE_DIR``
+    raises ``FileNotFoundError`` instead of being downloaded.
+    """
+    encoding = _encodings.get(encoding_name)
+    if encoding is not None:
+        return encoding
+    with _encodings_lock:
+        if encoding_name in _encodings:
+            return _encodings[encoding_name]
+        if encoding_name in _encoding_errors:
+            raise RuntimeError(f"loading failed earlier: {_encoding_errors[encoding_name]}")
+        try:
+            if _offline():
+                cache_dir = os.getenv("TIKTOKEN_CACHE_DIR")
+                path = tiktoken_data_path(encoding_name, cache_dir) if cache_dir else None
+                if path is None or not os.path.exists(path):
+                    raise FileNotFoundError(
+                        f"no data for {encoding_name} in TIKTOKEN_CACHE_DIR={cache_dir} (LLM_TOKENIZER_OFFLINE)"
+                    )
+            import tiktoken
+
+            encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            _encoding_errors[encoding_name] = e
+            logger.warning(
+                f"[LLM][tokens] Could not load tiktoken encoding {encoding_name} ({e}); "
+                f"counting with a characters/{DEFAULT_CHARS_PER_TOKEN:g} estimate instead"
+            )
+            raise
+        _encodings[encoding_name] = encoding
+        return encoding
+
+
+def clear_tiktoken_encodings() -> None:
+    """Forget loaded encodings and load failures, so the next use loads again."""
+    with _encodings_lock:
+        _encodings.clear()
+        _encoding_errors.clear()
+
+
+def download_tokenizer_data(cache_dir: str, encodings: Iterable[str] = DEFAULT_PRELOAD_ENCODINGS) -> list[str]:
+    """
+    Download tiktoken data into *cache_dir*, in tiktoken's cache layout, for later offline use.
+
+    Run where network access is available, e.g. while building an image,
+    then set ``TIKTOKEN_CACHE_DIR`` to the same directory.
+
+    Returns:
+        Paths of the data files
+    """
+    from tiktoken.load import read_file
+
+    for name in encodings:
+        if name not in TIKTOKEN_DATA_URLS:
+            raise ValueError(f"Unknown tiktoken encoding {name!r}; expected one of {', '.join(TIKTOKEN_DATA_URLS)}")
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = []
+    for name in encodings:
+        path = tiktoken_data_path(name, cache_dir)
+        if not os.path.exists(path):
+            partial = f"{path}.{os.getpid()}.tmp"
+            with open(partial, "wb") as f:
+                f.write(read_file(TIKTOKEN_DATA_URLS[name]))
+            os.replace(partial, path)
+        paths.append(path)
+    return paths
+
+
+def preload_tokenizers(encodings: Iterable[str] = DEFAULT_PRELOAD_ENCODINGS, freeze: bool = False) -> dict[str, bool]:
+    """
+    Load tiktoken encodings now instead of on the first count.
+
+    Call it before worker processes fork (for example from a pre-fork
+    server's preload hook): the loaded ranks tables are then shared
+    copy-on-write by every worker instead of loaded once per process. With
+    *freeze*, ``gc.freeze()`` moves everything loaded so far out of the
+    collector's reach, so collections in the workers do not write to (and
+    copy) those pages.
+
+    Returns:
+        Whether each encoding was loaded
+    """
+    loaded = {}
+    for name in encodings:
+        try:
+            load_tiktoken_encoding(name)
+            loaded[name] = True
+        except Exception:  # noqa: BLE001
+            loaded[name] = False
+    if freeze:
+        import gc
+        gc.freeze()
+    logger.info(f"[LLM][tokens] Preloaded tokenizers: {loaded}")
+    return loaded
+
+
+def preload_tokenizers_from_env() -> dict[str, bool] | None:
+    """
+    Preload encodings named by ``LLM_TOKENIZER_PRELOAD`` and freeze them for forked workers.
+
+    The value is a comma-separated list of encodings, or ``true`` for
+    ``DEFAULT_PRELOAD_ENCODINGS``. Call it once at server startup, before
+    workers fork (e.g. from gunicorn's ``on_starting`` hook); importing the
+    package never loads encodings.
+    """
+    value = os.getenv("LLM_TOKENIZER_PRELOAD", "").strip()
+    if not value or value.lower() in ("0", "false", "no", "off"):
+        return None
+    if value.lower() in ("1", "true", "yes", "on"):
+        encodings: Iterable[str] = DEFAULT_PRELOAD_ENCODINGS
+    else:
+        encodings = [name.strip() for name in value.split(",") if name.strip()]
+    return preload_tokenizers(encodings, freeze=True)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """
+    Exact counts with a tiktoken encoding, loaded on first use.
+
+    If the encoding cannot be loaded (for example, no network access to
+    fetch its data and no local copy in ``TIKTOKEN_CACHE_DIR``), counts
+    fall back to a characters/4 approximation.
+
+    Args:
+        encoding_name: tiktoken encoding name, e.g. "cl100k_base"
+        encoding: An already loaded encoding, used instead of *encoding_name*
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", encoding: Any = None):
+        self.encoding_name = getattr(encoding, "name", None) or encoding_name
+        self._encoding = encoding
+        self._fallback: CharRatioTokenizer | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        self._load()
+        return f"{self.encoding_name}~approx" if self._fallback else self.encoding_name
+
+    def _load(self) -> None:
+        if self._encoding is not None or self._fallback is not None:
+            return
+        with self._lock:
+            if self._encoding is not None or self._fallback is not None:
+                return
+            try:
+                self._encoding = load_tiktoken_encoding(self.encoding_name)
+            except Exception:  # noqa: BLE001
+                # load_tiktoken_encoding has logged the failure, once per process
+                self._fallback = CharRatioTokenizer(DEFAULT_CHARS_PER_TOKEN)
+
+    def count(self, text: str) -> int:
+        self._load()
+        if self._fallback:
+            return self._fallback.count(text)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        self._load()
+        if self._fallback:
+            return self._fallback.count_batch(texts)
+        return [len(tokens) for tokens in self._encoding.encode_batch(texts, disallowed_special=())]
+
+
+class EstimateTokenizer(Tokenizer):
+    """
+    Fast upper-bound token estimate from UTF-8 byte and word counts.
+
+    Counts ``max(bytes / bytes_per_token, words)``: a whitespace-separated
+    word is at least one token, and the byte ratio is set low for the target
+    encoding so most text is overcounted slightly. Costs one encode to
+    bytes and one split, far less than BPE on large tool outputs.
+
+    Args:
+        bytes_per_token: Conservative UTF-8 bytes per token for the target tokenizer
+        name: Name used in cache keys and logs
+    """
+
+    def __init__(self, bytes_per_token: float = DEFAULT_ESTIMATE_BYTES_PER_TOKEN, name: str | None = None):
+        self.bytes_per_token = bytes_per_token
+        self.name = name or f"bytes/{bytes_per_token:g}"
+
+    def count(self, text: str) -> int:
+        size = len(text.encode("utf-8", "surrogatepass"))
+        return max(math.ceil(size / self.bytes_per_token), len(text.split()))
+
+
+def tiktoken_encoding_name(model_name: str | None) -> str:
+    """Return the tiktoken encoding for *model_name*, defaulting to ``cl100k_base``."""
+    if model_name:
+        try:
+            from tiktoken.model import encoding_name_for_model
+            return encoding_name_for_model(model_name.rsplit("/", 1)[-1])
+        except (ImportError, KeyError):
+            pass
+    return "cl100k_base"
+
+
+def tokenizer_for(provider: str, model_name: str | None = None) -> Tokenizer:
+    """Return the local tokenizer for *provider* (underscored or dashed) and *model_name*."""
+    provider = provider.replace("-", "_")
+    model = (model_name or "").lower()
+    if provider == "anthropic_claude" or (provider == "aws_bedrock" and "claude" in model):
+        return CharRatioTokenizer(CLAUDE_CHARS_PER_TOKEN, name="claude~approx")
+    if provider in ("google_gemini", "gcp_vertexai"):
+        return CharRatioTokenizer(GEMINI_CHARS_PER_TOKEN, name="gemini~approx")
+    if provider in TIKTOKEN_PROVIDERS:
+        return TiktokenTokenizer(tiktoken_encoding_name(model_name))
+    return TiktokenTokenizer("cl100k_base")
+
+
+def estimator_for(provider: str, model_name: str | None = None) -> EstimateTokenizer:
+    """Return the fast estimate tokenizer for *provider* and *model_name*."""
+    provider = provider.replace("-", "_")
+    model = (model_name or "").lower()
+    if provider == "anthropic_claude" or (provider == "aws_bedrock" and "claude" in model):
+        family = "claude"
+    elif provider in ("google_gemini", "gcp_vertexai"):
+        family = "gemini"
+    elif provider in TIKTOKEN_PROVIDERS:
+        family = tiktoken_encoding_name(model_name)
+    else:
+        family = "cl100k_base"
+    bytes_per_token = ESTIMATE_BYTES_PER_TOKEN.get(family, DEFAULT_ESTIMATE_BYTES_PER_TOKEN)
+    return EstimateTokenizer(bytes_per_token, name=f"{family}~estimate")
+
+
+def normalize_tokenizer_mode(mode: str | None) -> str:
+    """Validate a tokenizer mode; None selects ``DEFAULT_TOKENIZER_MODE``."""
+    if mode is None:
+        return DEFAULT_TOKENIZER_MODE
+    value = mode.strip().lower()
+    if value not in TOKENIZER_MODES:
+        raise ValueError(f"Unknown tokenizer mode {mode!r}; expected one of {', '.join(TOKENIZER_MODES)}")
+    return value
+
+
+def message_text(message: Any) -> str:
+    """Return the text of a chat message that counts toward its tokens, including tool calls."""
+    if isinstance(message, str):
+        return message
+    if isinstance(message, tuple) and len(message) == 2:
+        return message_text({"content": message[1]})
+    if isinstance(message, dict):
+        content, tool_calls = message.get("content", ""), message.get("tool_calls")
+    else:
+        content, tool_calls = getattr(message, "content", ""), getattr(message, "tool_calls", None)
+
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            if isinstance(block, str):
+                parts.append(block)
+            elif isinstance(block, dict) and isinstance(block.get("text"), str):
+                parts.append(block["text"])
+            elif isinstance(block, dict) and isinstance(block.get("thinking"), str):
+                parts.append(block["thinking"])
+            else:
+                parts.append(json.dumps(block, sort_keys=True, default=str))
+        text = "".join(parts)
+    else:
+        text = "" if content is None else str(content)
+
+    for call in tool_calls or ():
+        if isinstance(call, dict):
+            text += json.dumps({"name": call.get("name"), "args": call.get("args")}, sort_keys=True, default=str)
+        else:
+            text += str(call)
+    return text
+
+
+def _message_role(message: Any) -> str:
+    if isinstance(message, dict):
+        return str(message.get("type") or message.get("role") or "")
+    if isinstance(message, tuple):
+        return str(message[0])
+    return str(getattr(message, "type", "") or "")
+
+
+def message_id(message: Any) -> str | None:
+    """Return the ID of a chat message, or None when it has none."""
+    value = message.get("id") if isinstance(message, dict) else getattr(message, "id", None)
+    return value if isinstance(value, str) and value else None
+
+
+def message_fingerprint(message: Any) -> tuple[int, int]:
+    """
+    Cheap change detector for a message already counted under its ID.
+
+    Python caches the hash of a ``str``, so a message whose content object is
+    reused turn after turn costs O(1) here instead of a re-read of its text.
+    """
+    if isinstance(message, dict):
+        content, tool_calls = message.get("content", ""), message.get("tool_calls")
+    else:
+        content, tool_calls = getattr(message, "content", ""), getattr(message, "tool_calls", None)
+    content_key = hash(content) if isinstance(content, str) else hash(repr(content))
+    calls_key = hash(repr(tool_calls)) if tool_calls else 0
+    return content_key, calls_key
+
+
+def message_size(message: Any) -> int:
+    """Return a message's content length in characters without building its text."""
+    content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        size = 0
+        for block in content:
+            if isinstance(block, str):
+                size += len(block)
+            elif isinstance(block, dict):
+                text = block.get("text") or block.get("thinking")
+                size += len(text) if isinstance(text, str) else 0
+        return size
+    return 0
+
+
+def content_hash(role: str, text: str) -> str:
+    """Return the cache key digest for a message's role and text."""
+    return hashlib.sha256(f"{role}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class TokenCountCache:
+    """
+    Thread-safe LRU of token counts keyed by tokenizer and content hash.
+
+    Entries keyed by message ID hold a (fingerprint, count) pair instead.
+
+    Args:
+        maxsize: Maximum number of entries (0 disables caching)
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            count = self._entries.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: str, count: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = count
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+_shared_cache: TokenCountCache | None = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_token_count_cache() -> TokenCountCache:
+    """Return the process-wide token count cache, sized from ``LLM_TOKEN_CACHE_SIZE``."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TokenCountCache(env_int("LLM_TOKEN_CACHE_SIZE", DEFAULT_TOKEN_CACHE_SIZE, minimum=0))
+        return _shared_cache
+
+
+_tokenizer_executor: ThreadPoolExecutor | None = None
+
+
+def get_tokenizer_executor() -> ThreadPoolExecutor:
+    """Return the process-wide tokenizer thread pool, sized from ``LLM_TOKENIZER_THREADS``."""
+    global _tokenizer_executor
+    with _shared_cache_lock:
+        if _tokenizer_executor is None:
+            _tokenizer_executor = ThreadPoolExecutor(
+                max_workers=env_int("LLM_TOKENIZER_THREADS", DEFAULT_TOKENIZER_THREADS),
+                thread_name_prefix="tokenizer",
+            )
+        return _tokenizer_executor
+
+
+class TokenCounter:
+    """
+    Count chat-message tokens for one provider and model.
+
+    Args:
+        provider: Provider name (underscored or dashed)
+        model_name: Model name used to pick the tokenizer
+        tokenizer: Local tokenizer; defaults to ``tokenizer_for(provider, model_name)``
+        llm: Chat model, or a zero-argument callable returning one, whose
+             ``get_num_tokens_from_messages`` is used for exact counts
+        exact: Use the provider's count API for ``count_total`` by default
+        cache: Count cache; defaults to the process-wide cache
+        mode: Local counting mode, one of ``TOKENIZER_MODES`` (see ``count_for_limit``)
+        estimator: Fast estimate tokenizer; defaults to ``estimator_for(provider, model_name)``
+        inline_chars: Characters of uncached content the async methods count on
+            the event loop; more goes to the tokenizer thread pool
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model_name: str | None = None,
+        tokenizer: Tokenizer | None = None,
+        llm: Any = None,
+        exact: bool = False,
+        cache: TokenCountCache | None = None,
+        mode: str | None = None,
+        estimator: Tokenizer | None = None,
+        inline_chars: int = DEFAULT_INLINE_TOKENIZE_CHARS,
+    ):
+        self.provider = provider.replace("-", "_")
+        self.model_name = model_name
+        self.tokenizer = tokenizer or tokenizer_for(self.provider, model_name)
+        self.estimator = estimator or estimator_for(self.provider, model_name)
+        self.mode = normalize_tokenizer_mode(mode)
+        self.inline_chars = inline_chars
+        self.exact = exact
+        self.cache = cache if cache is not None else get_token_count_cache()
+        self._llm = llm
+        self._llm_lock = threading.Lock()
+        self.api_calls = 0
+        self.api_errors = 0
+
+    def _model(self) -> Any:
+        if callable(self._llm) and not hasattr(self._llm, "get_num_tokens_from_messages"):
+            with self._llm_lock:
+                if callable(self._llm) and not hasattr(self._llm, "get_num_tokens_from_messages"):
+                    self._llm = self._llm()
+        return self._llm
+
+    def _kind(self, estimate: bool = False) -> str:
+        return self.estimator.name if estimate else self.tokenizer.name
+
+    def _key(self, message: Any, estimate: bool = False) -> str:
+        return f"{self._kind(estimate)}:{content_hash(_message_role(message), message_text(message))}"
+
+    def _id_key(self, message: Any, estimate: bool = False) -> str | None:
+        msg_id = message_id(message)
+        return None if msg_id is None else f"id:{self._kind(estimate)}:{_message_role(message)}:{msg_id}"
+
+    def _count_with_api(self, messages: list[Any]) -> int | None:
+        """Return the provider's count for *messages*, or None when it is unavailable."""
+        model = self._model()
+        if model is None or not hasattr(model, "get_num_tokens_from_messages"):
+            return None
+        from langchain_core.messages import convert_to_messages
+        try:
+            self.api_calls += 1
+            return int(model.get_num_tokens_from_messages(convert_to_messages(messages)))
+        except Exception as e:  # noqa: BLE001
+            self.api_errors += 1
+            logger.debug(f"[LLM][tokens] provider count failed for {self.provider}: {e}; counting locally")
+            return None
+
+    @property
+    def calibration(self) -> "TokenCalibration":
+        """The shared calibration of this counter's local estimates for its provider and model."""
+        return get_token_calibration(self.provider, self.model_name)
+
+    def count_text(self, text: str) -> int:
+        """Count tokens in plain text with the local tokenizer (not cached)."""
+        return self.tokenizer.count(text)
+
+    def count_message(self, message: Any) -> int:
+        """Count tokens in one message, including its tool calls and per-message overhead."""
+        return self.count_messages([message])[0]
+
+    def count_messages(self, messages: Iterable[Any], estimate: bool | None = None) -> list[int]:
+        """
+        Count tokens for each message, in order.
+
+        Messages seen before under the same ID and unchanged content are
+        answered from the cache without reading their text, so a growing
+        history only costs work for its new messages. Other cached counts
+        are found by content hash; the rest are tokenized in one batch.
+
+        With *estimate* (default: the ``estimate`` mode), local counts come
+        from the fast estimator instead of the tokenizer.
+        """
+        messages = list(messages)
+        estimate = self.mode == "estimate" if estimate is None else estimate
+        counts, by_id, pending = self._lookup_ids(messages, estimate)
+        if pending:
+            self._count_pending(messages, counts, by_id, pending, estimate)
+        return counts  # type: ignore[return-value]
+
+    def _lookup_ids(
+        self, messages: list[Any], estimate: bool
+    ) -> tuple[list[int | None], dict[int, tuple[str, tuple[int, int]]], list[int]]:
+        """Answer messages known by ID; return the counts so far, their ID keys and the pending indexes."""
+        counts: list[int | None] = [None] * len(messages)
+        by_id: dict[int, tuple[str, tuple[int, int]]] = {}
+        pending = []
+        for i, message in enumerate(messages):
+            id_key = self._id_key(message, estimate)
+            if id_key is not None:
+                fingerprint = message_fingerprint(message)
+                entry = self.cache.get(id_key)
+                if entry is not None and entry[0] == fingerprint:
+                    counts[i] = entry[1]
+                    continue
+                by_id[i] = (id_key, fingerprint)
+            pending.append(i)
+        return counts, by_id, pending
+
+    def _count_pending(
+        self,
+        messages: list[Any],
+        counts: list[int | None],
+        by_id: dict[int, tuple[str, tuple[int, int]]],
+        pending: list[int],
+        estimate: bool,
+    ) -> None:
+        """Fill in *counts* for the *pending* indexes from content keys or the tokenizer."""
+        keys = {i: self._key(messages[i], estimate) for i in pending}
+        missing = []
+        for i in pending:
+            counts[i] = self.cache.get(keys[i])
+            if counts[i] is None:
+                missing.append(i)
+        if missing:
+            texts = [message_text(messages[i]) for i in missing]
+            tokenizer = self.estimator if estimate else self.tokenizer
+            for i, tokens in zip(missing, tokenizer.count_batch(texts)):
+                counts[i] = tokens + MESSAGE_OVERHEAD_TOKENS
+                self.cache.put(keys[i], counts[i])
+        for i, (id_key, fingerprint) in by_id.items():
+            self.cache.put(id_key, (fingerprint, counts[i]))
+
+    def count_total(self, messages: Iterable[Any], exact: bool | None = None) -> int:
+        """
+        Count tokens for a whole message list.
+
+        With *exact*, the provider counts the list in a single request and
+        the result is memoized by the hash of all message keys.
+        """
+        messages = list(messages)
+        exact = self.exact if exact is None else exact
+        if not exact or not messages:
+            return sum(self.count_messages(messages))
+        key = f"api-total:{self.provider}:{self.model_name}:" + hashlib.sha256(
+            "\n".join(self._key(message) for message in messages).encode()
+        ).hexdigest()
+        count = self.cache.get(key)
+        if count is None:
+            count = self._count_with_api(messages)
+            if count is None:
+                return sum(self.count_messages(messages))
+            self.cache.put(key, count)
+        return count
+
+    def count_for_limit(
+        self,
+        messages: Iterable[Any],
+        limit: int,
+        fixed_tokens: int = 0,
+        to_provider_tokens: Callable[[int], int] | None = None,
+    ) -> list[int]:
+        """
+        Count tokens for each message, as precisely as a check against *limit* needs.
+
+        In ``exact`` mode every message is tokenized and in ``estimate``
+        mode every message is estimated. In ``hybrid`` mode messages already
+        tokenized keep their cached counts and the rest are estimated first;
+        only if the total reaches ``HYBRID_EXACT_FRACTION`` of *limit* are
+        they tokenized, so large contexts far below the limit skip BPE
+        entirely.
+
+        Args:
+            messages: Messages to count
+            limit: Token limit the total is compared with
+            fixed_tokens: Tokens sent alongside *messages*, e.g. the system prompt
+            to_provider_tokens: Maps a local total to the expected provider count
+        """
+        messages = list(messages)
+        if self.mode != "hybrid":
+            return self.count_messages(messages)
+        counts, _, pending = self._lookup_ids(messages, False)
+        if pending:
+            rest = [messages[i] for i in pending]
+            estimates = self.count_messages(rest, estimate=True)
+            if not self._near_limit(counts, estimates, limit, fixed_tokens, to_provider_tokens):
+                return self._fill(counts, pending, estimates)
+            self._fill(counts, pending, self.count_messages(rest, estimate=False))
+        return counts  # type: ignore[return-value]
+
+    @staticmethod
+    def _near_limit(
+        counts: list[int | None],
+        estimates: list[int],
+        limit: int,
+        fixed_tokens: int,
+        to_provider_tokens: Callable[[int], int] | None,
+    ) -> bool:
+        """Whether known *counts* plus *estimates* for the rest reach ``HYBRID_EXACT_FRACTION`` of *limit*."""
+        convert = to_provider_tokens or (lambda tokens: tokens)
+        known = sum(count for count in counts if count is not None)
+        return convert(fixed_tokens + known + sum(estimates)) >= HYBRID_EXACT_FRACTION * limit
+
+    @staticmethod
+    def _fill(counts: list[int | None], pending: list[int], values: list[int]) -> list[int]:
+        for i, value in zip(pending, values):
+            counts[i] = value
+        return counts  # type: ignore[return-value]
+
+    async def acount_messages(self, messages: Iterable[Any], estimate: bool | None = None) -> list[int]:
+        """
+        Async ``count_messages`` that keeps large tokenization off the event loop.
+
+        Messages known by ID are answered inline. The rest are counted
+        inline while their content is under ``inline_chars`` characters in
+        total, and otherwise on the shared tokenizer thread pool, where
+        tiktoken's native batch encoding runs without holding the GIL.
+        """
+        messages = list(messages)
+        estimate = self.mode == "estimate" if estimate is None else estimate
+        counts, by_id, pending = self._lookup_ids(messages, estimate)
+        if not pending:
+            return counts  # type: ignore[return-value]
+        if sum(message_size(messages[i]) for i in pending) >= self.inline_chars:
+            await asyncio.get_running_loop().run_in_executor(
+                get_tokenizer_executor(), self._count_pending, messages, counts, by_id, pending, estimate
+            )
+        else:
+            self._count_pending(messages, counts, by_id, pending, estimate)
+        return counts  # type: ignore[return-value]
+
+    async def acount_total(self, messages: Iterable[Any], exact: bool | None = None) -> int:
+        """Async ``count_total``; see ``acount_messages``."""
+        messages = list(messages)
+        exact = self.exact if exact is None else exact
+        if not exact or not messages:
+            return sum(await self.acount_messages(messages))
+        return await asyncio.get_running_loop().run_in_executor(
+            get_tokenizer_executor(), self.count_total, messages, True
+        )
+
+    async def acount_for_limit(
+        self,
+        messages: Iterable[Any],
+        limit: int,
+        fixed_tokens: int = 0,
+        to_provider_tokens: Callable[[int], int] | None = None,
+    ) -> list[int]:
+        """Async ``count_for_limit``; see ``acount_messages``."""
+        messages = list(messages)
+        if self.mode != "hybrid":
+            return await self.acount_messages(messages)
+        counts, _, pending = self._lookup_ids(messages, False)
+        if pending:
+            rest = [messages[i] for i in pending]
+            estimates = await self.acount_messages(rest, estimate=True)
+            if not self._near_limit(counts, estimates, limit, fixed_tokens, to_provider_tokens):
+                return self._fill(counts, pending, estimates)
+            self._fill(counts, pending, await self.acount_messages(rest, estimate=False))
+        return counts  # type: ignore[return-value]
+
+    def stats(self) -> dict[str, Any]:
+        """Return the tokenizer names and mode, provider API call counts and cache statistics."""
+        return {
+            "tokenizer": self.tokenizer.name,
+            "estimator": self.estimator.name,
+            "mode": self.mode,
+            "api_calls": self.api_calls,
+            "api_errors": self.api_errors,
+            "cache": self.cache.stats(),
+        }
+
+
+class TokenCalibration:
+    """
+    Online correction of local token estimates toward provider-reported input tokens.
+
+    Fits ``actual = ratio * estimate + offset`` by exponentially weighted
+    least squares, so the offset absorbs fixed per-call overhead (tool
+    schemas, system framing) and the ratio absorbs tokenizer drift. Until
+    ``MIN_CALIBRATION_SAMPLES`` calls have been observed, estimates pass
+    through unchanged; while all observations have about the same size, only
+    the ratio is fitted.
+
+    Args:
+        decay: Weight kept by past observations when a new one arrives
+    """
+
+    def __init__(self, decay: float = CALIBRATION_DECAY):
+        self.decay = decay
+        self.samples = 0
+        # Weighted sums: weight, x, y, x*x, x*y, squared residual
+        self._w = self._x = self._y = self._xx = self._xy = self._residual = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.samples >= MIN_CALIBRATION_SAMPLES
+
+    def _fit(self) -> tuple[float, float]:
+        if not self.ready or self._x <= 0:
+            return 1.0, 0.0
+        mean_x, mean_y = self._x / self._w, self._y / self._w
+        variance = self._xx / self._w - mean_x * mean_x
+        if variance > (0.05 * mean_x) ** 2:
+            ratio = (self._xy / self._w - mean_x * mean_y) / variance
+        else:
+            ratio = mean_y / mean_x
+        ratio = min(MAX_CALIBRATION_RATIO, max(MIN_CALIBRATION_RATIO, ratio))
+        return ratio, mean_y - ratio * mean_x
+
+    def observe(self, estimate: int, actual: int) -> None:
+        """Record one call's local *estimate* and the provider-reported *actual* input tokens."""
+        if estimate <= 0 or actual <= 0:
+            return
+        with self._lock:
+            ratio, offset = self._fit()
+            residual = actual - (ratio * estimate + offset) if self.ready else 0.0
+            d = self.decay
+            self._w = self._w * d + 1
+            self._x = self._x * d + estimate
+            self._y = self._y * d + actual
+            self._xx = self._xx * d + estimate * estimate
+            self._xy = self._xy * d + estimate * actual
+            self._residual = self._residual * d + residual * residual
+            self.samples += 1
+
+    def correct(self, estimate: int) -> int:
+        """Return the calibrated token count for a local *estimate*."""
+        with self._lock:
+            ratio, offset = self._fit()
+        return max(0, int(ratio * estimate + offset + 0.5))
+
+    def margin(self) -> int:
+        """Return a safety margin in tokens covering the calibrated estimate's recent error."""
+        with self._lock:
+            if not self.ready:
+                return 0
+            return int(CALIBRATION_MARGIN_STDDEVS * (self._residual / self._w) ** 0.5 + 0.5)
+
+    def upper_bound(self, estimate: int) -> int:
+        """Return the calibrated count plus the safety margin."""
+        return self.correct(estimate) + self.margin()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            ratio, offset = self._fit()
+            residual = (self._residual / self._w) ** 0.5 if self._w else 0.0
+            return {"samples": self.samples, "ready": self.ready, "ratio": ratio, "offset": offset,
+                    "residual_stddev": residual}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples = 0
+            self._w = self._x = self._y = self._xx = self._xy = self._residual = 0.0
+
+
+_calibrations: dict[tuple[str, str], TokenCalibration] = {}
+_calibrations_lock = threading.Lock()
+
+
+def get_token_calibration(provider: str, model_name: str | None) -> TokenCalibration:
+    """Return the process-wide calibration for *provider* and *model_name*."""
+    key = (provider.replace("-", "_"), model_name or "unknown")
+    with _calibrations_lock:
+        calibration = _calibrations.get(key)
+        if calibration is None:
+            calibration = _calibrations[key] = TokenCalibration()
+        return calibration
+
+
+def calibration_snapshot() -> dict[str, dict[str, Any]]:
+    """Return every calibration's state, keyed by ``"<provider>:<model>"``."""
+    with _calibrations_lock:
+        items = list(_calibrations.items())
+    return {f"{provider}:{model}": calibration.snapshot() for (provider, model), calibration in items}
+
+
+class TokenCalibrationHandler(BaseCallbackHandler):
+    """
+    Callback handler that feeds a ``TokenCalibration`` from each call's estimate and reported input tokens.
+
+    Calls are counted the way the agent's context check counts them before
+    calibrating (``TokenCounter.count_for_limit`` below the limit), so the
+    fitted correction applies to the same scale: ``hybrid`` mode keeps
+    tokenized counts already cached and estimates the rest, ``estimate``
+    mode estimates and ``exact`` mode tokenizes.
+
+    It runs on the caller's thread, which in async agents is the event loop,
+    so like ``TokenCounter.acount_messages`` it counts messages known by ID
+    and small uncached content inline, and large uncached content (e.g. a
+    tool result just added to the history) on the tokenizer thread pool. The
+    calibration is then updated when that count finishes.
+    """
+
+    # Record on the caller's thread instead of hopping to an executor
+    run_inline = True
+
+    def __init__(self, counter: TokenCounter, calibration: TokenCalibration | None = None):
+        self.counter = counter
+        self.calibration = calibration or counter.calibration
+        self._runs: dict[UUID, int | Future] = {}
+
+    def _estimate(self, messages: list[Any]) -> int | Future:
+        counter = self.counter
+        estimate = counter.mode == "estimate"
+        counts, by_id, pending = counter._lookup_ids(messages, estimate)
+        if not pending:
+            return sum(counts)
+
+        def count() -> int:
+            if counter.mode == "hybrid":
+                counter._fill(counts, pending, counter.count_messages([messages[i] for i in pending], estimate=True))
+            else:
+                counter._count_pending(messages, counts, by_id, pending, estimate)
+            return sum(counts)
+
+        if sum(message_size(messages[i]) for i in pending) >= counter.inline_chars:
+            return get_tokenizer_executor().submit(count)
+        return count()
+
+    def _observe(self, estimate: int | Future, actual: int) -> None:
+        if isinstance(estimate, Future):
+            if estimate.cancelled() or estimate.exception() is not None:
+                logger.debug(f"[LLM][tokens] could not estimate call for calibration: {estimate.exception()}")
+                return
+            estimate = estimate.result()
+        self.calibration.observe(estimate, actual)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        if len(messages) != 1:
+            return
+        try:
+            self._runs[run_id] = self._estimate(list(messages[0]))
+        except Exception as e:  # noqa: BLE001
+            logger.debug(f"[LLM][tokens] could not estimate call for calibration: {e}")
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        estimate = self._runs.pop(run_id, None)
+        if estimate is None:
+            return
+        from .usage import extract_usage
+        actual = extract_usage(response)["input_tokens"]
+        if isinstance(estimate, Future):
+            estimate.add_done_callback(lambda done: self._observe(done, actual))
+        else:
+            self._observe(estimate, actual)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        estimate = self._runs.pop(run_id, None)
+        if isinstance(estimate, Future):
+            estimate.cancel()
+
+
+def token_counter_from_env(
+    provider: str,
+    model_name: str | None = None,
+    llm: Any = None,
+    exact: bool | None = None,
+    mode: str | None = None,
+) -> TokenCounter:
+    """
+    Build a ``TokenCounter``.
+
+    *exact* defaults to ``LLM_TOKEN_COUNT_EXACT`` and *mode* to
+    ``LLM_TOKENIZER_MODE`` (an invalid value falls back to the default). The
+    async inline threshold comes from ``LLM_TOKEN_COUNT_INLINE_CHARS``.
+    """
+    if exact is None:
+        exact = os.getenv("LLM_TOKEN_COUNT_EXACT", "false").strip().lower() in ("1", "true", "yes", "on")
+    if mode is None:
+        try:
+            mode = normalize_tokenizer_mode(os.getenv("LLM_TOKENIZER_MODE") or None)
+        except ValueError as e:
+            logger.warning(f"[LLM][tokens] {e}; using {DEFAULT_TOKENIZER_MODE}")
+            mode = DEFAULT_TOKENIZER_MODE
+    inline_chars = env_int("LLM_TOKEN_COUNT_INLINE_CHARS", DEFAULT_INLINE_TOKENIZE_CHARS)
+    return TokenCounter(provider, model_name, llm=llm, exact=exact, mode=mode, inline_chars=inline_chars)
@@ -0,0 +1,173 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Memoized tool-schema conversion for ``LLMFactory.get_llm(tools=...)``.
+
+``bind_tools`` converts every tool's args schema into the provider tool
+format on each call. Agents with 100+ MCP tools pay that cost every time a
+model is built or re-bound. This module converts a tool set once into
+OpenAI-format tool dicts and caches the result under a stable hash of the
+tool set and the ``strict`` flag.
+
+OpenAI, Azure OpenAI, Groq and OpenAI-compatible models bind these dicts as
+they are. Anthropic, Bedrock and Gemini models still map them to their own
+tool format in ``bind_tools``; that dict-to-dict step is cheaper than
+building the schema from the tool, but it is not skipped.
+
+Binding the same tool objects again is looked up by object identity, so the
+tool set is hashed only the first time it is seen. Tools and dict schemas
+are treated as immutable once bound: build a new object instead of editing
+one in place. The cached payload is shared across models and factories, so
+callers must treat the returned dicts as read-only.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOL_SCHEMA_CACHE_SIZE = 64
+
+_cache: "OrderedDict[str, list[dict[str, Any]]]" = OrderedDict()
+# (strict, id of each tool) -> (tools, payload); holding the tools keeps their ids valid
+_by_identity: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _get_cache_size() -> int:
+    """Read the cache size from ``LLM_TOOL_SCHEMA_CACHE_SIZE`` (0 disables caching)."""
+    value = os.getenv("LLM_TOOL_SCHEMA_CACHE_SIZE", str(DEFAULT_TOOL_SCHEMA_CACHE_SIZE))
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning(
+            f"Invalid value for LLM_TOOL_SCHEMA_CACHE_SIZE='{value}', "
+            f"using default: {DEFAULT_TOOL_SCHEMA_CACHE_SIZE}"
+        )
+        return DEFAULT_TOOL_SCHEMA_CACHE_SIZE
+
+
+def _schema_fingerprint(schema: Any) -> str:
+    """Return a stable string for an args schema without converting it."""
+    if schema is None:
+        return ""
+    if isinstance(schema, dict):
+        return json.dumps(schema, sort_keys=True, default=str)
+    if isinstance(schema, type):
+        # Pydantic models / TypedDicts: identity of the class is stable for the
+        # lifetime of the process and avoids generating the JSON schema.
+        return f"{schema.__module__}.{schema.__qualname__}@{id(schema)}"
+    return repr(schema)
+
+
+def _tool_fingerprint(tool: Any) -> str:
+    """Return a stable string identifying a single tool definition."""
+    if isinstance(tool, dict):
+        return "dict:" + json.dumps(tool, sort_keys=True, default=str)
+    if isinstance(tool, type):
+        return "type:" + _schema_fingerprint(tool)
+    name = getattr(tool, "name", None)
+    if name is not None and hasattr(tool, "args_schema"):
+        metadata = getattr(tool, "metadata", None) or {}
+        return "tool:" + "\x1f".join([
+            str(name),
+            str(getattr(tool, "description", "") or ""),
+            _schema_fingerprint(tool.args_schema),
+            json.dumps(metadata, sort_keys=True, default=str),
+        ])
+    if callable(tool):
+        return f"callable:{getattr(tool, '__module__', '')}.{getattr(tool, '__qualname__', repr(tool))}@{id(tool)}"
+    return "repr:" + repr(tool)
+
+
+def tool_set_fingerprint(tools: Iterable[Any], strict: bool | None = None) -> str:
+    """
+    Compute a stable hash for a tool set and strict flag.
+
+    Args:
+        tools: Tools as accepted by ``bind_tools``
+        strict: The strict flag that will be used for conversion
+
+    Returns:
+        Hex digest identifying the converted payload
+    """
+    digest = hashlib.sha256(f"strict={strict}".encode())
+    for tool in tools:
+        digest.update(b"\x1e")
+        digest.update(_tool_fingerprint(tool).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def _convert(tools: list[Any], strict: bool | None) -> list[dict[str, Any]]:
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    return [convert_to_openai_tool(tool, strict=strict) for tool in tools]
+
+
+def convert_tools_cached(tools: Iterable[Any], strict: bool | None = None) -> list[dict[str, Any]]:
+    """
+    Convert tools to OpenAI-format tool dicts, reusing a cached payload.
+
+    Args:
+        tools: Tools as accepted by ``bind_tools`` (BaseTool, Pydantic models,
+               callables or tool dicts)
+        strict: Strict flag passed to the conversion
+
+    Returns:
+        List of OpenAI-format tool dicts (shared; do not mutate)
+    """
+    tools = list(tools)
+    max_size = _get_cache_size()
+    if max_size == 0:
+        return _convert(tools, strict)
+
+    identity = (strict, *map(id, tools))
+    with _cache_lock:
+        entry = _by_identity.get(identity)
+        if entry is not None:
+            _by_identity.move_to_end(identity)
+            _stats["hits"] += 1
+            return entry[1]
+
+    key = tool_set_fingerprint(tools, strict)
+    with _cache_lock:
+        converted = _cache.get(key)
+        if converted is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+    if converted is None:
+        converted = _convert(tools, strict)
+        with _cache_lock:
+            _stats["misses"] += 1
+            _cache[key] = converted
+            _cache.move_to_end(key)
+            while len(_cache) > max_size:
+                _cache.popitem(last=False)
+        logger.debug(f"Converted and cached schemas for {len(converted)} tools (key={key[:12]})")
+
+    with _cache_lock:
+        _by_identity[identity] = (tools, converted)
+        while len(_by_identity) > max_size:
+            _by_identity.popitem(last=False)
+    return converted
+
+
+def get_tool_schema_cache_info() -> dict[str, int]:
+    """Return cache statistics (hits, misses, size)."""
+    with _cache_lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"], "size": len(_cache)}
+
+
+def clear_tool_schema_cache() -> None:
+    """Drop all cached tool payloads and reset statistics."""
+    with _cache_lock:
+        _cache.clear()
+        _by_identity.clear()
+        _stats["hits"] = 0
+        _stats["misses"] = 0
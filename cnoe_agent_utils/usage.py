@@ -0,0 +1,469 @@
+# Copyright 2025 CNOE
+# SPDX-License-Identifier: Apache-2.0
+
+"""Per-provider usage and cost ledger.
+
+Every chat model built by ``LLMFactory.get_llm()`` carries a
+``UsageCallbackHandler`` that feeds the process-wide ``UsageLedger`` from the
+response's usage metadata: input, output, cached and reasoning tokens plus
+latency, keyed by provider, model, agent, session and latency profile.
+
+The per-call path only touches counters owned by the calling thread, so it
+never takes a lock; readers merge the per-thread shards when a snapshot or
+export is requested, and fold the shards of finished threads into one.
+Rolling 1m/5m/1h windows are kept as 10-second buckets. Sessions are
+unbounded, so only the windows keep them: lifetime totals are summed over
+sessions, and per-session usage is available for the last hour.
+
+Usage:
+    from cnoe_agent_utils.usage import get_usage_ledger, usage_context
+
+    with usage_context(agent="jira", session="abc"):
+        llm.invoke("...")
+
+    ledger = get_usage_ledger()
+    ledger.snapshot(window=300)   # last 5 minutes, one row per key (with cache_hit_ratio)
+    ledger.snapshot()             # lifetime totals (session is always "")
+    ledger.to_prometheus()        # Prometheus text exposition format
+    register_otel_metrics()       # or export through OpenTelemetry
+
+Agent and session default to the ``agent_name`` and ``thread_id`` run
+metadata, which ``BaseLangGraphAgent.stream()`` sets for every turn; the
+latency profile comes from the ``latency_profile`` run metadata (see
+``cnoe_agent_utils.latency_profile``).
+Prices come from ``LLM_PRICING`` (JSON: ``{"<model>": {"input": <usd per
+1K>, "output": ..., "cached_input": ...}}``) or ``UsageLedger.set_pricing()``.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Generator, Sequence
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 10
+WINDOWS: dict[str, int] = {"1m": 60, "5m": 300, "1h": 3600}
+_MAX_BUCKET_AGE = max(WINDOWS.values()) // BUCKET_SECONDS + 1
+
+FIELDS = ("calls", "errors", "input_tokens", "output_tokens", "cached_tokens", "reasoning_tokens", "latency_seconds")
+LABELS = ("provider", "model", "agent", "session", "latency_profile")
+# Labels exported as metrics; sessions are unbounded
+METRIC_LABELS = ("provider", "model", "agent", "latency_profile")
+# Labels left out of an exported sample when empty
+OPTIONAL_LABELS = ("latency_profile",)
+# A run with no end or error callback after this long is dropped
+MAX_RUN_SECONDS = max(WINDOWS.values())
+# Pending runs tracked per handler before stale ones are looked for
+_RUNS_PRUNE_THRESHOLD = 1024
+
+# (provider, model, agent, session, latency_profile)
+UsageKey = tuple[str, str, str, str, str]
+
+_agent_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("cnoe_usage_agent", default=None)
+_session_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("cnoe_usage_session", default=None)
+
+
+@contextlib.contextmanager
+def usage_context(agent: str | None = None, session: str | None = None) -> Generator[None]:
+    """Attribute LLM usage inside the block to *agent* and/or *session*."""
+    tokens = []
+    if agent is not None:
+        tokens.append((_agent_var, _agent_var.set(agent)))
+    if session is not None:
+        tokens.append((_session_var, _session_var.set(session)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _Shard:
+    """Counters owned by a single thread."""
+
+    __slots__ = ("buckets", "thread", "totals")
+
+    def __init__(self, thread: threading.Thread | None = None):
+        self.totals: dict[UsageKey, list[float]] = {}
+        self.buckets: dict[int, dict[UsageKey, list[float]]] = {}
+        self.thread = thread
+
+
+def _add(counters: dict[UsageKey, list[float]], key: UsageKey, values: Sequence[float]) -> None:
+    row = counters.get(key)
+    if row is None:
+        counters[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            row[i] += value
+
+
+class UsageLedger:
+    """
+    Aggregates LLM usage per provider, model, agent, session and latency profile.
+
+    ``record`` writes to thread-local shards without locking; ``snapshot``,
+    ``to_prometheus`` and the OTel callbacks merge shards on read.
+    """
+
+    def __init__(self, pricing: dict[str, dict[str, float]] | None = None):
+        self._local = threading.local()
+        self._shards: list[_Shard] = []
+        # Usage of threads that have exited, folded in by _retire_shards
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self.pricing: dict[str, dict[str, float]] = dict(pricing or {})
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._shards_lock:
+                self._retire_shards()
+                self._shards.append(shard)
+        return shard
+
+    def _retire_shards(self) -> None:
+        """Fold the shards of exited threads into ``_retired``; call with ``_shards_lock`` held."""
+        live = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+                continue
+            # The owning thread is gone, so nothing writes to this shard any more
+            for key, row in shard.totals.items():
+                _add(self._retired.totals, key, row)
+            for bucket_id, bucket in shard.buckets.items():
+                retired_bucket = self._retired.buckets.setdefault(bucket_id, {})
+                for key, row in bucket.items():
+                    _add(retired_bucket, key, row)
+        if len(live) < len(self._shards):
+            newest = max(self._retired.buckets, default=0)
+            for old in [b for b in self._retired.buckets if b <= newest - _MAX_BUCKET_AGE]:
+                del self._retired.buckets[old]
+            self._shards = live
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        agent: str | None = None,
+        session: str | None = None,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        cached_tokens: int = 0,
+        reasoning_tokens: int = 0,
+        latency: float = 0.0,
+        error: bool = False,
+        now: float | None = None,
+        latency_profile: str | None = None,
+    ) -> None:
+        """Record one model call."""
+        key = (provider, model, agent or "", session or "", latency_profile or "")
+        values = (1, 1 if error else 0, input_tokens, output_tokens, cached_tokens, reasoning_tokens, latency)
+        shard = self._shard()
+        # Lifetime totals leave the session out so they stay bounded
+        _add(shard.totals, (key[0], key[1], key[2], "", key[4]), values)
+
+        bucket_id = int((time.time() if now is None else now) // BUCKET_SECONDS)
+        bucket = shard.buckets.get(bucket_id)
+        if bucket is None:
+            # New bucket: drop buckets older than the longest window
+            for old in [b for b in shard.buckets if b <= bucket_id - _MAX_BUCKET_AGE]:
+                del shard.buckets[old]
+            bucket = shard.buckets[bucket_id] = {}
+        _add(bucket, key, values)
+
+    def set_pricing(
+        self,
+        model: str,
+        input_per_1k: float,
+        output_per_1k: float,
+        cached_input_per_1k: float | None = None,
+    ) -> None:
+        """Set USD prices per 1K tokens for *model*."""
+        price = {"input": input_per_1k, "output": output_per_1k}
+        if cached_input_per_1k is not None:
+            price["cached_input"] = cached_input_per_1k
+        self.pricing[model] = price
+
+    def cost(self, model: str, input_tokens: float, output_tokens: float, cached_tokens: float = 0) -> float:
+        """Estimate USD cost; cached input tokens use the cached price when one is set."""
+        price = self.pricing.get(model)
+        if not price:
+            return 0.0
+        cached_price = price.get("cached_input", price.get("input", 0.0))
+        return (
+            (input_tokens - cached_tokens) * price.get("input", 0.0)
+            + cached_tokens * cached_price
+            + output_tokens * price.get("output", 0.0)
+        ) / 1000
+
+    def _merged(self, window: int | None, now: float | None) -> dict[UsageKey, list[float]]:
+        with self._shards_lock:
+            self._retire_shards()
+            shards = [self._retired, *self._shards]
+        merged: dict[UsageKey, list[float]] = {}
+        if window is None:
+            for shard in shards:
+                for key, row in shard.totals.copy().items():
+                    _add(merged, key, row)
+            return merged
+        oldest = int((time.time() if now is None else now) // BUCKET_SECONDS) - window // BUCKET_SECONDS + 1
+        for shard in shards:
+            for bucket_id, bucket in shard.buckets.copy().items():
+                if bucket_id >= oldest:
+                    for key, row in bucket.copy().items():
+                        _add(merged, key, row)
+        return merged
+
+    def snapshot(
+        self,
+        window: int | None = None,
+        group_by: Sequence[str] = LABELS,
+        now: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Return aggregated usage rows.
+
+        Args:
+            window: Only include the last *window* seconds (rounded to 10s
+                    buckets, at most one hour); None returns lifetime totals,
+                    which are summed over sessions
+            group_by: Labels to keep; usage is summed over the others
+            now: Reference time for the window (defaults to the current time)
+
+        Each row has the kept labels, every counter in ``FIELDS``, ``cost_usd``,
+        ``output_tokens_per_second`` (output tokens over model latency) and
+        ``cache_hit_ratio`` (the share of input tokens read from the
+        provider's prompt cache).
+        """
+        indexes = [LABELS.index(label) for label in group_by]
+        grouped: dict[tuple[str, ...], list[float]] = {}
+        costs: dict[tuple[str, ...], float] = {}
+        for key, row in self._merged(window, now).items():
+            group = tuple(key[i] for i in indexes)
+            _add(grouped, group, row)
+            costs[group] = costs.get(group, 0.0) + self.cost(key[1], row[2], row[3], row[4])
+
+        rows = []
+        for group, values in sorted(grouped.items()):
+            row: dict[str, Any] = dict(zip(group_by, group))
+            row.update({field: (value if field == "latency_seconds" else int(value)) for field, value in zip(FIELDS, values)})
+            row["cost_usd"] = costs[group]
+            row["output_tokens_per_second"] = values[3] / values[6] if values[6] else 0.0
+            row["cache_hit_ratio"] = values[4] / values[2] if values[2] else 0.0
+            rows.append(row)
+        return rows
+
+    def to_prometheus(self, prefix: str = "llm", include_session: bool = False) -> str:
+        """
+        Render lifetime counters and rolling-window gauges in Prometheus text format.
+
+        Sessions are unbounded, so the ``session`` label is omitted unless
+        *include_session* is True; lifetime counters never carry a session.
+        """
+        labels = LABELS if include_session else METRIC_LABELS
+        lines: list[str] = []
+
+        def emit(name: str, kind: str, help_text: str, samples: list[tuple[dict[str, str], float]]) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for sample_labels, value in samples:
+                rendered = ",".join(
+                    f'{k}="{_escape(v)}"' for k, v in sample_labels.items() if v or k not in OPTIONAL_LABELS
+                )
+                lines.append(f"{prefix}_{name}{{{rendered}}} {value:g}")
+
+        totals = self.snapshot(group_by=labels)
+        for field in FIELDS:
+            name = f"{field}_total" if field != "latency_seconds" else "latency_seconds_total"
+            emit(name, "counter", f"LLM {field.replace('_', ' ')}",
+                 [({k: r[k] for k in labels}, r[field]) for r in totals])
+        emit("cost_usd_total", "counter", "Estimated LLM cost in USD",
+             [({k: r[k] for k in labels}, r["cost_usd"]) for r in totals])
+
+        windows = {name: self.snapshot(window=seconds, group_by=labels) for name, seconds in WINDOWS.items()}
+        for field in ("calls", "input_tokens", "output_tokens", "cost_usd"):
+            emit(f"{field}_window", "gauge", f"LLM {field.replace('_', ' ')} over a rolling window",
+                 [({**{k: r[k] for k in labels}, "window": name}, r[field])
+                  for name, rows in windows.items() for r in rows])
+        emit("cache_hit_ratio_window", "gauge", "Share of LLM input tokens read from the prompt cache over a rolling window",
+             [({**{k: r[k] for k in labels}, "window": name}, r["cache_hit_ratio"])
+              for name, rows in windows.items() for r in rows if r["input_tokens"]])
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Drop all recorded usage."""
+        with self._shards_lock:
+            for shard in [self._retired, *self._shards]:
+                shard.totals.clear()
+                shard.buckets.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _pricing_from_env() -> dict[str, dict[str, float]]:
+    raw = os.getenv("LLM_PRICING")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Invalid LLM_PRICING JSON, ignoring: {e}")
+        return {}
+
+
+_default_ledger: UsageLedger | None = None
+_default_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Return the process-wide ledger fed by models built with ``LLMFactory``."""
+    global _default_ledger
+    if _default_ledger is None:
+        with _default_ledger_lock:
+            if _default_ledger is None:
+                _default_ledger = UsageLedger(pricing=_pricing_from_env())
+    return _default_ledger
+
+
+def extract_usage(response: Any) -> dict[str, int]:
+    """
+    Read token usage from an ``LLMResult`` or message.
+
+    Prefers LangChain's ``usage_metadata`` and falls back to the provider's
+    ``token_usage``/``usage`` block in ``llm_output``.
+    """
+    messages = []
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None:
+                messages.append(message)
+    if not messages and hasattr(response, "usage_metadata"):
+        messages = [response]
+
+    usage = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "reasoning_tokens": 0}
+    found = False
+    for message in messages:
+        metadata = getattr(message, "usage_metadata", None)
+        if not metadata:
+            continue
+        found = True
+        usage["input_tokens"] += metadata.get("input_tokens", 0) or 0
+        usage["output_tokens"] += metadata.get("output_tokens", 0) or 0
+        usage["cached_tokens"] += (metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+        usage["reasoning_tokens"] += (metadata.get("output_token_details") or {}).get("reasoning", 0) or 0
+
+    if not found:
+        llm_output = getattr(response, "llm_output", None) or {}
+        raw = llm_output.get("token_usage") or llm_output.get("usage") or {}
+        usage["input_tokens"] = raw.get("prompt_tokens", raw.get("input_tokens", 0)) or 0
+        usage["output_tokens"] = raw.get("completion_tokens", raw.get("output_tokens", 0)) or 0
+    return usage
+
+
+def _response_model(response: Any) -> str | None:
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+            model = metadata.get("model_name") or metadata.get("model_id") or metadata.get("model")
+            if model:
+                return model
+    return None
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Callback handler that records each model call in a ``UsageLedger``."""
+
+    # Record on the caller's thread instead of hopping to an executor
+    run_inline = True
+
+    def __init__(self, provider: str, model: str, ledger: UsageLedger | None = None):
+        self.provider = provider
+        self.model = model
+        self.ledger = ledger or get_usage_ledger()
+        self._runs: dict[UUID, tuple[float, str | None, str | None, str | None]] = {}
+
+    def _start(self, run_id: UUID, metadata: dict[str, Any] | None) -> None:
+        metadata = metadata or {}
+        agent = _agent_var.get() or metadata.get("agent_name")
+        session = _session_var.get() or metadata.get("session_id") or metadata.get("thread_id")
+        started = time.perf_counter()
+        if len(self._runs) >= _RUNS_PRUNE_THRESHOLD:
+            # Runs whose end or error callback never came (e.g. a handler raised first)
+            for stale, run in self._runs.copy().items():
+                if started - run[0] > MAX_RUN_SECONDS:
+                    self._runs.pop(stale, None)
+        self._runs[run_id] = (started, agent, session, metadata.get("latency_profile"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs) -> None:
+        self._start(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs) -> None:
+        self._start(run_id, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        started, agent, session, profile = self._runs.pop(run_id, (None, None, None, None))
+        latency = time.perf_counter() - started if started is not None else 0.0
+        self.ledger.record(
+            self.provider,
+            _response_model(response) or self.model,
+            agent,
+            None if session is None else str(session),
+            latency=latency,
+            latency_profile=profile,
+            **extract_usage(response),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        started, agent, session, profile = self._runs.pop(run_id, (None, None, None, None))
+        latency = time.perf_counter() - started if started is not None else 0.0
+        self.ledger.record(
+            self.provider, self.model, agent, None if session is None else str(session),
+            latency=latency, error=True, latency_profile=profile,
+        )
+
+
+def register_otel_metrics(ledger: UsageLedger | None = None, meter: Any = None) -> None:
+    """
+    Export ledger counters through OpenTelemetry observable counters.
+
+    Uses the global meter provider unless *meter* is given. Values are read
+    from the ledger at collection time, so the per-call path is unchanged.
+    """
+    from opentelemetry import metrics
+
+    ledger = ledger or get_usage_ledger()
+    meter = meter or metrics.get_meter("cnoe_agent_utils.usage")
+
+    def observe(field: str):
+        def callback(options):
+            for row in ledger.snapshot(group_by=METRIC_LABELS):
+                yield metrics.Observation(
+                    row[field], {k: row[k] for k in METRIC_LABELS if row[k] or k not in OPTIONAL_LABELS},
+                )
+        return callback
+
+    units = {"latency_seconds": "s", "cost_usd": "USD"}
+    for field in FIELDS + ("cost_usd",):
+        meter.create_observable_counter(
+            f"llm.{field}", callbacks=[observe(field)], unit=units.get(field, "1"),
+            description=f"LLM {field.replace('_', ' ')}",
+        )
+    meter.create_observable_gauge(
+        "llm.cache_hit_ratio", callbacks=[observe("cache_hit_ratio")], unit="1",
+        description="Share of LLM input tokens read from the prompt cache",
+    )
@@ -2,8 +2,23 @@ import sys
 import time
 import threading
 import os
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+
+def env_int(name: str, default: int, minimum: int = 1) -> int:
+    """Read an integer environment variable of at least *minimum*, falling back to *default*."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return max(minimum, int(value))
+    except ValueError:
+        logger.warning(f"Invalid value for {name}='{value}', using default: {default}")
+        return default
+
 
 class Spinner:
     """A simple terminal spinner for showing progress during long-running operations."""
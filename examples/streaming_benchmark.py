@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Streaming vs non-streaming overhead benchmark.
+
+Compares the same chat calls made as streaming (SSE) and non-streaming
+requests for several output sizes.
+
+By default it runs offline against an in-process OpenAI-compatible mock, so
+it measures only the client-side cost of each mode: SSE parsing, per-chunk
+callbacks and chunk merging. With --live it calls the model configured for
+--provider (e.g. OPENAI_API_KEY / OPENAI_MODEL_NAME), which adds network
+framing and server time.
+
+Usage:
+    python examples/streaming_benchmark.py
+    python examples/streaming_benchmark.py --calls 50 --sizes 8,64,512,2048
+    python examples/streaming_benchmark.py --live --provider openai --calls 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+
+WORD = "token "
+
+
+def _completion(words: int) -> dict:
+    return {
+        "id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": WORD * words}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 20, "completion_tokens": words, "total_tokens": 20 + words},
+    }
+
+
+def _sse(words: int) -> bytes:
+    events = []
+    for i in range(words):
+        delta = {"role": "assistant", "content": WORD} if i == 0 else {"content": WORD}
+        events.append({"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+    events.append({"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+                   "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                   "usage": {"prompt_tokens": 20, "completion_tokens": words, "total_tokens": 20 + words}})
+    return "".join(f"data: {json.dumps(event)}\n\n" for event in events).encode() + b"data: [DONE]\n\n"
+
+
+def _mock_model(words: int, streaming: bool) -> ChatOpenAI:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if json.loads(request.content).get("stream"):
+            return httpx.Response(200, content=_sse(words), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=_completion(words))
+
+    return ChatOpenAI(model="bench", api_key="bench", base_url="http://bench.local/v1", streaming=streaming,
+                      stream_usage=True, http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+
+def _live_model(provider: str, words: int, streaming: bool):
+    env_var = {"openai": "OPENAI_STREAMING", "azure-openai": "AZURE_OPENAI_STREAMING", "groq": "GROQ_STREAMING",
+               "aws-bedrock": "AWS_BEDROCK_STREAMING"}.get(provider, "LLM_STREAMING")
+    os.environ[env_var] = "true" if streaming else "false"
+    return LLMFactory(provider).get_llm(max_tokens=max(16, words * 2))
+
+
+def _time_calls(model, prompt: str, calls: int) -> list:
+    model.invoke(prompt)  # warm up connections and lazy imports
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        model.invoke(prompt)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=30, help="calls per size and mode")
+    parser.add_argument("--sizes", default="8,32,256,2048", help="output sizes in tokens (words for --live)")
+    parser.add_argument("--live", action="store_true", help="call the configured provider instead of the mock")
+    parser.add_argument("--provider", default="openai")
+    args = parser.parse_args()
+
+    print(f"{'output tokens':>13}  {'non-streaming ms':>16}  {'streaming ms':>12}  {'overhead':>9}")
+    for words in (int(size) for size in args.sizes.split(",")):
+        medians = {}
+        for streaming in (False, True):
+            if args.live:
+                model = _live_model(args.provider, words, streaming)
+                prompt = f"Repeat the word 'token' exactly {words} times, separated by spaces."
+            else:
+                model, prompt = _mock_model(words, streaming), "benchmark"
+            medians[streaming] = statistics.median(_time_calls(model, prompt, args.calls))
+        overhead = (medians[True] - medians[False]) / medians[False] * 100
+        print(f"{words:>13}  {medians[False]:>16.2f}  {medians[True]:>12.2f}  {overhead:>8.0f}%")
+
+
+if __name__ == "__main__":
+    main()
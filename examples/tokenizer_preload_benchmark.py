@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tokenizer startup and per-worker memory benchmark.
+
+Forks worker processes the way a pre-fork server does and measures, in
+each worker, the time to its first token count and its private memory
+(pages not shared with other processes, from /proc/self/smaps_rollup).
+Two setups are compared:
+
+- lazy: every worker loads the tiktoken encoding on its first count
+- preloaded: the parent calls ``preload_tokenizers(freeze=True)`` before
+  forking, so workers share its copy of the ranks table
+
+Real encodings are read from TIKTOKEN_CACHE_DIR (see
+``download_tokenizer_data``) or downloaded; the benchmark exits with an
+error if the encoding cannot be loaded, rather than timing the fallback
+estimate. With --synthetic, a generated ranks file of the same size and
+format stands in, so the benchmark runs offline. Linux only.
+
+Usage:
+    TIKTOKEN_CACHE_DIR=/opt/tiktoken LLM_TOKENIZER_OFFLINE=true python examples/tokenizer_preload_benchmark.py
+    python examples/tokenizer_preload_benchmark.py --synthetic --workers 8
+"""
+
+import argparse
+import base64
+import gc
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from cnoe_agent_utils.token_counting import TiktokenTokenizer, preload_tokenizers
+
+TEXT = "kubectl get pods -n team-a shows pod-a in CrashLoopBackOff after the last rollout. " * 20
+
+
+def _private_kb() -> int:
+    with open("/proc/self/smaps_rollup", encoding="utf-8") as f:
+        fields = dict(line.split(":", 1) for line in f if ":" in line)
+    return sum(int(fields[name].split()[0]) for name in ("Private_Clean", "Private_Dirty"))
+
+
+def _write_synthetic_data(vocab: int) -> str:
+    """Write a generated ranks file in tiktoken's format, sized like a real encoding."""
+    rng = random.Random(0)
+    ranks = {bytes([i]): i for i in range(256)}
+    while len(ranks) < vocab:
+        ranks.setdefault(bytes(rng.randrange(97, 123) for _ in range(rng.randrange(2, 9))), len(ranks))
+    fd, path = tempfile.mkstemp(suffix=".tiktoken")
+    with os.fdopen(fd, "wb") as f:
+        f.writelines(base64.b64encode(token) + b" " + str(rank).encode() + b"\n" for token, rank in ranks.items())
+    return path
+
+
+def _load_synthetic(encoding_name: str, data_path: str):
+    """Build an encoding from the generated ranks file, parsed the way tiktoken reads its own."""
+    import tiktoken
+
+    with open(data_path, "rb") as f:
+        ranks = {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in f if line.strip())}
+    return tiktoken.Encoding(encoding_name, pat_str=r"""\S+|\s+""", mergeable_ranks=ranks, special_tokens={})
+
+
+def _worker(write_fd: int, encoding_name: str, data_path: str, preloaded) -> None:
+    before = _private_kb()
+    started = time.perf_counter()
+    if data_path:
+        tokenizer = TiktokenTokenizer(encoding=preloaded or _load_synthetic(encoding_name, data_path))
+    else:
+        tokenizer = TiktokenTokenizer(encoding_name)
+    tokenizer.count(TEXT)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    os.write(write_fd, f"{elapsed_ms:.1f} {_private_kb() - before} {tokenizer.name}\n".encode())
+    os._exit(0)
+
+
+def _run(workers: int, encoding_name: str, data_path: str, preloaded=None) -> list:
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _worker(write_fd, encoding_name, data_path, preloaded)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            elapsed_ms, private_kb, name = pipe.read().split()
+        os.waitpid(pid, 0)
+        if name.endswith("~approx"):
+            raise SystemExit(
+                f"Could not load the {encoding_name} encoding in the worker; set TIKTOKEN_CACHE_DIR to a "
+                "directory filled by download_tokenizer_data(), or use --synthetic"
+            )
+        results.append((float(elapsed_ms), int(private_kb), name))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--encoding", default="o200k_base")
+    parser.add_argument("--synthetic", action="store_true", help="use a generated encoding instead of tiktoken data")
+    parser.add_argument("--vocab", type=int, default=200_000, help="size of the synthetic encoding")
+    args = parser.parse_args()
+
+    data_path = _write_synthetic_data(args.vocab) if args.synthetic else ""
+    print(f"{'setup':>9}  {'first count ms':>14}  {'private MB/worker':>17}  tokenizer")
+    try:
+        for setup in ("lazy", "preloaded"):
+            preloaded = None
+            if setup == "preloaded":
+                if data_path:
+                    preloaded = _load_synthetic(args.encoding, data_path)
+                    gc.freeze()
+                elif not preload_tokenizers([args.encoding], freeze=True)[args.encoding]:
+                    raise SystemExit(f"Could not preload the {args.encoding} encoding")
+            results = _run(args.workers, args.encoding, data_path, preloaded)
+            first_ms = statistics.median(result[0] for result in results)
+            private_mb = statistics.median(result[1] for result in results) / 1024
+            print(f"{setup:>9}  {first_ms:>14.1f}  {private_mb:>17.1f}  {results[0][2]}")
+    finally:
+        if data_path:
+            os.remove(data_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Context trimming benchmark.
+
+Times ``BaseLangGraphAgent._trim_messages_if_needed`` end to end on long
+histories: reading the state, counting it, choosing the cut and removing
+the messages. It is compared with the previous implementation of the same
+step, which counted the history, kept MIN_MESSAGES_TO_KEEP messages and
+then removed one more at a time, re-counting the kept ones, until they fit.
+
+Both use the agent's memoized TokenCounter, warmed before timing as on any
+turn after the first, and the agent's settings (MIN_MESSAGES_TO_KEEP, the
+provider's context limit). The current path trims down to the low
+watermark, the previous one down to the limit. Runs offline in a few
+seconds.
+
+With the default settings both take about as long, since counting the
+history dominates. The previous loop re-counted every kept message after
+each removal, so it grows quadratically once the newest MIN_MESSAGES_TO_KEEP
+messages alone exceed the limit (seconds for --min-keep 2000 --limit 20000).
+
+Usage:
+    python examples/trimming_benchmark.py
+    python examples/trimming_benchmark.py --sizes 2000 --min-keep 2000 --limit 20000 --repeat 1
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from pydantic import BaseModel
+
+from cnoe_agent_utils.agents.base_langgraph_agent import BaseLangGraphAgent
+
+
+class BenchmarkAgent(BaseLangGraphAgent):
+    def get_agent_name(self):
+        return "benchmark"
+
+    def get_system_instruction(self):
+        return "You are a Kubernetes assistant."
+
+    def get_response_format_instruction(self):
+        return ""
+
+    def get_response_format_class(self):
+        return BaseModel
+
+    def get_tool_working_message(self):
+        return ""
+
+    def get_tool_processing_message(self):
+        return ""
+
+
+class HistoryGraph:
+    """Checkpointer stand-in holding one thread's messages."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"messages": list(self.messages)})
+
+    async def aupdate_state(self, config, values):
+        removed = {command.id for command in values["messages"]}
+        self.messages = [m for m in self.messages if m.id not in removed]
+
+
+def _history(size: int) -> list:
+    messages = []
+    while len(messages) < size:
+        turn = len(messages)
+        messages += [
+            HumanMessage(content=f"turn {turn}: list the failing pods in namespace team-{turn % 7}", id=f"h{turn}"),
+            AIMessage(content="", id=f"c{turn}",
+                      tool_calls=[{"name": "get_pods", "args": {"ns": f"team-{turn % 7}"}, "id": f"t{turn}"}]),
+            ToolMessage(content="pod-a CrashLoopBackOff\n" * 20, tool_call_id=f"t{turn}", id=f"r{turn}"),
+            AIMessage(content=f"pod-a is crash-looping in team-{turn % 7}.", id=f"a{turn}"),
+        ]
+    return messages[:size]
+
+
+async def _previous_trim(agent: BenchmarkAgent, messages: list) -> int:
+    """The trimming step before cut selection, state reads and writes included."""
+    agent.graph = HistoryGraph(messages)
+    config = {"configurable": {"thread_id": "benchmark"}}
+    messages = (await agent.graph.aget_state(config)).values["messages"]
+    counter, limit = agent.token_counter, agent.max_context_tokens
+    if counter.count_total(messages) <= limit:
+        return 0
+    system = [m for m in messages if isinstance(m, SystemMessage)]
+    conversation = [m for m in messages if not isinstance(m, SystemMessage)]
+    keep = conversation[-agent.min_messages_to_keep:]
+    remove = conversation[:-agent.min_messages_to_keep]
+    while counter.count_total(system) + counter.count_total(keep) > limit and len(keep) > 2:
+        remove.append(keep.pop(0))
+    await agent.graph.aupdate_state(config, {"messages": [RemoveMessage(id=m.id) for m in remove]})
+    return len(messages) - len(agent.graph.messages)
+
+
+async def _current_trim(agent: BenchmarkAgent, messages: list) -> int:
+    agent.graph = HistoryGraph(messages)
+    await agent._trim_messages_if_needed({"configurable": {"thread_id": "benchmark"}})
+    return len(messages) - len(agent.graph.messages)
+
+
+def _best_ms(loop: asyncio.AbstractEventLoop, repeat: int, trim, agent: BenchmarkAgent, messages: list) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = loop.run_until_complete(trim(agent, messages))
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000", help="history sizes in messages")
+    parser.add_argument("--min-keep", type=int, help="MIN_MESSAGES_TO_KEEP (default: the agent's, 10 unless set)")
+    parser.add_argument("--limit", type=int, help="context limit in tokens (default: the provider's)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the fastest is reported")
+    args = parser.parse_args()
+
+    os.environ.update({"LLM_PROVIDER": "openai", "OPENAI_API_KEY": "offline", "OPENAI_MODEL_NAME": "gpt-4o"})
+    logging.disable(logging.WARNING)
+    agent = BenchmarkAgent()
+    agent.system_prompt = agent.get_system_instruction()
+    if args.min_keep is not None:
+        agent.min_messages_to_keep = args.min_keep
+    if args.limit is not None:
+        agent.max_context_tokens = args.limit
+    print(f"min_keep={agent.min_messages_to_keep}  limit={agent.max_context_tokens:,}  "
+          f"watermarks={agent.trim_high_watermark:g}/{agent.trim_low_watermark:g}")
+
+    print(f"{'messages':>8}  {'previous ms':>11}  {'current ms':>10}  {'previous removed':>16}  {'current removed':>15}")
+    loop = asyncio.new_event_loop()
+    for size in (int(value) for value in args.sizes.split(",")):
+        messages = _history(size)
+        agent.token_counter.count_messages(messages)  # warm the memoized counts
+        previous_ms, previous_removed = _best_ms(loop, args.repeat, _previous_trim, agent, messages)
+        current_ms, current_removed = _best_ms(loop, args.repeat, _current_trim, agent, messages)
+        print(f"{size:>8}  {previous_ms:>11.1f}  {current_ms:>10.1f}  {previous_removed:>16}  {current_removed:>15}")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Tests that BaseLangGraphAgent models work with create_react_agent(response_format=...).
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.prebuilt import create_react_agent
+from pydantic import BaseModel, Field
+
+from cnoe_agent_utils.agents.base_langgraph_agent import BaseLangGraphAgent
+from cnoe_agent_utils.llm_factory import LLMFactory
+
+
+class Answer(BaseModel):
+    text: str
+
+
+@tool
+def lookup(query: str) -> str:
+    """Look something up in the knowledge base."""
+    return query
+
+
+class ToolCallingChatModel(GenericFakeChatModel):
+    """Fake chat model that supports tools and records each call's keyword arguments."""
+
+    model_name: str = "fake-model"
+    calls: list = Field(default_factory=list)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(kwargs)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class AnswerAgent(BaseLangGraphAgent):
+    def get_agent_name(self):
+        return "answer"
+
+    def get_system_instruction(self):
+        return "Answer."
+
+    def get_response_format_instruction(self):
+        return ""
+
+    def get_response_format_class(self):
+        return Answer
+
+    def get_tool_working_message(self):
+        return ""
+
+    def get_tool_processing_message(self):
+        return ""
+
+
+def _agent(env):
+    model = ToolCallingChatModel(messages=iter([
+        AIMessage(content="done"),
+        AIMessage(content="", tool_calls=[{"name": "Answer", "args": {"text": "done"}, "id": "call-1"}]),
+    ]))
+    env = {"LLM_PROVIDER": "anthropic-claude", "ANTHROPIC_API_KEY": "k", "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5", **env}
+    with patch.dict(os.environ, env), \
+            patch.object(LLMFactory, "_build_anthropic_claude_llm", lambda self, *args, **kwargs: model):
+        return AnswerAgent(), model
+
+
+@pytest.mark.parametrize("env, call_kwarg", [
+    ({"LLM_THINKING_POLICY": "adaptive"}, "max_tokens"),
+    ({"LLM_AUTO_MAX_TOKENS": "true"}, "max_tokens"),
+    ({"LLM_LATENCY_PROFILE": "fast"}, "service_tier"),
+])
+def test_structured_response_through_wrapped_model(env, call_kwarg):
+    agent, model = _agent(env)
+    graph = create_react_agent(agent.model, [lookup], response_format=Answer)
+    result = graph.invoke({"messages": [("user", "hi")]})
+    assert result["structured_response"] == Answer(text="done")
+    # Both the tool-loop call and the structured-output call went through the wrapper
+    assert len(model.calls) == 2 and all(call_kwarg in call for call in model.calls)
+
+def test_structured_response_takes_quota_leases():
+    agent, _ = _agent({"LLM_QUOTA_RPS": "100"})
+    graph = create_react_agent(agent.model, [lookup], response_format=Answer)
+    assert graph.invoke({"messages": [("user", "hi")]})["structured_response"] == Answer(text="done")
+    assert agent.model.quota.stats()["acquired"] == 2
@@ -0,0 +1,126 @@
+"""
+Tests for per-call streaming selection.
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.runnables import RunnableLambda
+from langgraph.prebuilt.chat_agent_executor import _get_model
+from pydantic import BaseModel, Field
+
+from cnoe_agent_utils.auto_streaming import AutoStreamingLLM, expected_output_tokens, has_live_consumer
+from cnoe_agent_utils.llm_factory import LLMFactory
+
+
+class CountingChatModel(GenericFakeChatModel):
+    """Fake model that counts streaming and non-streaming requests."""
+
+    requests: dict = Field(default_factory=dict)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[getattr(t, "__name__", t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.requests["generate"] = self.requests.get("generate", 0) + 1
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.requests["stream"] = self.requests.get("stream", 0) + 1
+        for word in next(self.messages).content.split():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def _model():
+    model = CountingChatModel(messages=iter([AIMessage(content="a b c d")] * 10), requests={})
+    return AutoStreamingLLM(model, min_output_tokens=100), model.requests
+
+
+class TestDecision:
+    """Test live-consumer detection and the expected output size."""
+
+    def test_expected_output_tokens(self):
+        assert expected_output_tokens(None, None, {"expected_output_tokens": 5, "max_tokens": 900}, False) == 5
+        assert expected_output_tokens(None, {"metadata": {"expected_output_tokens": 7}}, {}, False) == 7
+        assert expected_output_tokens(None, None, {"max_tokens": 900}, True) == 900
+        assert expected_output_tokens(None, None, {}, True) == 0
+        assert expected_output_tokens(None, None, {}, False) is None
+
+    def test_live_consumer_from_langgraph_messages_mode(self):
+        from langgraph.pregel._messages import StreamMessagesHandler
+        assert has_live_consumer({"callbacks": [StreamMessagesHandler(lambda _: None, subgraphs=False)]})
+        assert not has_live_consumer({"callbacks": []})
+        assert not has_live_consumer(None)
+
+
+class TestAutoStreamingLLM:
+    """Test which request type each call makes."""
+
+    def test_invoke_without_live_consumer_does_not_stream(self):
+        llm, requests = _model()
+        assert llm.invoke("hi").content == "a b c d"
+        assert requests == {"generate": 1}
+
+    def test_stream_streams_unless_output_is_short(self):
+        llm, requests = _model()
+        assert len(list(llm.stream("hi"))) > 1
+        assert requests == {"stream": 1}
+        chunks = list(llm.stream("hi", expected_output_tokens=10))
+        assert len(chunks) == 1 and chunks[0].content == "a b c d"
+        assert requests == {"stream": 1, "generate": 1}
+
+    @pytest.mark.asyncio
+    async def test_live_consumer_in_astream_events(self):
+        llm, requests = _model()
+        events = [e["event"] async for e in llm.model.astream_events("hi", version="v2")]
+        assert "on_chat_model_stream" in events and requests == {"stream": 1}
+
+        async def short_call(_):
+            return await llm.ainvoke("hi", max_tokens=20)
+        events = [e["event"] async for e in RunnableLambda(short_call).astream_events("x", version="v2")]
+        assert requests == {"stream": 1, "generate": 1}
+        assert "on_chat_model_end" in events
+
+    @pytest.mark.asyncio
+    async def test_structured_output_under_live_consumer_does_not_stream(self):
+        class Answer(BaseModel):
+            text: str
+
+        llm, requests = _model()
+        assert _get_model(llm) is llm
+        structured = llm.with_structured_output(Answer)
+
+        async def structured_call(_):
+            return await structured.ainvoke("hi")
+        [e async for e in RunnableLambda(structured_call).astream_events("x", version="v2")]
+        assert requests == {"generate": 1}
+
+    def test_tools_rebound_on_non_streaming_copy(self):
+        llm, _ = _model()
+        with patch.object(CountingChatModel, "bind_tools", create=True,
+                          side_effect=lambda self, tools, **kw: self.bind(tools=tools), autospec=True):
+            bound = llm.bind_tools(["get_pods"], tool_choice="auto")
+            copy = bound._non_streaming_runnable()
+        assert copy.kwargs == {"tools": ["get_pods"]} and copy.bound.disable_streaming is True
+
+
+class TestFactoryIntegration:
+    """Test the "auto" streaming setting in get_llm."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "OPENAI_STREAMING": "auto"})
+    def test_auto_leaves_streaming_unset(self):
+        llm = LLMFactory("openai").get_llm()
+        assert isinstance(llm, AutoStreamingLLM)
+        assert "streaming" not in llm.model.model_fields_set and not llm.structured
+        assert LLMFactory("openai").get_llm(response_format={"type": "json_object"}).structured
+
+    @patch.dict(os.environ, {"GROQ_API_KEY": "k", "GROQ_MODEL_NAME": "llama-3.3-70b", "LLM_STREAMING": "true"})
+    def test_fixed_setting_unchanged(self):
+        llm = LLMFactory("groq").get_llm()
+        assert not isinstance(llm, AutoStreamingLLM) and llm.streaming is True
+        with patch.dict(os.environ, {"GROQ_STREAMING": "auto"}):
+            assert isinstance(LLMFactory("groq").get_llm(), AutoStreamingLLM)
@@ -0,0 +1,183 @@
+"""
+Tests for history compaction in BaseLangGraphAgent.
+"""
+
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import BaseModel
+
+from cnoe_agent_utils.agents.base_langgraph_agent import BaseLangGraphAgent
+
+
+class EchoAgent(BaseLangGraphAgent):
+    def get_agent_name(self):
+        return "echo"
+
+    def get_system_instruction(self):
+        return "Echo."
+
+    def get_response_format_instruction(self):
+        return ""
+
+    def get_response_format_class(self):
+        return BaseModel
+
+    def get_tool_working_message(self):
+        return ""
+
+    def get_tool_processing_message(self):
+        return ""
+
+
+class FakeGraph:
+    def __init__(self, events):
+        self.events = events
+
+    async def astream(self, inputs, config, stream_mode=None):
+        self.events.append("turn")
+        return
+        yield
+
+
+@pytest.fixture
+def agent():
+    env = {"LLM_PROVIDER": "openai", "OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"}
+    with patch.dict(os.environ, env):
+        agent = EchoAgent()
+    agent.events = []
+    agent.graph = FakeGraph(agent.events)
+    agent.trim_delays = []
+
+    async def trim(config):
+        agent.events.append("trim-start")
+        await asyncio.sleep(agent.trim_delays.pop(0) if agent.trim_delays else 0)
+        agent.events.append("trim-end")
+
+    agent._trim_messages_if_needed = trim
+    return agent
+
+
+async def _turn(agent, session="s1"):
+    return [item async for item in agent.stream("hi", session)]
+
+
+@pytest.mark.asyncio
+async def test_compaction_runs_after_the_turn(agent):
+    await _turn(agent)
+    # First turn of a thread in this process: nothing compacted it yet
+    assert agent.events == ["trim-start", "trim-end", "turn"]
+    await agent._compaction_tasks["s1"]
+    assert agent.events[3:] == ["trim-start", "trim-end"]
+
+    await _turn(agent)
+    assert agent.events[5] == "turn"
+
+
+@pytest.mark.asyncio
+async def test_unfinished_compaction_is_followed_by_inline_trim(agent):
+    await _turn(agent)
+    await agent._compaction_tasks["s1"]
+    agent.trim_delays = [0.05]
+    agent.events.clear()
+    await _turn(agent)  # schedules a slow background compaction
+    await asyncio.sleep(0.01)
+    await _turn(agent)
+    # The next turn trimmed inline, after the running compaction rather than alongside it
+    assert agent.events == ["turn", "trim-start", "trim-end", "trim-start", "trim-end", "turn"]
+
+    await agent._compaction_tasks["s1"]
+    agent.events.clear()
+    await _turn(agent)  # schedules a compaction that has not started when the next turn does
+    await _turn(agent)
+    await asyncio.sleep(0.01)
+    # The next turn trimmed inline and the stale compaction was skipped; only the last turn's ran
+    assert agent.events == ["turn", "trim-start", "trim-end", "turn", "trim-start", "trim-end"]
+
+
+@pytest.mark.asyncio
+async def test_aborted_turn_is_trimmed_before_the_next_one(agent):
+    await _turn(agent)
+    await agent._compaction_tasks["s1"]
+
+    async def failing(inputs, config, stream_mode=None):
+        agent.events.append("turn")
+        raise RuntimeError("model error")
+        yield
+
+    agent.graph.astream = failing
+    with pytest.raises(RuntimeError):
+        await _turn(agent)
+    agent.graph.astream = FakeGraph(agent.events).astream
+    agent.events.clear()
+    await _turn(agent)
+    # The aborted turn scheduled no compaction: the finished one is older than it
+    assert agent.events == ["trim-start", "trim-end", "turn"]
+
+
+@pytest.mark.asyncio
+async def test_compactions_are_serialized_per_thread(agent):
+    agent.trim_delays = [0.05, 0.05]
+    config = {"configurable": {"thread_id": "s1"}}
+    other = {"configurable": {"thread_id": "s2"}}
+    await asyncio.gather(agent._compact_history(config), agent._compact_history(config))
+    assert agent.events == ["trim-start", "trim-end", "trim-start", "trim-end"]
+    agent.events.clear()
+    agent.trim_delays = [0.05, 0.05]
+    await asyncio.gather(agent._compact_history(config), agent._compact_history(other))
+    assert agent.events == ["trim-start", "trim-start", "trim-end", "trim-end"]
+
+
+@pytest.mark.asyncio
+async def test_inline_only_when_background_disabled(agent):
+    agent.enable_background_compaction = False
+    await _turn(agent)
+    await _turn(agent)
+    assert agent.events == ["trim-start", "trim-end", "turn"] * 2 and not agent._compaction_tasks
+
+
+class HistoryGraph:
+    """Checkpointer stand-in holding one thread's messages."""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"messages": list(self.messages)})
+
+    async def aupdate_state(self, config, values):
+        removed = {command.id for command in values["messages"]}
+        self.messages = [m for m in self.messages if m.id not in removed]
+
+
+@pytest.mark.asyncio
+async def test_trims_between_watermarks_at_user_turns():
+    env = {"LLM_PROVIDER": "openai", "OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"}
+    with patch.dict(os.environ, env):
+        agent = EchoAgent()
+    agent.system_prompt = ""
+    agent.min_messages_to_keep = 20
+    agent.max_context_tokens = 1000
+    agent.trim_high_watermark, agent.trim_low_watermark = 1.0, 0.5
+
+    async def count(messages, limit=None, fixed_tokens=0):
+        return [100] * len(messages)
+
+    agent._acount_message_list = count
+    agent._calibrated_tokens = lambda tokens: tokens
+    config = {"configurable": {"thread_id": "s1"}}
+    turns = [[HumanMessage(content="q", id=f"h{i}"), AIMessage(content="a", id=f"a{i}")] for i in range(6)]
+    agent.graph = HistoryGraph([m for turn in turns[:5] for m in turn])
+
+    # 1000 tokens: at the high watermark, nothing is trimmed
+    await agent._trim_messages_if_needed(config)
+    assert len(agent.graph.messages) == 10
+
+    # 1400 tokens: cut down to 500 at the start of a user turn, not at "a4"
+    agent.graph.messages += [*turns[5], AIMessage(content="a", id="x1"), AIMessage(content="a", id="x2")]
+    await agent._trim_messages_if_needed(config)
+    assert [m.id for m in agent.graph.messages] == ["h5", "a5", "x1", "x2"]
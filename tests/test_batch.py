@@ -0,0 +1,248 @@
+"""
+Tests for offline batch inference against a local stand-in batch server.
+"""
+
+import email
+import itertools
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from cnoe_agent_utils.batch import (
+    BatchRunner,
+    BedrockBatchBackend,
+    OpenAIBatchBackend,
+    load_batch_requests,
+    normalize_batch_requests,
+)
+from cnoe_agent_utils.llm_factory import LLMFactory
+
+
+class FakeBatchServer:
+    """Minimal stand-in for the OpenAI Files and Batches API.
+
+    Each batch reports ``in_progress`` on its first status poll and completes
+    on the next. Requests whose prompt is "fail" are written to the error file.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.batches = {}
+        self.polls = {}
+        self.ids = itertools.count()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, payload, raw=False):
+                body = payload if raw else json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.path == "/v1/files":
+                    self._send(server.upload(self.headers["Content-Type"], body))
+                elif self.path == "/v1/batches":
+                    self._send(server.create_batch(json.loads(body)))
+                elif self.path.endswith("/cancel"):
+                    batch = server.batches[self.path.split("/")[3]]
+                    batch["status"] = "cancelled"
+                    self._send(batch)
+
+            def do_GET(self):
+                parts = self.path.split("/")
+                if parts[2] == "batches":
+                    self._send(server.retrieve(parts[3]))
+                elif parts[2] == "files" and parts[-1] == "content":
+                    self._send(server.files[parts[3]], raw=True)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def upload(self, content_type, body):
+        message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        data = next(p.get_payload(decode=True) for p in message.get_payload() if p.get_filename())
+        file_id = f"file-{next(self.ids)}"
+        self.files[file_id] = data
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+
+    def create_batch(self, request):
+        batch_id = f"batch-{next(self.ids)}"
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+            "status": "validating", "created_at": 0, "output_file_id": None, "error_file_id": None,
+        }
+        self.polls[batch_id] = 0
+        return self.batches[batch_id]
+
+    def retrieve(self, batch_id):
+        batch = self.batches[batch_id]
+        self.polls[batch_id] += 1
+        if batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress":
+            self._complete(batch)
+        return batch
+
+    def _complete(self, batch):
+        output, errors = [], []
+        for line in self.files[batch["input_file_id"]].decode().splitlines():
+            request = json.loads(line)
+            prompt = request["body"]["messages"][-1]["content"]
+            if prompt == "fail":
+                errors.append({"custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "bad_request", "message": "rejected"}})
+            else:
+                output.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": {
+                    "choices": [{"message": {"role": "assistant", "content": prompt.upper()}}],
+                    "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+                }}})
+        for key, records in (("output_file_id", output), ("error_file_id", errors)):
+            if records:
+                file_id = f"file-{next(self.ids)}"
+                self.files[file_id] = "\n".join(json.dumps(r) for r in records).encode()
+                batch[key] = file_id
+        batch["status"] = "completed"
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+@pytest.fixture
+def batch_server():
+    server = FakeBatchServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def openai_env(batch_server):
+    with patch.dict(os.environ, {
+        "OPENAI_API_KEY": "test-key",
+        "OPENAI_ENDPOINT": batch_server.url,
+        "OPENAI_MODEL_NAME": "gpt-4o-mini",
+    }):
+        yield
+
+
+class TestNormalizeBatchRequests:
+    """Test request normalization."""
+
+    def test_accepts_strings_dicts_and_messages(self):
+        records = normalize_batch_requests([
+            "hello",
+            {"custom_id": "x", "prompt": "hi", "max_tokens": 5},
+            [SystemMessage(content="be brief"), HumanMessage(content="q")],
+        ])
+        assert records[0] == ("request-0", [{"role": "user", "content": "hello"}], {})
+        assert records[1] == ("x", [{"role": "user", "content": "hi"}], {"max_tokens": 5})
+        assert records[2][1] == [{"role": "system", "content": "be brief"}, {"role": "user", "content": "q"}]
+
+    def test_rejects_duplicates_and_missing_prompt(self):
+        with pytest.raises(ValueError, match="Duplicate"):
+            normalize_batch_requests([{"custom_id": "a", "prompt": "1"}, {"custom_id": "a", "prompt": "2"}])
+        with pytest.raises(ValueError, match="no 'prompt'"):
+            normalize_batch_requests([{"custom_id": "a"}])
+
+    def test_load_batch_requests(self, tmp_path):
+        path = tmp_path / "prompts.jsonl"
+        path.write_text('"one"\n\n{"custom_id": "b", "prompt": "two"}\n')
+        assert load_batch_requests(str(path)) == ["one", {"custom_id": "b", "prompt": "two"}]
+
+
+class TestOpenAIBatch:
+    """Test the OpenAI batch flow against the local stand-in server."""
+
+    def test_run_streams_results_per_job(self, batch_server, openai_env):
+        runner = LLMFactory("openai").get_batch_runner(chunk_size=2, poll_interval=0, max_tokens=16)
+        results = {r.custom_id: r for r in runner.run(["a", "b", "fail", "d", "e"])}
+
+        assert len(batch_server.batches) == 3
+        assert results["request-0"].content == "A"
+        assert results["request-0"].usage["completion_tokens"] == 2
+        assert results["request-2"].error == "rejected"
+        assert not results["request-2"].ok
+        assert len(results) == 5
+
+        first_input = batch_server.files[next(iter(batch_server.batches.values()))["input_file_id"]]
+        body = json.loads(first_input.decode().splitlines()[0])["body"]
+        assert body == {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "a"}], "max_tokens": 16}
+
+    @pytest.mark.asyncio
+    async def test_arun(self, batch_server, openai_env):
+        runner = LLMFactory("openai").get_batch_runner(poll_interval=0)
+        results = [r async for r in runner.arun(["x", "y"])]
+        assert sorted(r.content for r in results) == ["X", "Y"]
+
+    def test_timeout_cancels_jobs(self, batch_server, openai_env):
+        runner = LLMFactory("openai").get_batch_runner(poll_interval=0, timeout=0)
+        with pytest.raises(TimeoutError):
+            list(runner.run(["a"]))
+        assert next(iter(batch_server.batches.values()))["status"] == "cancelled"
+
+    def test_missing_results_are_reported(self):
+        backend = MagicMock()
+        backend.submit.return_value = "job-1"
+        backend.poll.return_value = ("failed", True)
+        backend.results.return_value = iter([])
+        results = list(BatchRunner(backend, poll_interval=0).run(["a"]))
+        assert results[0].custom_id == "request-0"
+        assert "failed" in results[0].error
+
+    def test_parse_http_error(self):
+        result = OpenAIBatchBackend._parse({"custom_id": "c", "response": {"status_code": 429, "body": {}}})
+        assert result.error == "status 429"
+
+
+class TestBedrockBatch:
+    """Test the Bedrock batch backend with stubbed clients."""
+
+    def test_submit_and_results(self):
+        bedrock, s3 = MagicMock(), MagicMock()
+        bedrock.create_model_invocation_job.return_value = {"jobArn": "arn:aws:bedrock:us-east-1:1:model-invocation-job/abc"}
+        backend = BedrockBatchBackend(
+            bedrock, s3, "anthropic.claude-3-haiku", "arn:role",
+            "s3://bucket/in", "s3://bucket/out/", default_params={"max_tokens": 64},
+        )
+        job = backend.submit(normalize_batch_requests([[("system", "sys"), ("user", "hi")]]))
+
+        put = s3.put_object.call_args.kwargs
+        assert put["Bucket"] == "bucket" and put["Key"].startswith("in/cnoe-batch-")
+        record = json.loads(put["Body"].decode())
+        assert record["modelInput"]["system"] == "sys"
+        assert record["modelInput"]["max_tokens"] == 64
+        assert record["modelInput"]["messages"] == [{"role": "user", "content": "hi"}]
+
+        output = json.dumps({"recordId": "request-0", "modelOutput": {
+            "content": [{"type": "text", "text": "hello"}], "usage": {"input_tokens": 4, "output_tokens": 1}}})
+        s3.get_object.return_value = {"Body": MagicMock(read=output.encode)}
+        bedrock.get_model_invocation_job.return_value = {"status": "Completed"}
+
+        assert backend.poll(job) == ("Completed", True)
+        [result] = list(backend.results(job))
+        assert result.content == "hello"
+        assert s3.get_object.call_args.kwargs["Key"] == f"out/abc/{put['Key'].rsplit('/', 1)[-1]}.out"
+
+    @patch.dict(os.environ, {"AWS_REGION": "us-east-1", "AWS_BEDROCK_MODEL_ID": "m"}, clear=True)
+    def test_factory_requires_s3_settings(self):
+        with pytest.raises(EnvironmentError, match="AWS_BEDROCK_BATCH_ROLE_ARN"):
+            LLMFactory("aws-bedrock").get_batch_runner()
+
+
+def test_provider_without_batch_api():
+    with pytest.raises(ValueError, match="does not provide a batch API"):
+        LLMFactory("anthropic-claude").get_batch_runner()
@@ -0,0 +1,148 @@
+"""
+Tests for cascading escalation from a fast model to a strong model.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+
+from cnoe_agent_utils.cascade import (
+    CascadeLLM,
+    confidence_validator,
+    structured_output_validator,
+    tiers_from_env,
+)
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.routing import ModelTier
+
+
+class Answer(BaseModel):
+    answer: str
+    confidence: float
+
+
+def _fake_factory(responses_by_model: dict):
+    factory = MagicMock()
+
+    def get_llm(model=None, tools=None, **kwargs):
+        return GenericFakeChatModel(messages=iter([AIMessage(content=responses_by_model[model])] * 10))
+
+    factory.get_llm.side_effect = get_llm
+    return factory
+
+
+TIERS = [ModelTier("fast", model="small"), ModelTier("strong", model="big")]
+
+
+class TestValidators:
+    """Test built-in validators."""
+
+    def test_structured_output_validator(self):
+        validate = structured_output_validator(Answer)
+        assert validate(AIMessage(content='```json\n{"answer": "x", "confidence": 0.9}\n```')) is True
+        assert "structured output invalid" in validate(AIMessage(content="not json"))
+        assert "structured output invalid" in validate(AIMessage(content='{"answer": "x"}'))
+
+    def test_structured_output_validator_reads_tool_calls(self):
+        validate = structured_output_validator(Answer)
+        message = AIMessage(content="", tool_calls=[{"name": "Answer", "id": "1", "args": {"answer": "x", "confidence": 1}}])
+        assert validate(message) is True
+
+    def test_confidence_validator_sources(self):
+        validate = confidence_validator(0.7)
+        assert validate(AIMessage(content='{"answer": "x", "confidence": 0.9}')) is True
+        assert validate(AIMessage(content="Paris.\nConfidence: 85%")) is True
+        assert "below" in validate(AIMessage(content="Confidence = 0.4"))
+        assert validate(Answer(answer="x", confidence=0.8)) is True
+        assert validate(AIMessage(content="no idea")) == "no self-reported confidence"
+
+
+class TestCascadeLLM:
+    """Test escalation behaviour and stats."""
+
+    def test_accepted_answer_stays_on_fast_tier(self):
+        factory = _fake_factory({"small": '{"answer": "a", "confidence": 0.9}', "big": "strong"})
+        llm = CascadeLLM(factory, TIERS, [confidence_validator(0.7)])
+        assert "answer" in llm.invoke("q").content
+        stats = llm.get_stats()
+        assert stats["escalations"] == 0
+        assert stats["accepted_by_tier"] == {"fast": 1}
+        assert factory.get_llm.call_count == 1
+
+    def test_rejected_answer_escalates(self):
+        factory = _fake_factory({"small": "Confidence: 0.2", "big": "strong answer"})
+        llm = CascadeLLM(factory, TIERS, [confidence_validator(0.7)])
+        assert llm.invoke("q").content == "strong answer"
+        stats = llm.get_stats()
+        assert stats["escalations"] == 1
+        assert stats["escalation_rate"] == pytest.approx(1.0)
+        assert stats["accepted_by_tier"] == {"strong": 1}
+        assert stats["added_latency"] >= 0.0
+        assert stats["rejections_by_reason"] == {"confidence>=0.7": 1}
+
+    def test_tool_call_turns_are_accepted_without_validation(self):
+        factory = MagicMock()
+        call = AIMessage(content="", tool_calls=[{"name": "get_pods", "id": "1", "args": {"ns": "default"}}])
+        factory.get_llm.return_value = GenericFakeChatModel(messages=iter([call]))
+        llm = CascadeLLM(factory, TIERS, [structured_output_validator(Answer), confidence_validator(0.7)])
+        assert llm.invoke("q").tool_calls[0]["name"] == "get_pods"
+        assert llm.get_stats()["escalations"] == 0
+        assert factory.get_llm.call_count == 1
+
+    def test_last_tier_is_not_validated(self):
+        factory = _fake_factory({"small": "bad", "big": "also bad"})
+        llm = CascadeLLM(factory, TIERS, [lambda response: False])
+        assert llm.invoke("q").content == "also bad"
+
+    def test_custom_check_and_exceptions(self):
+        factory = _fake_factory({"small": "short", "big": "long enough answer"})
+
+        def too_short(response):
+            return len(response.content) > 10
+
+        def broken(response):
+            raise RuntimeError("boom")
+
+        assert CascadeLLM(factory, TIERS, [too_short]).invoke("q").content == "long enough answer"
+        llm = CascadeLLM(factory, TIERS, [broken])
+        llm.invoke("q")
+        assert llm.get_stats()["rejections_by_reason"] == {"broken": 1}
+
+    @pytest.mark.asyncio
+    async def test_ainvoke_escalates(self):
+        factory = _fake_factory({"small": "nope", "big": '{"answer": "x", "confidence": 1}'})
+        llm = CascadeLLM(factory, TIERS, [structured_output_validator(Answer)])
+        assert "answer" in (await llm.ainvoke("q")).content
+        assert llm.get_stats()["escalations"] == 1
+
+    def test_stream_yields_accepted_answer(self):
+        factory = _fake_factory({"small": "Confidence: 0.1", "big": "final"})
+        llm = CascadeLLM(factory, TIERS, [confidence_validator(0.5)])
+        assert [c.content for c in llm.stream("q")] == ["final"]
+
+    def test_requires_tiers(self):
+        with pytest.raises(ValueError):
+            CascadeLLM(MagicMock(), [])
+
+
+class TestGetCascadeLLM:
+    """Test LLMFactory.get_cascade_llm."""
+
+    def test_tiers_from_env(self):
+        with patch.dict(os.environ, {"LLM_CASCADE_MODELS": "m-small, m-big"}):
+            assert [t.model for t in tiers_from_env()] == ["m-small", "m-big"]
+        with patch.dict(os.environ, {}, clear=True), pytest.raises(EnvironmentError):
+            tiers_from_env()
+
+    @patch.dict(os.environ, {
+        "ANTHROPIC_API_KEY": "test-key",
+        "ANTHROPIC_MODEL_NAME": "claude-default",
+    })
+    def test_builds_models_in_order(self):
+        factory = LLMFactory("anthropic-claude")
+        llm = factory.get_cascade_llm(models=["claude-haiku", "claude-opus"])
+        assert [llm.get_model(t).model for t in llm.tiers] == ["claude-haiku", "claude-opus"]
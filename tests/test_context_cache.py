@@ -0,0 +1,204 @@
+"""
+Tests for Gemini / Vertex AI explicit context caching.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.prebuilt.chat_agent_executor import _get_model
+from pydantic import BaseModel, Field
+
+from cnoe_agent_utils.context_cache import (
+    ContextCachedLLM,
+    ContextCacheStore,
+    min_cache_tokens,
+)
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.token_counting import CharRatioTokenizer, TokenCountCache, TokenCounter
+
+LONG_PROMPT = "You are a platform engineering assistant. " * 200
+
+
+@tool
+def get_pods(namespace: str) -> str:
+    """List pods in a namespace."""
+    return namespace
+
+
+class RecordingChatModel(BaseChatModel):
+    """Chat model that records the messages and kwargs of every call."""
+
+    calls: list[Any] = Field(default_factory=list)
+    fail_with: list[Exception] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append((messages, kwargs))
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[getattr(t, "name", None) or t.__name__ for t in tools], **kwargs)
+
+
+class FakeBackend:
+    """Cached-content backend that hands out numbered handles."""
+
+    scope = "fake"
+
+    def __init__(self):
+        self.created, self.renewed = [], []
+
+    def create(self, model_name, system_text, tools, ttl):
+        self.created.append((system_text, [t.name for t in tools]))
+        return f"cachedContents/{len(self.created)}"
+
+    def renew(self, name, ttl):
+        self.renewed.append(name)
+
+
+def _cached(min_tokens=1024, ttl=3600):
+    model = RecordingChatModel(calls=[], fail_with=[])
+    backend = FakeBackend()
+    counter = TokenCounter("google_gemini", "gemini-2.5-flash", tokenizer=CharRatioTokenizer(), cache=TokenCountCache(100))
+    llm = ContextCachedLLM(model, "google_gemini", "gemini-2.5-flash", backend=backend, ttl=ttl,
+                           min_tokens=min_tokens, counter=counter, store=ContextCacheStore())
+    return llm, model, backend
+
+
+class TestContextCachedLLM:
+    """Test handle reuse, renewal and fallbacks."""
+
+    def test_prefix_is_cached_once_and_reused(self):
+        llm, model, backend = _cached()
+        llm = llm.bind_tools([get_pods])
+        for question in ("list pods", "list pods in prod"):
+            assert llm.invoke([SystemMessage(content=LONG_PROMPT), HumanMessage(content=question)]).content == "ok"
+        assert backend.created == [(LONG_PROMPT, ["get_pods"])]
+        messages, kwargs = model.calls[-1]
+        assert [m.content for m in messages] == ["list pods in prod"]
+        assert kwargs["cached_content"] == "cachedContents/1" and "tools" not in kwargs
+        assert llm.store.stats()["hits"] == 1
+
+    def test_changed_prefix_gets_a_new_handle(self):
+        llm, _, backend = _cached()
+        llm.invoke([SystemMessage(content=LONG_PROMPT), HumanMessage(content="a")])
+        llm.invoke([SystemMessage(content=LONG_PROMPT + "Be brief."), HumanMessage(content="a")])
+        assert len(backend.created) == 2
+
+    def test_small_prefix_uses_normal_request(self):
+        llm, model, backend = _cached()
+        llm.bind_tools([get_pods]).invoke([SystemMessage(content="be brief"), HumanMessage(content="hi")])
+        messages, kwargs = model.calls[0]
+        assert backend.created == [] and len(messages) == 2
+        assert "cached_content" not in kwargs and kwargs["tools"] == ["get_pods"]
+
+    def test_ttl_renewed_near_expiry(self):
+        llm, _, backend = _cached(ttl=100)
+        request = [SystemMessage(content=LONG_PROMPT), HumanMessage(content="hi")]
+        llm.invoke(request)
+        with patch("cnoe_agent_utils.context_cache.time.time", return_value=10**10):
+            llm.invoke(request)  # expired: recreated
+        key = next(iter(llm.store._entries))
+        name, expires_at = llm.store._entries[key]
+        with patch("cnoe_agent_utils.context_cache.time.time", return_value=expires_at - 10):
+            llm.invoke(request)
+        assert len(backend.created) == 2 and backend.renewed == [name]
+
+    def test_missing_handle_is_recreated_and_retried(self):
+        llm, model, backend = _cached()
+        request = [SystemMessage(content=LONG_PROMPT), HumanMessage(content="hi")]
+        llm.invoke(request)
+        model.fail_with.append(RuntimeError("404 CachedContent not found (or permission denied)"))
+        assert llm.invoke(request).content == "ok"
+        assert len(backend.created) == 2
+        assert model.calls[-1][1]["cached_content"] == "cachedContents/2"
+
+    def test_create_failure_falls_back(self):
+        llm, model, backend = _cached()
+        backend.create = lambda *args: (_ for _ in ()).throw(RuntimeError("quota exceeded"))
+        assert llm.invoke([SystemMessage(content=LONG_PROMPT), HumanMessage(content="hi")]).content == "ok"
+        assert "cached_content" not in model.calls[0][1]
+        assert llm.store.stats()["errors"] == 1
+
+    def test_slow_creation_does_not_block_other_prefixes(self):
+        store, backend = ContextCacheStore(), FakeBackend()
+        started, release = threading.Event(), threading.Event()
+        create = backend.create
+
+        def slow_create(model_name, system_text, tools, ttl):
+            if system_text == "slow":
+                started.set()
+                release.wait(5)
+            return create(model_name, system_text, tools, ttl)
+
+        backend.create = slow_create
+        with ThreadPoolExecutor(3) as pool:
+            slow = [pool.submit(store.handle, "a", backend, "m", "slow", [], 60) for _ in range(2)]
+            assert started.wait(5)
+            # Another prefix is created while "a" is still waiting on the provider
+            assert pool.submit(store.handle, "b", backend, "m", "fast", [], 60).result(timeout=5)
+            release.set()
+            assert {future.result(timeout=5) for future in slow} == {"cachedContents/2"}
+        assert [text for text, _ in backend.created] == ["fast", "slow"]
+
+    @pytest.mark.asyncio
+    async def test_async_and_stream(self):
+        llm, model, backend = _cached()
+        request = [SystemMessage(content=LONG_PROMPT), HumanMessage(content="hi")]
+        assert (await llm.ainvoke(request)).content == "ok"
+        assert "".join(chunk.content for chunk in llm.stream(request)) == "ok"
+        assert len(backend.created) == 1
+        assert all(kwargs["cached_content"] == "cachedContents/1" for _, kwargs in model.calls)
+
+    def test_structured_output_goes_through_the_wrapper_uncached(self):
+        class Answer(BaseModel):
+            text: str
+
+        llm, model, backend = _cached()
+        llm = llm.bind_tools([get_pods])
+        assert _get_model(llm) is llm
+        llm.with_structured_output(Answer).invoke([SystemMessage(content=LONG_PROMPT), HumanMessage(content="hi")])
+        messages, kwargs = model.calls[0]
+        assert backend.created == [] and len(messages) == 2
+        assert kwargs["tools"] == ["Answer"] and "cached_content" not in kwargs
+        assert llm.store.stats()["uncached"] == 1
+
+    def test_min_tokens_per_model(self):
+        assert min_cache_tokens("google_gemini", "models/gemini-2.5-flash-lite") == 1024
+        assert min_cache_tokens("gcp_vertexai", "gemini-2.5-pro") == 2048
+        assert min_cache_tokens("google_gemini", "gemini-exp") == 4096
+
+
+class TestFactoryIntegration:
+    """Test LLM_CONTEXT_CACHE in get_llm."""
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "k", "GOOGLE_GEMINI_MODEL_NAME": "gemini-2.5-flash",
+                             "LLM_CONTEXT_CACHE": "true", "LLM_CONTEXT_CACHE_TTL": "600"})
+    def test_gemini_wrapped_when_enabled(self):
+        llm = LLMFactory("google-gemini").get_llm(tools=[get_pods])
+        assert isinstance(llm, ContextCachedLLM)
+        assert llm.ttl == 600 and llm.min_tokens == 1024 and len(llm.tools) == 1
+        assert type(llm.backend).__name__ == "GenAICacheBackend"
+        assert not isinstance(LLMFactory("google-gemini").get_llm(context_cache=False), ContextCachedLLM)
+
+    @patch.dict(os.environ, {"GOOGLE_API_KEY": "k", "GOOGLE_GEMINI_MODEL_NAME": "gemini-2.5-flash",
+                             "LLM_CONTEXT_CACHE": "true", "LLM_CONTEXT_CACHE_MIN_TOKENS": "0"})
+    def test_min_tokens_zero_caches_every_prefix(self):
+        assert LLMFactory("google-gemini").get_llm().min_tokens == 0
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"})
+    def test_other_providers_ignore_it(self):
+        assert not isinstance(LLMFactory("openai").get_llm(context_cache=True), ContextCachedLLM)
@@ -0,0 +1,117 @@
+"""
+Tests for context trimming cut selection.
+"""
+
+import os
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from cnoe_agent_utils.agents.context_config import get_trim_watermarks
+from cnoe_agent_utils.agents.context_trimming import (
+    safe_cut_points,
+    select_trim_cut,
+    stable_cut_points,
+    trim_cut_points,
+)
+
+
+def _tool_turn(call_id):
+    return [
+        AIMessage(content="", tool_calls=[{"name": "get_pods", "args": {}, "id": call_id}]),
+        ToolMessage(content="pods", tool_call_id=call_id),
+    ]
+
+
+def _reference_cut(counts, fixed, limit, min_keep, convert=lambda tokens: tokens):
+    """The pop-and-recount loop that select_trim_cut replaces."""
+    cut = max(0, len(counts) - min_keep)
+    while convert(fixed + sum(counts[cut:])) > limit and len(counts) - cut > 2:
+        cut += 1
+    return cut
+
+
+class TestSafeCutPoints:
+    """Test which cuts keep tool calls with their results."""
+
+    def test_cut_never_lands_between_call_and_result(self):
+        messages = [HumanMessage(content="q"), *_tool_turn("1"), AIMessage(content="a")]
+        assert safe_cut_points(messages) == [0, 1, 3, 4]
+
+    def test_parallel_calls_answered_later(self):
+        call = AIMessage(content="", tool_calls=[{"name": "a", "args": {}, "id": "1"},
+                                                 {"name": "b", "args": {}, "id": "2"}])
+        messages = [call, ToolMessage(content="x", tool_call_id="1"), HumanMessage(content="q"),
+                    ToolMessage(content="y", tool_call_id="2")]
+        assert safe_cut_points(messages) == [0, 4]
+
+    def test_dict_messages_and_unknown_results(self):
+        messages = [{"type": "tool", "tool_call_id": "gone"},
+                    {"type": "ai", "tool_calls": [{"id": "1"}]}, {"type": "tool", "tool_call_id": "1"}]
+        assert safe_cut_points(messages) == [0, 1, 3]
+
+    def test_scanning_from_start_matches_whole_history(self):
+        messages = [{"type": "tool", "tool_call_id": "gone"}]
+        for i in range(30):
+            if i % 3 == 0:
+                messages.append(HumanMessage(content="q"))
+            messages.append(AIMessage(content="", tool_calls=[{"name": "a", "args": {}, "id": f"{i}"}]))
+            if i % 4:
+                messages.append(AIMessage(content="thinking"))
+            # Some results arrive several messages after their call, one never does
+            if i != 7:
+                messages.insert(len(messages) - (i % 5), ToolMessage(content="x", tool_call_id=f"{i}"))
+        safe = safe_cut_points(messages)
+        counts = [(i * 37) % 50 + 1 for i in range(len(messages))]
+        for start in range(len(messages) + 1):
+            assert safe_cut_points(messages, start) == [cut for cut in safe if cut >= start]
+            min_keep = len(messages) - start
+            for limit in (0, 200, 1000):
+                for user_turns, cuts in ((False, safe), (True, stable_cut_points(messages, safe))):
+                    window = trim_cut_points(messages, min_keep, user_turns)
+                    expected = select_trim_cut(counts, 0, limit, min_keep, cuts)
+                    assert select_trim_cut(counts, 0, limit, min_keep, window) == expected
+
+    def test_stable_cuts_start_user_turns(self):
+        messages = [HumanMessage(content="q"), *_tool_turn("1"), AIMessage(content="a"),
+                    HumanMessage(content="q2"), AIMessage(content="a2")]
+        assert stable_cut_points(messages) == [0, 4]
+        assert stable_cut_points(messages, [3, 4, 5, 6]) == [4]
+
+
+class TestSelectTrimCut:
+    """Test the prefix-sum and binary-search cut selection."""
+
+    def test_matches_reference_loop(self):
+        counts = [(i * 37) % 50 + 1 for i in range(200)]
+        convert = lambda tokens: int(tokens * 1.1) + 20
+        for limit in (0, 50, 100, 500, 1000, 3000, 10_000):
+            for min_keep in (0, 1, 2, 10, 500):
+                expected = _reference_cut(counts, 30, limit, min_keep, convert)
+                assert select_trim_cut(counts, 30, limit, min_keep, to_provider_tokens=convert) == expected
+
+    def test_skips_unsafe_cuts(self):
+        messages = [HumanMessage(content="q"), *_tool_turn("1"), *_tool_turn("2"), AIMessage(content="a")]
+        counts = [10, 10, 100, 10, 100, 10]
+        # Cut 2 fits 225 tokens but would orphan the first tool result
+        assert select_trim_cut(counts, 0, 225, 10) == 2
+        assert select_trim_cut(counts, 0, 225, 10, safe_cut_points(messages)) == 3
+        # Without a safe cut in range, more is kept rather than splitting a pair
+        assert select_trim_cut(counts, 0, 0, 3, [0, 1, 6]) == 1
+
+
+class TestTrimWatermarks:
+    """Test the trimming hysteresis settings."""
+
+    def test_defaults_and_overrides(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_trim_watermarks() == (1.0, 0.7)
+        env = {"CONTEXT_TRIM_HIGH_WATERMARK": "0.9", "CONTEXT_TRIM_LOW_WATERMARK": "0.5"}
+        with patch.dict(os.environ, env):
+            assert get_trim_watermarks() == (0.9, 0.5)
+
+    def test_invalid_values_fall_back(self):
+        for high, low in (("0.5", "0.9"), ("1.5", "0.7"), ("x", "0.7"), ("0.9", "0")):
+            env = {"CONTEXT_TRIM_HIGH_WATERMARK": high, "CONTEXT_TRIM_LOW_WATERMARK": low}
+            with patch.dict(os.environ, env):
+                assert get_trim_watermarks() == (1.0, 0.7)
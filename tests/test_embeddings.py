@@ -0,0 +1,170 @@
+"""
+Tests for the embeddings factory and BatchedEmbeddings wrapper.
+"""
+
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from cnoe_agent_utils.embeddings import (
+    BatchedEmbeddings,
+    InMemoryEmbeddingCache,
+    SQLiteEmbeddingCache,
+)
+from cnoe_agent_utils.llm_factory import LLMFactory
+
+
+class RecordingEmbeddings(Embeddings):
+    """Deterministic fake embeddings that record every provider request."""
+
+    def __init__(self, delay: float = 0.0):
+        self.calls = []
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> list[float]:
+        return [float(len(text)), float(sum(map(ord, text)) % 97) / 7]
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self._vector(text)
+
+
+class TestBatchedEmbeddings:
+    """Test batching, de-duplication, caching and concurrency."""
+
+    def test_results_preserve_input_order_and_dedupe(self):
+        inner = RecordingEmbeddings()
+        wrapper = BatchedEmbeddings(inner, "m", batch_size=10, cache=None)
+        texts = ["a", "bb", "a", "ccc", "bb"]
+        result = wrapper.embed_documents(texts)
+
+        assert result == [inner._vector(t) for t in texts]
+        assert inner.calls == [["a", "bb", "ccc"]]
+        assert wrapper.get_stats()["duplicates"] == 2
+
+    def test_batches_respect_batch_size(self):
+        inner = RecordingEmbeddings()
+        wrapper = BatchedEmbeddings(inner, "m", batch_size=2, max_concurrency=1, cache=None)
+        wrapper.embed_documents(["a", "b", "c", "d", "e"])
+        assert [len(c) for c in inner.calls] == [2, 2, 1]
+
+    def test_cache_hits_skip_provider(self):
+        inner = RecordingEmbeddings()
+        wrapper = BatchedEmbeddings(inner, "m", cache=InMemoryEmbeddingCache())
+        wrapper.embed_documents(["a", "b"])
+        wrapper.embed_documents(["b", "c"])
+        assert inner.calls == [["a", "b"], ["c"]]
+        assert wrapper.get_stats()["cache_hits"] == 1
+
+    def test_cache_keys_include_model(self):
+        cache = InMemoryEmbeddingCache()
+        inner = RecordingEmbeddings()
+        BatchedEmbeddings(inner, "m1", cache=cache).embed_documents(["a"])
+        BatchedEmbeddings(inner, "m2", cache=cache).embed_documents(["a"])
+        assert len(inner.calls) == 2
+
+    def test_concurrency_is_bounded(self):
+        inner = RecordingEmbeddings(delay=0.02)
+        wrapper = BatchedEmbeddings(inner, "m", batch_size=1, max_concurrency=3, cache=None)
+        wrapper.embed_documents([str(i) for i in range(12)])
+        assert 1 < inner.max_in_flight <= 3
+
+    def test_query_cache(self):
+        inner = RecordingEmbeddings()
+        wrapper = BatchedEmbeddings(inner, "m", cache=InMemoryEmbeddingCache())
+        assert wrapper.embed_query("q") == wrapper.embed_query("q")
+        assert len(inner.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_async_embed_documents(self):
+        inner = RecordingEmbeddings()
+        wrapper = BatchedEmbeddings(inner, "m", batch_size=2, cache=InMemoryEmbeddingCache())
+        result = await wrapper.aembed_documents(["a", "b", "a", "c"])
+        assert result == [inner._vector(t) for t in ["a", "b", "a", "c"]]
+        assert sorted(len(c) for c in inner.calls) == [1, 2]
+
+
+class TestEmbeddingCaches:
+    """Test cache backends."""
+
+    def test_memory_cache_is_bounded(self):
+        cache = InMemoryEmbeddingCache(max_entries=2)
+        cache.set_many({"a": [1.0], "b": [2.0], "c": [3.0]})
+        assert len(cache) == 2
+        assert cache.get_many(["a", "c"]) == {"c": [3.0]}
+
+    def test_sqlite_cache_persists(self, tmp_path):
+        path = str(tmp_path / "cache" / "embeddings.db")
+        cache = SQLiteEmbeddingCache(path)
+        cache.set_many({"k": [0.1, 0.2]})
+        cache.close()
+
+        reopened = SQLiteEmbeddingCache(path)
+        assert reopened.get_many(["k", "missing"]) == {"k": [0.1, 0.2]}
+        assert len(reopened) == 1
+        reopened.close()
+
+
+class TestGetEmbeddings:
+    """Test LLMFactory.get_embeddings provider builders."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "test-key", "OPENAI_EMBEDDINGS_MODEL": "text-embedding-3-large"})
+    def test_openai_embeddings(self):
+        embeddings = LLMFactory("openai").get_embeddings(cache=False)
+        assert isinstance(embeddings, BatchedEmbeddings)
+        assert embeddings.embeddings.model == "text-embedding-3-large"
+        assert embeddings.batch_size == 2048
+        assert embeddings.cache is None
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "test-key", "EMBEDDINGS_BATCH_SIZE": "5000", "EMBEDDINGS_MAX_CONCURRENCY": "8"})
+    def test_batch_size_capped_at_provider_limit(self):
+        embeddings = LLMFactory("openai").get_embeddings()
+        assert embeddings.batch_size == 2048
+        assert embeddings.max_concurrency == 8
+        assert isinstance(embeddings.cache, InMemoryEmbeddingCache)
+
+    def test_persistent_cache_from_env(self, tmp_path):
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "k", "EMBEDDINGS_CACHE_PATH": str(tmp_path / "e.db")}):
+            embeddings = LLMFactory("openai").get_embeddings(model="text-embedding-3-small")
+        assert isinstance(embeddings.cache, SQLiteEmbeddingCache)
+        assert embeddings.model_id == "openai:text-embedding-3-small"
+
+    @patch.dict(os.environ, {
+        "AZURE_OPENAI_API_KEY": "k",
+        "AZURE_OPENAI_API_VERSION": "2024-02-15-preview",
+        "AZURE_OPENAI_ENDPOINT": "https://test.openai.azure.com/",
+    })
+    def test_azure_requires_deployment(self):
+        with pytest.raises(EnvironmentError, match="AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT"):
+            LLMFactory("azure-openai").get_embeddings()
+
+    @patch.dict(os.environ, {
+        "AWS_ACCESS_KEY_ID": "k",
+        "AWS_SECRET_ACCESS_KEY": "s",
+        "AWS_REGION": "us-east-1",
+    })
+    def test_bedrock_embeddings(self):
+        embeddings = LLMFactory("aws-bedrock").get_embeddings()
+        assert embeddings.embeddings.model_id == "amazon.titan-embed-text-v2:0"
+        assert embeddings.batch_size == 1
+
+    def test_provider_without_embeddings(self):
+        with pytest.raises(ValueError, match="does not provide an embeddings API"):
+            LLMFactory("anthropic-claude").get_embeddings()
@@ -0,0 +1,161 @@
+"""
+Tests for multi-key API credential pools.
+"""
+
+import os
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+from langchain_anthropic import ChatAnthropic
+
+from cnoe_agent_utils.key_pool import (
+    AsyncKeyPoolTransport,
+    KeyPool,
+    KeyPoolTransport,
+    parse_api_keys,
+    parse_reset,
+    throttle_seconds,
+)
+from cnoe_agent_utils.llm_factory import LLMFactory
+
+KEYS = ["sk-aaaaaaaa1111", "sk-bbbbbbbb2222", "sk-cccccccc3333"]
+
+COMPLETION = {
+    "id": "c1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+}
+
+
+class FakeProvider:
+    """Records the key of every request; keys listed in ``limited`` get a 429."""
+
+    def __init__(self, limited=(), reset="20s"):
+        self.limited = set(limited)
+        self.reset = reset
+        self.seen = []
+
+    def __call__(self, request):
+        key = request.headers.get("authorization", "").removeprefix("Bearer ") or request.headers.get("x-api-key")
+        self.seen.append(key)
+        if key in self.limited:
+            return httpx.Response(429, headers={"retry-after": "1", "x-ratelimit-remaining-requests": "0",
+                                                "x-ratelimit-reset-requests": self.reset}, json={"error": {}})
+        return httpx.Response(200, json=COMPLETION)
+
+
+class TestParsing:
+    """Test key lists and reset header formats."""
+
+    def test_parse_api_keys(self):
+        assert parse_api_keys(" k1, k2,,k1 ") == ["k1", "k2"]
+
+    def test_reset_formats(self):
+        assert parse_reset("12") == 12
+        assert parse_reset("6m0s") == 360
+        assert parse_reset("1m30.5s") == pytest.approx(90.5)
+        assert parse_reset("20ms") == pytest.approx(0.02)
+        assert parse_reset("2030-01-01T00:00:10Z", now=1893456000) == 10
+        assert parse_reset("soon") is None
+
+    def test_throttle_seconds(self):
+        assert throttle_seconds(200, {"x-ratelimit-remaining-requests": "3", "x-ratelimit-reset-requests": "1s"}) == 0
+        assert throttle_seconds(200, {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "7s"}) == 7
+        assert throttle_seconds(429, {"retry-after": "2", "x-ratelimit-remaining-requests": "0",
+                                      "x-ratelimit-reset-requests": "30s"}) == 30
+        assert throttle_seconds(429, {}, default_cooldown=4) == 4
+
+
+class TestKeyPool:
+    """Test key selection and sit-outs."""
+
+    def test_least_loaded(self):
+        pool = KeyPool(KEYS[:2])
+        first, _ = pool.acquire()
+        second, _ = pool.acquire()
+        assert first is not second
+        pool.release(first)
+        assert pool.acquire()[0] is first
+
+    def test_round_robin(self):
+        pool = KeyPool(KEYS, strategy="round-robin")
+        picks = [pool.acquire()[0].key for _ in range(4)]
+        assert picks == [KEYS[0], KEYS[1], KEYS[2], KEYS[0]]
+
+    def test_throttled_key_sits_out_until_reset(self):
+        pool = KeyPool(KEYS[:2], max_wait=5)
+        limited = pool.keys[0]
+        pool.observe(limited, 429, {"retry-after": "0.2"})
+        assert {pool.acquire()[0].key for _ in range(3)} == {KEYS[1]}
+        pool.observe(pool.keys[1], 429, {"retry-after": "0.3"})
+        state, wait = pool.acquire()
+        assert state is limited and 0 < wait <= 0.2
+        assert pool.stats()[0]["throttled"] == 1
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError, match="Unknown key pool strategy"):
+            KeyPool(KEYS, strategy="random")
+
+
+class TestTransport:
+    """Test per-request keys and 429 failover on the HTTP path."""
+
+    def test_429_fails_over_to_another_key(self):
+        provider = FakeProvider(limited={KEYS[0]})
+        pool = KeyPool(KEYS[:2], strategy="round_robin")
+        client = httpx.Client(transport=KeyPoolTransport(pool, transport=httpx.MockTransport(provider)))
+        responses = [client.post("https://api.example/v1/chat/completions", json={}) for _ in range(3)]
+        assert [r.status_code for r in responses] == [200, 200, 200]
+        assert provider.seen == [KEYS[0], KEYS[1], KEYS[1], KEYS[1]]
+        assert pool.stats()[0]["cooldown_seconds"] > 15
+        assert all(state["in_flight"] == 0 for state in pool.stats())
+
+    def test_all_keys_throttled_returns_429(self):
+        provider = FakeProvider(limited=set(KEYS[:2]), reset="0ms")
+        pool = KeyPool(KEYS[:2], default_cooldown=0.05)
+        client = httpx.Client(transport=KeyPoolTransport(pool, transport=httpx.MockTransport(provider)))
+        started = time.monotonic()
+        assert client.post("https://api.example/v1/chat/completions", json={}).status_code == 429
+        assert client.post("https://api.example/v1/chat/completions", json={}).status_code == 429
+        assert time.monotonic() - started >= 0.5  # waited for the retry-after of the first key
+        assert len(provider.seen) == 4
+
+    @pytest.mark.asyncio
+    async def test_async_transport_with_custom_header(self):
+        provider = FakeProvider(limited={KEYS[0]})
+        pool = KeyPool(KEYS[:2], strategy="round_robin")
+        transport = AsyncKeyPoolTransport(pool, header="x-api-key", scheme="",
+                                          transport=httpx.MockTransport(provider))
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.post("https://api.example/v1/messages", json={}, headers={"x-api-key": "k"})
+        assert response.status_code == 200
+        assert provider.seen == [KEYS[0], KEYS[1]]
+
+
+class TestFactoryIntegration:
+    """Test *_API_KEYS in the builders."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEYS": ",".join(KEYS), "OPENAI_MODEL_NAME": "gpt-4o",
+                             "OPENAI_STREAMING": "false", "LLM_KEY_POOL_STRATEGY": "round_robin"})
+    def test_openai_requests_rotate_keys(self):
+        os.environ.pop("OPENAI_API_KEY", None)
+        llm = LLMFactory("openai").get_llm()
+        provider = FakeProvider()
+        llm.http_client._transport._transport = httpx.MockTransport(provider)
+        for _ in range(3):
+            assert llm.invoke("hi").content == "ok"
+        assert sorted(provider.seen) == sorted(KEYS)
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEYS": ",".join(KEYS), "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5"})
+    def test_anthropic_and_groq_use_pool_clients(self):
+        os.environ.pop("ANTHROPIC_API_KEY", None)
+        llm = LLMFactory("anthropic-claude").get_llm()
+        transport = llm._client._client._transport
+        assert type(transport).__name__ == "KeyPoolTransport" and transport.header == "x-api-key"
+        assert isinstance(llm, ChatAnthropic) and "key_pool" not in llm.model_dump()
+        assert llm._async_client._client._transport.pool is transport.pool
+        with patch.dict(os.environ, {"GROQ_API_KEYS": ",".join(KEYS), "GROQ_MODEL_NAME": "llama-3.3-70b"}):
+            groq = LLMFactory("groq").get_llm()
+            assert isinstance(groq.http_client._transport, KeyPoolTransport)
@@ -0,0 +1,115 @@
+"""
+Tests for per-call latency profiles.
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+from langgraph.prebuilt.chat_agent_executor import _get_model
+from pydantic import BaseModel
+
+from cnoe_agent_utils.latency_profile import LatencyProfiledLLM, latency_profile_kwargs, normalize_latency_profile
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.usage import UsageCallbackHandler, UsageLedger
+
+BEDROCK_ENV = {
+    "AWS_BEDROCK_MODEL_ID": "anthropic.claude-4-sonnet",
+    "AWS_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "test-key",
+    "AWS_SECRET_ACCESS_KEY": "test-secret",
+}
+
+
+def _reply():
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+class TestMapping:
+    """Test profile names and the per-provider mapping."""
+
+    def test_normalize(self):
+        assert normalize_latency_profile(" Bulk ") == "bulk"
+        assert normalize_latency_profile("") is None
+        with pytest.raises(ValueError, match="Unknown latency profile"):
+            normalize_latency_profile("turbo")
+
+    def test_provider_kwargs(self):
+        assert latency_profile_kwargs("openai", None, "fast") == {"service_tier": "priority"}
+        assert latency_profile_kwargs("groq", None, "bulk") == {"service_tier": "flex"}
+        assert latency_profile_kwargs("anthropic_claude", None, "fast") == {"service_tier": "auto"}
+        assert latency_profile_kwargs("google_gemini", None, "fast") == {}
+
+
+class TestLatencyProfiledLLM:
+    """Test the default profile, per-call overrides and telemetry."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "OPENAI_STREAMING": "false"})
+    def test_openai_service_tier_per_call(self):
+        llm = LLMFactory("openai").get_llm(latency_profile="standard")
+        assert isinstance(llm, LatencyProfiledLLM)
+        with patch.object(ChatOpenAI, "_generate", autospec=True, return_value=_reply()) as generate:
+            llm.invoke("hi")
+            llm.invoke("hi", latency_profile="bulk")
+            llm.invoke("hi", config={"metadata": {"latency_profile": "fast"}})
+        tiers = [call.kwargs["service_tier"] for call in generate.call_args_list]
+        assert tiers == ["default", "flex", "priority"]
+        payload = llm.model._get_request_payload([HumanMessage(content="hi")], service_tier="flex")
+        assert payload["service_tier"] == "flex"
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "OPENAI_STREAMING": "false",
+                             "LLM_LATENCY_PROFILE": "bulk"})
+    def test_profile_from_env_survives_tool_binding(self):
+        @patch.object(ChatOpenAI, "_generate", autospec=True, return_value=_reply())
+        def run(generate):
+            llm = LLMFactory("openai").get_llm(tools=[{"type": "function", "function": {
+                "name": "get_pods", "description": "List pods", "parameters": {"type": "object", "properties": {}}}}])
+            llm.invoke("hi")
+            return generate.call_args.kwargs
+        kwargs = run()
+        assert kwargs["service_tier"] == "flex" and kwargs["tools"][0]["function"]["name"] == "get_pods"
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "OPENAI_STREAMING": "false",
+                             "LLM_LATENCY_PROFILE": "fast"})
+    def test_structured_output_keeps_the_profile(self):
+        class Answer(BaseModel):
+            text: str
+
+        llm = LLMFactory("openai").get_llm()
+        assert _get_model(llm) is llm
+        with patch.object(ChatOpenAI, "_generate", autospec=True, return_value=_reply()) as generate:
+            llm.with_structured_output(Answer, include_raw=True).invoke("hi")
+        assert generate.call_args.kwargs["service_tier"] == "priority"
+        assert generate.call_args.kwargs["response_format"] is Answer
+
+    def test_bedrock_converse_and_invoke_api(self):
+        with patch.dict(os.environ, {**BEDROCK_ENV, "AWS_BEDROCK_ENABLE_PROMPT_CACHE": "true"}):
+            converse = LLMFactory("aws-bedrock").get_llm(latency_profile="fast")
+        _, _, kwargs = converse._prepare(None, {})
+        assert kwargs == {"performanceConfig": {"latency": "optimized"}}
+        assert converse.model._converse_params(**kwargs)["performanceConfig"] == {"latency": "optimized"}
+
+        with patch.dict(os.environ, {**BEDROCK_ENV, "AWS_BEDROCK_USE_CONVERSE_API": "false"}):
+            invoke_api = LLMFactory("aws-bedrock").get_llm(latency_profile="standard")
+        runnable, _, kwargs = invoke_api._prepare(None, {"latency_profile": "bulk"})
+        assert kwargs == {} and runnable.service_tier == "flex"
+        assert invoke_api._prepare(None, {"latency_profile": "bulk"})[0] is runnable
+        assert invoke_api.model.service_tier is None
+
+    def test_profile_recorded_in_usage_ledger(self):
+        ledger = UsageLedger()
+        reply = AIMessage(content="ok", usage_metadata={"input_tokens": 3, "output_tokens": 1, "total_tokens": 4})
+        model = GenericFakeChatModel(messages=iter([reply] * 3), callbacks=[UsageCallbackHandler("groq", "m", ledger)])
+        llm = LatencyProfiledLLM(model, "groq", "standard")
+        llm.invoke("hi")
+        llm.invoke("hi", latency_profile="bulk")
+        model.invoke("hi")
+        rows = ledger.snapshot(group_by=("latency_profile",))
+        assert {row["latency_profile"]: row["calls"] for row in rows} == {"": 1, "bulk": 1, "standard": 1}
+        text = ledger.to_prometheus()
+        assert 'llm_calls_total{provider="groq",model="m",agent="",latency_profile="bulk"} 1' in text
+        assert 'llm_calls_total{provider="groq",model="m",agent=""} 1' in text
@@ -0,0 +1,179 @@
+"""
+Tests for the openai-compatible provider against local stand-in inference servers.
+"""
+
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.openai_compatible import (
+    BackendPool,
+    _verified,
+    parse_base_urls,
+    prefix_key,
+    verify_server_model,
+)
+
+
+class FakeInferenceServer:
+    """Minimal stand-in for a vLLM-style server: ``/v1/models`` and ``/v1/chat/completions``."""
+
+    def __init__(self, models=("llama-3-8b",)):
+        self.models = list(models)
+        self.completions = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send({"object": "list", "data": [{"id": m, "object": "model"} for m in server.models]})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.completions.append(request)
+                self._send({
+                    "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": request["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": f"from {server.url}"}}],
+                    "usage": {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8},
+                })
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _unused_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}/v1"
+
+
+@pytest.fixture
+def servers():
+    started = [FakeInferenceServer(), FakeInferenceServer()]
+    _verified.clear()
+    yield started
+    for server in started:
+        server.close()
+
+
+def _env(urls, **extra):
+    return patch.dict(os.environ, {
+        "OPENAI_COMPATIBLE_BASE_URLS": ",".join(urls),
+        "OPENAI_COMPATIBLE_STREAMING": "false",
+        **extra,
+    })
+
+
+class TestRouting:
+    """Test backend selection."""
+
+    def test_parse_base_urls(self):
+        assert parse_base_urls(" http://a/v1/, ,http://b/v1") == ["http://a/v1", "http://b/v1"]
+
+    def test_prefix_key_ignores_conversation_tail(self):
+        def body(*messages):
+            return json.dumps({"model": "m", "messages": list(messages)}).encode()
+
+        system = {"role": "system", "content": "You are helpful."}
+        assert prefix_key(body(system, {"role": "user", "content": "a"})) == \
+            prefix_key(body(system, {"role": "user", "content": "b"}))
+        assert prefix_key(body({"role": "system", "content": "other"})) != prefix_key(body(system))
+        assert prefix_key(b"not json") is None
+
+    def test_affinity_is_sticky_until_saturated(self):
+        pool = BackendPool(["http://a", "http://b"], affinity_slack=2)
+        first = pool.acquire("k")
+        assert pool.acquire("k") is first
+        # Preferred server now has 2 in flight vs 0: spill over to the least busy one
+        assert pool.acquire("k") is not first
+
+    def test_least_busy_and_round_robin(self):
+        pool = BackendPool(["http://a", "http://b"], strategy="least_busy")
+        a = pool.acquire()
+        assert pool.acquire() is not a
+        rr = BackendPool(["http://a", "http://b"], strategy="round_robin")
+        assert [rr.acquire().base_url for _ in range(4)] == ["http://a", "http://b"] * 2
+
+    def test_down_backend_is_skipped(self):
+        pool = BackendPool(["http://a", "http://b"], strategy="round_robin")
+        pool.mark_down(pool.backends[0])
+        assert {pool.acquire().base_url for _ in range(3)} == {"http://b"}
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError, match="Unknown load-balancing strategy"):
+            BackendPool(["http://a"], strategy="random")
+
+
+class TestVerifyModel:
+    """Test startup model checks."""
+
+    def test_model_not_served(self, servers):
+        with pytest.raises(EnvironmentError, match="not served by any"):
+            verify_server_model([s.url for s in servers], "qwen-72b")
+
+    def test_single_model_is_inferred(self, servers):
+        assert verify_server_model([s.url for s in servers], None) == "llama-3-8b"
+
+    def test_unreachable_servers(self):
+        _verified.clear()
+        with pytest.raises(EnvironmentError, match="reachable"):
+            verify_server_model([_unused_url()], "m")
+
+
+class TestProvider:
+    """Test get_llm() against the stand-in servers."""
+
+    def test_same_prefix_goes_to_one_server(self, servers):
+        with _env([s.url for s in servers]):
+            llm = LLMFactory("openai-compatible").get_llm()
+        assert llm.model_name == "llama-3-8b"
+        for question in ("a", "b", "c"):
+            llm.invoke([SystemMessage(content="You are an SRE."), HumanMessage(content=question)])
+        counts = sorted(len(s.completions) for s in servers)
+        assert counts == [0, 3]
+        assert all(r["temperature"] == 0 for s in servers for r in s.completions)
+
+    def test_failover_when_a_server_is_down(self, servers):
+        with _env([_unused_url(), servers[0].url], OPENAI_COMPATIBLE_MODEL_NAME="llama-3-8b"):
+            llm = LLMFactory("openai-compatible").get_llm()
+        for question in ("a", "b"):
+            assert llm.invoke(question).content == f"from {servers[0].url}"
+
+    @pytest.mark.asyncio
+    async def test_async_round_robin(self, servers):
+        with _env([s.url for s in servers], OPENAI_COMPATIBLE_LB_STRATEGY="round_robin"):
+            llm = LLMFactory("openai-compatible").get_llm()
+        for question in ("a", "b"):
+            await llm.ainvoke(question)
+        assert [len(s.completions) for s in servers] == [1, 1]
+
+    def test_missing_base_urls(self):
+        with patch.dict(os.environ, {}, clear=True), pytest.raises(EnvironmentError, match="OPENAI_COMPATIBLE_BASE_URLS"):
+            LLMFactory("openai-compatible").get_llm()
+
+    def test_verification_can_be_disabled(self):
+        with _env([_unused_url()], OPENAI_COMPATIBLE_VERIFY_MODEL="false", OPENAI_COMPATIBLE_MODEL_NAME="m"):
+            assert LLMFactory("openai-compatible").get_llm().model_name == "m"
@@ -0,0 +1,281 @@
+"""
+Tests for cross-process LLM quotas.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.prebuilt.chat_agent_executor import _get_model
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.quota import (
+    LocalQuotaBackend,
+    Quota,
+    QuotaLimitedLLM,
+    QuotaLimits,
+    RedisQuotaBackend,
+    SharedMemoryQuotaBackend,
+    priority_context,
+    quota_from_env,
+    resolve_priority,
+)
+
+# Effectively no refill during a test
+SLOW = 1e-6
+
+
+def _grab(path, attempts, results):
+    backend = SharedMemoryQuotaBackend(path)
+    granted = sum(backend.acquire("k", QuotaLimits(requests_per_second=SLOW, burst=5))[0] is not None
+                  for _ in range(attempts))
+    results.put(granted)
+
+
+def _hold(path, ready, done):
+    backend = SharedMemoryQuotaBackend(path)
+    backend.acquire("k", QuotaLimits(max_concurrency=1))
+    ready.set()
+    done.wait(10)
+
+
+class TestLocalBackend:
+    """Test bucket arithmetic on the in-process backend."""
+
+    def test_request_burst_then_wait(self):
+        backend = LocalQuotaBackend()
+        limits = QuotaLimits(requests_per_second=2, burst=3)
+        assert all(backend.acquire("k", limits)[0] for _ in range(3))
+        lease, wait = backend.acquire("k", limits)
+        assert lease is None and 0 < wait <= 0.5
+
+    def test_token_bucket_caps_oversized_requests(self):
+        backend = LocalQuotaBackend()
+        limits = QuotaLimits(tokens_per_minute=600)
+        assert backend.acquire("k", limits, tokens=10_000)[0] is not None  # capped at one full minute
+        lease, wait = backend.acquire("k", limits, tokens=100)
+        assert lease is None and wait == pytest.approx(10, rel=0.01)
+
+    def test_concurrency_lease(self):
+        backend = LocalQuotaBackend()
+        limits = QuotaLimits(max_concurrency=1)
+        lease, _ = backend.acquire("k", limits)
+        assert backend.acquire("k", limits)[0] is None
+        assert backend.acquire("other", limits)[0] is not None
+        backend.release("k", lease)
+        assert backend.acquire("k", limits)[0] is not None
+
+
+class TestSharedMemoryBackend:
+    """Test buckets shared between processes."""
+
+    def test_processes_share_one_bucket(self, tmp_path):
+        path = str(tmp_path / "quota")
+        SharedMemoryQuotaBackend(path)
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+        workers = [ctx.Process(target=_grab, args=(path, 10, results)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(10)
+        assert sum(results.get() for _ in workers) == 5
+
+    def test_leases_of_exited_processes_are_reclaimed(self, tmp_path):
+        path = str(tmp_path / "quota")
+        backend = SharedMemoryQuotaBackend(path)
+        ctx = multiprocessing.get_context("fork")
+        ready, done = ctx.Event(), ctx.Event()
+        holder = ctx.Process(target=_hold, args=(path, ready, done))
+        holder.start()
+        assert ready.wait(10)
+        limits = QuotaLimits(max_concurrency=1)
+        assert backend.acquire("k", limits)[0] is None
+        done.set()
+        holder.join(10)
+        lease, _ = backend.acquire("k", limits)
+        assert lease is not None
+        backend.release("k", lease)
+        assert backend.acquire("k", limits)[0] is not None
+
+    def test_reopen_keeps_state(self, tmp_path):
+        path = str(tmp_path / "quota")
+        limits = QuotaLimits(requests_per_second=SLOW, burst=1)
+        assert SharedMemoryQuotaBackend(path).acquire("k", limits)[0] is not None
+        assert SharedMemoryQuotaBackend(path).acquire("k", limits)[0] is None
+
+
+class TestRedisBackend:
+    """Test the script protocol with a stand-in client."""
+
+    def test_acquire_and_release(self):
+        client = MagicMock()
+        script = client.register_script.return_value
+        script.side_effect = ["0", "0.25"]
+        backend = RedisQuotaBackend(client, prefix="q")
+        lease, wait = backend.acquire("openai:m", QuotaLimits(requests_per_second=1, max_concurrency=2), tokens=5)
+        assert lease and wait == 0
+        assert script.call_args.kwargs["keys"] == ["q:openai:m:buckets", "q:openai:m:leases"]
+        assert backend.acquire("openai:m", QuotaLimits(requests_per_second=1)) == (None, 0.25)
+        backend.release("openai:m", lease)
+        client.zrem.assert_called_once_with("q:openai:m:leases", lease)
+
+
+class TestQuota:
+    """Test the blocking client and the LLM wrapper."""
+
+    def test_acquire_waits_then_times_out(self):
+        quota = Quota(LocalQuotaBackend(), "k", QuotaLimits(requests_per_second=20, burst=1), timeout=0.2)
+        quota.acquire()
+        started = time.monotonic()
+        quota.acquire()
+        assert time.monotonic() - started >= 0.04
+        assert quota.stats()["waited"] == 1
+        slow = Quota(LocalQuotaBackend(), "k", QuotaLimits(requests_per_second=SLOW, burst=1), timeout=0.1)
+        slow.acquire()
+        with pytest.raises(TimeoutError, match="LLM quota 'k'"):
+            slow.acquire()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_across_tasks(self):
+        quota = Quota(LocalQuotaBackend(), "k", QuotaLimits(max_concurrency=2))
+        active, peak = 0, 0
+
+        async def call():
+            nonlocal active, peak
+            async with quota.aslot():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.02)
+                active -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_acquire_releases_its_lease(self):
+        backend = LocalQuotaBackend()
+        quota = Quota(backend, "k", QuotaLimits(max_concurrency=1), timeout=1)
+        entered, proceed, acquired = threading.Event(), threading.Event(), threading.Event()
+        acquire = backend.acquire
+
+        def slow_acquire(*args):
+            entered.set()
+            proceed.wait(5)
+            try:
+                return acquire(*args)
+            finally:
+                acquired.set()
+
+        with patch.object(backend, "acquire", side_effect=slow_acquire):
+            task = asyncio.create_task(quota.aacquire())
+            await asyncio.to_thread(entered.wait, 5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            proceed.set()
+            await asyncio.to_thread(acquired.wait, 5)
+            for _ in range(100):
+                if not backend._state["k"][4]:
+                    break
+                await asyncio.sleep(0.01)
+        assert backend._state["k"][4] == set()
+        quota.release(await quota.aacquire())
+
+    def test_wrapper_holds_lease_for_stream(self):
+        backend = LocalQuotaBackend()
+        quota = Quota(backend, "k", QuotaLimits(max_concurrency=1))
+        llm = QuotaLimitedLLM(GenericFakeChatModel(messages=iter([AIMessage(content="a b c")])), quota)
+        stream = llm.stream("hi")
+        next(stream)
+        assert backend.acquire("k", quota.limits)[0] is None
+        list(stream)
+        assert backend.acquire("k", quota.limits)[0] is not None
+
+    def test_bound_and_configured_calls_take_a_lease(self):
+        quota = Quota(LocalQuotaBackend(), "k", QuotaLimits(max_concurrency=10))
+        llm = QuotaLimitedLLM(GenericFakeChatModel(messages=iter([AIMessage(content="x")] * 2)), quota)
+        assert _get_model(llm) is llm
+        llm.bind(stop=["y"]).invoke("a")
+        llm.with_config(tags=["t"]).invoke("b")
+        assert quota.stats()["acquired"] == 2
+
+
+class TestPriorityLanes:
+    """Test priority scheduling, aging and the interactive reserve."""
+
+    async def _order(self, quota, lanes, gap=0.0):
+        """Queue one call per lane behind a held lease and return the order they run in."""
+        held = quota.acquire()
+        order = []
+
+        async def call(lane):
+            lease = await quota.aacquire(priority=lane)
+            order.append(lane)
+            quota.release(lease)
+
+        tasks = []
+        for lane in lanes:
+            tasks.append(asyncio.create_task(call(lane)))
+            await asyncio.sleep(gap or 0.01)
+        quota.release(held)
+        await asyncio.gather(*tasks)
+        return order
+
+    @pytest.mark.asyncio
+    async def test_interactive_overtakes_queued_background(self):
+        quota = Quota(LocalQuotaBackend(), "k", QuotaLimits(max_concurrency=1))
+        assert await self._order(quota, ["background", "default", "interactive"]) == [
+            "interactive", "default", "background",
+        ]
+        lanes = quota.stats()["by_priority"]
+        assert lanes["background"]["waited"] == 1 and lanes["background"]["wait_seconds"] > 0
+
+    @pytest.mark.asyncio
+    async def test_aging_prevents_starvation(self):
+        quota = Quota(LocalQuotaBackend(), "k", QuotaLimits(max_concurrency=1), aging_seconds=0.05)
+        assert await self._order(quota, ["background", "interactive"], gap=0.2) == ["background", "interactive"]
+
+    def test_interactive_reserve(self):
+        backend = LocalQuotaBackend()
+        quota = Quota(backend, "k", QuotaLimits(max_concurrency=2), timeout=0.1, interactive_reserve=0.5)
+        quota.acquire(priority="background")
+        with pytest.raises(TimeoutError):
+            quota.acquire(priority="background")
+        quota.acquire(priority="interactive")
+
+    def test_priority_sources(self):
+        quota = Quota(LocalQuotaBackend(), "k", QuotaLimits(max_concurrency=10))
+        llm = QuotaLimitedLLM(GenericFakeChatModel(messages=iter([AIMessage(content="x")] * 4)), quota, priority="background")
+        llm.invoke("a")
+        llm.invoke("b", config={"metadata": {"priority": "interactive"}})
+        with priority_context(5):
+            llm.invoke("c")
+        assert set(quota.stats()["by_priority"]) == {"background", "interactive", "5"}
+
+    def test_unknown_priority(self):
+        assert resolve_priority("Interactive") == 0
+        with pytest.raises(ValueError, match="Unknown priority"):
+            resolve_priority("urgent")
+
+
+class TestFactoryIntegration:
+    """Test LLM_QUOTA_* configuration."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "LLM_QUOTA_RPS": "5"})
+    def test_env_enables_quota(self):
+        llm = LLMFactory("openai").get_llm()
+        assert isinstance(llm, QuotaLimitedLLM)
+        assert llm.quota.key == "openai:gpt-4o"
+        assert llm.model_name == "gpt-4o"
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"})
+    def test_disabled_without_limits(self):
+        assert quota_from_env("openai", "gpt-4o") is None
+        assert not isinstance(LLMFactory("openai").get_llm(), QuotaLimitedLLM)
@@ -0,0 +1,167 @@
+"""
+Tests for complexity-based model routing.
+"""
+
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.routing import ComplexityRouter, ModelTier, RoutedLLM, request_text
+
+
+def _tiers():
+    return [
+        ModelTier("strong", model="big-model", input_cost_per_1k=10.0, output_cost_per_1k=30.0),
+        ModelTier("fast", model="small-model", max_score=0.3, input_cost_per_1k=1.0, output_cost_per_1k=2.0),
+    ]
+
+
+def _fake_factory(responses_by_model: dict):
+    """A factory whose get_llm returns a fake chat model per model name."""
+    factory = MagicMock()
+
+    def get_llm(model=None, tools=None, **kwargs):
+        response = responses_by_model[model]
+        if isinstance(response, Exception):
+            failing = MagicMock()
+            failing.invoke.side_effect = response
+            failing.stream.side_effect = response
+            return failing
+        return GenericFakeChatModel(messages=iter([AIMessage(content=response)] * 10))
+
+    factory.get_llm.side_effect = get_llm
+    return factory
+
+
+class TestRequestText:
+    """Test input flattening."""
+
+    def test_flattens_common_input_shapes(self):
+        assert request_text("hi") == "hi"
+        assert request_text([SystemMessage("sys"), HumanMessage("q")]) == "sys\nq"
+        assert request_text({"messages": [("user", "q")]}) == "q"
+        assert request_text([HumanMessage(content=[{"type": "text", "text": "a"}, "b"])]) == "ab"
+
+
+class TestComplexityRouter:
+    """Test scoring and tier selection."""
+
+    def test_tiers_are_sorted_by_max_score(self):
+        router = ComplexityRouter(_tiers())
+        assert [t.name for t in router.tiers] == ["fast", "strong"]
+
+    def test_trivial_request_goes_to_fast_tier(self):
+        router = ComplexityRouter(_tiers())
+        score = router.score("What is the capital of France?")
+        assert router.select_tier(score).name == "fast"
+
+    def test_complex_request_goes_to_strong_tier(self):
+        router = ComplexityRouter(_tiers())
+        prompt = "Analyze the architecture and debug the root cause step by step. " + "x" * 3000
+        assert router.select_tier(router.score(prompt)).name == "strong"
+
+    def test_tool_need_raises_score(self):
+        router = ComplexityRouter(_tiers())
+        assert router.score("list the pods", has_tools=True) > router.score("list the pods")
+
+    def test_pluggable_classifier(self):
+        router = ComplexityRouter(_tiers(), classifier=lambda text, features: 0.9 if "hard" in text else 0.0)
+        assert router.select_tier(router.score("hard")).name == "strong"
+        assert router.select_tier(router.score("easy")).name == "fast"
+
+    def test_fallback_chain(self):
+        tiers = _tiers() + [ModelTier("mid", model="mid-model", max_score=0.6, fallback="strong")]
+        router = ComplexityRouter(tiers)
+        assert [t.name for t in router.fallback_chain(router.tiers[0])] == ["fast", "mid", "strong"]
+
+    def test_requires_tiers(self):
+        with pytest.raises(ValueError):
+            ComplexityRouter([])
+
+    def test_from_env(self):
+        spec = [{"name": "fast", "model": "m1", "max_score": 0.2}, {"name": "strong", "model": "m2"}]
+        with patch.dict(os.environ, {"LLM_ROUTER_TIERS": json.dumps(spec)}):
+            router = ComplexityRouter.from_env()
+        assert [t.model for t in router.tiers] == ["m1", "m2"]
+
+    def test_from_env_missing(self):
+        with patch.dict(os.environ, {}, clear=True), pytest.raises(EnvironmentError):
+            ComplexityRouter.from_env()
+
+
+class TestRoutedLLM:
+    """Test per-request routing, fallbacks and stats."""
+
+    def test_invoke_routes_and_records_savings(self):
+        factory = _fake_factory({"small-model": "fast answer", "big-model": "strong answer"})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers()))
+
+        assert llm.invoke("hi").content == "fast answer"
+        stats = llm.get_stats()
+        assert stats["fast"]["requests"] == 1
+        assert stats["fast"]["savings"] > 0
+
+    def test_models_are_cached_per_tier(self):
+        factory = _fake_factory({"small-model": "a", "big-model": "b"})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers()))
+        llm.invoke("hi")
+        llm.invoke("hello")
+        assert factory.get_llm.call_count == 1
+
+    def test_failing_tier_falls_back(self):
+        factory = _fake_factory({"small-model": RuntimeError("throttled"), "big-model": "strong answer"})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers()))
+        assert llm.invoke("hi").content == "strong answer"
+        stats = llm.get_stats()
+        assert stats["fast"]["errors"] == 1
+        assert stats["strong"]["requests"] == 1
+
+    def test_last_tier_failure_raises(self):
+        factory = _fake_factory({"small-model": RuntimeError("a"), "big-model": RuntimeError("b")})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers()))
+        with pytest.raises(RuntimeError, match="b"):
+            llm.invoke("hi")
+
+    def test_stream_routes(self):
+        factory = _fake_factory({"small-model": "fast answer", "big-model": "strong answer"})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers()))
+        assert "".join(c.content for c in llm.stream("hi")) == "fast answer"
+        assert llm.get_stats()["fast"]["requests"] == 1
+
+    @pytest.mark.asyncio
+    async def test_ainvoke_routes(self):
+        factory = _fake_factory({"small-model": "fast answer", "big-model": "strong answer"})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers(), classifier=lambda t, f: 1.0))
+        assert (await llm.ainvoke("hi")).content == "strong answer"
+
+    def test_bind_tools_shares_stats(self):
+        factory = _fake_factory({"small-model": "a", "big-model": "b"})
+        llm = RoutedLLM(factory, ComplexityRouter(_tiers()))
+        bound = llm.bind_tools(["tool"], strict=False)
+        bound.invoke("hi")
+        assert factory.get_llm.call_args.kwargs["tools"] == ["tool"]
+        assert factory.get_llm.call_args.kwargs["strict_tools"] is False
+        assert llm.get_stats()["fast"]["requests"] == 1
+
+
+class TestGetRoutedLLM:
+    """Test LLMFactory.get_routed_llm."""
+
+    @patch.dict(os.environ, {
+        "OPENAI_API_KEY": "test-key",
+        "OPENAI_MODEL_NAME": "gpt-4o",
+        "LLM_ROUTER_TIERS": json.dumps([{"name": "fast", "model": "gpt-4o-mini", "max_score": 0.3}, {"name": "strong"}]),
+    })
+    def test_builds_tier_models_with_model_override(self):
+        factory = LLMFactory("openai")
+        llm = factory.get_routed_llm(temperature=0.5)
+        fast = llm.get_model(llm.router.tiers[0])
+        strong = llm.get_model(llm.router.tiers[1])
+        assert fast.model_name == "gpt-4o-mini"
+        assert strong.model_name == "gpt-4o"
+        assert fast.temperature == pytest.approx(0.5)
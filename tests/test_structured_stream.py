@@ -0,0 +1,150 @@
+"""
+Tests for incremental partial-JSON parsing of streamed structured output.
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from pydantic import BaseModel, Field, field_validator
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.structured_stream import (
+    PartialModelParser,
+    iter_partial_models,
+    partial_structured_output,
+)
+
+
+class RouteDecision(BaseModel):
+    status: str
+    route: str = Field(alias="agent")
+    details: dict
+    notes: list[str] = []
+
+    @field_validator("status")
+    @classmethod
+    def _upper(cls, v: str) -> str:
+        return v.upper()
+
+
+RESPONSE = '```json\n{"status": "ok", "agent": "argocd", "details": {"a": [1, {"b": "}"}]}, "notes": ["x, y"]}\n```'
+
+
+def _split(text: str, size: int = 3) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestPartialModelParser:
+    """Test field-by-field incremental validation."""
+
+    def test_fields_are_emitted_in_order_as_they_complete(self):
+        parser = PartialModelParser(RouteDecision)
+        seen = []
+        for chunk in _split(RESPONSE):
+            partial = parser.feed(chunk)
+            if partial is not None:
+                seen.append(set(partial.model_fields_set))
+
+        assert seen == [
+            {"status"},
+            {"status", "route"},
+            {"status", "route", "details"},
+            {"status", "route", "details", "notes"},
+        ]
+        assert parser.done
+
+    def test_partial_fields_are_validated(self):
+        parser = PartialModelParser(RouteDecision)
+        partial = parser.feed('{"status": "ok", "age')
+        assert partial.status == "OK"
+        assert partial.model_fields_set == {"status"}
+
+    def test_final_validates_complete_object(self):
+        parser = PartialModelParser(RouteDecision)
+        for chunk in _split(RESPONSE, 7):
+            parser.feed(chunk)
+        final = parser.final()
+        assert final.route == "argocd"
+        assert final.details == {"a": [1, {"b": "}"}]}
+        assert final.notes == ["x, y"]
+
+    def test_escaped_quotes_do_not_end_strings(self):
+        parser = PartialModelParser(RouteDecision)
+        partial = parser.feed('{"status": "say \\"hi\\", then", "agent"')
+        assert partial.status == 'SAY "HI", THEN'
+
+    def test_invalid_field_is_not_marked_complete(self):
+        parser = PartialModelParser(RouteDecision)
+        assert parser.feed('{"details": "not-a-dict", "status": "x"') is None
+        assert parser.feed(", ") is not None
+        assert parser.completed_fields == {"status"}
+
+    def test_incomplete_stream_raises(self):
+        parser = PartialModelParser(RouteDecision)
+        parser.feed('{"status": "ok"')
+        with pytest.raises(OutputParserException):
+            parser.final()
+
+
+class TestPartialStructuredOutputRunnable:
+    """Test the runnable composition used by get_llm(stream_partial=True)."""
+
+    def test_iter_partial_models_accepts_message_chunks(self):
+        chunks = [AIMessageChunk(content=c) for c in _split(RESPONSE, 5)]
+        results = list(iter_partial_models(RouteDecision, iter(chunks)))
+        assert len(results) == 5
+        assert results[-1] == RouteDecision.model_validate_json(RESPONSE[8:-4])
+
+    def test_stream_from_fake_chat_model(self):
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content=RESPONSE)]))
+        chain = llm | partial_structured_output(RouteDecision)
+        results = list(chain.stream("route this"))
+        assert results[0].model_fields_set == {"status"}
+        assert isinstance(results[-1], RouteDecision)
+
+    def test_invoke_returns_validated_object(self):
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content=RESPONSE)]))
+        chain = llm | partial_structured_output(RouteDecision)
+        assert chain.invoke("route this").route == "argocd"
+
+    @pytest.mark.asyncio
+    async def test_astream_from_fake_chat_model(self):
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content=RESPONSE)]))
+        chain = llm | partial_structured_output(RouteDecision)
+        results = [r async for r in chain.astream("route this")]
+        assert results[-1].status == "OK"
+
+    def test_tool_call_arguments_are_parsed(self):
+        message = AIMessage(content="", tool_calls=[{"name": "RouteDecision", "id": "1", "args": {
+            "status": "ok", "agent": "github", "details": {}}}])
+        chain = partial_structured_output(RouteDecision)
+        assert chain.invoke(message).route == "github"
+
+
+class TestGetLLMStreamPartial:
+    """Test get_llm(stream_partial=True)."""
+
+    @patch.dict(os.environ, {
+        "ANTHROPIC_API_KEY": "test-key",
+        "ANTHROPIC_MODEL_NAME": "claude-3-sonnet-20240229-v1",
+    })
+    def test_requires_pydantic_response_format(self):
+        factory = LLMFactory("anthropic-claude")
+        with pytest.raises(ValueError, match="stream_partial"):
+            factory.get_llm(response_format={"type": "json_object"}, stream_partial=True)
+
+    @patch.dict(os.environ, {
+        "OPENAI_API_KEY": "test-key",
+        "OPENAI_MODEL_NAME": "gpt-4o",
+    })
+    def test_returns_composed_runnable(self):
+        factory = LLMFactory("openai")
+        fake = GenericFakeChatModel(messages=iter([AIMessage(content=RESPONSE)]))
+        with patch.object(factory, "_build_openai_llm", return_value=fake) as mock_builder:
+            chain = factory.get_llm(response_format=RouteDecision, stream_partial=True)
+        assert mock_builder.call_args.args[0] is RouteDecision
+        assert next(p.model_fields_set for p in chain.stream("hi")) == {"status"}
@@ -0,0 +1,191 @@
+"""
+Tests for the adaptive per-request thinking budget.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from cnoe_agent_utils.cascade import confidence_validator
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.thinking_policy import ThinkingDecision, ThinkingPolicy
+from cnoe_agent_utils.token_budget import ContextSizedLLM, sizing_kwargs
+
+SIMPLE = "What is the capital of France?"
+COMPLEX = (
+    "Analyze the incident timeline, debug the failing deployment, compare both rollout "
+    "strategies and design a remediation plan.\n" + "log line with details\n" * 150
+)
+
+
+def _response(reasoning=0, content="ok"):
+    return AIMessage(
+        content=content,
+        usage_metadata={
+            "input_tokens": 10, "output_tokens": 5 + reasoning, "total_tokens": 15 + reasoning,
+            "output_token_details": {"reasoning": reasoning},
+        },
+    )
+
+
+class TestDecide:
+    """Test budget decisions."""
+
+    def test_simple_request_disables_thinking(self):
+        decision = ThinkingPolicy().decide(SIMPLE)
+        assert decision.budget is None and decision.band == "off"
+
+    def test_complex_request_gets_larger_budget(self):
+        policy = ThinkingPolicy(max_budget=16000)
+        decision = policy.decide(COMPLEX)
+        assert 1024 <= decision.budget <= 16000
+        assert decision.band in ("medium", "high")
+        assert decision.budget > policy.decide(COMPLEX[:600]).budget
+
+    def test_latency_slo_caps_then_disables(self):
+        policy = ThinkingPolicy(max_budget=16000, thinking_tokens_per_second=100, overhead_seconds=2)
+        capped = policy.decide(COMPLEX, latency_slo=22)
+        assert capped.budget == 2000 and capped.slo_capped
+        assert policy.decide(COMPLEX, latency_slo=10).budget is None
+
+    def test_observe_records_telemetry_and_throughput(self):
+        policy = ThinkingPolicy(validators=[confidence_validator(0.7)], overhead_seconds=0)
+        policy.observe(ThinkingDecision(4000, 0.8, "high"), _response(3000, '{"confidence": 0.9}'), latency=10.0)
+        policy.observe(ThinkingDecision(4000, 0.8, "high"), _response(1000, '{"confidence": 0.2}'), latency=10.0, latency_slo=5)
+        high = policy.stats.snapshot()["high"]
+        assert high["calls"] == 2
+        assert high["avg_thinking_tokens"] == 2000
+        assert high["budget_utilization"] == pytest.approx(0.5)
+        assert high["quality_pass_rate"] == pytest.approx(0.5)
+        assert high["slo_miss_rate"] == pytest.approx(0.5)
+        assert policy.thinking_tokens_per_second != pytest.approx(60.0)
+
+    def test_failed_call_without_validators_has_no_quality(self):
+        policy = ThinkingPolicy()
+        policy.observe(ThinkingDecision(2000, 0.5, "low"), None, latency=1.0)
+        assert policy.stats.snapshot()["low"]["quality_pass_rate"] is None
+        checked = ThinkingPolicy(validators=[confidence_validator(0.7)])
+        checked.observe(ThinkingDecision(2000, 0.5, "low"), None, latency=1.0)
+        assert checked.stats.snapshot()["low"]["quality_pass_rate"] == pytest.approx(0.0)
+
+    def test_thinking_blocks_are_counted(self):
+        policy = ThinkingPolicy()
+        message = AIMessage(content=[{"type": "thinking", "thinking": "x" * 400}, {"type": "text", "text": "ok"}])
+        policy.observe(ThinkingDecision(2000, 0.5, "low"), message, latency=1.0)
+        assert policy.stats.snapshot()["low"]["avg_thinking_tokens"] == 100
+
+
+class TestUserTurns:
+    """Test that thinking is decided once per user turn."""
+
+    def _tool_call(self, thinking=False):
+        content = [{"type": "thinking", "thinking": "plan", "signature": "s"}] if thinking else ""
+        return [
+            AIMessage(content=content, tool_calls=[{"name": "get_logs", "args": {}, "id": "1"}]),
+            ToolMessage(content="log line\n" * 2000, tool_call_id="1"),
+        ]
+
+    def test_scores_latest_user_message_only(self):
+        policy = ThinkingPolicy()
+        history = [SystemMessage(content=COMPLEX), HumanMessage(content=COMPLEX, id="h1"), AIMessage(content="done"),
+                   HumanMessage(content=SIMPLE, id="h2")]
+        assert policy.decide(history).budget is None
+
+    def test_decision_is_kept_through_the_tool_loop(self):
+        policy = ThinkingPolicy()
+        turn = [SystemMessage(content="You are an SRE agent."), HumanMessage(content=SIMPLE, id="h1")]
+        assert policy.decide(turn).budget is None
+        # Large tool output arrives mid-turn: thinking stays off
+        assert policy.decide(turn + self._tool_call()).budget is None
+
+        complex_turn = [*turn, AIMessage(content="ok"), HumanMessage(content=COMPLEX, id="h2")]
+        budget = policy.decide(complex_turn).budget
+        assert budget and policy.decide(complex_turn + self._tool_call(thinking=True)).budget == budget
+
+    def test_unknown_turn_follows_thinking_blocks(self):
+        turn = [HumanMessage(content=SIMPLE, id="h1")]
+        assert ThinkingPolicy().decide(turn + self._tool_call(thinking=True)).budget == 1024
+        assert ThinkingPolicy().decide([HumanMessage(content=COMPLEX)] + self._tool_call()).budget is None
+
+
+class TestSizingKwargsDisable:
+    """Test per-call thinking disable kwargs."""
+
+    def test_anthropic_and_google(self):
+        assert sizing_kwargs("anthropic_claude", None, 100, None, disable_thinking=True)["thinking"] == {"type": "disabled"}
+        assert sizing_kwargs("google_gemini", None, 100, None, disable_thinking=True)["thinking_budget"] == 0
+
+    def test_enabling_thinking_sets_temperature_one(self):
+        model = MagicMock(temperature=0.0)
+        assert sizing_kwargs("anthropic_claude", model, 5000, 2000)["temperature"] == 1
+        assert "temperature" not in sizing_kwargs("anthropic_claude", model, 100, None, disable_thinking=True)
+
+    def test_bedrock_converse_strips_configured_thinking(self):
+        model = MagicMock(beta_use_converse_api=True, additional_model_request_fields={
+            "top_k": 5, "thinking": {"type": "enabled", "budget_tokens": 8000},
+        })
+        kwargs = sizing_kwargs("aws_bedrock", model, 100, None, disable_thinking=True)
+        assert kwargs["additional_model_request_fields"] == {"top_k": 5}
+
+
+class TestContextSizedLLMWithPolicy:
+    """Test per-call application and telemetry."""
+
+    def _wrapped(self, policy):
+        inner = MagicMock()
+        inner.invoke.return_value = _response()
+        return inner, ContextSizedLLM(inner, "anthropic_claude", "claude-sonnet-4-5", thinking_policy=policy)
+
+    def test_simple_and_complex_calls(self):
+        policy = ThinkingPolicy(max_budget=8000)
+        inner, llm = self._wrapped(policy)
+        llm.invoke(SIMPLE)
+        assert inner.invoke.call_args.kwargs["thinking"] == {"type": "disabled"}
+        llm.invoke(COMPLEX)
+        assert inner.invoke.call_args.kwargs["thinking"]["type"] == "enabled"
+        assert set(policy.stats.snapshot()) >= {"off"}
+        assert sum(band["calls"] for band in policy.stats.snapshot().values()) == 2
+
+    def test_latency_slo_from_kwargs_and_metadata(self):
+        policy = ThinkingPolicy(max_budget=8000, thinking_tokens_per_second=100, overhead_seconds=0)
+        inner, llm = self._wrapped(policy)
+        llm.invoke(COMPLEX, latency_slo=5)
+        assert "latency_slo" not in inner.invoke.call_args.kwargs
+        assert inner.invoke.call_args.kwargs["thinking"] == {"type": "disabled"}
+        llm.invoke(COMPLEX, config={"metadata": {"latency_slo": 15}})
+        assert inner.invoke.call_args.kwargs["thinking"]["budget_tokens"] <= 1500
+
+    def test_failed_call_is_recorded(self):
+        policy = ThinkingPolicy()
+        inner, llm = self._wrapped(policy)
+        inner.invoke.side_effect = RuntimeError("boom")
+        with pytest.raises(RuntimeError):
+            llm.invoke(SIMPLE)
+        assert policy.stats.snapshot()["off"]["calls"] == 1
+
+
+class TestFactoryIntegration:
+    """Test get_llm(thinking_policy=...)."""
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "k", "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5"})
+    def test_policy_implies_per_call_sizing(self):
+        policy = ThinkingPolicy()
+        llm = LLMFactory("anthropic-claude").get_llm(thinking_policy=policy)
+        assert isinstance(llm, ContextSizedLLM) and llm.thinking_policy is policy
+
+    @patch.dict(os.environ, {
+        "ANTHROPIC_API_KEY": "k",
+        "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5",
+        "ANTHROPIC_THINKING_BUDGET": "12000",
+        "LLM_THINKING_POLICY": "adaptive",
+        "LLM_THINKING_LATENCY_SLO": "30",
+    })
+    def test_policy_from_env(self):
+        policy = LLMFactory("anthropic-claude").get_llm().thinking_policy
+        assert policy.max_budget == 12000 and policy.latency_slo == pytest.approx(30.0)
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"})
+    def test_provider_without_thinking_ignores_policy(self):
+        assert not isinstance(LLMFactory("openai").get_llm(thinking_policy=ThinkingPolicy()), ContextSizedLLM)
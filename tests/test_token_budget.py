@@ -0,0 +1,198 @@
+"""
+Tests for per-call max_tokens and thinking-budget sizing.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.prebuilt.chat_agent_executor import _get_model
+from pydantic import BaseModel, Field
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.token_budget import (
+    ContextSizedLLM,
+    compute_output_budget,
+    estimate_tokens,
+    get_model_limits,
+    sizing_kwargs,
+)
+
+
+@tool
+def lookup(query: str) -> str:
+    """Look something up in the knowledge base."""
+    return query
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class ToolCallingChatModel(GenericFakeChatModel):
+    """Fake chat model that supports tools and records each call's keyword arguments."""
+
+    calls: list = Field(default_factory=list)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(kwargs)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class TestModelLimits:
+    """Test model limit lookup."""
+
+    @pytest.mark.parametrize("model, expected", [
+        ("gpt-4o-mini", (128_000, 16_384)),
+        ("gpt-4.1-nano", (1_047_576, 32_768)),
+        ("us.anthropic.claude-3-7-sonnet-20250219-v1:0", (200_000, 64_000)),
+        ("claude-sonnet-4-5", (200_000, 64_000)),
+        ("models/gemini-2.5-pro", (1_048_576, 65_536)),
+    ])
+    def test_known_models(self, model, expected):
+        assert get_model_limits(model) == expected
+
+    def test_unknown_model_uses_provider_limit(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_model_limits("my-finetune", "aws-bedrock") == (150000, 4096)
+
+    @patch.dict(os.environ, {"LLM_CONTEXT_WINDOW": "32000", "LLM_MAX_OUTPUT_TOKENS": "2000"})
+    def test_env_overrides(self):
+        assert get_model_limits("gpt-4o") == (32000, 2000)
+
+
+class TestComputeOutputBudget:
+    """Test the sizing arithmetic."""
+
+    def test_reserve_fits(self):
+        assert compute_output_budget(128_000, 16_384, 1_000, output_reserve=4096) == (4096, None)
+
+    def test_capped_by_remaining_context(self):
+        max_tokens, _ = compute_output_budget(8_192, 8_192, 6_000, output_reserve=4096)
+        assert max_tokens == 8_192 - 6_000 - 300
+
+    def test_capped_by_model_output_limit(self):
+        assert compute_output_budget(200_000, 2_000, 100, output_reserve=4096)[0] == 2_000
+
+    def test_thinking_gets_budget_above_reserve(self):
+        assert compute_output_budget(200_000, 64_000, 1_000, 4096, thinking_budget=8000) == (12096, 8000)
+
+    def test_thinking_shrinks_then_drops_when_tight(self):
+        # 184K prompt + 5% safety leaves 6800 tokens, split between answer and thinking
+        assert compute_output_budget(200_000, 200_000, 184_000, 4096, 8000) == (6800, 3400)
+        assert compute_output_budget(200_000, 1_500, 1_000, 4096, 8000) == (1_500, None)
+
+    def test_overflow_raises(self):
+        with pytest.raises(ValueError, match="no room"):
+            compute_output_budget(8_192, 4_096, 8_000)
+
+
+class TestSizingKwargs:
+    """Test per-provider call kwargs."""
+
+    def test_openai_and_anthropic(self):
+        assert sizing_kwargs("openai", None, 100, None) == {"max_tokens": 100}
+        assert sizing_kwargs("anthropic_claude", None, 5000, 2000) == {
+            "max_tokens": 5000, "thinking": {"type": "enabled", "budget_tokens": 2000},
+        }
+
+    def test_google(self):
+        assert sizing_kwargs("gcp_vertexai", None, 100, 2048) == {"max_output_tokens": 100, "thinking_budget": 2048}
+
+    def test_bedrock_converse_merges_existing_fields(self):
+        model = MagicMock(beta_use_converse_api=True, additional_model_request_fields={"top_k": 5})
+        kwargs = sizing_kwargs("aws_bedrock", model, 5000, 2000)
+        assert kwargs["additional_model_request_fields"] == {
+            "top_k": 5, "thinking": {"type": "enabled", "budget_tokens": 2000},
+        }
+
+
+class TestContextSizedLLM:
+    """Test the runnable wrapper."""
+
+    def _wrapped(self, **kwargs):
+        inner = MagicMock()
+        inner.invoke.return_value = AIMessage(content="ok")
+        inner.model_name = "gpt-4o"
+        return inner, ContextSizedLLM(inner, "openai", "gpt-4o", **kwargs)
+
+    def test_invoke_passes_sized_kwargs(self):
+        inner, llm = self._wrapped(output_reserve=1000)
+        llm.invoke([HumanMessage(content="hello")])
+        assert inner.invoke.call_args.kwargs == {"max_tokens": 1000}
+        assert llm.model_name == "gpt-4o"
+
+    def test_explicit_kwargs_win(self):
+        inner, llm = self._wrapped()
+        llm.invoke("hi", max_tokens=7)
+        assert inner.invoke.call_args.kwargs["max_tokens"] == 7
+
+    def test_bind_tools_counts_schema_tokens(self):
+        inner, llm = self._wrapped()
+        bound = llm.bind_tools([lookup])
+        assert bound.tool_tokens > 0
+        assert bound.estimator("x") + bound.tool_tokens > estimate_tokens("x")
+        inner.bind_tools.assert_called_once()
+
+    def test_stream_with_fake_model(self):
+        model = GenericFakeChatModel(messages=iter([AIMessage(content="a b")]))
+        llm = ContextSizedLLM(model, "openai", "gpt-4o")
+        assert "".join(chunk.content for chunk in llm.stream("q")) == "a b"
+
+    def test_is_a_chat_model_for_langgraph(self):
+        _, llm = self._wrapped()
+        assert _get_model(llm) is llm
+        assert _get_model(llm.bind(stop=["x"])) is llm
+
+    def test_structured_output_and_bind_are_sized(self):
+        answer = AIMessage(content="", tool_calls=[{"name": "Answer", "args": {"text": "ok"}, "id": "1"}])
+        model = ToolCallingChatModel(messages=iter([answer, AIMessage(content="plain")]))
+        llm = ContextSizedLLM(model, "openai", "gpt-4o", output_reserve=1000)
+        assert llm.with_structured_output(Answer).invoke("q") == Answer(text="ok")
+        assert model.calls[0]["max_tokens"] == 1000 and model.calls[0]["tool_choice"]
+        llm.bind(stop=["x"]).invoke("q")
+        assert model.calls[1]["max_tokens"] == 1000
+
+    def test_forced_tool_call_turns_claude_thinking_off(self):
+        inner = MagicMock()
+        llm = ContextSizedLLM(inner, "anthropic_claude", "claude-sonnet-4-5", thinking_budget=4096)
+        llm.invoke("q", tool_choice={"type": "tool", "name": "Answer"})
+        assert inner.invoke.call_args.kwargs["thinking"] == {"type": "disabled"}
+        llm.invoke("q")
+        assert inner.invoke.call_args.kwargs["thinking"]["type"] == "enabled"
+
+
+class TestFactoryIntegration:
+    """Test get_llm(auto_max_tokens=...)."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"})
+    def test_disabled_by_default(self):
+        assert not isinstance(LLMFactory("openai").get_llm(), ContextSizedLLM)
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "LLM_OUTPUT_RESERVE_TOKENS": "2048"})
+    def test_enabled_with_cap(self):
+        llm = LLMFactory("openai").get_llm(auto_max_tokens=True, max_tokens=1500)
+        assert isinstance(llm, ContextSizedLLM)
+        assert llm.size("hi") == {"max_tokens": 1500}
+        assert LLMFactory("openai").get_llm(auto_max_tokens=True).size("hi") == {"max_tokens": 2048}
+
+    @patch.dict(os.environ, {
+        "ANTHROPIC_API_KEY": "k",
+        "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5",
+        "ANTHROPIC_THINKING_ENABLED": "true",
+        "ANTHROPIC_THINKING_BUDGET": "4000",
+        "LLM_AUTO_MAX_TOKENS": "true",
+    })
+    def test_thinking_budget_from_env(self):
+        llm = LLMFactory("anthropic-claude").get_llm(tools=[lookup])
+        # The model is built at temperature 0, which Claude rejects with thinking on
+        assert llm.size("hi") == {
+            "max_tokens": 8096, "thinking": {"type": "enabled", "budget_tokens": 4000}, "temperature": 1,
+        }
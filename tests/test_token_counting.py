@@ -0,0 +1,414 @@
+"""
+Tests for provider-aware token counting.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from cnoe_agent_utils import token_counting
+from cnoe_agent_utils.agents.context_config import get_calibrated_context_limit
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.token_counting import (
+    MESSAGE_OVERHEAD_TOKENS,
+    CharRatioTokenizer,
+    EstimateTokenizer,
+    TiktokenTokenizer,
+    TokenCalibration,
+    TokenCalibrationHandler,
+    TokenCountCache,
+    TokenCounter,
+    clear_tiktoken_encodings,
+    download_tokenizer_data,
+    estimator_for,
+    message_text,
+    preload_tokenizers_from_env,
+    tiktoken_data_path,
+    tokenizer_for,
+)
+
+
+class FakeEncoding:
+    """Whitespace 'tokenizer' that records how it was called."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def encode_batch(self, texts, disallowed_special=()):
+        self.batches.append(list(texts))
+        return [text.split() for text in texts]
+
+
+def _counter(**kwargs):
+    encoding = FakeEncoding()
+    counter = TokenCounter("openai", "gpt-4o", tokenizer=TiktokenTokenizer(encoding=encoding),
+                           cache=TokenCountCache(100), **kwargs)
+    return counter, encoding
+
+
+class TestTokenizers:
+    """Test tokenizer selection."""
+
+    def test_tokenizer_per_provider(self):
+        assert tokenizer_for("anthropic-claude").name == "claude~approx"
+        assert tokenizer_for("aws_bedrock", "us.anthropic.claude-sonnet-4-5").name == "claude~approx"
+        assert tokenizer_for("google_gemini", "gemini-2.5-pro").name == "gemini~approx"
+        assert tokenizer_for("openai", "gpt-4o").encoding_name == "o200k_base"
+        assert tokenizer_for("groq", "llama-3.3-70b").encoding_name == "cl100k_base"
+
+    def test_claude_counts_more_than_chars_over_four(self):
+        text = "x" * 700
+        assert tokenizer_for("anthropic_claude").count(text) == 200 > CharRatioTokenizer().count(text)
+
+    def test_missing_encoding_falls_back_to_estimate(self):
+        clear_tiktoken_encodings()
+        with patch("tiktoken.get_encoding", side_effect=OSError("offline")):
+            tokenizer = TiktokenTokenizer("cl100k_base")
+            assert tokenizer.count("x" * 40) == 10
+            assert tokenizer.name == "cl100k_base~approx"
+        clear_tiktoken_encodings()
+
+    def test_message_text_includes_tool_calls(self):
+        message = AIMessage(content=[{"type": "text", "text": "checking"}],
+                            tool_calls=[{"name": "get_pods", "args": {"ns": "prod"}, "id": "1"}])
+        text = message_text(message)
+        assert text.startswith("checking") and "get_pods" in text and "prod" in text
+
+
+class SlowEncoding(FakeEncoding):
+    """Encoding that takes a while and records which thread ran it."""
+
+    def encode_batch(self, texts, disallowed_special=()):
+        self.thread = threading.current_thread().name
+        time.sleep(0.3)
+        return super().encode_batch(texts, disallowed_special)
+
+
+class TestAsyncCounting:
+    """Test that large async counts run off the event loop."""
+
+    @pytest.mark.asyncio
+    async def test_small_counts_stay_inline(self):
+        encoding = SlowEncoding()
+        counter = TokenCounter("openai", "gpt-4o", tokenizer=TiktokenTokenizer(encoding=encoding),
+                               cache=TokenCountCache(100), mode="exact")
+        assert await counter.acount_total([HumanMessage(content="a b c")]) == 3 + MESSAGE_OVERHEAD_TOKENS
+        assert encoding.thread == threading.current_thread().name
+
+    @pytest.mark.asyncio
+    async def test_large_history_does_not_stall_other_sessions(self):
+        encoding = SlowEncoding()
+        counter = TokenCounter("openai", "gpt-4o", tokenizer=TiktokenTokenizer(encoding=encoding),
+                               cache=TokenCountCache(100), mode="exact", inline_chars=1000)
+        history = [HumanMessage(content="log line " * 200, id="big")]
+
+        async def other_session():
+            started = time.perf_counter()
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+            return time.perf_counter() - started
+
+        counts, other_elapsed = await asyncio.gather(counter.acount_messages(history), other_session())
+        assert counts == [400 + MESSAGE_OVERHEAD_TOKENS]
+        assert encoding.thread.startswith("tokenizer") and other_elapsed < 0.25
+        # Known by ID now: answered inline without tokenizing again
+        assert await counter.acount_for_limit(history, limit=10) == counts and len(encoding.batches) == 1
+
+
+class TestTokenizerData:
+    """Test offline loading and preloading of tiktoken data."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_encodings(self):
+        clear_tiktoken_encodings()
+        yield
+        clear_tiktoken_encodings()
+
+    def test_offline_never_downloads(self, tmp_path):
+        env = {"TIKTOKEN_CACHE_DIR": str(tmp_path), "LLM_TOKENIZER_OFFLINE": "true"}
+        with patch.dict(os.environ, env), patch("tiktoken.load.read_file", side_effect=AssertionError("network")):
+            tokenizer = TiktokenTokenizer("p50k_base")
+            assert tokenizer.name == "p50k_base~approx" and tokenizer.count("x" * 8) == 2
+
+    def test_offline_reads_the_cache_dir(self, tmp_path):
+        open(tiktoken_data_path("p50k_base", str(tmp_path)), "wb").close()
+        env = {"TIKTOKEN_CACHE_DIR": str(tmp_path), "LLM_TOKENIZER_OFFLINE": "true"}
+        with patch.dict(os.environ, env), patch("tiktoken.get_encoding", return_value=FakeEncoding()) as load:
+            assert TiktokenTokenizer("p50k_base").count("a b c") == 3
+            assert TiktokenTokenizer("p50k_base").count("a b") == 2
+        load.assert_called_once_with("p50k_base")
+
+    def test_failed_load_is_not_retried(self, caplog):
+        with patch("tiktoken.get_encoding", side_effect=OSError("offline")) as load:
+            tokenizers = [TiktokenTokenizer("r50k_base") for _ in range(3)]
+            assert all(tokenizer.name == "r50k_base~approx" for tokenizer in tokenizers)
+        load.assert_called_once_with("r50k_base")
+        assert sum("Could not load" in record.message for record in caplog.records) == 1
+
+    def test_download_into_cache_layout(self, tmp_path):
+        with patch("tiktoken.load.read_file", return_value=b"data") as read:
+            paths = download_tokenizer_data(str(tmp_path / "tiktoken"), ["cl100k_base"])
+            assert download_tokenizer_data(str(tmp_path / "tiktoken"), ["cl100k_base"]) == paths
+        assert paths == [tiktoken_data_path("cl100k_base", str(tmp_path / "tiktoken"))]
+        with open(paths[0], "rb") as f:
+            assert f.read() == b"data"
+        read.assert_called_once()
+        with pytest.raises(ValueError):
+            download_tokenizer_data(str(tmp_path), ["bogus"])
+
+    def test_preload_from_env_freezes_loaded_encodings(self):
+        with patch("cnoe_agent_utils.token_counting.load_tiktoken_encoding", side_effect=[None, OSError("x")]), \
+                patch("gc.freeze") as freeze:
+            with patch.dict(os.environ, {"LLM_TOKENIZER_PRELOAD": "cl100k_base, o200k_base"}):
+                assert preload_tokenizers_from_env() == {"cl100k_base": True, "o200k_base": False}
+            freeze.assert_called_once()
+            with patch.dict(os.environ, {"LLM_TOKENIZER_PRELOAD": "false"}):
+                assert preload_tokenizers_from_env() is None
+
+
+class TestCountingModes:
+    """Test the fast estimate and the exact/estimate/hybrid modes."""
+
+    def test_estimate_is_an_upper_bound_on_words_and_bytes(self):
+        estimator = EstimateTokenizer(3.0)
+        assert estimator.count("a b c d") == 4  # words
+        assert estimator.count("x" * 30) == 10  # bytes
+        assert estimator.count("é" * 15) == 10  # UTF-8 bytes, not characters
+        assert estimator_for("openai", "gpt-4o").name == "o200k_base~estimate"
+        assert estimator_for("aws-bedrock", "us.anthropic.claude-sonnet-4-5").name == "claude~estimate"
+
+    def test_hybrid_tokenizes_only_near_the_limit(self):
+        counter, encoding = _counter(estimator=EstimateTokenizer(3.0))
+        history = [HumanMessage(content="word " * 300, id="m1")]
+        estimated = counter.count_for_limit(history, limit=10_000)
+        assert encoding.batches == [] and estimated == [500 + MESSAGE_OVERHEAD_TOKENS]
+        assert counter.count_for_limit(history, limit=600) == [300 + MESSAGE_OVERHEAD_TOKENS]
+        assert len(encoding.batches) == 1
+
+    def test_hybrid_keeps_tokenized_counts_of_known_messages(self):
+        counter, encoding = _counter(estimator=EstimateTokenizer(3.0))
+        known = HumanMessage(content="word " * 300, id="m1")
+        counter.count_messages([known])
+        history = [known, HumanMessage(content="word " * 300, id="m2")]
+        counts = counter.count_for_limit(history, limit=10_000)
+        assert counts == [300 + MESSAGE_OVERHEAD_TOKENS, 500 + MESSAGE_OVERHEAD_TOKENS]
+        assert len(encoding.batches) == 1
+
+    def test_exact_and_estimate_modes(self):
+        history = [HumanMessage(content="word " * 300)]
+        counter, encoding = _counter(mode="exact")
+        assert counter.count_for_limit(history, limit=10_000) == [300 + MESSAGE_OVERHEAD_TOKENS]
+        counter, encoding = _counter(mode="estimate")
+        assert counter.count_for_limit(history, limit=600) == counter.count_messages(history)
+        assert encoding.batches == [] and counter.stats()["mode"] == "estimate"
+        with pytest.raises(ValueError):
+            _counter(mode="bpe")
+
+
+class TestTokenCounter:
+    """Test memoization, batching and provider count APIs."""
+
+    def test_counts_are_memoized_by_content(self):
+        counter, encoding = _counter()
+        history = [SystemMessage(content="be brief"), HumanMessage(content="list all pods")]
+        assert counter.count_messages(history) == [2 + MESSAGE_OVERHEAD_TOKENS, 3 + MESSAGE_OVERHEAD_TOKENS]
+        assert encoding.batches == [["be brief", "list all pods"]]
+        history.append(AIMessage(content="two pods"))
+        assert counter.count_total(history) == 7 + 3 * MESSAGE_OVERHEAD_TOKENS
+        assert encoding.batches[-1] == ["two pods"]
+        assert counter.stats()["cache"]["hits"] == 2
+
+    def test_same_text_different_role_is_a_different_entry(self):
+        counter, encoding = _counter()
+        counter.count_messages([HumanMessage(content="hi"), AIMessage(content="hi")])
+        assert encoding.batches == [["hi", "hi"]]
+
+    def test_provider_api_only_when_asked(self):
+        llm = MagicMock()
+        llm.get_num_tokens_from_messages.return_value = 42
+        counter, _ = _counter(llm=llm)
+        history = [HumanMessage(content="hello there")]
+        counter.count_total(history)
+        llm.get_num_tokens_from_messages.assert_not_called()
+        assert counter.count_total(history, exact=True) == 42
+        assert counter.count_total(history, exact=True) == 42
+        assert llm.get_num_tokens_from_messages.call_count == 1
+        assert counter.stats()["api_calls"] == 1
+
+    def test_provider_api_failure_counts_locally(self):
+        llm = MagicMock()
+        llm.get_num_tokens_from_messages.side_effect = RuntimeError("no count API")
+        counter, _ = _counter(llm=llm, exact=True)
+        assert counter.count_total([HumanMessage(content="a b c")]) == 3 + MESSAGE_OVERHEAD_TOKENS
+        assert counter.stats()["api_errors"] == 1
+
+    def test_per_message_counts_stay_local_when_exact(self):
+        llm = MagicMock()
+        llm.get_num_tokens_from_messages.return_value = 42
+        counter, _ = _counter(llm=llm, exact=True)
+        history = [AIMessage(content="", tool_calls=[{"name": "get_pods", "args": {}, "id": "t1"}]),
+                   ToolMessage(content="pod-a Running", tool_call_id="t1")]
+        assert counter.count_messages(history) == [
+            len(message_text(m).split()) + MESSAGE_OVERHEAD_TOKENS for m in history
+        ]
+        llm.get_num_tokens_from_messages.assert_not_called()
+        assert counter.count_total(history) == 42
+        assert llm.get_num_tokens_from_messages.call_count == 1
+
+    def test_known_message_ids_skip_reading_text(self):
+        counter, encoding = _counter()
+        history = [HumanMessage(content=f"question {i}", id=f"m{i}") for i in range(50)]
+        counter.count_messages(history)
+        history.append(AIMessage(content="new answer", id="m50"))
+        with patch("cnoe_agent_utils.token_counting.message_text", wraps=message_text) as read:
+            assert counter.count_total(history) == 2 * 51 + 51 * MESSAGE_OVERHEAD_TOKENS
+        assert read.call_count == 2  # content key and tokenization of the new message only
+        assert encoding.batches[-1] == ["new answer"]
+
+    def test_edited_message_under_same_id_is_recounted(self):
+        counter, _ = _counter()
+        counter.count_messages([HumanMessage(content="a b", id="m1")])
+        assert counter.count_messages([HumanMessage(content="a b c", id="m1")]) == [3 + MESSAGE_OVERHEAD_TOKENS]
+
+    def test_lru_bound(self):
+        cache = TokenCountCache(maxsize=2)
+        for key in "abc":
+            cache.put(key, 1)
+        assert cache.get("a") is None and cache.stats()["size"] == 2
+
+    def test_cache_size_zero_from_env_disables_the_cache(self):
+        with patch.dict(os.environ, {"LLM_TOKEN_CACHE_SIZE": "0"}), \
+                patch("cnoe_agent_utils.token_counting._shared_cache", None):
+            cache = token_counting.get_token_count_cache()
+            cache.put("a", 1)
+            assert cache.maxsize == 0 and cache.get("a") is None
+
+
+class TestCalibration:
+    """Test the estimate-to-usage correction model."""
+
+    def test_passthrough_until_enough_samples(self):
+        calibration = TokenCalibration()
+        calibration.observe(1000, 1500)
+        assert not calibration.ready
+        assert calibration.upper_bound(1000) == 1000
+
+    def test_learns_ratio_and_offset(self):
+        calibration = TokenCalibration()
+        for estimate in (1000, 4000, 2000, 8000, 500, 6000):
+            calibration.observe(estimate, int(1.2 * estimate) + 700)
+        snapshot = calibration.snapshot()
+        assert snapshot["ratio"] == pytest.approx(1.2, rel=0.01)
+        assert snapshot["offset"] == pytest.approx(700, abs=5)
+        assert calibration.correct(10_000) == pytest.approx(12_700, abs=10)
+        assert calibration.margin() < 20
+
+    def test_same_size_calls_fit_a_ratio(self):
+        calibration = TokenCalibration()
+        for _ in range(5):
+            calibration.observe(1000, 1300)
+        assert calibration.correct(2000) == 2600
+
+    def test_handler_feeds_calibration_from_usage(self):
+        calibration = TokenCalibration()
+        counter = TokenCounter("anthropic_claude", "claude-x", cache=TokenCountCache(100))
+        reply = AIMessage(content="ok", usage_metadata={"input_tokens": 250, "output_tokens": 1, "total_tokens": 251})
+        model = GenericFakeChatModel(messages=iter([reply] * 3),
+                                     callbacks=[TokenCalibrationHandler(counter, calibration)])
+        for _ in range(3):
+            model.invoke([HumanMessage(content="x" * 350)])
+        assert calibration.ready
+        counts = counter.count_for_limit([HumanMessage(content="x" * 350)], limit=1_000_000)
+        assert calibration.correct(sum(counts)) == 250
+
+    def test_handler_calibrates_hybrid_counts_against_estimates(self):
+        calibration = TokenCalibration()
+        counter, encoding = _counter(mode="hybrid")
+        handler = TokenCalibrationHandler(counter, calibration)
+        counter.count_messages([HumanMessage(content="seen before", id="old")])
+        history = [HumanMessage(content="seen before", id="old"), HumanMessage(content="x" * 4000, id="new")]
+        handler.on_chat_model_start({}, [history], run_id="run")
+        assert len(encoding.batches) == 1  # the new message is estimated, not tokenized
+        assert handler._runs["run"] == sum(counter.count_for_limit(history, limit=1_000_000))
+
+    def test_handler_tokenizes_large_prompts_off_the_caller_thread(self):
+        calibration = TokenCalibration()
+        counter = TokenCounter("openai", "gpt-4o", tokenizer=CharRatioTokenizer(4.0),
+                               cache=TokenCountCache(100), mode="exact", inline_chars=1000)
+        handler = TokenCalibrationHandler(counter, calibration)
+        caller = threading.get_ident()
+        threads = []
+        count_batch = counter.tokenizer.count_batch
+
+        def record_thread(texts):
+            threads.append(threading.get_ident())
+            return count_batch(texts)
+
+        reply = AIMessage(content="ok", usage_metadata={"input_tokens": 600, "output_tokens": 1, "total_tokens": 601})
+        with patch.object(counter.tokenizer, "count_batch", side_effect=record_thread):
+            handler.on_chat_model_start({}, [[HumanMessage(content="x" * 100, id="q")]], run_id="small")
+            handler.on_chat_model_start({}, [[HumanMessage(content="x" * 2000, id="tool")]], run_id="large")
+            handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=reply)]]), run_id="large")
+            for _ in range(100):
+                if calibration.samples:
+                    break
+                time.sleep(0.01)
+        assert threads[0] == caller and threads[1] != caller
+        assert calibration.samples == 1
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "k", "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5"})
+    def test_calibrated_context_limit(self):
+        assert get_calibrated_context_limit("anthropic-claude", "claude-sonnet-4-5") == 200_000 - 4096
+        with patch.dict(os.environ, {"ANTHROPIC_MAX_CONTEXT_TOKENS": "120000"}):
+            assert get_calibrated_context_limit("anthropic-claude", "claude-sonnet-4-5") == 120_000
+
+
+class TestFactoryIntegration:
+    """Test LLMFactory.get_token_counter."""
+
+    @patch.dict(os.environ, {"ANTHROPIC_API_KEY": "k", "ANTHROPIC_MODEL_NAME": "claude-sonnet-4-5"})
+    def test_counter_from_env_builds_model_only_for_exact_counts(self):
+        factory = LLMFactory("anthropic-claude")
+        with patch.object(LLMFactory, "_build_anthropic_claude_llm") as build:
+            build.return_value.get_num_tokens_from_messages.return_value = 9
+            counter = factory.get_token_counter()
+            assert counter.model_name == "claude-sonnet-4-5"
+            assert counter.tokenizer.name == "claude~approx"
+            counter.count_total([HumanMessage(content="hi")])
+            build.assert_not_called()
+            assert counter.count_total([HumanMessage(content="hi")], exact=True) == 9
+            build.assert_called_once()
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "LLM_TOKEN_COUNT_EXACT": "true"})
+    def test_exact_from_env_and_model_from_llm(self):
+        factory = LLMFactory("openai")
+        counter = factory.get_token_counter(llm=factory.get_llm(model="gpt-4.1"))
+        assert counter.exact and counter.model_name == "gpt-4.1"
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o", "LLM_TOKENIZER_MODE": "Exact"})
+    def test_mode_from_env(self):
+        assert LLMFactory("openai").get_token_counter().mode == "exact"
+        assert LLMFactory("openai").get_token_counter(mode="estimate").mode == "estimate"
+        with patch.dict(os.environ, {"LLM_TOKENIZER_MODE": "bogus"}):
+            assert LLMFactory("openai").get_token_counter().mode == "hybrid"
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o"})
+    def test_get_llm_attaches_calibration(self):
+        llm = LLMFactory("openai").get_llm()
+        [handler] = [cb for cb in llm.callbacks if isinstance(cb, TokenCalibrationHandler)]
+        assert handler.calibration is LLMFactory("openai").get_token_counter(llm=llm).calibration
+        with patch.dict(os.environ, {"LLM_TOKEN_CALIBRATION_ENABLED": "false"}):
+            llm = LLMFactory("openai").get_llm()
+            assert not any(isinstance(cb, TokenCalibrationHandler) for cb in llm.callbacks or [])
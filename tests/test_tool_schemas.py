@@ -0,0 +1,134 @@
+"""
+Tests for memoized tool-schema conversion used by LLMFactory.get_llm(tools=...).
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.tool_schemas import (
+    clear_tool_schema_cache,
+    convert_tools_cached,
+    get_tool_schema_cache_info,
+    tool_set_fingerprint,
+)
+
+
+def _mcp_like_tool(name: str, description: str = "Does things"):
+    """Build a tool with a dict args_schema, like langchain-mcp-adapters does."""
+    return StructuredTool(
+        name=name,
+        description=description,
+        args_schema={
+            "type": "object",
+            "properties": {"query": {"type": "string", "description": "Search query"}},
+            "required": ["query"],
+        },
+        func=lambda query: query,
+    )
+
+
+class WeatherArgs(BaseModel):
+    city: str
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache():
+    clear_tool_schema_cache()
+    yield
+    clear_tool_schema_cache()
+
+
+class TestToolSetFingerprint:
+    """Test stable hashing of tool sets."""
+
+    def test_fingerprint_is_stable_for_equal_tools(self):
+        a = [_mcp_like_tool("search"), _mcp_like_tool("lookup")]
+        b = [_mcp_like_tool("search"), _mcp_like_tool("lookup")]
+        assert tool_set_fingerprint(a, True) == tool_set_fingerprint(b, True)
+
+    def test_fingerprint_depends_on_strict_flag(self):
+        tools = [_mcp_like_tool("search")]
+        assert tool_set_fingerprint(tools, True) != tool_set_fingerprint(tools, False)
+
+    def test_fingerprint_depends_on_description_and_order(self):
+        a = [_mcp_like_tool("search"), _mcp_like_tool("lookup")]
+        assert tool_set_fingerprint(a) != tool_set_fingerprint([_mcp_like_tool("search", "Other"), _mcp_like_tool("lookup")])
+        assert tool_set_fingerprint(a) != tool_set_fingerprint(list(reversed(a)))
+
+
+class TestConvertToolsCached:
+    """Test cached conversion of tools to OpenAI tool dicts."""
+
+    def test_converts_to_openai_format(self):
+        converted = convert_tools_cached([_mcp_like_tool("search"), WeatherArgs], strict=True)
+        assert [t["function"]["name"] for t in converted] == ["search", "WeatherArgs"]
+        assert all(t["type"] == "function" for t in converted)
+        assert converted[0]["function"]["strict"] is True
+
+    def test_second_conversion_is_a_cache_hit(self):
+        with patch("langchain_core.utils.function_calling.convert_to_openai_tool",
+                   side_effect=lambda tool, strict=None: {"type": "function", "function": {"name": tool.name}}) as mock_convert:
+            first = convert_tools_cached([_mcp_like_tool("search")], strict=True)
+            second = convert_tools_cached([_mcp_like_tool("search")], strict=True)
+
+        assert mock_convert.call_count == 1
+        assert first is second
+        assert get_tool_schema_cache_info() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_same_tool_objects_skip_fingerprinting(self):
+        tools = [_mcp_like_tool("search")]
+        first = convert_tools_cached(tools, strict=True)
+        with patch("cnoe_agent_utils.tool_schemas.tool_set_fingerprint") as mock_fingerprint:
+            assert convert_tools_cached(tools, strict=True) is first
+            convert_tools_cached(tools, strict=False)
+        assert mock_fingerprint.call_count == 1
+
+    def test_cache_is_bounded(self):
+        with patch.dict(os.environ, {"LLM_TOOL_SCHEMA_CACHE_SIZE": "2"}):
+            for i in range(5):
+                convert_tools_cached([_mcp_like_tool(f"tool_{i}")])
+        assert get_tool_schema_cache_info()["size"] == 2
+
+    def test_cache_can_be_disabled(self):
+        with patch.dict(os.environ, {"LLM_TOOL_SCHEMA_CACHE_SIZE": "0"}):
+            convert_tools_cached([_mcp_like_tool("search")])
+            convert_tools_cached([_mcp_like_tool("search")])
+        assert get_tool_schema_cache_info() == {"hits": 0, "misses": 0, "size": 0}
+
+
+class TestGetLLMToolBinding:
+    """Test that get_llm binds the cached tool payload."""
+
+    @patch.dict(os.environ, {
+        "ANTHROPIC_API_KEY": "test-key",
+        "ANTHROPIC_MODEL_NAME": "claude-3-sonnet-20240229-v1",
+    })
+    def test_get_llm_reuses_payload_across_models(self):
+        factory = LLMFactory("anthropic-claude")
+        payloads = []
+        with patch.object(factory, "_build_anthropic_claude_llm") as mock_builder:
+            mock_llm = MagicMock()
+            mock_builder.return_value = mock_llm
+            tools = [_mcp_like_tool("search"), _mcp_like_tool("lookup")]
+            factory.get_llm(tools=tools)
+            factory.get_llm(tools=tools, model="claude-other")
+            for call in mock_llm.bind_tools.call_args_list:
+                payloads.append(call.args[0])
+                assert call.kwargs["strict"] is True
+
+        assert payloads[0] is payloads[1]
+        assert get_tool_schema_cache_info()["hits"] == 1
+
+    @patch.dict(os.environ, {
+        "ANTHROPIC_API_KEY": "test-key",
+        "ANTHROPIC_MODEL_NAME": "claude-3-sonnet-20240229-v1",
+    })
+    def test_get_llm_binds_real_model(self):
+        factory = LLMFactory("anthropic-claude")
+        bound = factory.get_llm(tools=[_mcp_like_tool("search")])
+        assert bound.kwargs["tools"][0]["name"] == "search"
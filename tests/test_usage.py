@@ -0,0 +1,203 @@
+"""
+Tests for the per-provider usage and cost ledger.
+"""
+
+import os
+import threading
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from cnoe_agent_utils.llm_factory import LLMFactory
+from cnoe_agent_utils.usage import (
+    UsageCallbackHandler,
+    UsageLedger,
+    extract_usage,
+    get_usage_ledger,
+    register_otel_metrics,
+    usage_context,
+)
+
+
+def _usage_message(content="ok", input_tokens=10, output_tokens=5, cached=0, reasoning=0, model="gpt-4o"):
+    return AIMessage(
+        content=content,
+        usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached},
+            "output_token_details": {"reasoning": reasoning},
+        },
+        response_metadata={"model_name": model},
+    )
+
+
+class TestUsageLedger:
+    """Test recording, aggregation and windows."""
+
+    def test_totals_grouping_and_cost(self):
+        ledger = UsageLedger(pricing={"m": {"input": 1.0, "output": 2.0, "cached_input": 0.5}})
+        ledger.record("openai", "m", "a1", "s1", input_tokens=1000, output_tokens=500, cached_tokens=400, latency=2.0)
+        ledger.record("openai", "m", "a2", "s2", input_tokens=1000, output_tokens=500, latency=1.0, error=True)
+
+        [row] = ledger.snapshot(group_by=("provider", "model"))
+        assert row["calls"] == 2 and row["errors"] == 1
+        assert row["input_tokens"] == 2000 and row["cached_tokens"] == 400
+        assert row["output_tokens_per_second"] == pytest.approx(1000 / 3.0)
+        # (600 * 1.0 + 400 * 0.5 + 500 * 2.0) / 1000 + (1000 * 1.0 + 500 * 2.0) / 1000
+        assert row["cost_usd"] == pytest.approx(1.8 + 2.0)
+        assert [r["agent"] for r in ledger.snapshot()] == ["a1", "a2"]
+
+    def test_rolling_windows(self):
+        ledger = UsageLedger()
+        now = 100_000.0
+        ledger.record("p", "m", input_tokens=1, now=now - 3000)
+        ledger.record("p", "m", input_tokens=10, now=now - 200)
+        ledger.record("p", "m", input_tokens=100, now=now - 5)
+
+        def window_tokens(seconds):
+            return sum(r["input_tokens"] for r in ledger.snapshot(window=seconds, now=now))
+
+        assert window_tokens(60) == 100
+        assert window_tokens(300) == 110
+        assert window_tokens(3600) == 111
+        assert ledger.snapshot()[0]["input_tokens"] == 111
+
+    def test_old_buckets_are_pruned(self):
+        ledger = UsageLedger()
+        ledger.record("p", "m", now=0)
+        ledger.record("p", "m", now=7200)
+        assert len(ledger._shard().buckets) == 1
+        assert ledger.snapshot()[0]["calls"] == 2
+
+    def test_threads_merge(self):
+        ledger = UsageLedger()
+
+        def work():
+            for _ in range(1000):
+                ledger.record("p", "m", output_tokens=1)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert ledger.snapshot()[0]["output_tokens"] == 4000
+        # Shards of finished threads are folded into one
+        assert ledger._shards == [] and ledger.snapshot(window=60)[0]["output_tokens"] == 4000
+
+    def test_lifetime_totals_drop_the_session(self):
+        ledger = UsageLedger()
+        for session in ("s1", "s2", "s3"):
+            ledger.record("p", "m", "a", session, input_tokens=1)
+        [total] = ledger.snapshot()
+        assert total["session"] == "" and total["input_tokens"] == 3
+        assert len(ledger._shard().totals) == 1
+        assert [r["session"] for r in ledger.snapshot(window=60)] == ["s1", "s2", "s3"]
+
+    def test_prometheus_export(self):
+        ledger = UsageLedger()
+        ledger.set_pricing("m", 1.0, 1.0)
+        ledger.record("openai", "m", 'ag"ent', "s1", input_tokens=1000, output_tokens=1000)
+        text = ledger.to_prometheus()
+        assert "# TYPE llm_input_tokens_total counter" in text
+        assert 'llm_input_tokens_total{provider="openai",model="m",agent="ag\\"ent"} 1000' in text
+        assert 'llm_cost_usd_total{provider="openai",model="m",agent="ag\\"ent"} 2' in text
+        assert 'llm_calls_window{provider="openai",model="m",agent="ag\\"ent",window="5m"} 1' in text
+        assert "session=" not in text
+        assert 'session="s1"' in ledger.to_prometheus(include_session=True)
+
+    def test_cache_hit_ratio(self):
+        ledger = UsageLedger()
+        ledger.record("anthropic", "m", "a", input_tokens=1000, cached_tokens=600)
+        ledger.record("anthropic", "m", "a", input_tokens=1000, cached_tokens=1000)
+        ledger.record("anthropic", "m", "b", output_tokens=10)
+        rows = {row["agent"]: row for row in ledger.snapshot(window=300)}
+        assert rows["a"]["cache_hit_ratio"] == pytest.approx(0.8)
+        assert rows["b"]["cache_hit_ratio"] == pytest.approx(0.0)
+        text = ledger.to_prometheus()
+        assert 'llm_cache_hit_ratio_window{provider="anthropic",model="m",agent="a",window="5m"} 0.8' in text
+        assert 'llm_cache_hit_ratio_window{provider="anthropic",model="m",agent="b"' not in text
+
+    def test_otel_export(self):
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+        reader = InMemoryMetricReader()
+        meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+        ledger = UsageLedger()
+        ledger.record("openai", "m", "a", input_tokens=8, cached_tokens=6)
+        register_otel_metrics(ledger, meter)
+
+        metrics = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+        by_name = {m.name: m for m in metrics}
+        point = by_name["llm.input_tokens"].data.data_points[0]
+        assert point.value == 8
+        assert by_name["llm.cache_hit_ratio"].data.data_points[0].value == pytest.approx(0.75)
+        assert dict(point.attributes) == {"provider": "openai", "model": "m", "agent": "a"}
+
+
+class TestUsageCallbackHandler:
+    """Test feeding the ledger from model calls."""
+
+    def test_extract_usage(self):
+        assert extract_usage(_usage_message(cached=3, reasoning=2)) == {
+            "input_tokens": 10, "output_tokens": 5, "cached_tokens": 3, "reasoning_tokens": 2,
+        }
+
+    def test_handler_records_call_with_context(self):
+        ledger = UsageLedger()
+        handler = UsageCallbackHandler("openai", "default-model", ledger)
+        model = GenericFakeChatModel(messages=iter([_usage_message(model="gpt-4o-2024")]), callbacks=[handler])
+        with usage_context(agent="jira", session="s-1"):
+            model.invoke("hi")
+
+        [row] = ledger.snapshot(window=60)
+        assert (row["provider"], row["model"], row["agent"], row["session"]) == ("openai", "gpt-4o-2024", "jira", "s-1")
+        assert row["input_tokens"] == 10 and row["output_tokens"] == 5
+        assert row["latency_seconds"] >= 0
+
+    def test_handler_reads_run_metadata(self):
+        ledger = UsageLedger()
+        handler = UsageCallbackHandler("openai", "m", ledger)
+        model = GenericFakeChatModel(messages=iter([_usage_message()]), callbacks=[handler])
+        model.invoke("hi", config={"metadata": {"agent_name": "argocd", "thread_id": "t-9"}})
+        [row] = ledger.snapshot(window=60)
+        assert (row["agent"], row["session"]) == ("argocd", "t-9")
+
+    def test_handler_drops_runs_that_never_end(self):
+        handler = UsageCallbackHandler("openai", "m", UsageLedger())
+        with patch("cnoe_agent_utils.usage._RUNS_PRUNE_THRESHOLD", 2), \
+             patch("cnoe_agent_utils.usage.time.perf_counter", side_effect=[0.0, 1.0, 5000.0]):
+            for _ in range(3):
+                handler.on_chat_model_start({}, [[]], run_id=uuid4())
+        assert len(handler._runs) == 1
+
+    @pytest.mark.asyncio
+    async def test_handler_async(self):
+        ledger = UsageLedger()
+        handler = UsageCallbackHandler("openai", "m", ledger)
+        model = GenericFakeChatModel(messages=iter([_usage_message()]), callbacks=[handler])
+        await model.ainvoke("hi")
+        assert ledger.snapshot()[0]["calls"] == 1
+
+
+class TestFactoryIntegration:
+    """Test that LLMFactory attaches the ledger handler."""
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "gpt-4o-mini"})
+    def test_get_llm_attaches_handler(self):
+        llm = LLMFactory("openai").get_llm()
+        [handler] = [cb for cb in llm.callbacks if isinstance(cb, UsageCallbackHandler)]
+        assert handler.provider == "openai"
+        assert handler.model == "gpt-4o-mini"
+        assert handler.ledger is get_usage_ledger()
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "k", "OPENAI_MODEL_NAME": "m", "LLM_USAGE_LEDGER_ENABLED": "false"})
+    def test_opt_out(self):
+        callbacks = LLMFactory("openai").get_llm().callbacks or []
+        assert not any(isinstance(cb, UsageCallbackHandler) for cb in callbacks)
@@ -7,6 +7,7 @@ import pytest
 from unittest.mock import Mock, patch
 
 from cnoe_agent_utils.utils import (
+    env_int,
     stream_with_spinner,
     invoke_with_spinner,
     time_llm_operation,
@@ -271,6 +272,18 @@ class TestEnvironmentVariableHandling:
                     except Exception as e:
                         pytest.fail(f"Function failed for env value '{env_value}': {e}")
 
+    def test_env_int(self):
+        """Test that env_int reads positive integers and falls back on bad values."""
+        for env_value, expected in [("12", 12), ("0", 1), ("", 7), ("many", 7)]:
+            with patch.dict(os.environ, {"TEST_ENV_INT": env_value}):
+                assert env_int("TEST_ENV_INT", 7) == expected
+
+    def test_env_int_minimum(self):
+        """Test that env_int clamps to the given minimum, so 0 can be allowed."""
+        for env_value, expected in [("0", 0), ("-3", 0), ("5", 5), ("", 7)]:
+            with patch.dict(os.environ, {"TEST_ENV_INT": env_value}):
+                assert env_int("TEST_ENV_INT", 7, minimum=0) == expected
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])